@@ -0,0 +1,108 @@
+# Run from the app folder, e.g. python -m benchmarks.benchmark_adaptive_dpi --input_files report.pdf --page_max 10
+# Checks the adaptive DPI heuristic (render each page so that its smaller text is about ADAPTIVE_DPI_TARGET_TEXT_PIXELS tall) against the fixed IMAGES_DPI, on OCR time and word recall.
+# Input PDFs need a text layer, which is used as the ground truth for word recall. With no input files, a synthetic PDF is made with one page of text at each of several font sizes.
+
+import argparse
+import os
+import time
+import random
+import tempfile
+import pymupdf
+import pandas as pd
+from tools.custom_image_analyser_engine import perform_tesseract_ocr, get_image_preprocessor
+from tools.file_conversion import render_pdf_page_with_pymupdf
+from tools.adaptive_dpi import choose_page_dpi
+from tools.config import IMAGES_DPI, TESSERACT_OCR_BACKEND
+from benchmarks.benchmark_page_segmentation import get_sample_text, normalise_words, get_word_recall
+
+tesseract_config = "--oem 3 --psm 11"
+
+def create_synthetic_pdf(pdf_path:str, font_sizes:list, seed:int=0):
+    '''
+    Write a PDF with one page of prose at each font size, with text drawn in Helvetica so that the text layer matches the rendered words.
+    '''
+    rng = random.Random(seed)
+    pdf_doc = pymupdf.open()
+    width, height = pymupdf.paper_size("a4")
+
+    for font_size in font_sizes:
+        page = pdf_doc.new_page(width=width, height=height)
+        # About half a page of text, as insert_textbox writes nothing if the text does not fit
+        page.insert_textbox(pymupdf.Rect(60, 60, width - 60, height - 60), get_sample_text(int(40000 / font_size ** 2), rng), fontsize=font_size, fontname="helv")
+
+    pdf_doc.save(pdf_path)
+    pdf_doc.close()
+
+def ocr_page(input_file:str, page_num:int, dpi:float, image_preprocessor, ocr_backend:str):
+    '''
+    Render a page at the given DPI and OCR it, returning the OCR results and the seconds taken for both.
+    '''
+    tic = time.perf_counter()
+    image = render_pdf_page_with_pymupdf(input_file, page_num, dpi)
+    ocr_results = perform_tesseract_ocr(image, tesseract_config, image_preprocessor, ocr_backend)
+    return ocr_results, time.perf_counter() - tic
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare Tesseract OCR of pages rendered at a fixed DPI and at the DPI chosen per page from its text size, on time and word recall against the PDF text layer')
+    parser.add_argument('--input_files', nargs='*', default=[], help='PDF files with a text layer. Synthetic pages are used if none are given')
+    parser.add_argument('--page_max', type=int, default=10, help='Maximum pages to use from each PDF. 0 uses all pages')
+    parser.add_argument('--font_sizes', type=float, nargs='*', default=[6.0, 8.0, 10.0, 12.0, 18.0], help='Font sizes in points for the synthetic pages')
+    parser.add_argument('--fixed_dpi', type=float, default=float(IMAGES_DPI), help='DPI to compare the adaptive DPI with')
+    parser.add_argument('--ocr_backend', default=TESSERACT_OCR_BACKEND, help="'pytesseract' or 'tesserocr'")
+    parser.add_argument('--output_file', default='', help='Optional csv file path for the results by page')
+
+    args = parser.parse_args()
+
+    input_files = args.input_files
+    temp_folder = None
+    if not input_files:
+        temp_folder = tempfile.TemporaryDirectory(prefix="adaptive_dpi_benchmark_")
+        input_files = [os.path.join(temp_folder.name, "synthetic_font_sizes.pdf")]
+        create_synthetic_pdf(input_files[0], args.font_sizes)
+
+    image_preprocessor = get_image_preprocessor()
+    results = []
+
+    try:
+        for input_file in input_files:
+            with pymupdf.open(input_file) as pdf_doc:
+                page_texts = [[word[4] for word in page.get_text("words")] for page in pdf_doc]
+                page_count = min(pdf_doc.page_count, args.page_max) if args.page_max else pdf_doc.page_count
+                # Choosing the DPI is included in the adaptive time
+                adaptive_dpis = []
+                choose_seconds = []
+                for page_num in range(page_count):
+                    tic = time.perf_counter()
+                    adaptive_dpis.append(choose_page_dpi(pdf_doc.load_page(page_num), args.fixed_dpi))
+                    choose_seconds.append(time.perf_counter() - tic)
+
+            for page_num in range(page_count):
+                ground_truth_words = normalise_words(page_texts[page_num])
+
+                fixed_ocr_results, fixed_seconds = ocr_page(input_file, page_num, args.fixed_dpi, image_preprocessor, args.ocr_backend)
+                adaptive_ocr_results, adaptive_seconds = ocr_page(input_file, page_num, adaptive_dpis[page_num], image_preprocessor, args.ocr_backend)
+                adaptive_seconds += choose_seconds[page_num]
+
+                fixed_recall = get_word_recall(ground_truth_words, normalise_words([result.text for result in fixed_ocr_results]))
+                adaptive_recall = get_word_recall(ground_truth_words, normalise_words([result.text for result in adaptive_ocr_results]))
+
+                results.append({"file": os.path.basename(input_file), "page": page_num + 1,
+                                "ground_truth_words": sum(ground_truth_words.values()),
+                                "fixed_dpi": args.fixed_dpi, "adaptive_dpi": adaptive_dpis[page_num],
+                                "fixed_seconds": round(fixed_seconds, 3), "adaptive_seconds": round(adaptive_seconds, 3),
+                                "fixed_recall": round(fixed_recall, 4) if fixed_recall is not None else None,
+                                "adaptive_recall": round(adaptive_recall, 4) if adaptive_recall is not None else None})
+    finally:
+        if temp_folder: temp_folder.cleanup()
+
+    results_df = pd.DataFrame(results)
+
+    print(results_df.to_string(index=False))
+    print(f"\nAll pages: fixed {args.fixed_dpi:g} DPI {len(results_df) / results_df['fixed_seconds'].sum():.2f} pages/second, mean recall {results_df['fixed_recall'].mean():.4f}; "
+          f"adaptive DPI {len(results_df) / results_df['adaptive_seconds'].sum():.2f} pages/second, mean recall {results_df['adaptive_recall'].mean():.4f}")
+
+    if args.output_file:
+        results_df.to_csv(args.output_file, index=None)
+
+if __name__ == "__main__":
+    main()
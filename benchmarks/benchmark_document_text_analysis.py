@@ -0,0 +1,100 @@
+# Run from the app folder, e.g. python -m benchmarks.benchmark_document_text_analysis --pages 100 1000 10000 --lines_per_page 40
+# Synthetic pages of text lines with names, addresses, phone numbers and emails are analysed with the local model three ways: one analyse call per line, one per page (as redact_text_pdf does in 'page' mode), and pages batched through spaCy (as in 'document' mode).
+
+import argparse
+import time
+import random
+import pandas as pd
+from tools.custom_image_analyser_engine import OCRResult, get_page_text_and_mapping, analyse_page_texts_in_batches
+from tools.load_spacy_model_custom_recognisers import nlp_analyser, score_threshold
+from tools.config import TEXT_ANALYSIS_BATCH_SIZE
+
+sample_entities = ["PERSON", "PHONE_NUMBER", "EMAIL_ADDRESS", "STREETNAME", "UKPOSTCODE"]
+
+first_names = ["Jane", "John", "Amara", "Wei", "Fatima", "Oliver", "Priya", "Tomasz"]
+last_names = ["Example", "Smith", "Okafor", "Chen", "Hussain", "Brown", "Patel", "Nowak"]
+streets = ["High Street", "Station Road", "Church Lane", "Mill Road", "Park Avenue"]
+postcodes = ["SW1A 1AA", "M1 1AE", "B33 8TH", "CR2 6XH", "DN55 1PT"]
+filler_words = ("the council received an application regarding planning permission for a rear extension and the officer "
+                "recommended approval subject to conditions about materials drainage and working hours").split()
+
+def get_sample_line(rng:random.Random) -> str:
+    words = [rng.choice(filler_words) for _ in range(rng.randint(6, 12))]
+    entity_type = rng.randint(0, 5)
+
+    if entity_type == 0:
+        words.insert(rng.randint(0, len(words)), f"{rng.choice(first_names)} {rng.choice(last_names)}")
+    elif entity_type == 1:
+        words.insert(rng.randint(0, len(words)), f"{rng.randint(1, 200)} {rng.choice(streets)}, {rng.choice(postcodes)}")
+    elif entity_type == 2:
+        words.append(f"on 07{rng.randint(100000000, 999999999)}")
+    elif entity_type == 3:
+        words.append(f"{rng.choice(first_names).lower()}.{rng.choice(last_names).lower()}@example.com")
+
+    return " ".join(words)
+
+def create_synthetic_pages(page_count:int, lines_per_page:int, seed:int=0) -> list:
+    rng = random.Random(seed)
+    return [[OCRResult(get_sample_line(rng), 60, 800 - line_no * 18, 400, 12) for line_no in range(lines_per_page)] for _ in range(page_count)]
+
+def get_result_keys(page_results:list) -> set:
+    return {(page_no, result.entity_type, result.start, result.end) for page_no, results in enumerate(page_results) for result in results}
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the throughput of analysing document text one line at a time, one page at a time, and with pages batched through spaCy')
+    parser.add_argument('--pages', nargs='+', type=int, default=[100, 1000, 10000], help='Document lengths in pages')
+    parser.add_argument('--lines_per_page', type=int, default=40, help='Text lines on each synthetic page')
+    parser.add_argument('--modes', nargs='+', default=["per_line", "per_page", "batched"], help="Any of 'per_line', 'per_page' and 'batched'")
+    parser.add_argument('--batch_size', type=int, default=int(TEXT_ANALYSIS_BATCH_SIZE), help='Pages passed through spaCy at a time in batched mode')
+    parser.add_argument('--language', default='en', help='Language of the analyser')
+    parser.add_argument('--output_file', default='', help='Optional csv file path for the results')
+
+    args = parser.parse_args()
+
+    results = []
+
+    for page_count in args.pages:
+        pages = create_synthetic_pages(page_count, args.lines_per_page)
+        page_texts = [get_page_text_and_mapping(page_lines)[0] for page_lines in pages]
+        mode_results = {}
+
+        for mode in args.modes:
+            tic = time.perf_counter()
+
+            if mode == "per_line":
+                line_results = [[nlp_analyser.analyze(text=line.text, language=args.language, entities=sample_entities, score_threshold=score_threshold, return_decision_process=True)
+                                 for line in page_lines] for page_lines in pages]
+                entity_count = sum(len(results) for page_results in line_results for results in page_results)
+            elif mode == "per_page":
+                mode_results[mode] = [nlp_analyser.analyze(text=page_text, language=args.language, entities=sample_entities, score_threshold=score_threshold, return_decision_process=True)
+                                      for page_text in page_texts]
+                entity_count = sum(len(results) for results in mode_results[mode])
+            elif mode == "batched":
+                mode_results[mode] = analyse_page_texts_in_batches(page_texts, nlp_analyser, args.language, sample_entities, score_threshold, batch_size=args.batch_size)
+                entity_count = sum(len(results) for results in mode_results[mode])
+            else:
+                print("Unknown mode:", mode)
+                continue
+
+            seconds = time.perf_counter() - tic
+
+            results.append({"pages": page_count, "lines": page_count * args.lines_per_page, "mode": mode,
+                            "seconds": round(seconds, 2), "pages_per_second": round(page_count / seconds, 2),
+                            "lines_per_second": round(page_count * args.lines_per_page / seconds, 1), "entities": entity_count})
+
+            print(results[-1])
+
+        # Batched results should match analysing each page on its own
+        if "per_page" in mode_results and "batched" in mode_results:
+            per_page_keys, batched_keys = get_result_keys(mode_results["per_page"]), get_result_keys(mode_results["batched"])
+            agreement = len(per_page_keys & batched_keys) / max(1, len(per_page_keys | batched_keys))
+            print(f"{page_count} pages: batched results agree with per page results on {agreement:.4f} of entities")
+
+    results_df = pd.DataFrame(results)
+    print(results_df.to_string(index=False))
+
+    if args.output_file:
+        results_df.to_csv(args.output_file, index=None)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+# Run from the app folder, e.g. python -m benchmarks.benchmark_image_preprocessing --input_files scan.pdf page.png --repeats 3
+# With no input files, synthetic scans are used: clean and faded A4 pages at 150 and 300 DPI, and a page with a dark background.
+
+import argparse
+import os
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+import pymupdf
+from PIL import Image, ImageDraw, ImageFilter
+from tools.custom_image_analyser_engine import ContrastSegmentedImageEnhancer, NumpyPreprocessingPipeline
+from tools.file_conversion import render_pdf_page_with_pymupdf
+
+def create_synthetic_scan(dpi:int, paper_colour:int, ink_colour:int, noise:float, seed:int=0) -> Image.Image:
+    '''
+    Draw an A4 page of text lines with scanner-like noise and blur.
+    '''
+    width, height = int(8.27 * dpi), int(11.69 * dpi)
+    image = Image.new("L", (width, height), paper_colour)
+    draw = ImageDraw.Draw(image)
+
+    line_height = max(12, dpi // 6)
+    for line_no, top in enumerate(range(dpi, height - dpi, line_height)):
+        draw.text((dpi, top), f"Line {line_no} Jane Example, 10 High Street, jane.example@example.com, 07700 900{line_no % 1000:03d}", fill=ink_colour)
+
+    pixels = np.asarray(image.filter(ImageFilter.GaussianBlur(0.6)), dtype=np.float32)
+    pixels += np.random.default_rng(seed).normal(0, noise, pixels.shape)
+
+    return Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8))
+
+def get_synthetic_scans() -> list:
+    return [("synthetic clean 150 DPI", create_synthetic_scan(150, 245, 20, 4)),
+            ("synthetic clean 300 DPI", create_synthetic_scan(300, 245, 20, 4)),
+            ("synthetic faded 300 DPI", create_synthetic_scan(300, 200, 150, 8)),
+            ("synthetic dark background 300 DPI", create_synthetic_scan(300, 60, 220, 6))]
+
+def load_input_images(input_files:list, dpi:float, page_max:int) -> list:
+    '''
+    Load page images from image files, and render the first page_max pages of PDF files.
+    '''
+    images = []
+    for input_file in input_files:
+        file_name = os.path.basename(input_file)
+
+        if input_file.lower().endswith(".pdf"):
+            with pymupdf.open(input_file) as pdf_doc:
+                page_count = pdf_doc.page_count
+            for page_num in range(min(page_count, page_max) if page_max else page_count):
+                images.append((f"{file_name} page {page_num + 1}", render_pdf_page_with_pymupdf(input_file, page_num, dpi)))
+        else:
+            images.append((file_name, Image.open(input_file).convert("L")))
+
+    return images
+
+def time_preprocessor(preprocessor, image:Image.Image, repeats:int) -> tuple:
+    '''
+    Return the fastest of several runs in seconds, the peak memory allocated during one run in MB, and the processed image.
+    '''
+    seconds = []
+    for _ in range(repeats):
+        tic = time.perf_counter()
+        processed_image, _ = preprocessor.preprocess_image(image)
+        seconds.append(time.perf_counter() - tic)
+
+    tracemalloc.start()
+    preprocessor.preprocess_image(image)
+    _, peak_bytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return min(seconds), peak_bytes / 1024 / 1024, processed_image
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the numpy image preprocessing pipeline with the original chain of preprocessors used before Tesseract OCR')
+    parser.add_argument('--input_files', nargs='*', default=[], help='Page images or PDF files. Synthetic scans are used if none are given')
+    parser.add_argument('--dpi', type=float, default=300.0, help='DPI used to render PDF pages')
+    parser.add_argument('--page_max', type=int, default=5, help='Maximum pages to render from each PDF. 0 renders all pages')
+    parser.add_argument('--stages', default='', help='Comma-separated stage order for the pipeline. Defaults to IMAGE_PREPROCESSING_STAGES')
+    parser.add_argument('--repeats', type=int, default=3, help='Number of times to repeat each measurement. The fastest run is reported')
+    parser.add_argument('--output_file', default='', help='Optional csv file path for the results')
+
+    args = parser.parse_args()
+
+    images = load_input_images(args.input_files, args.dpi, args.page_max) if args.input_files else get_synthetic_scans()
+
+    original_chain = ContrastSegmentedImageEnhancer()
+    pipeline = NumpyPreprocessingPipeline(stages=args.stages or None)
+
+    print("Pipeline stages:", ", ".join(pipeline.stages))
+
+    results = []
+
+    for image_name, image in images:
+        original_seconds, original_peak_mb, original_output = time_preprocessor(original_chain, image, args.repeats)
+        pipeline_seconds, pipeline_peak_mb, pipeline_output = time_preprocessor(pipeline, image, args.repeats)
+
+        # Share of pixels that are the same in both outputs, when the stage order matches the original chain
+        if original_output.size == pipeline_output.size:
+            matching_pixels = float((np.asarray(original_output) == np.asarray(pipeline_output)).mean())
+        else:
+            matching_pixels = None
+
+        results.append({"image": image_name,
+                        "pixels": image.size[0] * image.size[1],
+                        "original_seconds": round(original_seconds, 4),
+                        "pipeline_seconds": round(pipeline_seconds, 4),
+                        "speedup": round(original_seconds / pipeline_seconds, 2),
+                        "original_peak_mb": round(original_peak_mb, 1),
+                        "pipeline_peak_mb": round(pipeline_peak_mb, 1),
+                        "matching_pixels": round(matching_pixels, 4) if matching_pixels is not None else None})
+
+    results_df = pd.DataFrame(results)
+
+    print(results_df.to_string(index=False))
+    print(pipeline.get_stage_timing_report())
+
+    if args.output_file:
+        results_df.to_csv(args.output_file, index=None)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+# Run from the app folder, e.g. python -m benchmarks.benchmark_model_tiers --tiers small large --analysis_profile full
+# Each spaCy model tier analyses the bundled synthetic corpus (benchmarks/data/synthetic_entity_corpus.jsonl), and its throughput and entity recall are compared. Models that are not installed are downloaded when first used.
+
+import argparse
+import time
+import pandas as pd
+from benchmarks.synthetic_entity_corpus import default_corpus_file, load_synthetic_corpus
+from tools.analysis_profiles import get_profile_analyser, analysis_profiles
+from tools.custom_image_analyser_engine import analyse_page_texts_in_batches
+from tools.model_tiers import model_tiers, get_tier_model_name, get_tier_spacy_model
+from tools.load_spacy_model_custom_recognisers import score_threshold
+from tools.config import TEXT_ANALYSIS_BATCH_SIZE
+
+def get_entity_recall(pages:list, page_results:list) -> dict:
+    '''
+    Get the share of corpus entities of each type that overlap a result of the same type, and over all types.
+    '''
+    found_counts, total_counts = {}, {}
+
+    for page, results in zip(pages, page_results):
+        for start, end, entity_type in page["entities"]:
+            found = any(result.entity_type == entity_type and result.start < end and result.end > start for result in results)
+            total_counts[entity_type] = total_counts.get(entity_type, 0) + 1
+            found_counts[entity_type] = found_counts.get(entity_type, 0) + found
+
+    entity_recall = {f"recall_{entity_type}": round(found_counts[entity_type] / total_counts[entity_type], 4) for entity_type in sorted(total_counts)}
+    entity_recall["recall_all"] = round(sum(found_counts.values()) / max(1, sum(total_counts.values())), 4)
+
+    return entity_recall
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare spaCy model tiers on pages/second and entity recall on a synthetic corpus')
+    parser.add_argument('--tiers', nargs='+', default=list(model_tiers.keys()), help='Model tiers to compare, from SPACY_MODEL_TIERS')
+    parser.add_argument('--analysis_profile', default="full", help=f"Analysis profile, one of {', '.join(analysis_profiles)}")
+    parser.add_argument('--corpus_file', default=default_corpus_file, help='Synthetic corpus file, written by python -m benchmarks.synthetic_entity_corpus')
+    parser.add_argument('--repeats', type=int, default=3, help='Times the corpus is analysed for each tier. The fastest run is reported')
+    parser.add_argument('--batch_size', type=int, default=int(TEXT_ANALYSIS_BATCH_SIZE), help='Pages passed through spaCy at a time')
+    parser.add_argument('--output_file', default='', help='Optional csv file path for the results')
+
+    args = parser.parse_args()
+
+    pages = load_synthetic_corpus(args.corpus_file)
+    page_texts = [page["text"] for page in pages]
+    corpus_entities = sorted({entity_type for page in pages for _, _, entity_type in page["entities"]})
+
+    print(f"Corpus of {len(pages)} pages with {sum(len(page['entities']) for page in pages)} entities of types {', '.join(corpus_entities)}")
+
+    results = []
+
+    for tier in args.tiers:
+        tic = time.perf_counter()
+        spacy_model = get_tier_spacy_model(tier)
+        analyser = get_profile_analyser(args.analysis_profile, tier)
+        load_seconds = time.perf_counter() - tic
+
+        loaded_model_name = f"{spacy_model.meta.get('lang', '')}_{spacy_model.meta.get('name', '')}"
+
+        run_seconds = []
+        for _ in range(args.repeats):
+            tic = time.perf_counter()
+            page_results = analyse_page_texts_in_batches(page_texts, analyser, "en", corpus_entities, score_threshold, batch_size=args.batch_size)
+            run_seconds.append(time.perf_counter() - tic)
+
+        results.append({"tier": tier, "model": get_tier_model_name(tier), "model_loaded": loaded_model_name,
+                        "load_seconds": round(load_seconds, 2), "analysis_seconds": round(min(run_seconds), 2),
+                        "pages_per_second": round(len(pages) / min(run_seconds), 2),
+                        **get_entity_recall(pages, page_results)})
+
+        print(results[-1])
+
+    results_df = pd.DataFrame(results)
+    print(results_df.to_string(index=False))
+
+    if args.output_file:
+        results_df.to_csv(args.output_file, index=None)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+# Run from the app folder, e.g. python -m benchmarks.benchmark_page_segmentation --input_files report.pdf form.pdf --page_max 10
+# Input PDFs need a text layer, which is used as the ground truth for word recall. With no input files, synthetic PDFs are made with one page of each layout: dense single column, two columns, sparse form and ruled table.
+
+import argparse
+import os
+import re
+import time
+import random
+import tempfile
+import pymupdf
+import pandas as pd
+from collections import Counter
+from tools.custom_image_analyser_engine import perform_tesseract_ocr, get_image_preprocessor
+from tools.file_conversion import render_pdf_page_with_pymupdf
+from tools.page_layout import choose_tesseract_config_for_page
+from tools.config import TESSERACT_OCR_BACKEND
+
+fixed_tesseract_config = "--oem 3 --psm 11"
+
+sample_words = ("the council received an application from Jane Example of 10 High Street on 12 March regarding planning permission for "
+                "a rear extension and the officer recommended approval subject to conditions about materials drainage and working hours").split()
+
+def get_sample_text(word_count:int, rng:random.Random) -> str:
+    return " ".join(rng.choice(sample_words) for _ in range(word_count))
+
+def create_synthetic_pdf(pdf_path:str, seed:int=0):
+    '''
+    Write a PDF with one page of each layout, with text drawn in Helvetica so that the text layer matches the rendered words.
+    '''
+    rng = random.Random(seed)
+    pdf_doc = pymupdf.open()
+    width, height = pymupdf.paper_size("a4")
+
+    # Dense single column of prose
+    page = pdf_doc.new_page(width=width, height=height)
+    page.insert_textbox(pymupdf.Rect(60, 60, width - 60, height - 60), get_sample_text(900, rng), fontsize=10, fontname="helv")
+
+    # Two columns of prose
+    page = pdf_doc.new_page(width=width, height=height)
+    column_width = (width - 150) / 2
+    for column in range(2):
+        left = 60 + column * (column_width + 30)
+        page.insert_textbox(pymupdf.Rect(left, 60, left + column_width, height - 60), get_sample_text(450, rng), fontsize=10, fontname="helv")
+
+    # Sparse form of labels and values
+    page = pdf_doc.new_page(width=width, height=height)
+    for row in range(12):
+        top = 80 + row * 55
+        page.insert_text((60, top), get_sample_text(2, rng).title() + ":", fontsize=11, fontname="helv")
+        page.insert_text((250 + rng.randint(0, 80), top), get_sample_text(rng.randint(1, 4), rng), fontsize=11, fontname="helv")
+
+    # Ruled table
+    page = pdf_doc.new_page(width=width, height=height)
+    column_lefts = [60, 200, 340, 480]
+    row_height = 24
+    for row in range(20):
+        top = 80 + row * row_height
+        page.draw_line((60, top), (width - 60, top))
+        for left in column_lefts:
+            page.insert_text((left + 4, top + 16), get_sample_text(rng.randint(1, 2), rng), fontsize=9, fontname="helv")
+    page.draw_line((60, 80 + 20 * row_height), (width - 60, 80 + 20 * row_height))
+    for left in column_lefts + [width - 60]:
+        page.draw_line((left, 80), (left, 80 + 20 * row_height))
+
+    pdf_doc.save(pdf_path)
+    pdf_doc.close()
+
+def normalise_words(words:list) -> Counter:
+    normalised_words = (re.sub(r"[^\w]", "", word).lower() for word in words)
+    return Counter(word for word in normalised_words if word)
+
+def get_word_recall(ground_truth_words:Counter, ocr_words:Counter) -> float:
+    ground_truth_count = sum(ground_truth_words.values())
+    if not ground_truth_count: return None
+    return sum((ground_truth_words & ocr_words).values()) / ground_truth_count
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare Tesseract OCR with a fixed page segmentation mode (psm 11) and with the mode chosen per page from its layout, on throughput and word recall against the PDF text layer')
+    parser.add_argument('--input_files', nargs='*', default=[], help='PDF files with a text layer. Synthetic pages are used if none are given')
+    parser.add_argument('--page_max', type=int, default=10, help='Maximum pages to use from each PDF. 0 uses all pages')
+    parser.add_argument('--dpi', type=float, default=300.0, help='DPI used to render pages')
+    parser.add_argument('--ocr_backend', default=TESSERACT_OCR_BACKEND, help="'pytesseract' or 'tesserocr'")
+    parser.add_argument('--output_file', default='', help='Optional csv file path for the results by page')
+
+    args = parser.parse_args()
+
+    input_files = args.input_files
+    temp_folder = None
+    if not input_files:
+        temp_folder = tempfile.TemporaryDirectory(prefix="page_segmentation_benchmark_")
+        input_files = [os.path.join(temp_folder.name, "synthetic_layouts.pdf")]
+        create_synthetic_pdf(input_files[0])
+
+    image_preprocessor = get_image_preprocessor()
+    results = []
+
+    try:
+        for input_file in input_files:
+            with pymupdf.open(input_file) as pdf_doc:
+                page_texts = [[word[4] for word in page.get_text("words")] for page in pdf_doc]
+
+            page_count = min(len(page_texts), args.page_max) if args.page_max else len(page_texts)
+
+            for page_num in range(page_count):
+                image = render_pdf_page_with_pymupdf(input_file, page_num, args.dpi)
+                ground_truth_words = normalise_words(page_texts[page_num])
+
+                tic = time.perf_counter()
+                fixed_ocr_results = perform_tesseract_ocr(image, fixed_tesseract_config, image_preprocessor, args.ocr_backend)
+                fixed_seconds = time.perf_counter() - tic
+
+                # Layout classification is included in the adaptive time
+                tic = time.perf_counter()
+                adaptive_tesseract_config, layout_decision = choose_tesseract_config_for_page(image, fixed_tesseract_config)
+                adaptive_ocr_results = perform_tesseract_ocr(image, adaptive_tesseract_config, image_preprocessor, args.ocr_backend)
+                adaptive_seconds = time.perf_counter() - tic
+
+                fixed_recall = get_word_recall(ground_truth_words, normalise_words([result.text for result in fixed_ocr_results]))
+                adaptive_recall = get_word_recall(ground_truth_words, normalise_words([result.text for result in adaptive_ocr_results]))
+
+                results.append({"file": os.path.basename(input_file), "page": page_num + 1,
+                                "layout": layout_decision["layout"], "psm": layout_decision["psm"],
+                                "ground_truth_words": sum(ground_truth_words.values()),
+                                "fixed_seconds": round(fixed_seconds, 3), "adaptive_seconds": round(adaptive_seconds, 3),
+                                "fixed_recall": round(fixed_recall, 4) if fixed_recall is not None else None,
+                                "adaptive_recall": round(adaptive_recall, 4) if adaptive_recall is not None else None})
+    finally:
+        if temp_folder: temp_folder.cleanup()
+
+    results_df = pd.DataFrame(results)
+
+    print(results_df.to_string(index=False))
+
+    summary_df = results_df.groupby("layout").agg(pages=("page", "count"),
+                                                  fixed_seconds=("fixed_seconds", "sum"), adaptive_seconds=("adaptive_seconds", "sum"),
+                                                  fixed_recall=("fixed_recall", "mean"), adaptive_recall=("adaptive_recall", "mean")).reset_index()
+    summary_df["fixed_pages_per_second"] = (summary_df["pages"] / summary_df["fixed_seconds"]).round(2)
+    summary_df["adaptive_pages_per_second"] = (summary_df["pages"] / summary_df["adaptive_seconds"]).round(2)
+
+    print("\nBy layout:")
+    print(summary_df.round(4).to_string(index=False))
+    print(f"\nAll pages: fixed psm 11 {len(results_df) / results_df['fixed_seconds'].sum():.2f} pages/second, mean recall {results_df['fixed_recall'].mean():.4f}; "
+          f"adaptive {len(results_df) / results_df['adaptive_seconds'].sum():.2f} pages/second, mean recall {results_df['adaptive_recall'].mean():.4f}")
+
+    if args.output_file:
+        results_df.to_csv(args.output_file, index=None)
+
+if __name__ == "__main__":
+    main()
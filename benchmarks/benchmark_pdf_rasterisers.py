@@ -0,0 +1,73 @@
+# Run from the app folder, e.g. python -m benchmarks.benchmark_pdf_rasterisers --input_file example.pdf --page_max 20
+
+import argparse
+import os
+import time
+import shutil
+import tempfile
+import pandas as pd
+from pdf2image import convert_from_path, pdfinfo_from_path
+from tools.file_conversion import convert_pdf_to_images, render_pdf_page_with_pymupdf
+
+rasterisers = ["pdf2image", "pymupdf"]
+
+def time_in_memory_render(pdf_path:str, rasteriser:str, page_numbers:list, image_dpi:float) -> float:
+    '''
+    Time rendering pages to in-memory greyscale images one after another in this process, without writing them to disk.
+    '''
+    tic = time.perf_counter()
+    for page_num in page_numbers:
+        if rasteriser == "pymupdf":
+            render_pdf_page_with_pymupdf(pdf_path, page_num, image_dpi)
+        else:
+            convert_from_path(pdf_path, first_page=page_num+1, last_page=page_num+1, dpi=image_dpi, use_cropbox=False, use_pdftocairo=False)[0].convert("L")
+    return time.perf_counter() - tic
+
+def time_convert_pdf_to_images(pdf_path:str, rasteriser:str, page_min:int, page_max:int, image_dpi:float, num_workers:int) -> float:
+    '''
+    Time the full page image creation step used by the app (render, save png, check size) into an empty folder, so that no existing images are reused.
+    '''
+    temp_input_folder = tempfile.mkdtemp(prefix="rasteriser_benchmark_")
+    try:
+        tic = time.perf_counter()
+        convert_pdf_to_images(pdf_path, page_min=page_min, page_max=page_max, image_dpi=image_dpi, num_threads=num_workers, input_folder=temp_input_folder, rasteriser=rasteriser)
+        return time.perf_counter() - tic
+    finally:
+        shutil.rmtree(temp_input_folder, ignore_errors=True)
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare pages/second of the pdf2image and PyMuPDF PDF rasterisers')
+    parser.add_argument('--input_file', required=True, help='Path to input PDF file')
+    parser.add_argument('--page_min', type=int, default=0, help='First page to render (zero-indexed)')
+    parser.add_argument('--page_max', type=int, default=0, help='Page to stop rendering at. 0 renders to the end of the document')
+    parser.add_argument('--dpi', type=float, default=300.0, help='Image DPI')
+    parser.add_argument('--workers', type=int, default=8, help='Number of threads (pdf2image) or processes (PyMuPDF) used by convert_pdf_to_images')
+    parser.add_argument('--repeats', type=int, default=1, help='Number of times to repeat each measurement. The fastest run is reported')
+    parser.add_argument('--output_file', default='', help='Optional csv file path for the results')
+
+    args = parser.parse_args()
+
+    page_count = pdfinfo_from_path(args.input_file)['Pages']
+    page_max = args.page_max if args.page_max else page_count
+    page_numbers = list(range(args.page_min, page_max))
+
+    print(f"Benchmarking {len(page_numbers)} pages of {os.path.basename(args.input_file)} at {args.dpi} DPI")
+
+    results = []
+
+    for rasteriser in rasterisers:
+        in_memory_seconds = min(time_in_memory_render(args.input_file, rasteriser, page_numbers, args.dpi) for _ in range(args.repeats))
+        results.append({"rasteriser": rasteriser, "measurement": "in-memory render, single worker", "pages": len(page_numbers), "seconds": round(in_memory_seconds, 3), "pages_per_second": round(len(page_numbers) / in_memory_seconds, 2)})
+
+        full_seconds = min(time_convert_pdf_to_images(args.input_file, rasteriser, args.page_min, page_max, args.dpi, args.workers) for _ in range(args.repeats))
+        results.append({"rasteriser": rasteriser, "measurement": f"convert_pdf_to_images, {args.workers} workers", "pages": len(page_numbers), "seconds": round(full_seconds, 3), "pages_per_second": round(len(page_numbers) / full_seconds, 2)})
+
+    results_df = pd.DataFrame(results)
+
+    print(results_df.to_string(index=False))
+
+    if args.output_file:
+        results_df.to_csv(args.output_file, index=None)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+# Run from the app folder, e.g. python -m benchmarks.benchmark_textract_block_graph --lines 500 --words_per_line 12
+
+import argparse
+import time
+import uuid
+import random
+import pandas as pd
+from tools.aws_textract import json_to_ocrresult, TextractBlockGraph
+
+def create_synthetic_textract_page(number_of_lines:int, words_per_line:int, handwriting_share:float=0.05, signature_share:float=0.01, seed:int=42) -> dict:
+    '''
+    Create a Textract-style response for a single dense page, with LINE blocks that have CHILD relationships to their WORD blocks, some handwritten words, and some SIGNATURE blocks.
+    '''
+    rng = random.Random(seed)
+    blocks = [{"BlockType": "PAGE", "Id": str(uuid.UUID(int=rng.getrandbits(128))), "Geometry": {"BoundingBox": {"Left": 0.0, "Top": 0.0, "Width": 1.0, "Height": 1.0}}}]
+
+    for line_no in range(number_of_lines):
+        line_top = line_no / max(number_of_lines, 1)
+
+        if rng.random() < signature_share:
+            blocks.append({"BlockType": "SIGNATURE", "Id": str(uuid.UUID(int=rng.getrandbits(128))), "Confidence": 90.0,
+                           "Geometry": {"BoundingBox": {"Left": 0.6, "Top": line_top, "Width": 0.2, "Height": 0.8 / number_of_lines}}})
+            continue
+
+        word_blocks = []
+        for word_no in range(words_per_line):
+            word_blocks.append({"BlockType": "WORD", "Id": str(uuid.UUID(int=rng.getrandbits(128))), "Text": f"word{word_no}", "Confidence": 99.0,
+                                "TextType": "HANDWRITING" if rng.random() < handwriting_share else "PRINTED",
+                                "Geometry": {"BoundingBox": {"Left": word_no / words_per_line, "Top": line_top, "Width": 0.8 / words_per_line, "Height": 0.8 / number_of_lines}}})
+
+        blocks.append({"BlockType": "LINE", "Id": str(uuid.UUID(int=rng.getrandbits(128))), "Text": " ".join(word["Text"] for word in word_blocks), "Confidence": 99.0,
+                       "Geometry": {"BoundingBox": {"Left": 0.0, "Top": line_top, "Width": 1.0, "Height": 0.8 / number_of_lines}},
+                       "Relationships": [{"Type": "CHILD", "Ids": [word["Id"] for word in word_blocks]}]})
+        blocks.extend(word_blocks)
+
+    return {"Blocks": blocks}
+
+def resolve_line_words_by_scanning(text_blocks:list) -> int:
+    '''
+    The previous way of finding the words of each line, searching the whole block list for every child id. Kept here as a baseline.
+    '''
+    words_found = 0
+    for text_block in text_blocks:
+        if text_block["BlockType"] != "LINE": continue
+        for relationship in text_block.get("Relationships", []):
+            if relationship["Type"] != "CHILD": continue
+            for child_id in relationship["Ids"]:
+                child_block = next((block for block in text_blocks if block["Id"] == child_id), None)
+                if child_block and child_block["BlockType"] == "WORD": words_found += 1
+    return words_found
+
+def resolve_line_words_with_graph(text_blocks:list) -> int:
+    block_graph = TextractBlockGraph(text_blocks)
+    return sum(len(block_graph.get_child_words(line)) for line in block_graph.get_blocks_of_type("LINE"))
+
+def time_function(function, repeats:int) -> float:
+    timings = []
+    for _ in range(repeats):
+        tic = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - tic)
+    return min(timings)
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark resolving Textract LINE/WORD relationships on a synthetic dense page')
+    parser.add_argument('--lines', type=int, nargs='+', default=[100, 250, 500], help='Numbers of lines per page to test')
+    parser.add_argument('--words_per_line', type=int, default=12, help='Words in each line')
+    parser.add_argument('--repeats', type=int, default=3, help='Number of times to repeat each measurement. The fastest run is reported')
+    parser.add_argument('--output_file', default='', help='Optional csv file path for the results')
+
+    args = parser.parse_args()
+
+    results = []
+
+    for number_of_lines in args.lines:
+        page_json = create_synthetic_textract_page(number_of_lines, args.words_per_line)
+        text_blocks = page_json["Blocks"]
+
+        scan_seconds = time_function(lambda: resolve_line_words_by_scanning(text_blocks), args.repeats)
+        graph_seconds = time_function(lambda: resolve_line_words_with_graph(text_blocks), args.repeats)
+        conversion_seconds = time_function(lambda: json_to_ocrresult(page_json, 2480, 3508, 1), args.repeats)
+
+        results.append({"lines": number_of_lines, "blocks": len(text_blocks),
+                        "scan_lookup_seconds": round(scan_seconds, 4),
+                        "graph_lookup_seconds": round(graph_seconds, 4),
+                        "lookup_speedup": round(scan_seconds / graph_seconds, 1) if graph_seconds else None,
+                        "json_to_ocrresult_seconds": round(conversion_seconds, 4)})
+
+    results_df = pd.DataFrame(results)
+
+    print(results_df.to_string(index=False))
+
+    if args.output_file:
+        results_df.to_csv(args.output_file, index=None)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+# Run from the app folder, e.g. python -m benchmarks.benchmark_textract_submission --pages 40 --latency 0.5 --quota 5 --max_in_flight 8
+# No AWS account is needed. Requests go to a local stub of the Textract API that adds a fixed latency to each call and throttles requests above a quota, as the real service does.
+
+import argparse
+import io
+import json
+import time
+import threading
+import uuid
+import boto3
+import pandas as pd
+from PIL import Image
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from tools.aws_textract import analyse_page_with_textract, TextractPageSubmitter, TokenBucketRateLimiter, textract_client_config
+
+class StubTextractState:
+    '''
+    Shared settings and request counts for the stub Textract server.
+    '''
+    def __init__(self, latency:float, quota:float):
+        self.latency = latency
+        self.quota = quota
+        self.lock = threading.Lock()
+        self.request_times = []
+        self.requests = 0
+        self.throttled = 0
+
+    def reset_counts(self):
+        with self.lock:
+            self.request_times = []
+            self.requests = 0
+            self.throttled = 0
+
+    def is_over_quota(self) -> bool:
+        # Allow at most quota requests in any one second window
+        with self.lock:
+            now = time.monotonic()
+            self.request_times = [request_time for request_time in self.request_times if now - request_time < 1.0]
+            self.requests += 1
+
+            if len(self.request_times) >= self.quota:
+                self.throttled += 1
+                return True
+
+            self.request_times.append(now)
+            return False
+
+def create_stub_textract_handler(state:StubTextractState):
+
+    class StubTextractHandler(BaseHTTPRequestHandler):
+        '''
+        Answers DetectDocumentText and AnalyzeDocument calls (AWS JSON 1.1 protocol) with a single LINE and WORD block.
+        '''
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            target = self.headers.get("X-Amz-Target", "")
+
+            if target not in ("Textract.DetectDocumentText", "Textract.AnalyzeDocument"):
+                self.send_json(400, {"__type": "UnknownOperationException", "message": target})
+                return
+
+            if state.is_over_quota():
+                self.send_json(400, {"__type": "ThrottlingException", "message": "Rate exceeded"})
+                return
+
+            time.sleep(state.latency)
+
+            bounding_box = {"Left": 0.1, "Top": 0.1, "Width": 0.3, "Height": 0.05}
+            self.send_json(200, {"DocumentMetadata": {"Pages": 1},
+                                 "Blocks": [{"BlockType": "LINE", "Id": "line-1", "Text": "Stub text", "Confidence": 99.0, "Geometry": {"BoundingBox": bounding_box},
+                                             "Relationships": [{"Type": "CHILD", "Ids": ["word-1"]}]},
+                                            {"BlockType": "WORD", "Id": "word-1", "Text": "Stub", "Confidence": 99.0, "TextType": "PRINTED", "Geometry": {"BoundingBox": bounding_box}}]})
+
+        def send_json(self, status_code:int, body:dict):
+            response_bytes = json.dumps(body).encode("utf-8")
+            self.send_response(status_code)
+            self.send_header("Content-Type", "application/x-amz-json-1.1")
+            # boto3 reads the request ID from this header into ResponseMetadata, as Textract sends it
+            self.send_header("x-amzn-RequestId", str(uuid.uuid4()))
+            self.send_header("Content-Length", str(len(response_bytes)))
+            self.end_headers()
+            self.wfile.write(response_bytes)
+
+        def log_message(self, format, *args):
+            pass
+
+    return StubTextractHandler
+
+def start_stub_textract_server(state:StubTextractState):
+    '''
+    Start the stub Textract server on a free local port in a background thread. Returns the server, which should be shut down when finished, and a Textract client that sends requests to it.
+    '''
+    server = ThreadingHTTPServer(("127.0.0.1", 0), create_stub_textract_handler(state))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    endpoint_url = f"http://127.0.0.1:{server.server_address[1]}"
+    client = boto3.client('textract', endpoint_url=endpoint_url, region_name="eu-west-2", aws_access_key_id="stub", aws_secret_access_key="stub", config=textract_client_config)
+
+    return server, client
+
+def create_page_bytes() -> bytes:
+    image_buffer = io.BytesIO()
+    Image.new("L", (850, 1100), 255).save(image_buffer, format="PNG")
+    return image_buffer.getvalue()
+
+def run_sequential(client, page_numbers, page_bytes:bytes, max_retries:int):
+    for page_no in page_numbers:
+        analyse_page_with_textract(page_bytes, str(page_no + 1), client, [], max_retries=max_retries)
+
+def run_with_submitter(client, page_numbers, page_bytes:bytes, max_in_flight:int, requests_per_second:float, max_retries:int):
+    rate_limiter = TokenBucketRateLimiter(requests_per_second, burst=max(1, int(requests_per_second)))
+    with TextractPageSubmitter(page_numbers, lambda page_no: page_bytes, client, [], max_in_flight=max_in_flight, rate_limiter=rate_limiter, max_retries=max_retries) as textract_submitter:
+        for page_no in page_numbers:
+            textract_submitter.get_page_result(page_no)
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark sending pages to a local stub of AWS Textract one at a time compared with several in flight under a rate limit')
+    parser.add_argument('--pages', type=int, default=40, help='Number of pages to send')
+    parser.add_argument('--latency', type=float, default=0.5, help='Seconds the stub service takes to answer each request')
+    parser.add_argument('--quota', type=float, default=5, help='Requests per second the stub service accepts before throttling')
+    parser.add_argument('--max_in_flight', type=int, nargs='+', default=[2, 4, 8], help='Numbers of pages in flight to test')
+    parser.add_argument('--requests_per_second', type=float, default=0, help='Rate limit for the submitter. Defaults to the stub quota')
+    parser.add_argument('--max_retries', type=int, default=6, help='Retries for throttled requests')
+    parser.add_argument('--output_file', default='', help='Optional csv file path for the results')
+
+    args = parser.parse_args()
+
+    requests_per_second = args.requests_per_second or args.quota
+
+    state = StubTextractState(args.latency, args.quota)
+    server, client = start_stub_textract_server(state)
+
+    page_numbers = list(range(args.pages))
+    page_bytes = create_page_bytes()
+
+    runs = [("sequential", 1, lambda: run_sequential(client, page_numbers, page_bytes, args.max_retries))]
+    for max_in_flight in args.max_in_flight:
+        runs.append(("submitter", max_in_flight, lambda max_in_flight=max_in_flight: run_with_submitter(client, page_numbers, page_bytes, max_in_flight, requests_per_second, args.max_retries)))
+
+    results = []
+
+    try:
+        for method, max_in_flight, run in runs:
+            # Start each run with an empty quota window
+            time.sleep(1.0)
+            state.reset_counts()
+
+            tic = time.perf_counter()
+            run()
+            seconds = time.perf_counter() - tic
+
+            results.append({"method": method, "max_in_flight": max_in_flight, "pages": args.pages,
+                            "seconds": round(seconds, 2),
+                            "pages_per_second": round(args.pages / seconds, 2),
+                            "requests": state.requests,
+                            "throttled_retries": state.throttled})
+    finally:
+        server.shutdown()
+
+    results_df = pd.DataFrame(results)
+
+    print(f"Stub latency {args.latency}s, quota {args.quota} requests per second, submitter limited to {requests_per_second} requests per second")
+    print(results_df.to_string(index=False))
+
+    if args.output_file:
+        results_df.to_csv(args.output_file, index=None)
+
+if __name__ == "__main__":
+    main()
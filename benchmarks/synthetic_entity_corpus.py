@@ -0,0 +1,117 @@
+# Run from the app folder, e.g. python -m benchmarks.synthetic_entity_corpus --pages 100
+# Writes the synthetic corpus bundled with the benchmarks: pages of letter-like text with the position and type of every entity in them, for measuring entity recall. All names, addresses and contact details are made up.
+
+import os
+import json
+import random
+import argparse
+
+default_corpus_file = os.path.join(os.path.dirname(__file__), "data", "synthetic_entity_corpus.jsonl")
+
+first_names = ["Jane", "John", "Amara", "Wei", "Fatima", "Oliver", "Priya", "Tomasz", "Siobhan", "Kwame", "Ingrid", "Mohammed", "Chloe", "Rhys", "Aisha", "George"]
+last_names = ["Example", "Smith", "Okafor", "Chen", "Hussain", "Brown", "Patel", "Nowak", "O'Neill", "Mensah", "Larsen", "Rahman", "Davies", "Evans", "Campbell", "Taylor"]
+cities = ["London", "Manchester", "Leeds", "Bristol", "Cardiff", "Glasgow", "Birmingham", "Norwich", "Sheffield", "Belfast"]
+street_words = ["Station", "Church", "Mill", "Park", "Victoria", "Queens", "Green", "Orchard"]
+street_types = ["Street", "Road", "Lane", "Avenue", "Close", "Crescent", "Way", "Terrace"]
+postcodes = ["SW1A 1AA", "M1 1AE", "B33 8TH", "CR2 6XH", "DN55 1PT", "LS1 4AP", "CF10 1EP", "G2 1DY", "NR1 3JU", "BT1 5GS"]
+months = ["January", "February", "March", "April", "May", "June", "July", "August", "September", "October", "November", "December"]
+
+entity_generators = {
+    "PERSON": lambda rng: f"{rng.choice(first_names)} {rng.choice(last_names)}",
+    "LOCATION": lambda rng: rng.choice(cities),
+    "STREETNAME": lambda rng: f"{rng.randint(1, 250)} {rng.choice(street_words)} {rng.choice(street_types)}",
+    "UKPOSTCODE": lambda rng: rng.choice(postcodes),
+    "PHONE_NUMBER": lambda rng: rng.choice([f"020 7946 {rng.randint(0, 999):04d}", f"07700 900{rng.randint(0, 999):03d}", f"0161 496 {rng.randint(0, 999):04d}"]),
+    "EMAIL_ADDRESS": lambda rng: f"{rng.choice(first_names).lower()}.{rng.choice(last_names).lower().replace(chr(39), '')}@example.com",
+    "DATE_TIME": lambda rng: f"{rng.randint(1, 28)} {rng.choice(months)} {rng.randint(2015, 2025)}",
+}
+
+# Sentences with entity placeholders, and sentences with no entities in them
+entity_templates = [
+    "Dear {PERSON},",
+    "Thank you for your letter of {DATE_TIME} about the property at {STREETNAME}, {LOCATION} {UKPOSTCODE}.",
+    "{PERSON} called on {PHONE_NUMBER} to ask about the progress of the planning application.",
+    "Please reply to {EMAIL_ADDRESS} or write to us at {STREETNAME}, {LOCATION} {UKPOSTCODE}.",
+    "The case officer, {PERSON}, visited the site in {LOCATION} on {DATE_TIME} with {PERSON}.",
+    "Yours sincerely, {PERSON}",
+    "If you have any questions, contact {PERSON} on {PHONE_NUMBER} or by email at {EMAIL_ADDRESS}.",
+    "The applicant moved from {LOCATION} to {STREETNAME} on {DATE_TIME}.",
+]
+
+filler_templates = [
+    "The committee considered the report and agreed to defer a decision until further information is received.",
+    "Conditions about materials, drainage and working hours will be attached to any permission granted.",
+    "This letter does not affect your right to appeal against the decision within the time allowed.",
+    "The officer recommended approval of the application subject to the conditions set out below.",
+    "No objections were received during the consultation period.",
+    "A copy of this letter has been placed on the public file.",
+]
+
+def fill_template(template:str, rng:random.Random):
+    '''
+    Fill the placeholders in a template with generated entities. Returns the text and the start, end and type of each entity in it.
+    '''
+    text = ""
+    entities = []
+    remaining = template
+
+    while "{" in remaining:
+        before, rest = remaining.split("{", 1)
+        entity_type, remaining = rest.split("}", 1)
+        text += before
+        entity_text = entity_generators[entity_type](rng)
+        entities.append([len(text), len(text) + len(entity_text), entity_type])
+        text += entity_text
+
+    return text + remaining, entities
+
+def create_synthetic_corpus(page_count:int=100, lines_per_page:int=15, entity_line_share:float=0.5, seed:int=0) -> list:
+    '''
+    Create pages of synthetic text. Lines are joined with spaces, as the lines of a page are when it is analysed, and entity positions are given in the page text.
+    '''
+    rng = random.Random(seed)
+    pages = []
+
+    for page_no in range(page_count):
+        page_text = ""
+        page_entities = []
+
+        for _ in range(lines_per_page):
+            if rng.random() < entity_line_share:
+                line_text, line_entities = fill_template(rng.choice(entity_templates), rng)
+            else:
+                line_text, line_entities = rng.choice(filler_templates), []
+
+            if page_text: page_text += " "
+            page_entities.extend([start + len(page_text), end + len(page_text), entity_type] for start, end, entity_type in line_entities)
+            page_text += line_text
+
+        pages.append({"page": page_no + 1, "text": page_text, "entities": page_entities})
+
+    return pages
+
+def load_synthetic_corpus(corpus_file:str=default_corpus_file) -> list:
+    with open(corpus_file, "r", encoding="utf-8") as corpus:
+        return [json.loads(line) for line in corpus if line.strip()]
+
+def write_synthetic_corpus(pages:list, corpus_file:str=default_corpus_file):
+    os.makedirs(os.path.dirname(corpus_file), exist_ok=True)
+    with open(corpus_file, "w", encoding="utf-8") as corpus:
+        for page in pages:
+            corpus.write(json.dumps(page) + "\n")
+
+def main():
+    parser = argparse.ArgumentParser(description='Write the synthetic entity corpus used by the model tier benchmark')
+    parser.add_argument('--pages', type=int, default=100, help='Number of pages')
+    parser.add_argument('--lines_per_page', type=int, default=15, help='Lines of text on each page')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed')
+    parser.add_argument('--output_file', default=default_corpus_file, help='Path of the corpus file')
+
+    args = parser.parse_args()
+
+    pages = create_synthetic_corpus(args.pages, args.lines_per_page, seed=args.seed)
+    write_synthetic_corpus(pages, args.output_file)
+    print(f"Wrote {len(pages)} pages with {sum(len(page['entities']) for page in pages)} entities to {args.output_file}")
+
+if __name__ == "__main__":
+    main()
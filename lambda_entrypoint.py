@@ -19,6 +19,15 @@ if run_direct_mode == "0":
         # Gradio App execution
         from app import app, max_queue_size, max_file_size  # Replace with actual import if needed
         from tools.auth import authenticate_user
+        from tools.analysis_profiles import measure_analysis_profiles_at_start_up
+        from tools.analysis_worker_pool import start_analysis_worker_pool
+        from tools.tesseract_engine_pool import start_tesseract_engine_pool
+
+        measure_analysis_profiles_at_start_up()
+
+        # Fork the text analysis and Tesseract OCR worker processes, if they are used, before the server starts its threads
+        start_analysis_worker_pool()
+        start_tesseract_engine_pool()
 
         if os.getenv("COGNITO_AUTH", "0") == "1":
             app.queue(max_size=max_queue_size).launch(show_error=True, auth=authenticate_user, max_file_size=max_file_size)
@@ -0,0 +1,11 @@
+import importlib
+import pytest
+
+def import_module_or_skip(module_name:str):
+    '''
+    Import a module of the app, skipping the test if the module, or a model or service it loads when imported, is not available.
+    '''
+    try:
+        return importlib.import_module(module_name)
+    except (Exception, SystemExit) as e:
+        pytest.skip(f"Could not import {module_name}: {e}", allow_module_level=True)
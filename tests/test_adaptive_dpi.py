@@ -0,0 +1,30 @@
+import pymupdf
+from tests.helpers import import_module_or_skip
+
+adaptive_dpi = import_module_or_skip("tools.adaptive_dpi")
+
+dpi_settings = {"target_text_pixels": 30, "min_dpi": 150, "max_dpi": 400, "dpi_step": 25, "unknown_text_dpi": 300}
+
+def test_dpi_gives_target_text_height():
+    # 10pt text is 30 pixels tall at 216 DPI, rounded up to a multiple of 25
+    assert adaptive_dpi.get_dpi_for_text_size(10, **dpi_settings) == 225
+    assert adaptive_dpi.get_dpi_for_text_size(4, **dpi_settings) == 400
+    assert adaptive_dpi.get_dpi_for_text_size(24, **dpi_settings) == 150
+
+def test_unknown_text_size_uses_default_dpi():
+    assert adaptive_dpi.get_dpi_for_text_size(None, **dpi_settings) == 300
+    assert adaptive_dpi.get_dpi_for_text_size(None) == float(adaptive_dpi.IMAGES_DPI)
+
+def test_page_without_text_is_rendered_at_default_dpi():
+    pdf_doc = pymupdf.open()
+    page = pdf_doc.new_page()
+
+    assert adaptive_dpi.choose_page_dpi(page) == float(adaptive_dpi.IMAGES_DPI)
+
+def test_text_layer_size_is_used_for_small_print():
+    pdf_doc = pymupdf.open()
+    page = pdf_doc.new_page()
+    page.insert_textbox(pymupdf.Rect(50, 50, 550, 700), "body text " * 200, fontsize=8)
+
+    assert adaptive_dpi.get_text_layer_text_size(page) == 8
+    assert adaptive_dpi.choose_page_dpi(page) == adaptive_dpi.get_dpi_for_text_size(8)
@@ -0,0 +1,162 @@
+import re
+import pytest
+from tests.helpers import import_module_or_skip
+
+analysis_cache_module = import_module_or_skip("tools.analysis_cache")
+from presidio_analyzer import RecognizerResult
+from tools.ocr_cache import OCRResultCache
+
+settings = {"method": "Local", "language": "en", "entities": ["PERSON", "STREET"]}
+
+entity_patterns = {"PERSON": re.compile(r"Smith"), "STREET": re.compile(r"High\s+Street")}
+
+class RegexAnalyser:
+    '''
+    Finds entities with regular expressions, and records the texts it was asked to analyse.
+    '''
+    def __init__(self):
+        self.analysed_texts = []
+
+    def analyse_text(self, text:str) -> list:
+        return sorted((RecognizerResult(entity_type, match.start(), match.end(), 0.85) for entity_type, pattern in entity_patterns.items() for match in pattern.finditer(text)),
+                      key=lambda result: (result.start, result.end))
+
+    def analyse_texts(self, texts:list) -> list:
+        self.analysed_texts.extend(texts)
+        return [self.analyse_text(text) for text in texts]
+
+def describe_results(pages_results) -> list:
+    return [[(result.entity_type, result.start, result.end) for result in page_results] for page_results in pages_results]
+
+def analyse_without_cache(pages_line_texts) -> list:
+    return describe_results([RegexAnalyser().analyse_text(" ".join(line_texts)) for line_texts in pages_line_texts])
+
+pages_line_texts = [["Letter to Mr Smith", "12 High Street", "Page 1"],
+                    ["Dear Mr Smith", "", "  Letter to Mr Smith"],
+                    ["Reply from Mrs Jones", "at 3 High", "Street, London"]]
+
+@pytest.fixture
+def analysis_cache():
+    return analysis_cache_module.AnalysisResultCache(memory_max_entries=100)
+
+def test_results_match_analysing_whole_pages(analysis_cache):
+    analyser = RegexAnalyser()
+
+    first_results = analysis_cache_module.analyse_pages_with_cache(analysis_cache, pages_line_texts, settings, analyser.analyse_texts)
+    second_results = analysis_cache_module.analyse_pages_with_cache(analysis_cache, pages_line_texts, settings, analyser.analyse_texts)
+
+    assert describe_results(first_results) == analyse_without_cache(pages_line_texts)
+    assert describe_results(second_results) == analyse_without_cache(pages_line_texts)
+
+def test_cached_lines_are_not_analysed_again(analysis_cache):
+    analyser = RegexAnalyser()
+    analysis_cache_module.analyse_pages_with_cache(analysis_cache, pages_line_texts, settings, analyser.analyse_texts)
+
+    # Pages with lines not in the cache are analysed whole, as they would be without the cache
+    assert analyser.analysed_texts == [" ".join(line_texts) for line_texts in pages_line_texts]
+
+    analyser.analysed_texts = []
+    analysis_cache_module.analyse_pages_with_cache(analysis_cache, pages_line_texts, settings, analyser.analyse_texts)
+
+    # The street split across two lines depends on both lines, so they are not cached and their page is analysed again
+    assert analyser.analysed_texts == ["Reply from Mrs Jones at 3 High Street, London"]
+
+def test_repeated_lines_on_a_new_page_use_cache(analysis_cache):
+    analyser = RegexAnalyser()
+    analysis_cache_module.analyse_pages_with_cache(analysis_cache, pages_line_texts[:1], settings, analyser.analyse_texts)
+    analyser.analysed_texts = []
+
+    # Leading whitespace is ignored when matching lines, and the results are moved to where the lines are on the new page
+    new_page = ["12 High Street", "", "   Letter to Mr Smith"]
+    results = analysis_cache_module.analyse_pages_with_cache(analysis_cache, [new_page], settings, analyser.analyse_texts)
+
+    assert analyser.analysed_texts == []
+    assert describe_results(results) == analyse_without_cache([new_page])
+
+def test_page_with_a_new_line_is_analysed_whole(analysis_cache):
+    analyser = RegexAnalyser()
+    analysis_cache_module.analyse_pages_with_cache(analysis_cache, pages_line_texts[:1], settings, analyser.analyse_texts)
+    analyser.analysed_texts = []
+
+    new_page = ["Attachment 2", "   Letter to Mr Smith"]
+    results = analysis_cache_module.analyse_pages_with_cache(analysis_cache, [new_page], settings, analyser.analyse_texts)
+
+    assert analyser.analysed_texts == ["Attachment 2    Letter to Mr Smith"]
+    assert describe_results(results) == analyse_without_cache([new_page])
+
+def test_settings_are_part_of_the_key(analysis_cache):
+    analyser = RegexAnalyser()
+    analysis_cache_module.analyse_pages_with_cache(analysis_cache, pages_line_texts[:1], settings, analyser.analyse_texts)
+    analyser.analysed_texts = []
+
+    analysis_cache_module.analyse_pages_with_cache(analysis_cache, pages_line_texts[:1], {**settings, "entities": ["PERSON"]}, analyser.analyse_texts)
+
+    assert analyser.analysed_texts == ["Letter to Mr Smith 12 High Street Page 1"]
+
+def test_lines_used_again_are_kept_on_disk(tmp_path):
+    disk_cache = OCRResultCache(str(tmp_path), max_size_mb=1)
+    analyser = RegexAnalyser()
+
+    first_cache = analysis_cache_module.AnalysisResultCache(memory_max_entries=100, disk_cache=disk_cache)
+    analysis_cache_module.analyse_pages_with_cache(first_cache, pages_line_texts[:1], settings, analyser.analyse_texts)
+    analysis_cache_module.analyse_pages_with_cache(first_cache, pages_line_texts[:1], settings, analyser.analyse_texts)
+    assert first_cache.get_stats()["disk_writes"] == 3
+
+    # A new cache, e.g. after the app restarts, finds the lines on disk
+    analyser.analysed_texts = []
+    second_cache = analysis_cache_module.AnalysisResultCache(memory_max_entries=100, disk_cache=disk_cache)
+    results = analysis_cache_module.analyse_pages_with_cache(second_cache, pages_line_texts[:1], settings, analyser.analyse_texts)
+
+    assert analyser.analysed_texts == []
+    assert second_cache.get_stats()["disk_hits"] == 3
+    assert describe_results(results) == analyse_without_cache(pages_line_texts[:1])
+
+class SpacyNerAnalyser(RegexAnalyser):
+    '''
+    Finds entities with a spaCy pipeline, so that the results depend on how the text is split into tokens and on the tokens around each entity.
+    '''
+    def __init__(self, nlp):
+        super().__init__()
+        self.nlp = nlp
+
+    def analyse_text(self, text:str) -> list:
+        return [RecognizerResult(ent.label_, ent.start_char, ent.end_char, 0.85) for ent in self.nlp(text).ents]
+
+def create_ner_pipeline():
+    '''
+    A blank English pipeline with an entity ruler, and a component that only marks a name as a person if the text opens with a greeting, as NER models use the context of a whole page.
+    '''
+    spacy = pytest.importorskip("spacy")
+    from spacy.language import Language
+    from spacy.tokens import Span
+
+    @Language.component("greeted_person")
+    def greeted_person(doc):
+        if len(doc) and doc[0].lower_ == "dear":
+            greeted_names = [Span(doc, token.i, token.i + 1, label="PERSON") for token in doc if token.text == "Smith" and not any(ent.start <= token.i < ent.end for ent in doc.ents)]
+            doc.ents = list(doc.ents) + greeted_names
+        return doc
+
+    nlp = spacy.blank("en")
+    entity_ruler = nlp.add_pipe("entity_ruler")
+    entity_ruler.add_patterns([{"label": "STREET", "pattern": [{"IS_DIGIT": True}, {"IS_TITLE": True}, {"LOWER": "street"}]},
+                               {"label": "PERSON", "pattern": [{"LOWER": {"IN": ["mr", "mrs"]}}, {"LOWER": "jones"}]}])
+    nlp.add_pipe("greeted_person")
+    return nlp
+
+def test_ner_results_match_analysing_whole_pages(analysis_cache):
+    analyser = SpacyNerAnalyser(create_ner_pipeline())
+    ner_pages_line_texts = [["Letter to Mr Smith", "Reply from Mrs Jones"],
+                            ["Dear Sir", "Letter to Mr Smith", "Reply from Mrs Jones"],
+                            ["Dear Mr Smith", "at 3 High", "Street, London"]]
+
+    def analyse_pages_without_cache(pages):
+        return describe_results([analyser.analyse_text(" ".join(line_texts)) for line_texts in pages])
+
+    first_results = analysis_cache_module.analyse_pages_with_cache(analysis_cache, ner_pages_line_texts, settings, analyser.analyse_texts)
+    second_results = analysis_cache_module.analyse_pages_with_cache(analysis_cache, ner_pages_line_texts, settings, analyser.analyse_texts)
+
+    assert describe_results(first_results) == analyse_pages_without_cache(ner_pages_line_texts)
+    assert describe_results(second_results) == analyse_pages_without_cache(ner_pages_line_texts)
+    # The name on the second page is only a person in the context of the greeting on the line before
+    assert ("PERSON", 22, 27) in describe_results(first_results)[1]
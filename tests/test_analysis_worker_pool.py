@@ -0,0 +1,78 @@
+import os
+import signal
+import multiprocessing
+import pytest
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+from tests.helpers import import_module_or_skip
+
+analysis_worker_pool = import_module_or_skip("tools.analysis_worker_pool")
+
+texts = ["Please contact Mr Smith at 12 High Street.", "No personal details here.", "Call Jane on 07700 900123."]
+
+class BrokenPool:
+    '''
+    A pool whose worker processes have died, failing requests either when they are sent or when their results are collected.
+    '''
+    def __init__(self, fail_on_submit:bool=False):
+        self.fail_on_submit = fail_on_submit
+        self.submitted = 0
+        self.closed = False
+
+    def submit(self, *args, **kwargs) -> Future:
+        if self.fail_on_submit: raise BrokenProcessPool("worker died")
+        self.submitted += 1
+        future = Future()
+        future.set_exception(BrokenProcessPool("worker died"))
+        return future
+
+    def close(self, wait:bool=True):
+        self.closed = True
+
+def describe_results(results) -> list:
+    return [[(result.entity_type, result.start, result.end) for result in text_results] for text_results in results]
+
+def get_in_process_results() -> list:
+    return describe_results(analysis_worker_pool.analyse_texts(texts, "en", "full", None, analysis_worker_pool.SPACY_MODEL_TIER, 1, {}))
+
+@pytest.fixture
+def no_started_pool(monkeypatch):
+    monkeypatch.setattr(analysis_worker_pool, "_analysis_worker_pool", None)
+    monkeypatch.setattr(analysis_worker_pool, "USE_ANALYSIS_WORKER_POOL", "True")
+
+def test_job_analyser_does_not_start_pool(no_started_pool):
+    job_analyser = analysis_worker_pool.get_job_analyser("full", None, analysis_worker_pool.SPACY_MODEL_TIER)
+
+    assert not isinstance(job_analyser, analysis_worker_pool.PooledAnalyzer)
+    assert analysis_worker_pool._analysis_worker_pool is None
+
+@pytest.mark.parametrize("fail_on_submit", [False, True])
+def test_broken_pool_is_discarded_and_texts_analysed_in_process(no_started_pool, monkeypatch, fail_on_submit):
+    broken_pool = BrokenPool(fail_on_submit)
+    monkeypatch.setattr(analysis_worker_pool, "_analysis_worker_pool", broken_pool)
+
+    job_analyser = analysis_worker_pool.get_job_analyser("full", None, analysis_worker_pool.SPACY_MODEL_TIER)
+    assert isinstance(job_analyser, analysis_worker_pool.PooledAnalyzer)
+
+    results = job_analyser.analyze_batch(texts, "en")
+
+    assert describe_results(results) == get_in_process_results()
+    assert broken_pool.closed
+    assert analysis_worker_pool._analysis_worker_pool is None
+    # Later chunks and jobs are analysed in this process without trying the pool again
+    assert broken_pool.submitted <= 1
+    assert not isinstance(analysis_worker_pool.get_job_analyser("full", None, analysis_worker_pool.SPACY_MODEL_TIER), analysis_worker_pool.PooledAnalyzer)
+
+@pytest.mark.skipif("fork" not in multiprocessing.get_all_start_methods(), reason="Needs an OS that can fork processes")
+def test_killed_worker_falls_back_to_in_process_analysis(no_started_pool):
+    pool = analysis_worker_pool.start_analysis_worker_pool(max_workers=1)
+    try:
+        job_analyser = analysis_worker_pool.get_job_analyser("full", None, analysis_worker_pool.SPACY_MODEL_TIER)
+        assert describe_results(job_analyser.analyze_batch(texts, "en")) == get_in_process_results()
+
+        os.kill(pool.worker_pids[0], signal.SIGKILL)
+
+        assert describe_results(job_analyser.analyze_batch(texts, "en")) == get_in_process_results()
+        assert analysis_worker_pool._analysis_worker_pool is None
+    finally:
+        pool.close(wait=False)
@@ -0,0 +1,70 @@
+import os
+import subprocess
+import sys
+from PIL import Image, ImageDraw
+from tests.helpers import import_module_or_skip
+
+blank_page_detector_module = import_module_or_skip("tools.blank_page_detector")
+
+def make_page(paper_colour:int=250, size=(1700, 2200)) -> Image.Image:
+    return Image.new("L", size, paper_colour)
+
+def test_blank_page_detection_is_off_by_default():
+    # Run in a new interpreter, as importing the config sets environment variables for this one
+    environment = {key: value for key, value in os.environ.items() if key not in ("USE_BLANK_PAGE_DETECTION", "APP_CONFIG_PATH")}
+    output = subprocess.run([sys.executable, "-c", "from tools.config import USE_BLANK_PAGE_DETECTION; print(USE_BLANK_PAGE_DETECTION)"],
+                            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))), env=environment, capture_output=True, text=True, check=True).stdout
+
+    assert output.strip().splitlines()[-1] == "False"
+
+def test_empty_page_with_noise_is_blank():
+    page = make_page()
+    page_pixels = page.load()
+    # Isolated single pixels, e.g. scanner noise, are not marks
+    for x, y in [(100, 100), (900, 1300), (1500, 2000)]: page_pixels[x, y] = 0
+
+    assert blank_page_detector_module.BlankPageDetector().is_blank_page(page, 0)
+
+def test_small_mark_near_page_edge_is_not_blank():
+    # A page number in the bottom corner, inside the area that used to be left out as margin
+    page = make_page()
+    ImageDraw.Draw(page).rectangle([1640, 2150, 1652, 2170], fill=0)
+
+    assert not blank_page_detector_module.BlankPageDetector().is_blank_page(page, 0)
+
+def test_faint_mark_is_not_blank():
+    # Pencil that is only 40 levels darker than the paper
+    page = make_page()
+    ImageDraw.Draw(page).line([(400, 1000), (700, 1010)], fill=210, width=3)
+
+    assert not blank_page_detector_module.BlankPageDetector().is_blank_page(page, 0)
+
+def test_thin_stroke_is_not_lost_at_full_resolution():
+    # A one pixel wide line fades into the paper if the page is shrunk before checking
+    page = make_page(size=(4000, 5200))
+    ImageDraw.Draw(page).line([(1000, 2000), (1000, 2040)], fill=170, width=1)
+
+    assert not blank_page_detector_module.BlankPageDetector().is_blank_page(page, 0)
+
+def test_dark_page_is_not_blank():
+    assert not blank_page_detector_module.BlankPageDetector().is_blank_page(make_page(paper_colour=15), 0)
+
+def test_results_are_remembered_by_path_and_reported(tmp_path):
+    blank_page_path = str(tmp_path / "blank.png")
+    text_page_path = str(tmp_path / "text.png")
+    make_page().save(blank_page_path)
+    text_page = make_page()
+    ImageDraw.Draw(text_page).text((200, 200), "Name: Jane Smith", fill=0)
+    text_page.save(text_page_path)
+
+    detector = blank_page_detector_module.BlankPageDetector()
+
+    assert detector.is_blank_page(blank_page_path, 2)
+    assert not detector.is_blank_page(text_page_path, 3)
+
+    # Remembered results are used even if the file changes
+    text_page.save(blank_page_path)
+    assert detector.is_blank_page(blank_page_path, 2)
+
+    assert detector.get_blank_page_numbers() == [3]
+    assert "1 of 2 pages" in detector.get_report_message()
@@ -0,0 +1,83 @@
+import io
+import numpy as np
+from PIL import Image, ImageDraw
+from tests.helpers import import_module_or_skip
+
+image_encoder = import_module_or_skip("tools.image_encoder")
+
+def make_text_page(size=(1240, 1754)) -> Image.Image:
+    page = Image.new("RGB", size, "white")
+    draw = ImageDraw.Draw(page)
+    for line_no in range(60):
+        draw.text((80, 60 + line_no * 27), f"Line {line_no} of a letter to Jane Smith, 12 High Street", fill=(20, 20, 120))
+    return page
+
+def make_noisy_page(size=(900, 900), seed:int=0) -> Image.Image:
+    # Random colour noise barely compresses, so it needs scaling down to fit a small budget
+    return Image.fromarray(np.random.default_rng(seed).integers(0, 256, (size[1], size[0], 3), dtype=np.uint8))
+
+def test_page_within_budget_keeps_full_resolution():
+    page = make_text_page()
+
+    image_bytes, encoding_metadata = image_encoder.encode_image_to_byte_budget(page, 5 * 1024 * 1024)
+
+    assert len(image_bytes) <= 5 * 1024 * 1024
+    assert encoding_metadata["scale_factor"] == 1.0
+    assert Image.open(io.BytesIO(image_bytes)).size == page.size
+    assert encoding_metadata["bytes"] == len(image_bytes)
+
+def test_bit_depth_is_reduced_before_resolution():
+    page = make_noisy_page()
+    max_bytes = 1_000_000
+    assert len(image_encoder.encode_png(page, 1)) > max_bytes
+
+    image_bytes, encoding_metadata = image_encoder.encode_image_to_byte_budget(page, max_bytes, encodings=["original", "grey8", "grey4"])
+
+    # 8-bit greyscale noise is a third of the colour size, so fits without scaling
+    assert len(image_bytes) <= max_bytes
+    assert encoding_metadata["encoding"] == "grey8"
+    assert encoding_metadata["scale_factor"] == 1.0
+    assert Image.open(io.BytesIO(image_bytes)).mode == "L"
+
+def test_page_over_budget_is_scaled_down_to_fit():
+    page = make_noisy_page()
+    max_bytes = 300_000
+
+    image_bytes, encoding_metadata = image_encoder.encode_image_to_byte_budget(page, max_bytes, encodings=["original"])
+    encoded_image = Image.open(io.BytesIO(image_bytes))
+
+    assert len(image_bytes) <= max_bytes
+    assert encoded_image.mode == "RGB"
+    assert encoded_image.size == (encoding_metadata["width"], encoding_metadata["height"])
+    assert encoding_metadata["scale_factor"] < 1.0
+    assert encoding_metadata["scale_factor"] == round(encoded_image.width / page.width, 4)
+    # The scale is predicted, so the budget is not missed by much or encoded many times
+    assert len(image_bytes) >= max_bytes * 0.5
+    assert encoding_metadata["encodes"] <= 2
+
+def test_files_within_budget_are_sent_as_they_are(tmp_path):
+    image_path = str(tmp_path / "page.png")
+    make_text_page().save(image_path)
+
+    image_bytes, encoding_metadata = image_encoder.load_image_bytes_for_byte_budget(image_path, 5 * 1024 * 1024)
+
+    with open(image_path, "rb") as image_file:
+        assert image_bytes == image_file.read()
+    assert encoding_metadata["encodes"] == 0
+
+def test_stored_page_image_keeps_its_colour_mode(tmp_path, monkeypatch):
+    file_conversion = import_module_or_skip("tools.file_conversion")
+    monkeypatch.setattr(file_conversion, "TEXTRACT_MAX_IMAGE_BYTES", "300000")
+
+    image_path = str(tmp_path / "page.png")
+    page = make_noisy_page()
+    page.save(image_path)
+
+    reduced_image, new_width, new_height, _, out_path = file_conversion.check_image_size_and_reduce(image_path, page)
+
+    with Image.open(out_path) as stored_image:
+        # Only the resolution of the stored page is reduced. Lower bit depths are only used for the bytes sent to Textract
+        assert stored_image.mode == "RGB"
+        assert stored_image.size == (new_width, new_height) == reduced_image.size
+    assert new_width < page.width
+    assert tmp_path.joinpath("page.png").stat().st_size <= 300000
@@ -0,0 +1,39 @@
+import pymupdf
+import pandas as pd
+from tests.helpers import import_module_or_skip
+
+file_conversion = import_module_or_skip("tools.file_conversion")
+
+def write_pdf(pdf_path, page_count:int):
+    pdf_doc = pymupdf.open()
+    for page_no in range(page_count):
+        page = pdf_doc.new_page(width=200, height=300)
+        page.insert_text((20, 40), f"Page {page_no + 1}", fontsize=12)
+    pdf_doc.save(pdf_path)
+    pdf_doc.close()
+
+def test_page_image_memo_is_bounded(tmp_path, monkeypatch):
+    pdf_path = str(tmp_path / "document.pdf")
+    write_pdf(pdf_path, 3)
+    monkeypatch.setattr(file_conversion, "max_page_image_memo_entries", 2)
+    monkeypatch.setattr(file_conversion, "_page_image_memo", file_conversion.OrderedDict())
+    monkeypatch.setattr(file_conversion, "_page_image_locks", {})
+
+    page_images = [file_conversion.get_page_image(pdf_path, page_no, image_dpi=72, input_folder=str(tmp_path / "input"), rasteriser="pymupdf") for page_no in range(3)]
+
+    assert [page_image[0] for page_image in page_images] == [0, 1, 2]
+    assert [memo_key[1] for memo_key in file_conversion._page_image_memo] == [1, 2]
+    assert set(file_conversion._page_image_locks) == set(file_conversion._page_image_memo)
+
+    # A page dropped from the memo is still returned, from its image on disk
+    assert file_conversion.get_page_image(pdf_path, 0, image_dpi=72, input_folder=str(tmp_path / "input"), rasteriser="pymupdf")[1] == page_images[0][1]
+
+def test_missing_image_sizes_are_filled_per_page():
+    # Page 1 has been rendered, page 2 is a lazy page image that has not been created yet
+    page_sizes_df = pd.DataFrame({"page": [1, 2], "image_width": [1000, pd.NA], "image_height": [2000, pd.NA], "mediabox_width": [500, 600], "mediabox_height": [1000, 800]})
+    review_file_df = pd.DataFrame({"page": [1, 2], "xmin": [100, 60], "xmax": [200, 120], "ymin": [400, 80], "ymax": [500, 160], "label": ["PERSON", "PERSON"]})
+
+    relative_df = file_conversion.divide_coordinates_by_page_sizes(review_file_df, page_sizes_df).set_index("page")
+
+    assert relative_df.loc[1, ["xmin", "xmax", "ymin", "ymax"]].tolist() == [0.1, 0.2, 0.2, 0.25]
+    assert relative_df.loc[2, ["xmin", "xmax", "ymin", "ymax"]].tolist() == [0.1, 0.2, 0.1, 0.2]
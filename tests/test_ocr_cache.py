@@ -0,0 +1,89 @@
+import os
+import time
+from tests.helpers import import_module_or_skip
+
+ocr_cache_module = import_module_or_skip("tools.ocr_cache")
+OCRResultCache = ocr_cache_module.OCRResultCache
+
+def random_value() -> dict:
+    return {"words": [[os.urandom(200).hex(), 1, 2, 3, 4, 95.0]]}
+
+def test_put_and_get_round_trip(tmp_path):
+    cache = OCRResultCache(str(tmp_path), max_size_mb=1)
+    key = cache.make_key("page_hash", "tesseract", {"psm": 11})
+    value = {"words": [["Smith", 10, 20, 30, 40, 91.5]]}
+
+    cache.put(key, value)
+
+    assert cache.get(key) == value
+    assert cache.get_stats()["hits"] == 1
+    assert cache.get_stats()["writes"] == 1
+
+def test_missing_key_is_a_miss(tmp_path):
+    cache = OCRResultCache(str(tmp_path), max_size_mb=1)
+
+    assert cache.get(cache.make_key("page_hash", "tesseract")) is None
+    assert cache.get_stats()["misses"] == 1
+    assert cache.get_stats()["hit_rate"] == 0.0
+
+def test_key_depends_on_content_engine_and_settings():
+    keys = {OCRResultCache.make_key("page_hash", "tesseract", {"psm": 11}),
+            OCRResultCache.make_key("other_page_hash", "tesseract", {"psm": 11}),
+            OCRResultCache.make_key("page_hash", "textract", {"psm": 11}),
+            OCRResultCache.make_key("page_hash", "tesseract", {"psm": 6})}
+
+    assert len(keys) == 4
+    assert OCRResultCache.make_key("page_hash", "tesseract", {"psm": 11}) in keys
+
+def test_trim_removes_least_recently_used_entries(tmp_path):
+    cache = OCRResultCache(str(tmp_path), max_size_mb=1)
+    oldest_key, older_key, newest_key = (cache.make_key(page_hash, "tesseract") for page_hash in ["a", "b", "c"])
+
+    cache.put(oldest_key, random_value())
+    cache.put(older_key, random_value())
+    now = time.time()
+    os.utime(cache._get_entry_path(oldest_key), (now - 200, now - 200))
+    os.utime(cache._get_entry_path(older_key), (now - 100, now - 100))
+
+    # Room for about two and a half entries, so adding a third removes only the oldest
+    cache.max_size_bytes = int(cache.current_size_bytes * 1.25)
+    cache.put(newest_key, random_value())
+
+    assert not os.path.exists(cache._get_entry_path(oldest_key))
+    assert os.path.exists(cache._get_entry_path(older_key))
+    assert os.path.exists(cache._get_entry_path(newest_key))
+    assert cache.get_stats()["evictions"] == 1
+
+def test_cached_tesseract_words_keep_confidence(tmp_path):
+    engine = import_module_or_skip("tools.custom_image_analyser_engine")
+    from PIL import Image
+
+    image_analyser = engine.CustomImageAnalyzerEngine(object(), ocr_cache=OCRResultCache(str(tmp_path), max_size_mb=1))
+    image = Image.new("RGB", (100, 50), "white")
+    ocr_results = [engine.OCRResult("Smith", 10, 20, 30, 40, 91.5), engine.OCRResult("Jane", 50, 20, 30, 40, 42.0)]
+
+    cache_key, cached_results = image_analyser.get_cached_ocr_results(image)
+    assert cached_results is None
+
+    image_analyser.store_cached_ocr_results(cache_key, ocr_results)
+    _, cached_results = image_analyser.get_cached_ocr_results(image)
+
+    assert cached_results == ocr_results
+
+def test_layout_decision_is_recorded_on_cache_hit(tmp_path):
+    engine = import_module_or_skip("tools.custom_image_analyser_engine")
+    from PIL import Image
+
+    image_analyser = engine.CustomImageAnalyzerEngine(object(), ocr_cache=OCRResultCache(str(tmp_path), max_size_mb=1), page_segmentation="adaptive")
+    image = Image.new("RGB", (100, 50), "white")
+    layout_decision = {"layout": "sparse_form", "reason": "few text lines", "psm": 11}
+
+    cache_key, _ = image_analyser.get_cached_ocr_results(image, 0)
+    image_analyser.store_cached_ocr_results(cache_key, [engine.OCRResult("Smith", 10, 20, 30, 40, 91.5)], layout_decision)
+    assert image_analyser.layout_decisions == []
+
+    # A later run of the same page finds it in the cache, and still logs the layout it was OCRed with
+    _, cached_results = image_analyser.get_cached_ocr_results(image, 4)
+
+    assert len(cached_results) == 1
+    assert image_analyser.layout_decisions == [{"page": 5, **layout_decision}]
@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+from tests.helpers import import_module_or_skip
+
+ocr_regions = import_module_or_skip("tools.ocr_regions")
+
+def make_ocr_data(words):
+    '''
+    Tesseract image_to_data output in dictionary form, from (text, left, top, width, height, conf) tuples.
+    '''
+    columns = ["text", "left", "top", "width", "height", "conf"]
+    return {column: [word[i] for word in words] for i, column in enumerate(columns)}
+
+@pytest.mark.parametrize("region, tile_size, overlap", [((0, 0, 1000, 600), 400, 50),
+                                                         ((120, 40, 2500, 3300), 1024, 64),
+                                                         ((0, 0, 300, 200), 512, 32),
+                                                         ((10, 10, 1034, 522), 512, 0)])
+def test_tiles_cover_region_within_tile_size(region, tile_size, overlap):
+    left, top, right, bottom = region
+    tiles = ocr_regions.split_region_into_tiles(region, tile_size, overlap)
+
+    covered = np.zeros((bottom, right), dtype=bool)
+    for tile_left, tile_top, tile_right, tile_bottom in tiles:
+        assert left <= tile_left < tile_right <= right
+        assert top <= tile_top < tile_bottom <= bottom
+        assert tile_right - tile_left <= tile_size
+        assert tile_bottom - tile_top <= tile_size
+        covered[tile_top:tile_bottom, tile_left:tile_right] = True
+
+    assert covered[top:bottom, left:right].all()
+
+def test_neighbouring_tiles_overlap():
+    tiles = ocr_regions.split_region_into_tiles((0, 0, 1000, 400), 400, 50)
+
+    assert [tile[0] for tile in tiles] == [0, 350, 700]
+    for tile, next_tile in zip(tiles, tiles[1:]):
+        assert tile[2] - next_tile[0] >= 50
+
+def test_region_smaller_than_a_tile_is_one_tile():
+    assert ocr_regions.split_region_into_tiles((5, 5, 100, 80), 512, 32) == [(5, 5, 100, 80)]
+
+def test_merged_words_are_in_page_coordinates_and_reading_order():
+    parts = [((0, 0, 500, 300), make_ocr_data([("second", 50, 200, 60, 20, 90), ("first", 50, 20, 50, 20, 95)])),
+             ((0, 300, 500, 600), make_ocr_data([("third", 10, 10, 50, 20, 80), ("", 0, 0, 500, 300, -1)]))]
+
+    merged = ocr_regions.merge_ocr_data_from_parts(parts, 500, 600)
+
+    assert merged["text"] == ["first", "second", "third"]
+    assert merged["left"] == [50, 50, 10]
+    assert merged["top"] == [20, 200, 310]
+    assert merged["conf"] == [95, 90, 80]
+    assert list(merged.keys()) == ["text", "left", "top", "width", "height", "conf"]
+
+def test_word_found_in_two_tiles_is_kept_once_from_the_tile_furthest_from_the_seam():
+    # The tiles overlap between x=350 and x=400. The word at x=360 to 395 is cut short at the right edge of the first tile, but whole in the second
+    first_tile = (0, 0, 400, 300)
+    second_tile = (350, 0, 800, 300)
+    parts = [(first_tile, make_ocr_data([("Smi", 360, 100, 38, 20, 60), ("Jane", 300, 100, 50, 20, 96)])),
+             (second_tile, make_ocr_data([("Smith", 10, 100, 45, 20, 94)]))]
+
+    merged = ocr_regions.merge_ocr_data_from_parts(parts, 800, 300)
+
+    assert merged["text"] == ["Jane", "Smith"]
+    assert merged["left"] == [300, 360]
+
+def test_overlapping_words_from_the_same_part_are_both_kept():
+    parts = [((0, 0, 500, 300), make_ocr_data([("a", 100, 100, 40, 20, 90), ("b", 105, 100, 40, 20, 90)]))]
+
+    merged = ocr_regions.merge_ocr_data_from_parts(parts, 500, 300)
+
+    assert merged["text"] == ["a", "b"]
+
+def test_words_far_apart_on_a_large_page_are_not_merged():
+    # Words in different grid cells, with equal boxes in their own tiles
+    parts = [((0, 0, 2000, 2000), make_ocr_data([("top", 100, 100, 40, 20, 90)])),
+             ((1000, 1000, 3000, 3000), make_ocr_data([("bottom", 100, 100, 40, 20, 90)]))]
+
+    merged = ocr_regions.merge_ocr_data_from_parts(parts, 3000, 3000)
+
+    assert merged["text"] == ["top", "bottom"]
+    assert merged["left"] == [100, 1100]
+
+def test_merging_no_parts_gives_empty_columns():
+    merged = ocr_regions.merge_ocr_data_from_parts([], 100, 100)
+
+    assert merged == {"left": [], "top": [], "width": [], "height": [], "conf": [], "text": []}
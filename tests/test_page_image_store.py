@@ -0,0 +1,45 @@
+import os
+import numpy as np
+from PIL import Image
+from tests.helpers import import_module_or_skip
+
+page_image_store = import_module_or_skip("tools.page_image_store")
+
+def write_stored_page(tmp_path, page_no:int=1):
+    image_path = str(tmp_path / f"document.pdf_{page_no}.png")
+    image = Image.fromarray(np.arange(40 * 60, dtype=np.uint8).reshape(40, 60))
+    image.save(image_path)
+
+    store, stored_page_no = page_image_store.get_page_image_store(image_path, use_page_image_store=True)
+    store.put_page(stored_page_no, image)
+    store.update_index([(stored_page_no, image_path, image.width, image.height)])
+    return store, image_path, image
+
+def use_page_image_store(monkeypatch):
+    get_page_image_store = page_image_store.get_page_image_store
+    monkeypatch.setattr(page_image_store, "_page_image_stores", {})
+    monkeypatch.setattr(page_image_store, "get_page_image_store", lambda image_path, use_page_image_store=True: get_page_image_store(image_path, use_page_image_store))
+
+def test_index_is_written_and_read_again(tmp_path):
+    store, image_path, _ = write_stored_page(tmp_path)
+
+    reopened_store = page_image_store.PageImageStore(store.store_folder)
+
+    assert reopened_store.index == {"1": {"image_path": image_path, "width": 60, "height": 40}}
+
+def test_removed_page_png_is_restored_from_the_store(tmp_path, monkeypatch):
+    use_page_image_store(monkeypatch)
+    _, image_path, image = write_stored_page(tmp_path)
+    os.remove(image_path)
+
+    assert page_image_store.restore_page_image(image_path) == (image_path, 60, 40)
+    with Image.open(image_path) as restored_image:
+        assert np.array_equal(np.asarray(restored_image), np.asarray(image))
+
+    # The PNG now exists, so it is not written again
+    assert page_image_store.restore_page_image(image_path) is None
+
+def test_page_that_was_not_stored_is_not_restored(tmp_path, monkeypatch):
+    use_page_image_store(monkeypatch)
+
+    assert page_image_store.restore_page_image(str(tmp_path / "document.pdf_0.png")) is None
@@ -0,0 +1,27 @@
+import pandas as pd
+from tests.helpers import import_module_or_skip
+
+def test_page_layout_decisions_are_kept_across_page_breaks(tmp_path):
+    file_redaction = import_module_or_skip("tools.file_redaction")
+    page_layouts_file_path = str(tmp_path / "doc_page_layouts.csv")
+    log_files_output_paths = []
+
+    first_call_analyser = file_redaction.CustomImageAnalyzerEngine(file_redaction.nlp_analyser, page_segmentation="adaptive")
+    first_call_analyser.record_layout_decision(0, {"layout": "dense_single_column", "reason": "full width lines", "psm": 6})
+    first_call_analyser.record_layout_decision(1, {"layout": "sparse_form", "reason": "few text lines", "psm": 11})
+    file_redaction.save_page_layout_decisions(first_call_analyser, page_layouts_file_path, False, log_files_output_paths)
+
+    # Redaction continues after the page break with a new image analyser
+    second_call_analyser = file_redaction.CustomImageAnalyzerEngine(file_redaction.nlp_analyser, page_segmentation="adaptive")
+    second_call_analyser.record_layout_decision(2, {"layout": "multi_column", "reason": "2 text columns", "psm": 3})
+    file_redaction.save_page_layout_decisions(second_call_analyser, page_layouts_file_path, True, log_files_output_paths)
+
+    page_layouts_df = pd.read_csv(page_layouts_file_path)
+
+    assert page_layouts_df["page"].tolist() == [1, 2, 3]
+    assert page_layouts_df["psm"].tolist() == [6, 11, 3]
+    assert log_files_output_paths == [page_layouts_file_path]
+
+    # A new run of the document starts the file again
+    file_redaction.save_page_layout_decisions(second_call_analyser, page_layouts_file_path, False, log_files_output_paths)
+    assert pd.read_csv(page_layouts_file_path)["page"].tolist() == [3]
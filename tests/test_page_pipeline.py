@@ -0,0 +1,54 @@
+import time
+import random
+import itertools
+import pytest
+from tests.helpers import import_module_or_skip
+
+page_pipeline = import_module_or_skip("tools.page_pipeline")
+
+def sleep_then(function):
+    def stage_function(item):
+        time.sleep(random.uniform(0, 0.01))
+        return function(item)
+    return stage_function
+
+def test_items_are_returned_in_order():
+    pipeline = page_pipeline.PagePipeline([("add_one", sleep_then(lambda item: item + 1)), ("double", sleep_then(lambda item: item * 2))], max_queue_size=2)
+
+    assert list(pipeline.run(range(20))) == [(item + 1) * 2 for item in range(20)]
+
+    pipeline.close()
+    stage_report = pipeline.get_stage_report()
+    assert list(stage_report["stage"]) == ["add_one", "double", "consumer"]
+    assert list(stage_report["items_processed"]) == [20, 20, 20]
+
+def test_stage_error_is_raised_in_consumer_after_earlier_items():
+    def fail_on_three(item):
+        if item == 3: raise ValueError("page 3 could not be processed")
+        return item
+
+    pipeline = page_pipeline.PagePipeline([("check", fail_on_three), ("copy", lambda item: item)])
+    consumed_items = []
+
+    with pytest.raises(ValueError, match="page 3"):
+        for item in pipeline.run(range(10)):
+            consumed_items.append(item)
+
+    assert consumed_items == [0, 1, 2]
+
+def test_stage_threads_stop_when_a_stage_fails_while_others_are_blocked():
+    pipeline = page_pipeline.PagePipeline([("copy", lambda item: item), ("fail", None)], max_queue_size=1)
+
+    def fail_once_upstream_is_blocked(item):
+        # Wait until the feeder and the first stage are blocked on full queues
+        while not (pipeline.queues[0].full() and pipeline.queues[1].full()):
+            time.sleep(0.01)
+        raise RuntimeError("stage failed")
+
+    pipeline.stages[1].function = fail_once_upstream_is_blocked
+
+    # The feeder never runs out of items, so it only stops if the pipeline is shut down
+    with pytest.raises(RuntimeError, match="stage failed"):
+        list(pipeline.run(itertools.count()))
+
+    assert not any(thread.is_alive() for thread in pipeline.threads)
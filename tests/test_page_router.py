@@ -0,0 +1,46 @@
+import pytest
+import pymupdf
+import pandas as pd
+from tests.helpers import import_module_or_skip
+
+page_router = import_module_or_skip("tools.page_router")
+
+def page_stats(chars:int=500, readable_share:float=1.0, invisible_text_share:float=0.0, image_coverage:float=0.0) -> dict:
+    return {"chars": chars, "readable_share": readable_share, "invisible_text_share": invisible_text_share, "image_coverage": image_coverage}
+
+route_thresholds = {"min_chars": 20, "min_readable_share": 0.9, "large_image_coverage": 0.5, "min_chars_with_large_image": 200}
+
+@pytest.mark.parametrize("stats, expected", [
+    (page_stats(), (page_router.text_layer_route, "text layer")),
+    (page_stats(chars=0), (page_router.ocr_route, "little or no text layer")),
+    (page_stats(chars=19), (page_router.ocr_route, "little or no text layer")),
+    (page_stats(chars=20), (page_router.text_layer_route, "text layer")),
+    (page_stats(readable_share=0.5), (page_router.ocr_route, "text layer not readable")),
+    (page_stats(chars=50, image_coverage=0.9), (page_router.ocr_route, "large image with little text")),
+    (page_stats(chars=500, image_coverage=0.9), (page_router.text_layer_route, "text layer")),
+    (page_stats(chars=50, image_coverage=1.0, invisible_text_share=0.95), (page_router.text_layer_route, "existing OCR text layer")),
+    (page_stats(chars=50, image_coverage=0.4), (page_router.text_layer_route, "text layer")),
+])
+def test_choose_page_route(stats, expected):
+    assert page_router.choose_page_route(stats, **route_thresholds) == expected
+
+def test_unreadable_text_layer_is_sent_to_ocr_even_if_invisible():
+    assert page_router.choose_page_route(page_stats(readable_share=0.2, invisible_text_share=1.0, image_coverage=1.0), **route_thresholds)[0] == page_router.ocr_route
+
+def test_route_pdf_pages_within_page_range():
+    pdf_doc = pymupdf.open()
+    pdf_doc.new_page().insert_text((72, 72), "This page has a text layer with more than enough characters.")
+    pdf_doc.new_page()
+    pdf_doc.new_page().insert_text((72, 72), "So does this page, which should also be redacted from its text.")
+
+    page_routes_df = page_router.route_pdf_pages(pdf_doc, page_min=2, page_max=3)
+
+    assert page_routes_df["page"].tolist() == [2, 3]
+    assert page_routes_df["route"].tolist() == [page_router.ocr_route, page_router.text_layer_route]
+
+def test_page_route_runs_group_consecutive_pages_from_start_page():
+    page_routes_df = pd.DataFrame({"page": [1, 2, 3, 4, 6, 7], "route": ["text", "text", "ocr", "text", "text", "ocr"]})
+
+    assert page_router.get_page_route_runs(page_routes_df) == [("text", [0, 1]), ("ocr", [2]), ("text", [3, 5]), ("ocr", [6])]
+    assert page_router.get_page_route_runs(page_routes_df, start_page=1) == [("text", [1]), ("ocr", [2]), ("text", [3, 5]), ("ocr", [6])]
+    assert page_router.get_page_route_runs(page_routes_df, start_page=7) == []
@@ -0,0 +1,105 @@
+import shutil
+import cv2
+import pytest
+import numpy as np
+import pandas as pd
+from PIL import Image, ImageDraw, ImageFont
+from tests.helpers import import_module_or_skip
+
+requires_tesseract = pytest.mark.skipif(shutil.which("tesseract") is None, reason="Tesseract is not installed")
+
+page_lines = [["Dear John Smith", "12 High Street, London"], ["Invoice number 1234"], ["Thank you for your letter", "Jane Example"]]
+
+def write_page_image(image_path, lines:list) -> str:
+    image = Image.new("RGB", (1200, 800), "white")
+    draw = ImageDraw.Draw(image)
+    font = ImageFont.load_default(size=36)
+    for line_no, line in enumerate(lines):
+        draw.text((60, 60 + line_no * 80), line, fill="black", font=font)
+    image.save(image_path)
+    return str(image_path)
+
+def describe_lines(line_level_ocr_results:list) -> list:
+    return [(line.text, line.left, line.top, line.width, line.height) for line in line_level_ocr_results]
+
+def fake_perform_tesseract_ocr(image, *args, **kwargs) -> list:
+    '''
+    Stands in for Tesseract OCR: one word for each patch of ink on the page, so that the results only depend on the page image.
+    '''
+    custom_image_analyser_engine = import_module_or_skip("tools.custom_image_analyser_engine")
+    ink = (np.asarray(image.convert("L")) < 128).astype(np.uint8)
+    _, _, stats, _ = cv2.connectedComponentsWithStats(ink)
+    return [custom_image_analyser_engine.OCRResult(text=f"ink{left}x{top}", left=int(left), top=int(top), width=int(width), height=int(height), conf=90.0) for left, top, width, height, _ in stats[1:]]
+
+def start_test_tesseract_engine_pool(monkeypatch):
+    '''
+    Start a Tesseract worker pool as the app does when it starts. The workers are forked now, so changes the test has already made to the OCR functions are also used in the workers.
+    '''
+    tesseract_engine_pool_module = import_module_or_skip("tools.tesseract_engine_pool")
+    pool = tesseract_engine_pool_module.TesseractEnginePool(max_workers=2)
+    monkeypatch.setattr(tesseract_engine_pool_module, "_tesseract_engine_pool", pool)
+    return pool
+
+@pytest.fixture
+def page_image_paths(tmp_path):
+    return [write_page_image(tmp_path / f"page_{page_no}.png", lines) for page_no, lines in enumerate(page_lines)]
+
+@pytest.fixture
+def tesseract_engine_pool(monkeypatch):
+    pool = start_test_tesseract_engine_pool(monkeypatch)
+    yield pool
+    pool.close()
+
+@pytest.fixture
+def fake_tesseract_engine_pool(monkeypatch):
+    custom_image_analyser_engine = import_module_or_skip("tools.custom_image_analyser_engine")
+    monkeypatch.setattr(custom_image_analyser_engine, "perform_tesseract_ocr", fake_perform_tesseract_ocr)
+    pool = start_test_tesseract_engine_pool(monkeypatch)
+    yield pool
+    pool.close()
+
+def assert_parallel_ocr_matches_page_by_page_ocr(page_image_paths):
+    file_redaction = import_module_or_skip("tools.file_redaction")
+    image_analyser = file_redaction.CustomImageAnalyzerEngine(file_redaction.nlp_analyser)
+
+    parallel_results = file_redaction.run_tesseract_ocr_on_pages_in_parallel(list(range(len(page_image_paths))), pd.DataFrame(), page_image_paths, image_analyser)
+
+    assert sorted(parallel_results) == list(range(len(page_image_paths)))
+
+    for page_no, image_path in enumerate(page_image_paths):
+        page_by_page_lines, page_by_page_children = file_redaction.combine_ocr_results(image_analyser.perform_ocr(image_path, page_no))
+        parallel_lines, parallel_children = parallel_results[page_no]
+
+        assert describe_lines(parallel_lines) == describe_lines(page_by_page_lines)
+        assert list(parallel_children) == list(page_by_page_children)
+
+    return parallel_results
+
+@requires_tesseract
+def test_parallel_ocr_matches_page_by_page_ocr(tesseract_engine_pool, page_image_paths):
+    assert_parallel_ocr_matches_page_by_page_ocr(page_image_paths)
+
+def test_parallel_ocr_matches_page_by_page_ocr_with_stubbed_tesseract(fake_tesseract_engine_pool, page_image_paths):
+    parallel_results = assert_parallel_ocr_matches_page_by_page_ocr(page_image_paths)
+
+    # The stand-in OCR found the ink on every page, so the comparison above was not between empty results
+    assert all(parallel_results[page_no][0] for page_no in parallel_results)
+
+def test_parallel_ocr_returns_no_pages_if_the_pool_was_not_started(monkeypatch, page_image_paths):
+    file_redaction = import_module_or_skip("tools.file_redaction")
+    tesseract_engine_pool_module = import_module_or_skip("tools.tesseract_engine_pool")
+    monkeypatch.setattr(tesseract_engine_pool_module, "_tesseract_engine_pool", None)
+    image_analyser = file_redaction.CustomImageAnalyzerEngine(file_redaction.nlp_analyser)
+
+    assert file_redaction.run_tesseract_ocr_on_pages_in_parallel([0, 1], pd.DataFrame(), page_image_paths, image_analyser) == {}
+
+@requires_tesseract
+def test_next_pages_chunk_only_covers_pending_pages_from_current_page(tesseract_engine_pool, page_image_paths):
+    file_redaction = import_module_or_skip("tools.file_redaction")
+    image_analyser = file_redaction.CustomImageAnalyzerEngine(file_redaction.nlp_analyser)
+    pending_page_numbers = [0, 1, 2]
+
+    chunk_results = file_redaction.run_tesseract_ocr_on_next_pages_in_parallel(1, pending_page_numbers, page_image_paths[0], pd.DataFrame(), page_image_paths, image_analyser, max_workers=1)
+
+    assert sorted(chunk_results) == [1, 2]
+    assert pending_page_numbers == [0]
@@ -0,0 +1,76 @@
+import os
+import threading
+import pymupdf
+from tests.helpers import import_module_or_skip
+
+file_conversion = import_module_or_skip("tools.file_conversion")
+
+def write_pdf(pdf_path, page_width:float, page_height:float, text:str):
+    pdf_doc = pymupdf.open()
+    page = pdf_doc.new_page(width=page_width, height=page_height)
+    page.insert_text((72, 72), text, fontsize=12)
+    pdf_doc.save(pdf_path)
+    pdf_doc.close()
+
+def test_new_file_at_same_path_is_rendered_from_new_file(tmp_path):
+    pdf_path = str(tmp_path / "upload.pdf")
+
+    write_pdf(pdf_path, 612, 792, "First upload")
+    first_image = file_conversion.render_pdf_page_with_pymupdf(pdf_path, 0, image_dpi=72)
+
+    write_pdf(pdf_path, 842, 595, "Second upload, landscape")
+    # Make sure the modification time differs even on file systems with coarse timestamps
+    file_stat = os.stat(pdf_path)
+    os.utime(pdf_path, ns=(file_stat.st_atime_ns, file_stat.st_mtime_ns + 1_000_000_000))
+    second_image = file_conversion.render_pdf_page_with_pymupdf(pdf_path, 0, image_dpi=72)
+
+    assert first_image.size == (612, 792)
+    assert second_image.size == (842, 595)
+
+def test_documents_have_separate_locks(tmp_path):
+    first_pdf_path, second_pdf_path = str(tmp_path / "first.pdf"), str(tmp_path / "second.pdf")
+    write_pdf(first_pdf_path, 612, 792, "First")
+    write_pdf(second_pdf_path, 612, 792, "Second")
+
+    rendered = threading.Event()
+
+    # While the first document is in use, a page of the second document can still be rendered
+    with file_conversion.open_pymupdf_rasteriser_doc(first_pdf_path):
+        render_thread = threading.Thread(target=lambda: (file_conversion.render_pdf_page_with_pymupdf(second_pdf_path, 0, image_dpi=72), rendered.set()))
+        render_thread.start()
+        assert rendered.wait(timeout=30)
+
+    render_thread.join()
+
+def test_least_recently_used_documents_are_closed(tmp_path):
+    pdf_paths = [str(tmp_path / f"doc_{doc_no}.pdf") for doc_no in range(file_conversion.max_pymupdf_rasteriser_docs + 1)]
+    for pdf_path in pdf_paths:
+        write_pdf(pdf_path, 200, 200, "Page")
+        file_conversion.render_pdf_page_with_pymupdf(pdf_path, 0, image_dpi=36)
+
+    open_paths = [doc_key[0] for doc_key in file_conversion._pymupdf_rasteriser_docs]
+
+    assert len(open_paths) <= file_conversion.max_pymupdf_rasteriser_docs
+    assert os.path.abspath(pdf_paths[0]) not in open_paths
+    assert os.path.abspath(pdf_paths[-1]) in open_paths
+
+def test_worker_processes_do_not_inherit_documents_in_use(tmp_path):
+    pdf_path = str(tmp_path / "upload.pdf")
+    write_pdf(pdf_path, 612, 792, "Page")
+    input_folder = str(tmp_path) + "/"
+
+    # While this process holds the lock of the document, a worker process can still render its pages from its own copy
+    with file_conversion.open_pymupdf_rasteriser_doc(pdf_path) as pdf_doc:
+        executor = file_conversion.create_rasteriser_process_pool(1)
+        try:
+            future = executor.submit(file_conversion.process_single_page_for_image_conversion, pdf_path, 0, 36, input_folder=input_folder, rasteriser="pymupdf")
+            page_num, image_path, width, height = future.result(timeout=120)
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        # The worker dropped its copy of the document without closing the one in this process
+        assert not pdf_doc.is_closed
+        assert pdf_doc.load_page(0).get_text().strip() == "Page"
+
+    assert page_num == 0
+    assert os.path.exists(image_path)
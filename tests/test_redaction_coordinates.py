@@ -0,0 +1,23 @@
+import pytest
+import pandas as pd
+from tests.helpers import import_module_or_skip
+
+page_sizes_df = pd.DataFrame({"page": [1], "image_width": [1000], "image_height": [2000], "mediabox_width": [500], "mediabox_height": [1000]})
+
+def test_text_layer_results_are_made_relative_and_measured_from_the_top():
+    file_redaction = import_module_or_skip("tools.file_redaction")
+    decision_process_table = pd.DataFrame({"page": [1], "xmin": [100.0], "xmax": [300.0], "ymin": [200.0], "ymax": [400.0]})
+    line_level_ocr_results_df = pd.DataFrame({"page": [1], "text": ["A line"], "left": [100.0], "top": [500.0], "width": [200.0], "height": [40.0]})
+
+    decision_process_table, line_level_ocr_results_df = file_redaction.convert_redaction_results_to_relative_coordinates(decision_process_table, line_level_ocr_results_df, page_sizes_df, from_text_layer=True)
+
+    assert decision_process_table[["xmin", "xmax", "ymin", "ymax"]].values.ravel().tolist() == pytest.approx([0.1, 0.3, 0.9, 0.8])
+    assert line_level_ocr_results_df[["left", "top", "width", "height"]].values.ravel().tolist() == pytest.approx([0.1, 0.75, 0.2, 0.02])
+
+def test_relative_ocr_results_are_not_converted_again():
+    file_redaction = import_module_or_skip("tools.file_redaction")
+    decision_process_table = pd.DataFrame({"page": [1, 1], "xmin": [0.1, 100.0], "xmax": [0.3, 300.0], "ymin": [0.2, 200.0], "ymax": [0.4, 400.0]})
+
+    decision_process_table, _ = file_redaction.convert_redaction_results_to_relative_coordinates(decision_process_table, pd.DataFrame(), page_sizes_df)
+
+    assert sorted(decision_process_table[["xmin", "xmax", "ymin", "ymax"]].values.tolist()) == [[0.1, 0.3, 0.1, 0.2], [0.1, 0.3, 0.2, 0.4]]
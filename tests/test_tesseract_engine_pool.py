@@ -0,0 +1,92 @@
+import time
+import shutil
+import threading
+import pytest
+from PIL import Image, ImageDraw, ImageFont
+from tests.helpers import import_module_or_skip
+
+tesseract_engine_pool = import_module_or_skip("tools.tesseract_engine_pool")
+
+@pytest.mark.parametrize("tesseract_config, expected", [
+    ("", ("eng", 3, 3, {})),
+    (None, ("eng", 3, 3, {})),
+    ("--oem 3 --psm 11", ("eng", 11, 3, {})),
+    ("-l fra --psm 6 --oem 1", ("fra", 6, 1, {})),
+    ("--psm 4 -c preserve_interword_spaces=1 -c tessedit_char_whitelist=a=b", ("eng", 4, 3, {"preserve_interword_spaces": "1", "tessedit_char_whitelist": "a=b"})),
+])
+def test_parse_tesseract_config(tesseract_config, expected):
+    assert tesseract_engine_pool.parse_tesseract_config(tesseract_config) == expected
+
+def test_parse_tesseract_config_ignores_unsupported_options():
+    assert tesseract_engine_pool.parse_tesseract_config("--dpi 300 --psm 6 -c no_value") == ("eng", 6, 3, {})
+
+class FakeTesseractApi:
+    '''
+    Stands in for a tesserocr engine, returning fixed tsv output without a header row, as GetTSVText does.
+    '''
+    def __init__(self, tsv_text:str):
+        self.tsv_text = tsv_text
+
+    def SetImage(self, image): pass
+
+    def GetTSVText(self, page_number:int) -> str:
+        return self.tsv_text
+
+    def Clear(self): pass
+
+def test_tesserocr_tsv_output_is_parsed_to_pytesseract_dictionary_format(monkeypatch):
+    tsv_text = "1\t1\t0\t0\t0\t0\t0\t0\t800\t600\t-1\t\n5\t1\t1\t1\t1\t1\t60\t62\t90\t30\t95.5\tDear\n5\t1\t1\t1\t1\t2\t160\t60\t80\t32\t91\tJohn\n"
+    monkeypatch.setattr(tesseract_engine_pool, "get_tesseract_api", lambda tesseract_config: (FakeTesseractApi(tsv_text), threading.Lock()))
+
+    ocr_data = tesseract_engine_pool.tesserocr_image_to_data(Image.new("RGB", (800, 600), "white"), "--psm 11")
+
+    assert list(ocr_data) == tesseract_engine_pool.tesseract_tsv_columns
+    assert ocr_data["text"] == ["", "Dear", "John"]
+    assert ocr_data["left"] == [0, 60, 160]
+    assert ocr_data["conf"] == [-1.0, 95.5, 91.0]
+
+@pytest.mark.skipif(tesseract_engine_pool.PyTessBaseAPI is None or shutil.which("tesseract") is None, reason="tesserocr and Tesseract are needed to compare the OCR backends")
+def test_tesserocr_output_matches_pytesseract():
+    import pytesseract
+
+    image = Image.new("RGB", (1200, 400), "white")
+    draw = ImageDraw.Draw(image)
+    font = ImageFont.load_default(size=36)
+    draw.text((60, 60), "Dear John Smith", fill="black", font=font)
+    draw.text((60, 160), "12 High Street, London", fill="black", font=font)
+
+    tesseract_config = "--oem 3 --psm 11"
+    tesserocr_data = tesseract_engine_pool.tesserocr_image_to_data(image, tesseract_config)
+    pytesseract_data = pytesseract.image_to_data(image, output_type=pytesseract.Output.DICT, config=tesseract_config)
+
+    def describe_words(ocr_data:dict) -> list:
+        return [(ocr_data["text"][i], ocr_data["left"][i], ocr_data["top"][i], ocr_data["width"][i], ocr_data["height"][i], round(float(ocr_data["conf"][i]))) for i in range(len(ocr_data["text"])) if ocr_data["text"][i].strip()]
+
+    assert set(tesserocr_data) == set(pytesseract_data)
+    assert describe_words(tesserocr_data) == describe_words(pytesseract_data)
+
+def test_engine_pool_is_only_started_once_from_several_threads(monkeypatch):
+    started_pools = []
+
+    class SlowTesseractEnginePool:
+        def __init__(self, tesseract_config, max_workers):
+            time.sleep(0.05)
+            started_pools.append(self)
+
+        def close(self, wait:bool=True): pass
+
+    monkeypatch.setattr(tesseract_engine_pool, "TesseractEnginePool", SlowTesseractEnginePool)
+    monkeypatch.setattr(tesseract_engine_pool, "_tesseract_engine_pool", None)
+
+    threads = [threading.Thread(target=tesseract_engine_pool.start_tesseract_engine_pool, kwargs={"max_workers": 2}) for _ in range(4)]
+    for thread in threads: thread.start()
+    for thread in threads: thread.join()
+
+    assert len(started_pools) == 1
+    assert tesseract_engine_pool.get_tesseract_engine_pool() is started_pools[0]
+
+def test_engine_pool_is_not_started_for_one_worker(monkeypatch):
+    monkeypatch.setattr(tesseract_engine_pool, "_tesseract_engine_pool", None)
+
+    assert tesseract_engine_pool.start_tesseract_engine_pool(max_workers=1) is None
+    assert tesseract_engine_pool.get_tesseract_engine_pool() is None
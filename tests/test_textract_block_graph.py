@@ -0,0 +1,35 @@
+from tests.helpers import import_module_or_skip
+
+aws_textract = import_module_or_skip("tools.aws_textract")
+
+def word_block(block_id:str, text:str) -> dict:
+    return {"BlockType": "WORD", "Id": block_id, "Text": text}
+
+def key_value_blocks() -> list:
+    '''
+    Blocks from a Textract FORMS response with two fields, "Name: John Smith" and "Date:" with an empty value. The blocks are listed out of order, as Textract does not list children next to their parents.
+    '''
+    return [
+        {"BlockType": "KEY_VALUE_SET", "Id": "key-1", "EntityTypes": ["KEY"], "Relationships": [{"Type": "VALUE", "Ids": ["value-1"]}, {"Type": "CHILD", "Ids": ["word-1"]}]},
+        {"BlockType": "KEY_VALUE_SET", "Id": "value-2", "EntityTypes": ["VALUE"]},
+        word_block("word-3", "Smith"),
+        {"BlockType": "KEY_VALUE_SET", "Id": "value-1", "EntityTypes": ["VALUE"], "Relationships": [{"Type": "CHILD", "Ids": ["word-2", "word-3"]}]},
+        {"BlockType": "KEY_VALUE_SET", "Id": "key-2", "EntityTypes": ["KEY"], "Relationships": [{"Type": "CHILD", "Ids": ["word-4"]}, {"Type": "VALUE", "Ids": ["value-2"]}]},
+        word_block("word-1", "Name:"),
+        word_block("word-2", "John"),
+        word_block("word-4", "Date:"),
+    ]
+
+def test_key_value_pairs_follow_key_to_value_relationships():
+    block_graph = aws_textract.TextractBlockGraph(key_value_blocks())
+
+    key_value_pairs = block_graph.get_key_value_pairs()
+
+    assert [(key_text, value_text) for key_text, value_text, _, _ in key_value_pairs] == [("Name:", "John Smith"), ("Date:", "")]
+    assert [(key_block["Id"], value_block["Id"]) for _, _, key_block, value_block in key_value_pairs] == [("key-1", "value-1"), ("key-2", "value-2")]
+
+def test_blocks_are_looked_up_by_id():
+    block_graph = aws_textract.TextractBlockGraph(key_value_blocks())
+
+    assert block_graph.get_block("word-2")["Text"] == "John"
+    assert block_graph.get_block("missing") is None
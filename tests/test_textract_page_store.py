@@ -0,0 +1,44 @@
+import os
+import zipfile
+from tests.helpers import import_module_or_skip
+
+textract_page_store = import_module_or_skip("tools.textract_page_store")
+
+def page_response(page_no:int, text:str) -> dict:
+    return {"page_no": str(page_no), "data": {"Blocks": [{"BlockType": "LINE", "Id": f"line-{page_no}", "Text": text}]}}
+
+def create_store(tmp_path) -> "textract_page_store.TextractPageStore":
+    store = textract_page_store.TextractPageStore(str(tmp_path / "doc_textract.jsonl.gz"), str(tmp_path / "doc_textract.json"))
+    store.load()
+    store.add_page(page_response(2, "Second page"))
+    store.add_page(page_response(1, "First page"))
+    return store
+
+def test_zip_export_contains_one_json_file_that_the_store_imports(tmp_path):
+    store = create_store(tmp_path)
+
+    zip_file_path = store.export_zip(str(tmp_path / "doc_textract.zip"))
+
+    # prepare_image_or_pdf only uses a Textract zip with exactly one json file, which it saves as the document's _textract.json
+    with zipfile.ZipFile(zip_file_path) as zip_file:
+        json_files = [file_name for file_name in zip_file.namelist() if file_name.lower().endswith(".json")]
+        assert json_files == ["doc_textract.json"]
+        extract_folder = tmp_path / "extracted"
+        zip_file.extract(json_files[0], extract_folder)
+
+    imported_store = textract_page_store.TextractPageStore(str(extract_folder / "doc_textract.jsonl.gz"), str(extract_folder / "doc_textract.json"))
+    imported_store.load()
+
+    assert imported_store.get_page_numbers() == ["1", "2"]
+    assert imported_store.get_page(1) == store.get_page(1)
+    assert imported_store.get_page(2) == store.get_page(2)
+
+def test_json_export_is_not_imported_again_over_the_store(tmp_path):
+    store = create_store(tmp_path)
+    textract_json_file_path = store.export_json()
+
+    reloaded_store = textract_page_store.TextractPageStore(store.store_file_path, textract_json_file_path)
+    reloaded_store.load()
+
+    assert os.path.getmtime(store.store_file_path) >= os.path.getmtime(textract_json_file_path)
+    assert reloaded_store.to_textract_json_data() == store.to_textract_json_data()
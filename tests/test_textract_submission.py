@@ -0,0 +1,68 @@
+import time
+import pytest
+from tests.helpers import import_module_or_skip
+
+benchmark_textract_submission = import_module_or_skip("benchmarks.benchmark_textract_submission")
+aws_textract = import_module_or_skip("tools.aws_textract")
+
+@pytest.fixture
+def stub_textract():
+    def start(latency:float, quota:float):
+        state = benchmark_textract_submission.StubTextractState(latency, quota)
+        server, client = benchmark_textract_submission.start_stub_textract_server(state)
+        servers.append(server)
+        return state, client
+
+    servers = []
+    yield start
+    for server in servers: server.shutdown()
+
+def collect_pages(client, page_numbers, max_in_flight:int, rate_limiter, max_retries:int=6):
+    page_bytes = benchmark_textract_submission.create_page_bytes()
+    results = []
+
+    with aws_textract.TextractPageSubmitter(page_numbers, lambda page_no: page_bytes, client, [], max_in_flight=max_in_flight, rate_limiter=rate_limiter, max_retries=max_retries) as textract_submitter:
+        for page_no in page_numbers:
+            results.append(textract_submitter.get_page_result(page_no))
+
+    assert textract_submitter.executor._shutdown
+    return results
+
+def test_pages_are_returned_in_order_with_request_ids(stub_textract):
+    # Later pages answer faster than earlier ones would if they were sent one at a time, but results must still come back in page order
+    state, client = stub_textract(latency=0.05, quota=1000)
+    page_numbers = list(range(8))
+
+    results = collect_pages(client, page_numbers, max_in_flight=4, rate_limiter=aws_textract.TokenBucketRateLimiter(0))
+
+    assert [wrapped_response["page_no"] for wrapped_response, _ in results] == [str(page_no + 1) for page_no in page_numbers]
+    assert all(block["Page"] == wrapped_response["page_no"] for wrapped_response, _ in results for block in wrapped_response["data"]["Blocks"])
+    assert all("'RequestId': '" in request_metadata for _, request_metadata in results)
+    assert state.requests == len(page_numbers)
+    assert state.throttled == 0
+
+def test_throttled_requests_are_retried(stub_textract):
+    # Without a rate limiter, more requests are in flight than the stub quota allows, so some are throttled and must be retried
+    state, client = stub_textract(latency=0.05, quota=2)
+    page_numbers = list(range(6))
+
+    results = collect_pages(client, page_numbers, max_in_flight=6, rate_limiter=aws_textract.TokenBucketRateLimiter(0), max_retries=20)
+
+    assert [wrapped_response["page_no"] for wrapped_response, _ in results] == [str(page_no + 1) for page_no in page_numbers]
+    assert state.throttled > 0
+    assert state.requests == len(page_numbers) + state.throttled
+
+def test_rate_limiter_keeps_requests_under_quota(stub_textract):
+    # Two requests per second with no burst never puts more than three requests in any one second window, below the stub quota of four
+    state, client = stub_textract(latency=0.05, quota=4)
+    page_numbers = list(range(5))
+
+    tic = time.monotonic()
+    results = collect_pages(client, page_numbers, max_in_flight=5, rate_limiter=aws_textract.TokenBucketRateLimiter(2, burst=1), max_retries=0)
+    seconds = time.monotonic() - tic
+
+    assert len(results) == len(page_numbers)
+    assert state.throttled == 0
+    assert state.requests == len(page_numbers)
+    # The first request goes straight away, and each later one waits for a token
+    assert seconds >= (len(page_numbers) - 1) / 2 - 0.1
@@ -0,0 +1,91 @@
+import cv2
+import numpy as np
+import pymupdf
+from pymupdf import Page
+from typing import List, Optional
+
+from tools.config import IMAGES_DPI, ADAPTIVE_DPI_TARGET_TEXT_PIXELS, ADAPTIVE_DPI_MIN, ADAPTIVE_DPI_MAX, ADAPTIVE_DPI_STEP, ADAPTIVE_DPI_TEXT_PERCENTILE, ADAPTIVE_DPI_PROBE_DPI
+from tools.page_router import is_readable_character
+
+# Text smaller than this (in points) is ignored, as it is usually hidden or decorative rather than body text
+min_text_size_points = 3.0
+
+def get_text_layer_text_size(page:Page, percentile:float=float(ADAPTIVE_DPI_TEXT_PERCENTILE), min_chars:int=20) -> Optional[float]:
+    '''
+    Estimate the size of the smaller text on a PDF page, in points, from the font sizes in its text layer. Each span is weighted by its number of readable characters, and the given percentile of the sizes is returned, so that a page of body text with a few lines of footnotes is sized for the footnotes. Returns None if the page has too little readable text.
+    '''
+    span_sizes = []
+    span_weights = []
+
+    for block in page.get_text("dict").get("blocks", []):
+        for line in block.get("lines", []):
+            for span in line.get("spans", []):
+                readable_chars = sum(1 for character in span.get("text", "") if not character.isspace() and is_readable_character(character))
+                if readable_chars and span.get("size", 0) >= min_text_size_points:
+                    span_sizes.append(span["size"])
+                    span_weights.append(readable_chars)
+
+    if sum(span_weights) < min_chars: return None
+
+    return get_weighted_percentile(span_sizes, span_weights, percentile)
+
+def get_probe_text_size(page:Page, probe_dpi:float=float(ADAPTIVE_DPI_PROBE_DPI), percentile:float=float(ADAPTIVE_DPI_TEXT_PERCENTILE), min_lines:int=3) -> Optional[float]:
+    '''
+    Estimate the size of the smaller text on a page with no usable text layer, in points, from a low resolution render. Dark marks are joined into words and lines by dilating horizontally, and the heights of line-shaped marks (much wider than they are tall) are taken as the text size, since a line of text from the top of its ascenders to the bottom of its descenders is about as tall as its font size. Returns None if too few lines of text are found.
+    '''
+    pixmap = page.get_pixmap(dpi=int(probe_dpi), colorspace=pymupdf.csGRAY, alpha=False)
+    pixels = np.frombuffer(pixmap.samples, dtype=np.uint8).reshape(pixmap.height, pixmap.stride)[:, :pixmap.width]
+
+    _, ink_mask = cv2.threshold(pixels, 0, 255, cv2.THRESH_BINARY_INV | cv2.THRESH_OTSU)
+
+    # Join letters and words along each line, without joining neighbouring lines
+    line_mask = cv2.dilate(ink_mask, cv2.getStructuringElement(cv2.MORPH_RECT, (max(3, int(probe_dpi / 12)), 1)))
+
+    number_of_labels, _, component_stats, _ = cv2.connectedComponentsWithStats(line_mask, connectivity=8)
+
+    line_heights = []
+    for label in range(1, number_of_labels):
+        width = component_stats[label, cv2.CC_STAT_WIDTH]
+        height = component_stats[label, cv2.CC_STAT_HEIGHT]
+
+        # Line-shaped marks with at least two pixels of height. Larger blocks are usually images, tables or several lines joined together.
+        if height >= 2 and width >= 3 * height and height <= probe_dpi / 2:
+            line_heights.append(height)
+
+    if len(line_heights) < min_lines: return None
+
+    return float(np.percentile(line_heights, percentile)) * 72 / probe_dpi
+
+def get_weighted_percentile(values:List[float], weights:List[float], percentile:float) -> float:
+    order = np.argsort(values)
+    sorted_values = np.asarray(values, dtype=float)[order]
+    cumulative_weights = np.cumsum(np.asarray(weights, dtype=float)[order])
+
+    return float(sorted_values[np.searchsorted(cumulative_weights, percentile / 100 * cumulative_weights[-1])])
+
+def get_dpi_for_text_size(text_size:Optional[float],
+                          target_text_pixels:float=float(ADAPTIVE_DPI_TARGET_TEXT_PIXELS),
+                          min_dpi:float=float(ADAPTIVE_DPI_MIN),
+                          max_dpi:float=float(ADAPTIVE_DPI_MAX),
+                          dpi_step:float=float(ADAPTIVE_DPI_STEP),
+                          unknown_text_dpi:float=float(IMAGES_DPI)) -> float:
+    '''
+    Lowest DPI at which text of the given size in points is at least target_text_pixels tall, rounded up to a multiple of dpi_step and kept between min_dpi and max_dpi. If the text size is not known (no text layer, and the probe render found no lines of text), the page may still have text that the probe missed, so it is rendered at unknown_text_dpi as it would be without adaptive DPI.
+    '''
+    if not text_size: return float(unknown_text_dpi)
+
+    dpi = target_text_pixels * 72 / text_size
+    dpi = np.ceil(dpi / dpi_step) * dpi_step
+
+    return float(min(max_dpi, max(min_dpi, dpi)))
+
+def choose_page_dpi(page:Page, unknown_text_dpi:float=float(IMAGES_DPI)) -> float:
+    '''
+    Choose the DPI to render a PDF page at for OCR, from the size of the smaller text on the page. The text size comes from the text layer where there is one, and otherwise from a low resolution probe render. Pages where no text is found are rendered at unknown_text_dpi.
+    '''
+    text_size = get_text_layer_text_size(page)
+
+    if text_size is None:
+        text_size = get_probe_text_size(page)
+
+    return get_dpi_for_text_size(text_size, unknown_text_dpi=unknown_text_dpi)
@@ -0,0 +1,332 @@
+import json
+import hashlib
+import threading
+from bisect import bisect_right
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from presidio_analyzer import DictAnalyzerResult, RecognizerResult
+
+from tools.config import USE_ANALYSIS_CACHE, ANALYSIS_CACHE_MEMORY_ENTRIES, USE_ANALYSIS_DISK_CACHE, ANALYSIS_CACHE_FOLDER, ANALYSIS_CACHE_MAX_SIZE_MB
+from tools.ocr_cache import OCRResultCache
+from tools.analysis_profiles import choose_analysis_profile, full_analysis_profile
+from tools.analysis_worker_pool import PooledAnalyzer, get_custom_word_list_settings
+from tools.model_tiers import get_tier_model_name
+
+def hash_list(values:Optional[List[Any]]) -> str:
+    return hashlib.sha256(json.dumps(list(values or []), default=str).encode("utf-8")).hexdigest()
+
+def describe_analyser(analyser) -> Dict[str, str]:
+    '''
+    Get the analysis profile and spaCy model name of a local analyser, for use in cache keys.
+    '''
+    if isinstance(analyser, PooledAnalyzer):
+        return {"profile": choose_analysis_profile(analyser.analysis_profile, analyser.profile_entities), "model": get_tier_model_name(analyser.spacy_model_tier)}
+
+    spacy_model = getattr(getattr(analyser, "nlp_engine", None), "nlp", {}).get("en")
+    model_name = f"{spacy_model.meta.get('lang', '')}_{spacy_model.meta.get('name', '')}" if spacy_model is not None else ""
+
+    return {"profile": getattr(analyser, "profile_name", full_analysis_profile), "model": model_name}
+
+def get_analysis_settings(method:str, language:str, entities:List[str], allow_list:List[str]=None, score_threshold:float=None, analyser=None, context:List[str]=None) -> Dict[str, Any]:
+    '''
+    Get the settings that affect the results of analysing a line of text, for use in cache keys. Local analysis also depends on the custom deny list in the recogniser registry, and on the analyser's profile and model.
+    '''
+    settings = {"method": method,
+                "language": language,
+                "entities": sorted(entities or []),
+                "allow_list_hash": hash_list(allow_list),
+                "score_threshold": score_threshold,
+                "context": list(context or [])}
+
+    if method == "Local":
+        settings["deny_list_hash"] = hash_list(get_custom_word_list_settings())
+        settings["analyser"] = describe_analyser(analyser)
+
+    return settings
+
+def normalise_line_text(line_text:str) -> Tuple[str, int]:
+    '''
+    Normalise a line for use in a cache key: whitespace characters become spaces (which keeps character offsets the same) and leading and trailing whitespace is removed. Returns the normalised text and the number of leading characters removed.
+    '''
+    normalised_text = "".join(" " if character.isspace() else character for character in line_text)
+    stripped_text = normalised_text.lstrip()
+    return stripped_text.rstrip(), len(normalised_text) - len(stripped_text)
+
+def shift_result(result:RecognizerResult, offset:int) -> RecognizerResult:
+    return RecognizerResult(result.entity_type, result.start + offset, result.end + offset, result.score, result.analysis_explanation, result.recognition_metadata)
+
+class AnalysisResultCache:
+    '''
+    Cache of text analysis results for lines of text, keyed on the normalised line text and the settings used to analyse it. Recently used lines are held in memory. Lines that are looked up again after being analysed are also written to an on-disk cache, so that repeated headers, footers and boilerplate are reused across documents and app restarts without writing a file for every line seen once.
+
+    Results are stored without their analysis explanations. A line that is analysed again (as part of a page with other lines not in the cache) and gets different results, as NER results can depend on the rest of the page, is stored with results of None, so that it is always analysed with its page from then on.
+    '''
+    def __init__(self, memory_max_entries:int=int(ANALYSIS_CACHE_MEMORY_ENTRIES), disk_cache:Optional[OCRResultCache]=None):
+        self.memory_max_entries = max(1, int(memory_max_entries))
+        self.disk_cache = disk_cache
+        self.memory_entries: "OrderedDict[str, Tuple[List[dict], bool]]" = OrderedDict()
+        self.lock = threading.Lock()
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.writes = 0
+
+    @staticmethod
+    def make_key(normalised_text:str, settings:Dict[str, Any]) -> str:
+        key_source = json.dumps({"text": normalised_text, "settings": settings}, sort_keys=True, default=str)
+        return hashlib.sha256(key_source.encode("utf-8")).hexdigest()
+
+    def _add_to_memory(self, key:str, results:List[dict], on_disk:bool):
+        self.memory_entries[key] = (results, on_disk)
+        self.memory_entries.move_to_end(key)
+        while len(self.memory_entries) > self.memory_max_entries:
+            self.memory_entries.popitem(last=False)
+
+    def get(self, key:str) -> Optional[List[dict]]:
+        '''
+        Return the cached results for a key, or None if it is not in the cache or its results depend on the rest of the page.
+        '''
+        with self.lock:
+            memory_entry = self.memory_entries.get(key)
+            if memory_entry is not None:
+                self.memory_entries.move_to_end(key)
+                results, on_disk = memory_entry
+                if results is None: self.misses += 1
+                else: self.memory_hits += 1
+                write_to_disk = self.disk_cache is not None and not on_disk
+                if write_to_disk: self.memory_entries[key] = (results, True)
+
+        if memory_entry is not None:
+            if write_to_disk:
+                self.disk_cache.put(key, {"results": results})
+                with self.lock: self.writes += 1
+            return results
+
+        disk_entry = self.disk_cache.get(key) if self.disk_cache is not None else None
+
+        with self.lock:
+            if disk_entry is None:
+                self.misses += 1
+                return None
+            if disk_entry["results"] is None: self.misses += 1
+            else: self.disk_hits += 1
+            self._add_to_memory(key, disk_entry["results"], True)
+
+        return disk_entry["results"]
+
+    def put(self, key:str, results:List[dict]):
+        '''
+        Add results for a key to the cache. If the key is already in memory with different results, it is stored with results of None instead.
+        '''
+        with self.lock:
+            memory_entry = self.memory_entries.get(key)
+            if memory_entry is not None and memory_entry[0] != results: results = None
+            self._add_to_memory(key, results, False)
+
+    def get_line_results(self, line_text:str, settings:Dict[str, Any]) -> Optional[List[RecognizerResult]]:
+        '''
+        Return the cached results for a line, with offsets in the line text, or None if the line is not in the cache.
+        '''
+        normalised_text, leading_offset = normalise_line_text(line_text)
+        results = self.get(self.make_key(normalised_text, settings))
+        if results is None: return None
+
+        return [RecognizerResult(result["entity_type"], result["start"] + leading_offset, result["end"] + leading_offset, result["score"]) for result in results]
+
+    def put_line_results(self, line_text:str, settings:Dict[str, Any], results:List[RecognizerResult]):
+        '''
+        Add the results for a line to the cache. Result offsets are given in the line text.
+        '''
+        normalised_text, leading_offset = normalise_line_text(line_text)
+        self.put(self.make_key(normalised_text, settings),
+                 [{"entity_type": result.entity_type, "start": max(0, result.start - leading_offset), "end": max(0, result.end - leading_offset), "score": result.score} for result in results])
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self.lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": round((self.memory_hits + self.disk_hits) / lookups, 3) if lookups else 0.0,
+                "memory_entries": len(self.memory_entries),
+                "disk_writes": self.writes
+            }
+
+    def get_stats_message(self) -> str:
+        stats = self.get_stats()
+        return (f"Analysis cache: {stats['memory_hits']} memory hits, {stats['disk_hits']} disk hits, {stats['misses']} misses (hit rate {stats['hit_rate']:.1%}), "
+                f"{stats['memory_entries']} lines in memory, {stats['disk_writes']} lines written to disk.")
+
+def get_line_starts(line_texts:List[str]) -> List[int]:
+    '''
+    Get the offset of each line in the text made by joining the lines with spaces, as the lines of a page are joined for analysis.
+    '''
+    line_starts = []
+    offset = 0
+    for line_text in line_texts:
+        line_starts.append(offset)
+        offset += len(line_text) + 1
+    return line_starts
+
+def analyse_pages_with_cache(analysis_cache:AnalysisResultCache, pages_line_texts:List[List[str]], settings:Dict[str, Any], analyse_texts:Callable[[List[str]], List[List[RecognizerResult]]]) -> List[List[RecognizerResult]]:
+    '''
+    Analyse pages given as lists of line texts, taking the results of pages whose lines are all in the cache from the cache. Pages with any line not in the cache are analysed whole by analyse_texts, with their lines joined with spaces, so that NER models see each line in the context of the rest of its page as they would without the cache. The results of the lines that were not in the cache are then added to it. Results are returned with offsets in the page text made by joining all of its lines with spaces.
+
+    Lines touched by a result that runs across more than one line are not added to the cache, as their results depend on the neighbouring lines.
+    '''
+    page_plans = []
+    texts_to_analyse = []
+
+    for line_texts in pages_line_texts:
+        cached_line_results = {}
+        uncached_line_indexes = []
+
+        for line_idx, line_text in enumerate(line_texts):
+            if not line_text.strip(): continue
+            line_results = analysis_cache.get_line_results(line_text, settings)
+            if line_results is None: uncached_line_indexes.append(line_idx)
+            else: cached_line_results[line_idx] = line_results
+
+        analysed_text_idx = None
+        if uncached_line_indexes:
+            analysed_text_idx = len(texts_to_analyse)
+            texts_to_analyse.append(" ".join(line_texts))
+
+        page_plans.append((cached_line_results, uncached_line_indexes, analysed_text_idx))
+
+    analysed_results = analyse_texts(texts_to_analyse) if texts_to_analyse else []
+
+    pages_results = []
+
+    for line_texts, (cached_line_results, uncached_line_indexes, analysed_text_idx) in zip(pages_line_texts, page_plans):
+        line_starts = get_line_starts(line_texts)
+
+        if analysed_text_idx is None:
+            page_results = [shift_result(result, line_starts[line_idx]) for line_idx, line_results in cached_line_results.items() for result in line_results]
+        else:
+            page_results = list(analysed_results[analysed_text_idx])
+            new_line_results = {line_idx: [] for line_idx in uncached_line_indexes}
+
+            for result in page_results:
+                first_line = max(0, bisect_right(line_starts, result.start) - 1)
+                last_line = max(first_line, bisect_right(line_starts, max(result.start, result.end - 1)) - 1)
+
+                if first_line == last_line:
+                    if first_line in new_line_results:
+                        new_line_results[first_line].append(shift_result(result, -line_starts[first_line]))
+                else:
+                    for line_idx in range(first_line, last_line + 1):
+                        new_line_results.pop(line_idx, None)
+
+            for line_idx, line_results in new_line_results.items():
+                analysis_cache.put_line_results(line_texts[line_idx], settings, line_results)
+
+        page_results.sort(key=lambda result: (result.start, result.end))
+        pages_results.append(page_results)
+
+    return pages_results
+
+def get_cached_line_results(analysis_cache:Optional[AnalysisResultCache], line_texts:List[str], settings:Dict[str, Any]) -> Dict[int, List[RecognizerResult]]:
+    '''
+    Get the cached results of each line in the cache, by line index. Empty if no cache is used.
+    '''
+    if analysis_cache is None: return {}
+
+    cached_line_results = {}
+    for line_idx, line_text in enumerate(line_texts):
+        if not line_text.strip(): continue
+        line_results = analysis_cache.get_line_results(line_text, settings)
+        if line_results is not None: cached_line_results[line_idx] = line_results
+
+    return cached_line_results
+
+def store_line_results(analysis_cache:Optional[AnalysisResultCache], line_texts:List[str], settings:Dict[str, Any], line_results:List[Tuple[int, List[RecognizerResult]]], analysed_line_indexes:List[int]):
+    '''
+    Add the results of analysed lines to the cache, from a list of (line index, results) tuples. Analysed lines with no entry in the list are stored with no results.
+    '''
+    if analysis_cache is None: return
+
+    results_by_line = {line_idx: [] for line_idx in analysed_line_indexes}
+    for line_idx, results in line_results:
+        if line_idx in results_by_line: results_by_line[line_idx].extend(results)
+
+    for line_idx, results in results_by_line.items():
+        if line_texts[line_idx].strip():
+            analysis_cache.put_line_results(line_texts[line_idx], settings, results)
+
+def merge_line_results(all_text_line_results:List[Tuple[int, List[RecognizerResult]]], line_results:List[Tuple[int, List[RecognizerResult]]]) -> List[Tuple[int, List[RecognizerResult]]]:
+    '''
+    Add (line index, results) tuples to a list of them, extending the entry of a line that is already in the list.
+    '''
+    for line_idx, results in line_results:
+        existing_entry = next((entry for entry in all_text_line_results if entry[0] == line_idx), None)
+        if existing_entry: existing_entry[1].extend(results)
+        else: all_text_line_results.append((line_idx, list(results)))
+
+    return all_text_line_results
+
+def analyse_dict_with_cache(analysis_cache:AnalysisResultCache, analyse_dict:Callable, analyser, input_dict:Dict[str, Any], language:str, **analyze_kwargs) -> List[DictAnalyzerResult]:
+    '''
+    Analyse a dictionary of column names and lists of cell values, as analyze_dict does, taking the results of text cells seen before in the same column from the cache. Only cells not in the cache are passed to analyse_dict.
+    '''
+    column_settings = {}
+    cached_cell_results = {}
+    uncached_dict = {}
+    uncached_cell_indexes = {}
+
+    for key, values in input_dict.items():
+        if not isinstance(values, list):
+            uncached_dict[key] = values
+            continue
+
+        column_settings[key] = get_analysis_settings("Local", language, analyze_kwargs.get("entities"), analyze_kwargs.get("allow_list"), analyze_kwargs.get("score_threshold"), analyser, context=[key])
+        cached_cell_results[key] = {}
+        uncached_cell_indexes[key] = []
+
+        for cell_idx, value in enumerate(values):
+            cell_results = analysis_cache.get_line_results(value, column_settings[key]) if isinstance(value, str) and value.strip() else None
+            if cell_results is None: uncached_cell_indexes[key].append(cell_idx)
+            else: cached_cell_results[key][cell_idx] = cell_results
+
+        uncached_dict[key] = [values[cell_idx] for cell_idx in uncached_cell_indexes[key]]
+
+    analysed_results = {result.key: result.recognizer_results for result in analyse_dict(uncached_dict, language=language, **analyze_kwargs)}
+
+    dict_results = []
+
+    for key, values in input_dict.items():
+        if key not in column_settings:
+            dict_results.append(DictAnalyzerResult(key=key, value=values, recognizer_results=analysed_results.get(key, [])))
+            continue
+
+        column_results = [cached_cell_results[key].get(cell_idx, []) for cell_idx in range(len(values))]
+
+        for cell_idx, cell_results in zip(uncached_cell_indexes[key], analysed_results.get(key) or []):
+            column_results[cell_idx] = list(cell_results)
+            value = values[cell_idx]
+            if isinstance(value, str) and value.strip():
+                analysis_cache.put_line_results(value, column_settings[key], column_results[cell_idx])
+
+        dict_results.append(DictAnalyzerResult(key=key, value=values, recognizer_results=column_results))
+
+    return dict_results
+
+_analysis_cache = None
+_analysis_cache_lock = threading.Lock()
+
+def get_analysis_cache() -> Optional[AnalysisResultCache]:
+    '''
+    Return the shared analysis result cache if USE_ANALYSIS_CACHE is set to True, otherwise None.
+    '''
+    global _analysis_cache
+
+    if USE_ANALYSIS_CACHE != "True": return None
+
+    with _analysis_cache_lock:
+        if _analysis_cache is None:
+            disk_cache = OCRResultCache(ANALYSIS_CACHE_FOLDER, float(ANALYSIS_CACHE_MAX_SIZE_MB)) if USE_ANALYSIS_DISK_CACHE == "True" else None
+            _analysis_cache = AnalysisResultCache(int(ANALYSIS_CACHE_MEMORY_ENTRIES), disk_cache)
+
+        return _analysis_cache
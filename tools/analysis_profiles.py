@@ -0,0 +1,208 @@
+import time
+import threading
+import tracemalloc
+from typing import Dict, List
+from spacy.language import Language
+from presidio_analyzer import AnalyzerEngine, RecognizerResult, EntityRecognizer
+from presidio_analyzer.context_aware_enhancers import ContextAwareEnhancer
+from presidio_analyzer.nlp_engine import NlpArtifacts
+
+from tools.config import ANALYSIS_PROFILE, MEASURE_ANALYSIS_PROFILES, SPACY_MODEL_TIER
+from tools.load_spacy_model_custom_recognisers import nlp, nlp_analyser, score_threshold, LoadedSpacyNlpEngine
+from tools.model_tiers import get_tier_spacy_model
+
+full_analysis_profile = "full"
+auto_analysis_profile = "auto"
+
+# Entities found by the spaCy NER model, through Presidio's SpacyRecognizer. Other entities come from regex and custom recognisers that only need the tokenizer.
+spacy_ner_entities = ["PERSON", "LOCATION", "ORGANIZATION", "NRP", "DATE_TIME"]
+
+# spaCy components run by each profile (None for all of them), whether context words near an entity raise its score (which needs the lemmatizer), and whether the analysis explanation is kept for each result
+analysis_profiles = {
+    full_analysis_profile: {"spacy_components": None, "context_enhancement": True, "return_decision_process": True},
+    "ner_and_patterns": {"spacy_components": ["ner"], "context_enhancement": False, "return_decision_process": False},
+    "patterns_only": {"spacy_components": [], "context_enhancement": False, "return_decision_process": False},
+}
+
+profile_sample_text = ("Dear Mr John Smith, thank you for your letter of 3 March 2024 about the extension at 12 High Street, London SW1A 1AA. "
+                       "Please call Jane Example on 020 7946 0000 or email jane.example@example.com before the Planning Committee meets.")
+
+class ProfileSpacyNlpEngine(LoadedSpacyNlpEngine):
+    '''
+    spaCy NLP engine that runs the loaded model with some of its components disabled for each call, so that profiles share one copy of the model.
+    '''
+    def __init__(self, loaded_spacy_model:Language, disabled_components:List[str]):
+        super().__init__(loaded_spacy_model)
+        self.disabled_components = disabled_components
+
+    def process_text(self, text:str, language:str) -> NlpArtifacts:
+        doc = self.nlp[language](text, disable=self.disabled_components)
+        return self._doc_to_nlp_artifact(doc, language)
+
+    def process_batch(self, texts:List[str], language:str, batch_size:int=1, n_process:int=1, **kwargs):
+        texts = (str(text) for text in texts)
+        docs = self.nlp[language].pipe(texts, batch_size=batch_size, n_process=n_process, disable=self.disabled_components)
+        for doc in docs:
+            yield doc.text, self._doc_to_nlp_artifact(doc, language)
+
+class NoContextAwareEnhancer(ContextAwareEnhancer):
+    '''
+    Leaves entity scores as the recognisers gave them, for profiles that do not run the lemmatizer that context enhancement relies on.
+    '''
+    def __init__(self):
+        super().__init__(context_similarity_factor=0, min_score_with_context_similarity=0, context_prefix_count=0, context_suffix_count=0)
+
+    def enhance_using_context(self, text:str, raw_results:List[RecognizerResult], nlp_artifacts:NlpArtifacts, recognizers:List[EntityRecognizer], context:List[str]=None) -> List[RecognizerResult]:
+        return raw_results
+
+class ProfileAnalyzerEngine(AnalyzerEngine):
+    '''
+    Analyser for a profile on a spaCy model. Decision process explanations are only built if the profile keeps them, whatever the caller asks for.
+    '''
+    def __init__(self, profile_name:str, return_decision_process:bool, **kwargs):
+        super().__init__(**kwargs)
+        self.profile_name = profile_name
+        self.return_decision_process = return_decision_process
+
+    def analyze(self, text:str, language:str, return_decision_process:bool=False, **kwargs) -> List[RecognizerResult]:
+        return super().analyze(text, language, return_decision_process=return_decision_process and self.return_decision_process, **kwargs)
+
+def get_disabled_components(spacy_model:Language, components:List[str]) -> List[str]:
+    '''
+    Get the components of a spaCy pipeline to disable to run only the given components (None for all). Shared tok2vec components that a given component listens to are kept.
+    '''
+    if components is None: return []
+
+    required_components = set(components)
+    for name in spacy_model.pipe_names:
+        listening_components = getattr(spacy_model.get_pipe(name), "listening_components", [])
+        if required_components & set(listening_components):
+            required_components.add(name)
+
+    return [name for name in spacy_model.pipe_names if name not in required_components]
+
+# Profile analysers are created when first used, keyed by profile name and the id of their spaCy model
+_profile_analysers: Dict[tuple, AnalyzerEngine] = {(full_analysis_profile, id(nlp)): nlp_analyser}
+_profile_analysers_lock = threading.Lock()
+
+def get_profile_analyser(profile_name:str, model_tier:str=SPACY_MODEL_TIER) -> AnalyzerEngine:
+    '''
+    Get the analyser for a profile and spaCy model tier. The full profile with the model loaded at start-up is nlp_analyser itself. Other analysers share the recogniser registry of nlp_analyser, so custom word lists added to nlp_analyser are used by every profile, and analysers on the same model share one copy of it. The tokenizer only profile always uses the model loaded at start-up, so no other model is loaded for it.
+    '''
+    profile = analysis_profiles[profile_name]
+    spacy_model = nlp if profile["spacy_components"] == [] else get_tier_spacy_model(model_tier)
+
+    with _profile_analysers_lock:
+        analyser_key = (profile_name, id(spacy_model))
+
+        if analyser_key not in _profile_analysers:
+            _profile_analysers[analyser_key] = ProfileAnalyzerEngine(profile_name,
+                                                                     profile["return_decision_process"],
+                                                                     nlp_engine=ProfileSpacyNlpEngine(spacy_model, get_disabled_components(spacy_model, profile["spacy_components"])),
+                                                                     registry=nlp_analyser.registry,
+                                                                     context_aware_enhancer=None if profile["context_enhancement"] else NoContextAwareEnhancer(),
+                                                                     default_score_threshold=score_threshold,
+                                                                     supported_languages=["en"],
+                                                                     log_decision_process=False)
+
+        return _profile_analysers[analyser_key]
+
+def choose_analysis_profile(profile_name:str=ANALYSIS_PROFILE, chosen_redact_entities:List[str]=None) -> str:
+    '''
+    Get the profile to use for the chosen entities. 'auto' picks 'ner_and_patterns' if any of the entities come from the spaCy NER model (or no entities are given), and 'patterns_only' otherwise.
+    '''
+    if profile_name == auto_analysis_profile:
+        if not chosen_redact_entities or any(entity in spacy_ner_entities for entity in chosen_redact_entities):
+            return "ner_and_patterns"
+        return "patterns_only"
+
+    if profile_name not in analysis_profiles:
+        print("Analysis profile", profile_name, "not found, so using the full profile.")
+        return full_analysis_profile
+
+    return profile_name
+
+def get_analysis_profile_analyser(profile_name:str=ANALYSIS_PROFILE, chosen_redact_entities:List[str]=None, model_tier:str=SPACY_MODEL_TIER) -> AnalyzerEngine:
+    return get_profile_analyser(choose_analysis_profile(profile_name, chosen_redact_entities), model_tier)
+
+def get_component_weight_bytes(spacy_model:Language, component_names:List[str]) -> int:
+    '''
+    Sum the bytes of the model weights of spaCy pipeline components. Word vectors are shared by all profiles and are not included.
+    '''
+    weight_bytes = 0
+    for name in component_names:
+        model = getattr(spacy_model.get_pipe(name), "model", None)
+        if model is None or not hasattr(model, "walk"): continue
+
+        for node in model.walk():
+            for param_name in node.param_names:
+                if node.has_param(param_name):
+                    weight_bytes += node.get_param(param_name).nbytes
+
+    return weight_bytes
+
+# Profile name -> latency and memory measured on the sample text
+analysis_profile_stats: Dict[str, dict] = {}
+
+def measure_analysis_profile(profile_name:str, repeats:int=5) -> dict:
+    '''
+    Measure the mean latency of analysing the sample text with a profile, the peak Python memory allocated during one analysis (traced separately, as tracing slows analysis), and the model weights of the spaCy components the profile runs.
+    '''
+    analyser = get_profile_analyser(profile_name)
+    spacy_model = analyser.nlp_engine.nlp["en"]
+    disabled_components = getattr(analyser.nlp_engine, "disabled_components", [])
+    enabled_components = [name for name in spacy_model.pipe_names if name not in disabled_components]
+    analyse_kwargs = {"text": profile_sample_text, "language": "en", "score_threshold": score_threshold, "return_decision_process": True}
+
+    # The first call is left out, as it loads lazily created resources
+    analyser.analyze(**analyse_kwargs)
+
+    tic = time.perf_counter()
+    for _ in range(repeats):
+        results = analyser.analyze(**analyse_kwargs)
+    latency_ms = (time.perf_counter() - tic) * 1000 / repeats
+
+    already_tracing = tracemalloc.is_tracing()
+    if not already_tracing: tracemalloc.start()
+    tracemalloc.reset_peak()
+    start_memory, _ = tracemalloc.get_traced_memory()
+    analyser.analyze(**analyse_kwargs)
+    _, peak_memory = tracemalloc.get_traced_memory()
+    if not already_tracing: tracemalloc.stop()
+
+    analysis_profile_stats[profile_name] = {"profile": profile_name,
+                                            "spacy_components": ", ".join(enabled_components) or "tokenizer only",
+                                            "latency_ms": round(latency_ms, 2),
+                                            "analysis_peak_memory_mb": round((peak_memory - start_memory) / 1e6, 2),
+                                            "component_weights_mb": round(get_component_weight_bytes(spacy_model, enabled_components) / 1e6, 1),
+                                            "entities_found": len(results)}
+
+    return analysis_profile_stats[profile_name]
+
+def measure_analysis_profiles() -> List[dict]:
+    for profile_name in analysis_profiles:
+        try:
+            measure_analysis_profile(profile_name)
+        except Exception as e:
+            print("Could not measure analysis profile", profile_name, ":", e)
+
+    print(get_analysis_profile_stats_message())
+    return get_analysis_profile_stats()
+
+def get_analysis_profile_stats() -> List[dict]:
+    return [dict(stats) for stats in analysis_profile_stats.values()]
+
+def get_analysis_profile_stats_message() -> str:
+    vectors_mb = nlp.vocab.vectors.data.nbytes / 1e6
+    message = f"Analysis profiles (word vectors of {vectors_mb:.1f} MB shared by all profiles):"
+    for stats in analysis_profile_stats.values():
+        message += (f"\n{stats['profile']}: {stats['latency_ms']} ms per sample text, {stats['analysis_peak_memory_mb']} MB peak analysis memory, "
+                    f"{stats['component_weights_mb']} MB component weights ({stats['spacy_components']}), {stats['entities_found']} entities found")
+    return message
+
+def measure_analysis_profiles_at_start_up(measure_analysis_profiles_option:str=MEASURE_ANALYSIS_PROFILES) -> List[dict]:
+    '''
+    Measure the analysis profiles if MEASURE_ANALYSIS_PROFILES is "True". Called by the app when it starts rather than when this module is imported, so that tests, benchmarks and scripts that import it do not load and run every profile.
+    '''
+    if measure_analysis_profiles_option != "True": return []
+    return measure_analysis_profiles()
@@ -0,0 +1,227 @@
+import os
+import gc
+import atexit
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, Future, wait
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+from presidio_analyzer import BatchAnalyzerEngine, DictAnalyzerResult, RecognizerResult
+
+from tools.config import USE_ANALYSIS_WORKER_POOL, ANALYSIS_MAX_WORKERS, ANALYSIS_WORKER_CHUNK_SIZE, ANALYSIS_PROFILE, SPACY_MODEL_TIER
+from tools.load_spacy_model_custom_recognisers import nlp_analyser, custom_word_list_recogniser, CustomWordFuzzyRecognizer
+from tools.analysis_profiles import analysis_profiles, get_profile_analyser, get_analysis_profile_analyser
+from tools.presidio_analyzer_custom import analyze_iterator_custom
+
+# Custom word list settings last applied to the recogniser registry in this worker process
+_worker_custom_word_list_settings = None
+
+def get_custom_word_list_settings() -> Tuple[tuple, Any, Any]:
+    '''
+    Get the custom word list, maximum spelling mistakes and whole phrase setting of the fuzzy custom word recogniser in the nlp_analyser registry of this process. The custom word list recognisers are always updated together, so this is enough to rebuild both of them in a worker.
+    '''
+    for recogniser in nlp_analyser.registry.recognizers:
+        if isinstance(recogniser, CustomWordFuzzyRecognizer):
+            return tuple(recogniser.custom_list), recogniser.spelling_mistakes_max, recogniser.search_whole_phrase
+    return (), 1, True
+
+def set_custom_word_list_recognisers(custom_word_list_settings:Tuple[tuple, Any, Any]):
+    '''
+    Update the custom word list recognisers of a worker to match those of the app process when the request was made, as the redaction code updates them in the app process for each job.
+    '''
+    global _worker_custom_word_list_settings
+    if custom_word_list_settings == _worker_custom_word_list_settings: return
+
+    custom_word_list, spelling_mistakes_max, search_whole_phrase = custom_word_list_settings
+
+    nlp_analyser.registry.remove_recognizer("CUSTOM")
+    nlp_analyser.registry.add_recognizer(custom_word_list_recogniser(list(custom_word_list)))
+
+    nlp_analyser.registry.remove_recognizer("CustomWordFuzzyRecognizer")
+    nlp_analyser.registry.add_recognizer(CustomWordFuzzyRecognizer(supported_entities=["CUSTOM_FUZZY"], custom_list=list(custom_word_list), spelling_mistakes_max=spelling_mistakes_max, search_whole_phrase=search_whole_phrase))
+
+    _worker_custom_word_list_settings = custom_word_list_settings
+
+def get_worker_pid() -> int:
+    return os.getpid()
+
+def analyse_texts(texts:List[str], language:str, analysis_profile:str, profile_entities:List[str], spacy_model_tier:str, batch_size:int, analyze_kwargs:Dict[str, Any]) -> List[List[RecognizerResult]]:
+    '''
+    Analyse texts with the analyser for a job's analysis profile and model tier in this process. A single text is analysed with one analyse call, and several are passed through spaCy together in batches.
+    '''
+    analyser = get_analysis_profile_analyser(analysis_profile, profile_entities, spacy_model_tier)
+
+    if len(texts) == 1:
+        return [analyser.analyze(text=texts[0], language=language, **analyze_kwargs)]
+
+    return analyze_iterator_custom(BatchAnalyzerEngine(analyzer_engine=analyser), texts=texts, language=language, list_length=len(texts), batch_size=batch_size, **analyze_kwargs)
+
+def analyse_texts_in_worker(texts:List[str], language:str, analysis_profile:str, profile_entities:List[str], spacy_model_tier:str, custom_word_list_settings:Tuple[tuple, Any, Any], batch_size:int, analyze_kwargs:Dict[str, Any]) -> List[List[RecognizerResult]]:
+    '''
+    Analyse texts in a worker process, with the analyser and custom word lists the app process would have used for the job.
+    '''
+    set_custom_word_list_recognisers(custom_word_list_settings)
+    return analyse_texts(texts, language, analysis_profile, profile_entities, spacy_model_tier, batch_size, analyze_kwargs)
+
+class AnalysisWorkerPool:
+    '''
+    A pool of worker processes for local text analysis, forked from the app process after the spaCy model and analysers are loaded. The workers share the memory of the loaded models with the app process copy-on-write, rather than each loading its own copy, and analyse text outside of the app process's GIL.
+
+    The pool should be started before the app starts its server threads, as forking a process with other threads running can leave locks held in the workers.
+    '''
+    def __init__(self, max_workers:int=int(ANALYSIS_MAX_WORKERS)):
+        self.max_workers = max(1, int(max_workers))
+
+        # Analysers for every profile on the default model tier are created before forking, so that the workers share them
+        for profile_name in analysis_profiles:
+            get_profile_analyser(profile_name)
+
+        # Objects that exist now, including the loaded models, are moved out of the garbage collector's generations, so that collections in the workers do not write to (and so copy) the memory they share with the app process
+        gc.freeze()
+
+        self.executor = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=multiprocessing.get_context("fork"))
+
+        # All workers are forked now rather than when the first requests arrive
+        worker_pid_futures = [self.executor.submit(get_worker_pid) for _ in range(self.max_workers)]
+        wait(worker_pid_futures)
+        self.worker_pids = sorted({future.result() for future in worker_pid_futures})
+
+        print("Started", len(self.worker_pids), "text analysis worker processes.")
+
+    def submit(self, texts:List[str], language:str, analysis_profile:str, profile_entities:List[str], spacy_model_tier:str, batch_size:int=1, **analyze_kwargs) -> Future:
+        '''
+        Send texts to a worker for analysis. The future result is the analyser results for each text.
+        '''
+        return self.executor.submit(analyse_texts_in_worker, list(texts), language, analysis_profile, profile_entities, spacy_model_tier, get_custom_word_list_settings(), batch_size, analyze_kwargs)
+
+    def close(self, wait:bool=True):
+        self.executor.shutdown(wait=wait)
+
+class PooledAnalyzer:
+    '''
+    Stands in for the AnalyzerEngine of a job, sending its analysis to the worker pool and waiting on the results. Long lists of texts are split into chunks that are analysed by several workers at once.
+
+    If a worker process dies (e.g. killed for running out of memory), the pool can no longer be used. It is then discarded, and the job's remaining texts are analysed in the app process.
+    '''
+    def __init__(self, pool:AnalysisWorkerPool, analysis_profile:str=ANALYSIS_PROFILE, profile_entities:List[str]=None, spacy_model_tier:str=SPACY_MODEL_TIER, chunk_size:int=int(ANALYSIS_WORKER_CHUNK_SIZE)):
+        self.pool = pool
+        self.analysis_profile = analysis_profile
+        self.profile_entities = profile_entities
+        self.spacy_model_tier = spacy_model_tier
+        self.chunk_size = max(1, int(chunk_size))
+
+    def submit_texts(self, texts:List[str], language:str, batch_size:int=1, **analyze_kwargs) -> List[Tuple[Optional[Future], List[str], str, int, Dict[str, Any]]]:
+        '''
+        Send texts to the pool in chunks. Returns each chunk's future, which is None if the pool could not be used, with the chunk's analysis arguments so that it can be analysed in this process instead.
+        '''
+        chunks = []
+        for start in range(0, len(texts), self.chunk_size):
+            chunk_texts = texts[start:start + self.chunk_size]
+            future = None
+
+            if self.pool:
+                try:
+                    future = self.pool.submit(chunk_texts, language, self.analysis_profile, self.profile_entities, self.spacy_model_tier, batch_size, **analyze_kwargs)
+                except BrokenProcessPool as e:
+                    self.discard_pool(e)
+
+            chunks.append((future, chunk_texts, language, batch_size, analyze_kwargs))
+
+        return chunks
+
+    def get_results(self, chunks:List[Tuple[Optional[Future], List[str], str, int, Dict[str, Any]]]) -> List[List[RecognizerResult]]:
+        results = []
+        for future, chunk_texts, language, batch_size, analyze_kwargs in chunks:
+            if future is not None:
+                try:
+                    results.extend(future.result())
+                    continue
+                except BrokenProcessPool as e:
+                    self.discard_pool(e)
+
+            results.extend(analyse_texts(chunk_texts, language, self.analysis_profile, self.profile_entities, self.spacy_model_tier, batch_size, analyze_kwargs))
+        return results
+
+    def discard_pool(self, error:Exception):
+        if self.pool: discard_analysis_worker_pool(self.pool, error)
+        self.pool = None
+
+    def analyze(self, text:str, language:str, **analyze_kwargs) -> List[RecognizerResult]:
+        return self.get_results(self.submit_texts([text], language, **analyze_kwargs))[0]
+
+    def analyze_batch(self, texts:List[str], language:str, batch_size:int=1, **analyze_kwargs) -> List[List[RecognizerResult]]:
+        return self.get_results(self.submit_texts(list(texts), language, batch_size, **analyze_kwargs))
+
+    def analyze_dict(self, input_dict:Dict[str, Any], language:str, keys_to_skip:Optional[List[str]]=None, **analyze_kwargs) -> Iterator[DictAnalyzerResult]:
+        '''
+        Analyse the values of a dictionary of column names and lists of values, as analyze_dict in presidio_analyzer_custom does, with the columns sent to the workers together.
+        '''
+        keys_to_skip = keys_to_skip or []
+        column_futures = {}
+
+        for key, value in input_dict.items():
+            if not value or key in keys_to_skip: continue
+            if isinstance(value, (str, int, bool, float)):
+                column_futures[key] = self.submit_texts([str(value)], language, context=[key], **analyze_kwargs)
+            elif isinstance(value, Iterable):
+                column_futures[key] = self.submit_texts(list(value), language, context=[key], **analyze_kwargs)
+            else:
+                raise ValueError(f"type {type(value)} is unsupported.")
+
+        for key, value in input_dict.items():
+            if key not in column_futures:
+                yield DictAnalyzerResult(key=key, value=value, recognizer_results=[])
+                continue
+
+            results = self.get_results(column_futures[key])
+            yield DictAnalyzerResult(key=key, value=value, recognizer_results=results[0] if isinstance(value, (str, int, bool, float)) else results)
+
+_analysis_worker_pool: Optional[AnalysisWorkerPool] = None
+_analysis_worker_pool_lock = threading.Lock()
+
+def start_analysis_worker_pool(max_workers:int=int(ANALYSIS_MAX_WORKERS)) -> Optional[AnalysisWorkerPool]:
+    '''
+    Start the shared analysis worker pool if USE_ANALYSIS_WORKER_POOL is True and it is not already running. Only called when the app starts, before the server starts its threads.
+    '''
+    global _analysis_worker_pool
+
+    if USE_ANALYSIS_WORKER_POOL != "True": return None
+
+    with _analysis_worker_pool_lock:
+        if _analysis_worker_pool is None:
+            if "fork" not in multiprocessing.get_all_start_methods():
+                print("Text analysis worker processes need an OS that can fork processes, so text will be analysed in the app process.")
+                return None
+            _analysis_worker_pool = AnalysisWorkerPool(max_workers)
+
+        return _analysis_worker_pool
+
+def discard_analysis_worker_pool(pool:AnalysisWorkerPool, error:Exception):
+    '''
+    Stop using a pool whose worker processes have died. It is not restarted, as jobs run in server threads and forking a new pool from them can leave locks held in the workers, so later jobs analyse text in the app process.
+    '''
+    global _analysis_worker_pool
+
+    with _analysis_worker_pool_lock:
+        if _analysis_worker_pool is not pool: return
+        _analysis_worker_pool = None
+
+    print("Text analysis worker processes stopped unexpectedly, so text will be analysed in the app process. Error:", error)
+    pool.close(wait=False)
+
+def get_job_analyser(analysis_profile:str=ANALYSIS_PROFILE, chosen_redact_entities:List[str]=None, spacy_model_tier:str=SPACY_MODEL_TIER):
+    '''
+    Get the analyser for a job: a PooledAnalyzer if the analysis worker pool was started when the app started, or otherwise the analyser for the job's analysis profile and model tier in this process. The pool is never started here, as jobs run in server threads.
+    '''
+    with _analysis_worker_pool_lock:
+        analysis_worker_pool = _analysis_worker_pool
+
+    if analysis_worker_pool:
+        return PooledAnalyzer(analysis_worker_pool, analysis_profile, chosen_redact_entities, spacy_model_tier)
+
+    return get_analysis_profile_analyser(analysis_profile, chosen_redact_entities, spacy_model_tier)
+
+def _close_analysis_worker_pool():
+    if _analysis_worker_pool: _analysis_worker_pool.close()
+
+atexit.register(_close_analysis_worker_pool)
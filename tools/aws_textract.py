@@ -1,13 +1,19 @@
 import boto3
-from typing import List
+from typing import List, Tuple, Callable, Dict
 import io
 import os
 import json
 from collections import defaultdict
 import pikepdf
 import time
+import random
+import threading
+from botocore.config import Config
+from concurrent.futures import ThreadPoolExecutor, Future
+from dataclasses import astuple
 from tools.custom_image_analyser_engine import OCRResult, CustomImageRecognizerResult
-from tools.config import AWS_ACCESS_KEY, AWS_SECRET_KEY, AWS_REGION
+from tools.config import AWS_ACCESS_KEY, AWS_SECRET_KEY, AWS_REGION, AWS_TEXTRACT_ENDPOINT_URL, TEXTRACT_MAX_IN_FLIGHT, TEXTRACT_REQUESTS_PER_SECOND, TEXTRACT_MAX_RETRIES
+from tools.ocr_cache import OCRResultCache, hash_bytes
 
 def extract_textract_metadata(response:object):
     """Extracts metadata from an AWS Textract response."""
@@ -25,18 +31,138 @@ def extract_textract_metadata(response:object):
         #'NumberOfPages': number_of_pages
     })
 
-def analyse_page_with_textract(pdf_page_bytes:object, page_no:int, client:str="", handwrite_signature_checkbox:List[str]=["Extract handwriting", "Redact all identified signatures"]):
+# Error codes returned by Textract when requests are coming in faster than the account quota allows, or when the service is temporarily unavailable
+textract_retryable_error_codes = {"ThrottlingException", "ProvisionedThroughputExceededException", "LimitExceededException", "TooManyRequestsException", "RequestLimitExceeded", "InternalServerError", "ServiceUnavailable", "ServiceUnavailableException"}
+
+# Retries are handled by call_textract_with_backoff, so botocore's own retries are turned off for Textract clients
+textract_client_config = Config(retries={"max_attempts": 1, "mode": "standard"})
+
+class TokenBucketRateLimiter:
     '''
-    Analyse page with AWS Textract
+    Thread-safe token bucket. Tokens are added at rate_per_second up to a maximum of burst, and each request takes one token, waiting if none are available.
     '''
-    if client == "":
-        try:               
+    def __init__(self, rate_per_second:float, burst:int=1, clock:Callable[[], float]=time.monotonic, sleep:Callable[[float], None]=time.sleep):
+        self.rate_per_second = float(rate_per_second)
+        self.burst = max(1, int(burst))
+        self.clock = clock
+        self.sleep = sleep
+        self.tokens = float(self.burst)
+        self.last_refill_time = clock()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        # A rate of 0 or less means no limit
+        if self.rate_per_second <= 0: return
+
+        while True:
+            with self.lock:
+                now = self.clock()
+                self.tokens = min(self.burst, self.tokens + (now - self.last_refill_time) * self.rate_per_second)
+                self.last_refill_time = now
+
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+
+                wait_time = (1 - self.tokens) / self.rate_per_second
+
+            self.sleep(wait_time)
+
+def is_retryable_textract_error(error:Exception) -> bool:
+    '''
+    Throttling, server-side and connection errors are worth retrying. Errors about the request itself (e.g. an unsupported or too large document) are not.
+    '''
+    error_response = getattr(error, "response", None)
+
+    if isinstance(error_response, dict):
+        error_code = error_response.get("Error", {}).get("Code", "")
+        status_code = error_response.get("ResponseMetadata", {}).get("HTTPStatusCode", 0)
+        return error_code in textract_retryable_error_codes or status_code >= 500
+
+    # Errors without a service response, e.g. timeouts or dropped connections
+    return True
+
+def call_textract_with_backoff(textract_call:Callable[[], dict], rate_limiter:TokenBucketRateLimiter=None, max_retries:int=int(TEXTRACT_MAX_RETRIES), base_delay:float=0.5, max_delay:float=20.0, sleep:Callable[[float], None]=time.sleep) -> dict:
+    '''
+    Make a Textract API call, waiting for the rate limiter first. Retryable errors are retried up to max_retries times, waiting a random time between zero and an exponentially increasing cap before each retry (full jitter), so that concurrent requests do not retry in step.
+    '''
+    attempt = 0
+
+    while True:
+        if rate_limiter: rate_limiter.acquire()
+
+        try:
+            return textract_call()
+        except Exception as e:
+            if attempt >= max_retries or not is_retryable_textract_error(e):
+                raise
+
+            backoff_time = random.uniform(0, min(max_delay, base_delay * (2 ** attempt)))
+            print("Textract call failed due to:", e, f"retrying in {backoff_time:.1f} seconds.")
+            sleep(backoff_time)
+            attempt += 1
+
+_textract_client = None
+_textract_client_lock = threading.Lock()
+
+def get_textract_client():
+    '''
+    Return a Textract client using credentials from environment variables or the current AWS session, creating it on first use. boto3 clients are thread-safe, so the same client is shared by all requests. AWS_TEXTRACT_ENDPOINT_URL can point the client at another endpoint, e.g. a local stub.
+    '''
+    global _textract_client
+
+    with _textract_client_lock:
+        if _textract_client is None:
+            client_kwargs = {"region_name": AWS_REGION, "config": textract_client_config}
+            if AWS_TEXTRACT_ENDPOINT_URL: client_kwargs["endpoint_url"] = AWS_TEXTRACT_ENDPOINT_URL
+
             if AWS_ACCESS_KEY and AWS_SECRET_KEY:
-                client = boto3.client('textract', 
-                aws_access_key_id=AWS_ACCESS_KEY, 
-                aws_secret_access_key=AWS_SECRET_KEY, region_name=AWS_REGION)
+                _textract_client = boto3.client('textract', aws_access_key_id=AWS_ACCESS_KEY, aws_secret_access_key=AWS_SECRET_KEY, **client_kwargs)
             else:
-                client = boto3.client('textract', region_name=AWS_REGION)
+                _textract_client = boto3.client('textract', **client_kwargs)
+
+        return _textract_client
+
+_textract_rate_limiter = None
+
+def get_textract_rate_limiter() -> TokenBucketRateLimiter:
+    '''
+    Return the rate limiter shared by all Textract requests from this app, so that documents redacted at the same time share the account request quota.
+    '''
+    global _textract_rate_limiter
+
+    with _textract_client_lock:
+        if _textract_rate_limiter is None:
+            _textract_rate_limiter = TokenBucketRateLimiter(float(TEXTRACT_REQUESTS_PER_SECOND), burst=max(1, int(float(TEXTRACT_REQUESTS_PER_SECOND))))
+
+        return _textract_rate_limiter
+
+def analyse_page_with_textract(pdf_page_bytes:object, page_no:int, client:str="", handwrite_signature_checkbox:List[str]=["Extract handwriting", "Redact all identified signatures"], ocr_cache:OCRResultCache=None, rate_limiter:TokenBucketRateLimiter=None, max_retries:int=int(TEXTRACT_MAX_RETRIES)):
+    '''
+    Analyse page with AWS Textract. If an OCR cache is given, a previous Textract response for the same page image and Textract options is reused instead of calling the service, and request metadata is returned as an empty string.
+
+    Calls wait for the rate limiter if one is given, and throttling or temporary errors are retried with jittered exponential backoff.
+    '''
+    if "Redact all identified signatures" in handwrite_signature_checkbox: textract_feature_types = ["SIGNATURES"]
+    else: textract_feature_types = []
+
+    cache_key = ""
+    if ocr_cache:
+        cache_key = ocr_cache.make_key(hash_bytes(pdf_page_bytes), "textract", {"feature_types": textract_feature_types})
+        cached_value = ocr_cache.get(cache_key)
+
+        if cached_value is not None:
+            response = cached_value["response"]
+
+            if "Blocks" in response:
+                for block in response["Blocks"]:
+                    block["Page"] = page_no
+
+            return {'page_no': page_no, 'data': response}, ""
+
+    if client == "":
+        try:               
+            client = get_textract_client()
         except:
             print("Cannot connect to AWS Textract")
             return [], ""  # Return an empty list and an empty string
@@ -48,21 +174,11 @@ def analyse_page_with_textract(pdf_page_bytes:object, page_no:int, client:str=""
     # Redact signatures if specified
     if "Redact all identified signatures" in handwrite_signature_checkbox:
         #print("Analysing document with signature detection")
-        try:
-            response = client.analyze_document(Document={'Bytes': pdf_page_bytes}, FeatureTypes=["SIGNATURES"])
-        except Exception as e:
-            print("Textract call failed due to:", e, "trying again in 3 seconds.")
-            time.sleep(3)
-            response = client.analyze_document(Document={'Bytes': pdf_page_bytes}, FeatureTypes=["SIGNATURES"])
+        response = call_textract_with_backoff(lambda: client.analyze_document(Document={'Bytes': pdf_page_bytes}, FeatureTypes=["SIGNATURES"]), rate_limiter, max_retries)
     else:
         #print("Analysing document without signature detection")
         # Call detect_document_text to extract plain text
-        try:
-            response = client.detect_document_text(Document={'Bytes': pdf_page_bytes})
-        except Exception as e:
-            print("Textract call failed due to:", e, "trying again in 5 seconds.")
-            time.sleep(5)
-            response = client.detect_document_text(Document={'Bytes': pdf_page_bytes})
+        response = call_textract_with_backoff(lambda: client.detect_document_text(Document={'Bytes': pdf_page_bytes}), rate_limiter, max_retries)
 
      # Add the 'Page' attribute to each block
     if "Blocks" in response:
@@ -79,11 +195,101 @@ def analyse_page_with_textract(pdf_page_bytes:object, page_no:int, client:str=""
 
     request_metadata = extract_textract_metadata(response)  # Metadata comes out as a string
 
+    if ocr_cache: ocr_cache.put(cache_key, {"response": response})
+
     #print("request_metadata:", request_metadata)
 
     # Return a list containing the wrapped response and the metadata
     return wrapped_response, request_metadata  # Return as a list to match the desired structure
 
+class TextractPageSubmitter:
+    '''
+    Keeps several Textract page requests in flight at once, so that the number of pages analysed per second is limited by the account quota (through the rate limiter) rather than by the time each request takes.
+
+    Pages are submitted in order, keeping up to max_in_flight pages submitted but not yet collected. Page bytes are loaded in the worker threads by load_page_bytes(page_no), so that creating page images for later pages also happens in the background. If load_page_bytes returns None (e.g. for a blank page), no request is sent for the page.
+    '''
+    def __init__(self,
+                 page_numbers:List[int],
+                 load_page_bytes:Callable[[int], bytes],
+                 client:str="",
+                 handwrite_signature_checkbox:List[str]=["Extract handwriting", "Redact all identified signatures"],
+                 ocr_cache:OCRResultCache=None,
+                 max_in_flight:int=int(TEXTRACT_MAX_IN_FLIGHT),
+                 rate_limiter:TokenBucketRateLimiter=None,
+                 max_retries:int=int(TEXTRACT_MAX_RETRIES)):
+        self.page_numbers = list(page_numbers)
+        self.load_page_bytes = load_page_bytes
+        self.client = client if client != "" else get_textract_client()
+        self.handwrite_signature_checkbox = handwrite_signature_checkbox
+        self.ocr_cache = ocr_cache
+        self.max_in_flight = max(1, int(max_in_flight))
+        self.rate_limiter = rate_limiter if rate_limiter is not None else get_textract_rate_limiter()
+        self.max_retries = max_retries
+        self.futures: Dict[int, Future] = {}
+        self.discarded_page_numbers = set()
+        self.next_page_index = 0
+        self.executor = ThreadPoolExecutor(max_workers=self.max_in_flight, thread_name_prefix="textract")
+
+    def _analyse_page(self, page_no:int):
+        pdf_page_bytes = self.load_page_bytes(page_no)
+        if pdf_page_bytes is None: return None, ""
+        return analyse_page_with_textract(pdf_page_bytes, str(page_no + 1), self.client, self.handwrite_signature_checkbox, ocr_cache=self.ocr_cache, rate_limiter=self.rate_limiter, max_retries=self.max_retries)
+
+    def submit_pages_ahead(self):
+        '''
+        Submit the next pages in order until max_in_flight pages are waiting to be collected.
+        '''
+        while self.next_page_index < len(self.page_numbers) and len(self.futures) < self.max_in_flight:
+            page_no = self.page_numbers[self.next_page_index]
+            self.next_page_index += 1
+            if page_no in self.discarded_page_numbers: continue
+            self.futures[page_no] = self.executor.submit(self._analyse_page, page_no)
+
+    def discard_page(self, page_no:int):
+        '''
+        Stop waiting for a page whose result is no longer needed (e.g. a blank page), freeing its place in the window. The request is cancelled if it has not started.
+        '''
+        self.discarded_page_numbers.add(page_no)
+
+        page_result = self.futures.pop(page_no, None)
+        if page_result: page_result.cancel()
+
+        self.submit_pages_ahead()
+
+    def get_page_result(self, page_no:int):
+        '''
+        Wait for the Textract result of a zero-indexed page, returning the wrapped response and request metadata as analyse_page_with_textract does. Raises the error from the request if it failed.
+        '''
+        self.submit_pages_ahead()
+
+        if page_no not in self.futures:
+            self.futures[page_no] = self.executor.submit(self._analyse_page, page_no)
+
+        page_result = self.futures.pop(page_no)
+
+        # Keep the window full while this page's result is used
+        self.submit_pages_ahead()
+
+        return page_result.result()
+
+    def close(self) -> List[Tuple[dict, str]]:
+        '''
+        Cancel pages that have not been sent yet and wait for requests already in flight. Returns the results of requests that completed but were not collected, so that they can be saved rather than paid for again on the next run. Calling close again returns an empty list.
+        '''
+        for future in self.futures.values(): future.cancel()
+        self.executor.shutdown(wait=True)
+
+        completed_results = [future.result() for future in self.futures.values() if not future.cancelled() and future.exception() is None]
+        self.futures = {}
+
+        return completed_results
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
 def convert_pike_pdf_page_to_bytes(pdf:object, page_num:int):
     # Create a new empty PDF
     new_pdf = pikepdf.Pdf.new()
@@ -109,6 +315,61 @@ def convert_pike_pdf_page_to_bytes(pdf:object, page_num:int):
 
     return pdf_bytes
 
+class TextractBlockGraph:
+    '''
+    Index of the blocks in a Textract response by id and block type, so that relationships between blocks (LINE to WORD, KEY to VALUE, etc.) can be followed without searching the whole block list each time.
+    '''
+    def __init__(self, text_blocks:List[dict]):
+        self.blocks = text_blocks
+        self.blocks_by_id = {}
+        self.blocks_by_type = defaultdict(list)
+
+        for block in text_blocks:
+            if "Id" in block: self.blocks_by_id[block["Id"]] = block
+            self.blocks_by_type[block.get("BlockType", "")].append(block)
+
+    def get_block(self, block_id:str) -> dict:
+        return self.blocks_by_id.get(block_id)
+
+    def get_blocks_of_type(self, block_type:str) -> List[dict]:
+        return self.blocks_by_type.get(block_type, [])
+
+    def get_related_blocks(self, block:dict, relationship_type:str="CHILD", block_type:str=None) -> List[dict]:
+        '''
+        Return the blocks linked to a block through a given relationship type (e.g. CHILD, VALUE), in the order Textract lists them. Optionally only return blocks of one type.
+        '''
+        related_blocks = []
+
+        for relationship in block.get("Relationships", []):
+            if relationship["Type"] != relationship_type: continue
+
+            for related_id in relationship["Ids"]:
+                related_block = self.blocks_by_id.get(related_id)
+                if related_block and (block_type is None or related_block["BlockType"] == block_type):
+                    related_blocks.append(related_block)
+
+        return related_blocks
+
+    def get_child_words(self, block:dict) -> List[dict]:
+        return self.get_related_blocks(block, "CHILD", "WORD")
+
+    def get_key_value_pairs(self) -> List[Tuple[str, str, dict, dict]]:
+        '''
+        Return (key text, value text, key block, value block) for each KEY_VALUE_SET key found by the Textract FORMS feature.
+        '''
+        key_value_pairs = []
+
+        for block in self.get_blocks_of_type("KEY_VALUE_SET"):
+            if "KEY" not in block.get("EntityTypes", []): continue
+
+            key_text = " ".join(word.get("Text", "") for word in self.get_child_words(block))
+
+            for value_block in self.get_related_blocks(block, "VALUE", "KEY_VALUE_SET"):
+                value_text = " ".join(word.get("Text", "") for word in self.get_child_words(value_block))
+                key_value_pairs.append((key_text, value_text, block, value_block))
+
+        return key_value_pairs
+
 def json_to_ocrresult(json_data:dict, page_width:float, page_height:float, page_no:int):
     '''
     Convert the json response from textract to the OCRResult format used elsewhere in the code. Looks for lines, words, and signatures. Handwriting and signatures are set aside especially for later in case the user wants to override the default behaviour and redact all handwriting/signatures.
@@ -138,6 +399,14 @@ def json_to_ocrresult(json_data:dict, page_width:float, page_height:float, page_
     elif "page_no" in page_json_data:
         text_blocks = page_json_data["data"]["Blocks"]
 
+    # Index blocks by id once, so that finding the words of each line does not mean searching all blocks
+    block_graph = TextractBlockGraph(text_blocks)
+
+    # Keys of results already in each list, to check for duplicates without searching the lists
+    signature_or_handwriting_result_keys = set()
+    signature_result_keys = set()
+    handwriting_result_keys = set()
+
     is_signature = False
     is_handwriting = False
 
@@ -163,56 +432,54 @@ def json_to_ocrresult(json_data:dict, page_width:float, page_height:float, page_
                 current_line_handwriting_results = []  # Track handwriting results for this line
 
                 if 'Relationships' in text_block:
-                    for relationship in text_block['Relationships']:
-                        if relationship['Type'] == 'CHILD':
-                            for child_id in relationship['Ids']:
-                                child_block = next((block for block in text_blocks if block['Id'] == child_id), None)
-                                if child_block and child_block['BlockType'] == 'WORD':
-                                    word_text = child_block.get('Text', '')
-                                    word_bbox = child_block["Geometry"]["BoundingBox"]
-                                    confidence = child_block.get('Confidence','')
-                                    word_left = int(word_bbox["Left"] * page_width)
-                                    word_top = int(word_bbox["Top"] * page_height)
-                                    word_right = int((word_bbox["Left"] + word_bbox["Width"]) * page_width)
-                                    word_bottom = int((word_bbox["Top"] + word_bbox["Height"]) * page_height)
-
-                                    # Extract BoundingBox details
-                                    word_width = word_bbox["Width"]
-                                    word_height = word_bbox["Height"]
-
-                                    # Convert proportional coordinates to absolute coordinates
-                                    word_width_abs = int(word_width * page_width)
-                                    word_height_abs = int(word_height * page_height)
+                    for child_block in block_graph.get_child_words(text_block):
+                        word_text = child_block.get('Text', '')
+                        word_bbox = child_block["Geometry"]["BoundingBox"]
+                        confidence = child_block.get('Confidence','')
+                        word_left = int(word_bbox["Left"] * page_width)
+                        word_top = int(word_bbox["Top"] * page_height)
+                        word_right = int((word_bbox["Left"] + word_bbox["Width"]) * page_width)
+                        word_bottom = int((word_bbox["Top"] + word_bbox["Height"]) * page_height)
+
+                        # Extract BoundingBox details
+                        word_width = word_bbox["Width"]
+                        word_height = word_bbox["Height"]
+
+                        # Convert proportional coordinates to absolute coordinates
+                        word_width_abs = int(word_width * page_width)
+                        word_height_abs = int(word_height * page_height)
                                     
-                                    words.append({
-                                        'text': word_text,
-                                        'bounding_box': (word_left, word_top, word_right, word_bottom)
-                                    })
-                                    # Check for handwriting
-                                    text_type = child_block.get("TextType", '')
-
-                                    if text_type == "HANDWRITING":
-                                        is_handwriting = True
-                                        entity_name = "HANDWRITING"
-                                        word_end = len(word_text)
-
-                                        recogniser_result = CustomImageRecognizerResult(
-                                            entity_type=entity_name,
-                                            text=word_text,
-                                            score=confidence,
-                                            start=0,
-                                            end=word_end,
-                                            left=word_left,
-                                            top=word_top,
-                                            width=word_width_abs,
-                                            height=word_height_abs
-                                        )
-
-                                        # Add to handwriting collections immediately
-                                        handwriting.append(recogniser_result)
-                                        handwriting_recogniser_results.append(recogniser_result)
-                                        signature_or_handwriting_recogniser_results.append(recogniser_result)
-                                        current_line_handwriting_results.append(recogniser_result)
+                        words.append({
+                            'text': word_text,
+                            'bounding_box': (word_left, word_top, word_right, word_bottom)
+                        })
+                        # Check for handwriting
+                        text_type = child_block.get("TextType", '')
+
+                        if text_type == "HANDWRITING":
+                            is_handwriting = True
+                            entity_name = "HANDWRITING"
+                            word_end = len(word_text)
+
+                            recogniser_result = CustomImageRecognizerResult(
+                                entity_type=entity_name,
+                                text=word_text,
+                                score=confidence,
+                                start=0,
+                                end=word_end,
+                                left=word_left,
+                                top=word_top,
+                                width=word_width_abs,
+                                height=word_height_abs
+                            )
+
+                            # Add to handwriting collections immediately
+                            handwriting.append(recogniser_result)
+                            handwriting_recogniser_results.append(recogniser_result)
+                            signature_or_handwriting_recogniser_results.append(recogniser_result)
+                            current_line_handwriting_results.append(recogniser_result)
+                            handwriting_result_keys.add(astuple(recogniser_result))
+                            signature_or_handwriting_result_keys.add(astuple(recogniser_result))
 
             # If handwriting or signature, add to bounding box               
 
@@ -239,6 +506,8 @@ def json_to_ocrresult(json_data:dict, page_width:float, page_height:float, page_
                 signatures.append(recogniser_result)
                 signature_recogniser_results.append(recogniser_result)
                 signature_or_handwriting_recogniser_results.append(recogniser_result)
+                signature_result_keys.add(astuple(recogniser_result))
+                signature_or_handwriting_result_keys.add(astuple(recogniser_result))
 
                 words = [{
                     'text': line_text,
@@ -260,16 +529,21 @@ def json_to_ocrresult(json_data:dict, page_width:float, page_height:float, page_
 
             # If it is signature or handwriting, will overwrite the default behaviour of the PII analyser
             if is_signature_or_handwriting:
-                if recogniser_result not in signature_or_handwriting_recogniser_results: 
+                recogniser_result_key = astuple(recogniser_result)
+
+                if recogniser_result_key not in signature_or_handwriting_result_keys: 
                     signature_or_handwriting_recogniser_results.append(recogniser_result)
+                    signature_or_handwriting_result_keys.add(recogniser_result_key)
 
                 if is_signature:
-                    if recogniser_result not in signature_recogniser_results:          
+                    if recogniser_result_key not in signature_result_keys:          
                         signature_recogniser_results.append(recogniser_result)
+                        signature_result_keys.add(recogniser_result_key)
 
                 if is_handwriting: 
-                    if recogniser_result not in handwriting_recogniser_results: 
+                    if recogniser_result_key not in handwriting_result_keys: 
                         handwriting_recogniser_results.append(recogniser_result)
+                        handwriting_result_keys.add(recogniser_result_key)
 
             i += 1
 
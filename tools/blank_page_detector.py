@@ -0,0 +1,101 @@
+import threading
+import numpy as np
+import cv2
+from PIL import Image
+from typing import Dict, List, Union
+
+from tools.config import BLANK_PAGE_INK_CONTRAST, BLANK_PAGE_MAX_INK_SHARE, BLANK_PAGE_MAX_INK_COMPONENTS, BLANK_PAGE_MIN_COMPONENT_AREA
+from tools.page_image_store import open_page_image
+
+class BlankPageDetector:
+    '''
+    Cheap check for blank page images, e.g. separator sheets and the blank backs of scanned pages, based on pixel statistics, so that they can skip OCR and text analysis.
+
+    The whole page is checked in greyscale at full resolution, so that page numbers, marginal notes and small marks near the edges are not missed. The paper colour is taken from the brightest pixels, and pixels darker than it by more than ink_contrast are counted as ink. A page is blank if the share of ink pixels is at most max_ink_share and there are at most max_ink_components marks of at least min_component_area pixels. With the default limits only pages with no marks at all are treated as blank: single-pixel noise is allowed, but a full stop, a stray pen mark or a punch hole is not.
+
+    Results are remembered by image path, so a page checked in a worker thread is not checked again in the redaction loop.
+    '''
+    def __init__(self,
+                 ink_contrast:int=int(BLANK_PAGE_INK_CONTRAST),
+                 max_ink_share:float=float(BLANK_PAGE_MAX_INK_SHARE),
+                 max_ink_components:int=int(BLANK_PAGE_MAX_INK_COMPONENTS),
+                 min_component_area:int=int(BLANK_PAGE_MIN_COMPONENT_AREA)):
+        self.ink_contrast = ink_contrast
+        self.max_ink_share = max_ink_share
+        self.max_ink_components = max_ink_components
+        self.min_component_area = min_component_area
+        self.page_results: Dict[str, dict] = {}
+        self.lock = threading.Lock()
+
+    def get_page_stats(self, image:Image.Image) -> dict:
+        '''
+        Return the share of ink pixels and the number of ink marks on a page image.
+        '''
+        pixels = np.asarray(image.convert("L"))
+
+        if pixels.size == 0: return {"ink_share": 0.0, "ink_components": 0}
+
+        # Paper colour is the 95th percentile of brightness, which allows for grey or yellowed scans
+        histogram = np.bincount(pixels.ravel(), minlength=256)
+        background_level = int(np.searchsorted(np.cumsum(histogram), 0.95 * pixels.size))
+
+        # Dark pages (e.g. photos or pages that are already fully redacted) are never treated as blank
+        if background_level <= self.ink_contrast: return {"ink_share": 1.0, "ink_components": 0}
+
+        ink_mask = (pixels < background_level - self.ink_contrast).astype(np.uint8)
+        ink_share = float(ink_mask.mean())
+
+        ink_components = 0
+        if ink_share > 0:
+            number_of_labels, _, component_stats, _ = cv2.connectedComponentsWithStats(ink_mask, connectivity=8)
+            # Label 0 is the background
+            ink_components = int((component_stats[1:number_of_labels, cv2.CC_STAT_AREA] >= self.min_component_area).sum())
+
+        return {"ink_share": round(ink_share, 6), "ink_components": ink_components}
+
+    def is_blank_page(self, image:Union[str, Image.Image], page_no:int=None) -> bool:
+        '''
+        Check whether a page image (a file path or PIL image) is blank. page_no (zero-indexed) is only used for reporting.
+        '''
+        image_key = image if isinstance(image, str) else None
+
+        if image_key:
+            with self.lock:
+                if image_key in self.page_results: return self.page_results[image_key]["blank"]
+
+        try:
+            if isinstance(image, str):
+                with open_page_image(image) as page_image:
+                    page_stats = self.get_page_stats(page_image)
+            else:
+                page_stats = self.get_page_stats(image)
+        except Exception as e:
+            print("Could not check whether page is blank due to:", e)
+            return False
+
+        page_stats["blank"] = page_stats["ink_share"] <= self.max_ink_share and page_stats["ink_components"] <= self.max_ink_components
+        page_stats["page"] = page_no + 1 if page_no is not None else None
+
+        with self.lock:
+            self.page_results[image_key or f"image_{len(self.page_results)}"] = page_stats
+
+        return page_stats["blank"]
+
+    def get_blank_page_numbers(self) -> List[int]:
+        '''
+        One-indexed page numbers of pages found to be blank.
+        '''
+        with self.lock:
+            return sorted(page_stats["page"] for page_stats in self.page_results.values() if page_stats["blank"] and page_stats["page"] is not None)
+
+    def get_report_message(self) -> str:
+        with self.lock:
+            pages_checked = len(self.page_results)
+            pages_blank = sum(page_stats["blank"] for page_stats in self.page_results.values())
+
+        blank_page_numbers = self.get_blank_page_numbers()
+
+        message = f"Blank page detection (ink contrast {self.ink_contrast}, max ink share {self.max_ink_share}, max ink marks {self.max_ink_components}): {pages_blank} of {pages_checked} pages skipped OCR and text analysis as blank."
+        if blank_page_numbers: message += " Blank pages: " + ", ".join(str(page) for page in blank_page_numbers)
+
+        return message
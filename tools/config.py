@@ -65,6 +65,16 @@ if AWS_SECRET_KEY: print(f'AWS_SECRET_KEY found in environment variables')
 
 DOCUMENT_REDACTION_BUCKET = get_or_create_env_var('DOCUMENT_REDACTION_BUCKET', '')
 
+# Textract requests are sent several pages at a time, limited to a number of requests per second to stay within the account quota. Throttled requests are retried with backoff.
+TEXTRACT_MAX_IN_FLIGHT = get_or_create_env_var('TEXTRACT_MAX_IN_FLIGHT', '4')
+
+TEXTRACT_REQUESTS_PER_SECOND = get_or_create_env_var('TEXTRACT_REQUESTS_PER_SECOND', '2')
+
+TEXTRACT_MAX_RETRIES = get_or_create_env_var('TEXTRACT_MAX_RETRIES', '6')
+
+# Alternative endpoint for Textract calls, e.g. a local stub service for testing
+AWS_TEXTRACT_ENDPOINT_URL = get_or_create_env_var('AWS_TEXTRACT_ENDPOINT_URL', '')
+
 # Custom headers e.g. if routing traffic through Cloudfront
 # Retrieving or setting CUSTOM_HEADER
 CUSTOM_HEADER = get_or_create_env_var('CUSTOM_HEADER', '')
@@ -80,6 +90,29 @@ if CUSTOM_HEADER_VALUE: print(f'CUSTOM_HEADER_VALUE found')
 IMAGES_DPI = get_or_create_env_var('IMAGES_DPI', '300.0')
 LOAD_TRUNCATED_IMAGES = get_or_create_env_var('LOAD_TRUNCATED_IMAGES', 'True')
 MAX_IMAGE_PIXELS = get_or_create_env_var('MAX_IMAGE_PIXELS', '') # Changed to None if blank in file_conversion.py
+PDF_RASTERISER = get_or_create_env_var('PDF_RASTERISER', 'pdf2image') # 'pdf2image' (poppler, one subprocess per page) or 'pymupdf' (renders in memory with each worker keeping the PDF open)
+
+# Render each PDF page at a DPI chosen from the size of its smaller text, rather than at IMAGES_DPI. The text size comes from the text layer, or from a low resolution probe render for scanned pages.
+USE_ADAPTIVE_DPI = get_or_create_env_var('USE_ADAPTIVE_DPI', 'False')
+ADAPTIVE_DPI_TARGET_TEXT_PIXELS = get_or_create_env_var('ADAPTIVE_DPI_TARGET_TEXT_PIXELS', '30') # Height in pixels that text of the estimated size should have in the page image. About 30 pixels (10pt text at 216 DPI) keeps Tesseract accuracy close to its best.
+ADAPTIVE_DPI_MIN = get_or_create_env_var('ADAPTIVE_DPI_MIN', '150')
+ADAPTIVE_DPI_MAX = get_or_create_env_var('ADAPTIVE_DPI_MAX', '400')
+ADAPTIVE_DPI_STEP = get_or_create_env_var('ADAPTIVE_DPI_STEP', '25') # DPIs are rounded up to a multiple of this
+ADAPTIVE_DPI_TEXT_PERCENTILE = get_or_create_env_var('ADAPTIVE_DPI_TEXT_PERCENTILE', '10') # Percentile of text sizes on the page used as its text size, so that small print such as footnotes is readable
+ADAPTIVE_DPI_PROBE_DPI = get_or_create_env_var('ADAPTIVE_DPI_PROBE_DPI', '100')
+
+# Redact JPG and PNG uploads directly as images, rather than first wrapping each one in a PDF that is saved to the output folder. Images over the Textract size limit are re-encoded when they are sent, rather than when they are loaded.
+USE_DIRECT_IMAGE_INPUT = get_or_create_env_var('USE_DIRECT_IMAGE_INPUT', 'True')
+
+# Also save a PDF of each redacted image upload, alongside the redacted PNG
+IMAGE_INPUT_OUTPUT_PDF = get_or_create_env_var('IMAGE_INPUT_OUTPUT_PDF', 'False')
+
+# Keep the decoded greyscale pixels of each page image in a store next to the page PNGs (one memory-mapped .npy file per page), so that OCR, redaction and review read pages without decoding the PNG again. Uses about 9MB of disk per A4 page at 300 DPI.
+USE_PAGE_IMAGE_STORE = get_or_create_env_var('USE_PAGE_IMAGE_STORE', 'False')
+
+# Page images above this size in bytes are re-encoded before they are sent to AWS Textract, which accepts images up to 5MB
+TEXTRACT_MAX_IMAGE_BYTES = get_or_create_env_var('TEXTRACT_MAX_IMAGE_BYTES', '4718592')
+TEXTRACT_IMAGE_ENCODINGS = get_or_create_env_var('TEXTRACT_IMAGE_ENCODINGS', 'grey8,grey4') # Comma-separated encodings to try, in order, before scaling the image down: original, grey8 (8-bit greyscale), grey4 (16 grey levels), bilevel (black and white)
 
 ###
 # File I/O config
@@ -125,6 +158,151 @@ CUSTOM_BOX_COLOUR = get_or_create_env_var("CUSTOM_BOX_COLOUR", "")
 
 REDACTION_LANGUAGE = get_or_create_env_var("REDACTION_LANGUAGE", "en") # Currently only English is supported by the app
 
+# Number of worker processes started with the app to run local Tesseract OCR on document pages. 1 runs OCR page by page in the main process.
+TESSERACT_MAX_WORKERS = get_or_create_env_var("TESSERACT_MAX_WORKERS", "1")
+
+# Either 'pytesseract' (starts a tesseract process for each page) or 'tesserocr' (keeps Tesseract engines loaded in memory, requires the tesserocr package)
+TESSERACT_OCR_BACKEND = get_or_create_env_var("TESSERACT_OCR_BACKEND", "pytesseract")
+
+# How each page image is passed to Tesseract. 'page' OCRs the whole page at once. 'regions' OCRs only the blocks of the page that contain marks, found with OpenCV. 'tiles' splits the page into overlapping tiles. 'auto' uses regions for sparse pages, tiles for very large dense pages, and the whole page otherwise.
+TESSERACT_OCR_REGION_MODE = get_or_create_env_var("TESSERACT_OCR_REGION_MODE", "page")
+
+# Number of threads used to OCR the regions or tiles of a page at the same time
+OCR_REGION_MAX_WORKERS = get_or_create_env_var("OCR_REGION_MAX_WORKERS", "4")
+
+# Tile size and overlap between neighbouring tiles, in pixels of the preprocessed page image
+OCR_TILE_SIZE = get_or_create_env_var("OCR_TILE_SIZE", "3000")
+
+OCR_TILE_OVERLAP = get_or_create_env_var("OCR_TILE_OVERLAP", "200")
+
+# In 'auto' mode, pages where text blocks cover more than this share of the page are OCRed whole (or in tiles if larger than OCR_TILE_MIN_PAGE_PIXELS)
+OCR_REGION_MAX_COVERAGE = get_or_create_env_var("OCR_REGION_MAX_COVERAGE", "0.6")
+
+OCR_TILE_MIN_PAGE_PIXELS = get_or_create_env_var("OCR_TILE_MIN_PAGE_PIXELS", "16000000")
+
+# 'fixed' OCRs every page with the page segmentation mode in the Tesseract config (--psm 11, sparse text). 'adaptive' classifies the layout of each page from cheap image features and uses the mode for that layout in TESSERACT_PSM_BY_LAYOUT.
+TESSERACT_PAGE_SEGMENTATION = get_or_create_env_var("TESSERACT_PAGE_SEGMENTATION", "fixed")
+
+# Tesseract page segmentation mode for each page layout: 6 assumes a single uniform block of text, 3 finds blocks and columns automatically, 11 finds as much sparse text as possible, and 4 reads a single column of text of variable sizes row by row
+TESSERACT_PSM_BY_LAYOUT = get_or_create_env_var("TESSERACT_PSM_BY_LAYOUT", "dense_single_column:6,multi_column:3,sparse_form:11,table_like:4")
+
+# Image preprocessing before Tesseract OCR. 'pipeline' runs the stages in IMAGE_PREPROCESSING_STAGES on a single numpy buffer, 'contrast_segmented' uses the original chain of preprocessors
+IMAGE_PREPROCESSOR = get_or_create_env_var("IMAGE_PREPROCESSOR", "pipeline")
+
+# Comma-separated order of the stages run by the 'pipeline' preprocessor. Available stages: bilateral_filter, contrast, adaptive_threshold, otsu_threshold, rescale
+IMAGE_PREPROCESSING_STAGES = get_or_create_env_var("IMAGE_PREPROCESSING_STAGES", "bilateral_filter,contrast,adaptive_threshold,otsu_threshold,rescale")
+
+# OCR pages with a fast first pass on a lightly processed image, then OCR only the parts of the page with low confidence words again after full image preprocessing
+USE_TWO_PASS_OCR = get_or_create_env_var("USE_TWO_PASS_OCR", "False")
+
+# Comma-separated preprocessing stages for the first pass (see IMAGE_PREPROCESSING_STAGES). Empty converts the image to greyscale only
+OCR_FIRST_PASS_STAGES = get_or_create_env_var("OCR_FIRST_PASS_STAGES", "rescale")
+
+# Words with a Tesseract confidence (0-100) below this are OCRed again in the second pass
+OCR_LOW_CONFIDENCE_THRESHOLD = get_or_create_env_var("OCR_LOW_CONFIDENCE_THRESHOLD", "60")
+
+# Pixels added around low confidence words to make the parts of the page OCRed in the second pass
+OCR_TWO_PASS_REGION_PADDING = get_or_create_env_var("OCR_TWO_PASS_REGION_PADDING", "20")
+
+# If more than this share of first pass words are low confidence, the whole page is OCRed again
+OCR_TWO_PASS_MAX_LOW_CONFIDENCE_SHARE = get_or_create_env_var("OCR_TWO_PASS_MAX_LOW_CONFIDENCE_SHARE", "0.5")
+
+# Stream pages through rasterisation, OCR and redaction stages at the same time rather than rasterising the whole document before redaction starts. Applies to the local OCR and AWS Textract options.
+RUN_PAGE_PIPELINE = get_or_create_env_var("RUN_PAGE_PIPELINE", "False")
+
+# Maximum number of pages waiting between two pipeline stages
+PAGE_PIPELINE_QUEUE_SIZE = get_or_create_env_var("PAGE_PIPELINE_QUEUE_SIZE", "4")
+
+# Create page images only when a page is OCRed, redacted or opened for review, rather than for the whole document before redaction starts
+LAZY_PAGE_IMAGES = get_or_create_env_var("LAZY_PAGE_IMAGES", "True")
+
+# Reuse local OCR and AWS Textract results for page images that have been seen before, keyed on the page image content and OCR settings
+USE_OCR_CACHE = get_or_create_env_var("USE_OCR_CACHE", "False")
+
+OCR_CACHE_FOLDER = get_or_create_env_var("OCR_CACHE_FOLDER", "ocr_cache/")
+
+# Least recently used cache entries are removed when the cache folder grows larger than this
+OCR_CACHE_MAX_SIZE_MB = get_or_create_env_var("OCR_CACHE_MAX_SIZE_MB", "1024")
+
+# Reuse text analysis results for lines of text (or table cells) that have been analysed before with the same entities, allow and deny lists, score threshold and analyser, such as headers, footers and boilerplate repeated across pages and documents
+USE_ANALYSIS_CACHE = get_or_create_env_var("USE_ANALYSIS_CACHE", "False")
+
+# Number of line results held in memory. Least recently used lines are dropped when the cache is full.
+ANALYSIS_CACHE_MEMORY_ENTRIES = get_or_create_env_var("ANALYSIS_CACHE_MEMORY_ENTRIES", "100000")
+
+# Keep lines that are seen more than once in an on-disk cache, so that they are reused across app restarts
+USE_ANALYSIS_DISK_CACHE = get_or_create_env_var("USE_ANALYSIS_DISK_CACHE", "True")
+
+ANALYSIS_CACHE_FOLDER = get_or_create_env_var("ANALYSIS_CACHE_FOLDER", "analysis_cache/")
+
+ANALYSIS_CACHE_MAX_SIZE_MB = get_or_create_env_var("ANALYSIS_CACHE_MAX_SIZE_MB", "256")
+
+# With the automatic text extraction option, pages without a usable text layer are sent to this OCR method. Either 'tesseract' (local OCR) or 'textract' (AWS Textract)
+MIXED_DOCUMENT_OCR_METHOD = get_or_create_env_var("MIXED_DOCUMENT_OCR_METHOD", "tesseract")
+
+# Pages with fewer non-space characters than this in their text layer are sent to OCR
+PAGE_ROUTER_MIN_CHARS = get_or_create_env_var("PAGE_ROUTER_MIN_CHARS", "20")
+
+# Pages where a smaller share of text layer characters than this are readable (e.g. fonts without a unicode mapping) are sent to OCR
+PAGE_ROUTER_MIN_READABLE_SHARE = get_or_create_env_var("PAGE_ROUTER_MIN_READABLE_SHARE", "0.9")
+
+# Pages with images covering at least this share of the page, and fewer visible characters than PAGE_ROUTER_MIN_CHARS_WITH_LARGE_IMAGE, are sent to OCR
+PAGE_ROUTER_LARGE_IMAGE_COVERAGE = get_or_create_env_var("PAGE_ROUTER_LARGE_IMAGE_COVERAGE", "0.5")
+
+PAGE_ROUTER_MIN_CHARS_WITH_LARGE_IMAGE = get_or_create_env_var("PAGE_ROUTER_MIN_CHARS_WITH_LARGE_IMAGE", "200")
+
+# In text extraction, also OCR the images embedded in text pages (e.g. signatures, stamps and scanned attachments) and redact their text along with the text layer. Identical images, such as a logo on every page, are only OCRed once per document.
+USE_EMBEDDED_IMAGE_OCR = get_or_create_env_var("USE_EMBEDDED_IMAGE_OCR", "False")
+
+# Embedded images narrower or shorter than this (in points) are not OCRed
+EMBEDDED_IMAGE_MIN_SIZE = get_or_create_env_var("EMBEDDED_IMAGE_MIN_SIZE", "36")
+
+# Small embedded images are upscaled to at least this DPI before OCR, and images that have to be rendered from the page are rendered at it
+EMBEDDED_IMAGE_OCR_DPI = get_or_create_env_var("EMBEDDED_IMAGE_OCR_DPI", "300")
+
+# Embedded images with more text layer words than this over them (e.g. scans with an OCR layer) are not OCRed
+EMBEDDED_IMAGE_MAX_TEXT_LAYER_WORDS = get_or_create_env_var("EMBEDDED_IMAGE_MAX_TEXT_LAYER_WORDS", "5")
+
+# How the text of text PDF pages is analysed with the local spaCy model. 'page' analyses each page with its own analyser call as it is redacted. 'document' extracts the text of TEXT_ANALYSIS_PAGE_WINDOW pages at a time, and analyses those pages together with spaCy nlp.pipe in batches of TEXT_ANALYSIS_BATCH_SIZE pages.
+TEXT_ANALYSIS_MODE = get_or_create_env_var("TEXT_ANALYSIS_MODE", "page")
+
+TEXT_ANALYSIS_PAGE_WINDOW = get_or_create_env_var("TEXT_ANALYSIS_PAGE_WINDOW", "100")
+
+TEXT_ANALYSIS_BATCH_SIZE = get_or_create_env_var("TEXT_ANALYSIS_BATCH_SIZE", "32")
+
+# spaCy model tiers that jobs can choose between, as tier:model_name pairs. Models are loaded when a job first uses them, and shared by jobs that choose the same tier.
+SPACY_MODEL_TIERS = get_or_create_env_var("SPACY_MODEL_TIERS", "small:en_core_web_sm,medium:en_core_web_md,large:en_core_web_lg,transformer:en_core_web_trf")
+
+# Model tier used for local text analysis unless a job chooses another. 'large' is the model loaded at start-up.
+SPACY_MODEL_TIER = get_or_create_env_var("SPACY_MODEL_TIER", "large")
+
+# Analysis profile used for local text analysis. 'full' runs the whole spaCy pipeline with context enhancement and decision process explanations. 'ner_and_patterns' runs only the spaCy NER component, and 'patterns_only' only the tokenizer, for regex and custom recognisers. 'auto' picks the lightest profile that covers the chosen entities.
+ANALYSIS_PROFILE = get_or_create_env_var("ANALYSIS_PROFILE", "full")
+
+# Measure the latency and memory of each analysis profile on a sample text at start-up
+MEASURE_ANALYSIS_PROFILES = get_or_create_env_var("MEASURE_ANALYSIS_PROFILES", "True")
+
+# Run local text analysis in a pool of worker processes forked from the app after the spaCy model is loaded, so that the workers share the model memory. Analysis requests from all sessions are sent to the pool. Needs an OS that can fork processes (not Windows).
+USE_ANALYSIS_WORKER_POOL = get_or_create_env_var("USE_ANALYSIS_WORKER_POOL", "False")
+
+ANALYSIS_MAX_WORKERS = get_or_create_env_var("ANALYSIS_MAX_WORKERS", "2")
+
+# Number of texts (pages, or rows of a column for tabular data) sent to an analysis worker in one request
+ANALYSIS_WORKER_CHUNK_SIZE = get_or_create_env_var("ANALYSIS_WORKER_CHUNK_SIZE", "32")
+
+# Skip OCR and text analysis for blank pages (e.g. separator sheets and blank backs of pages), found from page image pixel statistics. Off by default, as a page wrongly found to be blank is not redacted
+USE_BLANK_PAGE_DETECTION = get_or_create_env_var("USE_BLANK_PAGE_DETECTION", "False")
+
+# Pixels darker than the paper colour by more than this (0-255) are counted as ink. Kept low so that faint pencil, light stamps and pale highlighted text count as ink
+BLANK_PAGE_INK_CONTRAST = get_or_create_env_var("BLANK_PAGE_INK_CONTRAST", "25")
+
+# A page is blank if at most this share of pixels is ink, and there are at most BLANK_PAGE_MAX_INK_COMPONENTS marks of at least BLANK_PAGE_MIN_COMPONENT_AREA pixels
+BLANK_PAGE_MAX_INK_SHARE = get_or_create_env_var("BLANK_PAGE_MAX_INK_SHARE", "0.001")
+
+BLANK_PAGE_MAX_INK_COMPONENTS = get_or_create_env_var("BLANK_PAGE_MAX_INK_COMPONENTS", "0")
+
+BLANK_PAGE_MIN_COMPONENT_AREA = get_or_create_env_var("BLANK_PAGE_MIN_COMPONENT_AREA", "6")
+
 ###
 # APP RUN CONFIG
 ###
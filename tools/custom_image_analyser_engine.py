@@ -1,9 +1,10 @@
 import pytesseract
 import numpy as np
-from presidio_analyzer import AnalyzerEngine, RecognizerResult
+from presidio_analyzer import AnalyzerEngine, BatchAnalyzerEngine, RecognizerResult
 from typing import List, Dict, Optional, Union, Tuple
 from dataclasses import dataclass
 import time
+import threading
 import cv2
 import copy
 import botocore
@@ -13,8 +14,17 @@ import PIL
 from PIL import Image
 from typing import Optional, Tuple, Union
 from tools.helper_functions import clean_unicode_text
-from tools.presidio_analyzer_custom import recognizer_result_from_dict
+from tools.presidio_analyzer_custom import recognizer_result_from_dict, analyze_iterator_custom
 from tools.load_spacy_model_custom_recognisers import custom_entities
+from tools.analysis_worker_pool import PooledAnalyzer
+from tools.analysis_cache import get_analysis_cache, get_analysis_settings, analyse_pages_with_cache, get_cached_line_results, store_line_results, merge_line_results
+from tools.ocr_cache import OCRResultCache, hash_image, describe_ocr_settings
+from tools.tesseract_engine_pool import tesserocr_image_to_data, tesserocr_ocr_backend, default_tesseract_config
+from tools.ocr_regions import get_overlap_share, merge_overlapping_regions, regions_overlap, find_text_regions, get_region_coverage, split_region_into_tiles, merge_ocr_data_from_parts, page_ocr_region_mode, regions_ocr_region_mode, auto_ocr_region_mode
+from tools.page_layout import choose_tesseract_config_for_page
+from tools.page_image_store import open_page_image
+from tools.config import TEXT_ANALYSIS_BATCH_SIZE, TESSERACT_PAGE_SEGMENTATION, USE_TWO_PASS_OCR, OCR_FIRST_PASS_STAGES, OCR_LOW_CONFIDENCE_THRESHOLD, OCR_TWO_PASS_REGION_PADDING, OCR_TWO_PASS_MAX_LOW_CONFIDENCE_SHARE, IMAGE_PREPROCESSOR, IMAGE_PREPROCESSING_STAGES, TESSERACT_OCR_BACKEND, TESSERACT_OCR_REGION_MODE, OCR_REGION_MAX_WORKERS, OCR_TILE_SIZE, OCR_TILE_OVERLAP, OCR_REGION_MAX_COVERAGE, OCR_TILE_MIN_PAGE_PIXELS
+from concurrent.futures import ThreadPoolExecutor
 
 @dataclass
 class OCRResult:
@@ -23,6 +33,7 @@ class OCRResult:
     top: int
     width: int
     height: int
+    conf: Optional[float] = None
 
 @dataclass
 class CustomImageRecognizerResult:
@@ -400,6 +411,181 @@ class ContrastSegmentedImageEnhancer(ImagePreprocessor):
             adjusted_contrast = contrast
         return adjusted_image, contrast, adjusted_contrast
 
+class NumpyPreprocessingPipeline(ImagePreprocessor):
+    """NumpyPreprocessingPipeline class.
+
+    Runs the steps of ContrastSegmentedImageEnhancer on a single greyscale
+    numpy buffer rather than converting between PIL and numpy at each step.
+    Stages write into the buffer in place where OpenCV allows it, and otherwise
+    into one spare buffer of the same size that is then swapped with it, so the
+    only other full-page array allocated is the rescaled output. The order of
+    the stages is configurable, and the time spent in each stage is recorded.
+    """
+
+    available_stages = ("bilateral_filter", "contrast", "adaptive_threshold", "otsu_threshold", "rescale")
+
+    def __init__(
+        self,
+        stages: Optional[Union[str, List[str]]] = None,
+        bilateral_filter: Optional[BilateralFilter] = None,
+        adaptive_threshold: Optional[SegmentedAdaptiveThreshold] = None,
+        image_rescaling: Optional[ImageRescaling] = None,
+        low_contrast_threshold: int = 40,
+    ) -> None:
+        """Initialize the class.
+
+        :param stages: Stage names in the order to run them, as a list or a
+             comma-separated string. Defaults to IMAGE_PREPROCESSING_STAGES.
+        :param bilateral_filter: Optional BilateralFilter instance holding the filter settings.
+        :param adaptive_threshold: Optional SegmentedAdaptiveThreshold instance holding the threshold settings.
+        :param image_rescaling: Optional ImageRescaling instance holding the rescaling settings.
+        :param low_contrast_threshold: Threshold for low contrast images.
+        """
+        super().__init__(use_greyscale=True)
+
+        if stages is None:
+            stages = IMAGE_PREPROCESSING_STAGES
+        if isinstance(stages, str):
+            stages = [stage.strip() for stage in stages.split(",") if stage.strip()]
+
+        unknown_stages = [stage for stage in stages if stage not in self.available_stages]
+        if unknown_stages:
+            raise ValueError(f"Unknown image preprocessing stages: {', '.join(unknown_stages)}. Available stages are: {', '.join(self.available_stages)}")
+
+        self.stages = list(stages)
+        self.bilateral_filter = bilateral_filter or BilateralFilter()
+        self.adaptive_threshold = adaptive_threshold or SegmentedAdaptiveThreshold()
+        self.image_rescaling = image_rescaling or ImageRescaling()
+        self.low_contrast_threshold = low_contrast_threshold
+
+        # Running totals of [images, seconds] by stage. Underscored attributes are left out of OCR cache keys.
+        self._stage_timings = {}
+        self._timing_lock = threading.Lock()
+
+    def __getstate__(self) -> dict:
+        # Locks cannot be pickled, e.g. when the preprocessor is sent to a worker process
+        state = self.__dict__.copy()
+        del state["_timing_lock"]
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self._timing_lock = threading.Lock()
+
+    def preprocess_image(self, image: Union[Image.Image, np.ndarray]) -> Tuple[Image.Image, dict]:
+        """Preprocess the image to be analyzed.
+
+        :param image: Loaded PIL image or numpy array.
+
+        :return: The processed image and metadata (scale_factor if the image was
+             rescaled, the adaptive threshold settings, and seconds by stage).
+        """
+        image = self.convert_image_to_array(image)
+        if image.ndim == 3:
+            image = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+        image = np.ascontiguousarray(image, dtype=np.uint8)
+
+        spare = None
+        metadata = {"stage_seconds": {}}
+
+        for stage in self.stages:
+            # Arrays made from PIL images are read only, so stages that would work in place write to the spare buffer instead
+            needs_spare = stage in ("bilateral_filter", "adaptive_threshold") or (stage in ("contrast", "otsu_threshold") and not image.flags.writeable)
+            if needs_spare and (spare is None or spare.shape != image.shape):
+                spare = np.empty_like(image)
+
+            tic = time.perf_counter()
+            output = getattr(self, "_" + stage)(image, spare, metadata)
+            metadata["stage_seconds"][stage] = time.perf_counter() - tic
+
+            if output is spare:
+                spare = image if image.flags.writeable else None
+            image = output
+
+        self._record_stage_seconds(metadata["stage_seconds"])
+
+        # The PIL image shares memory with the final buffer, which is not used again
+        return Image.frombuffer("L", (image.shape[1], image.shape[0]), image, "raw", "L", 0, 1), metadata
+
+    def _bilateral_filter(self, image: np.ndarray, spare: np.ndarray, metadata: dict) -> np.ndarray:
+        return cv2.bilateralFilter(image, self.bilateral_filter.diameter, self.bilateral_filter.sigma_color, self.bilateral_filter.sigma_space, dst=spare)
+
+    def _contrast(self, image: np.ndarray, spare: Optional[np.ndarray], metadata: dict) -> np.ndarray:
+        # cv2.meanStdDev avoids the full-page float copies made by np.std
+        mean_intensity, contrast = (float(value[0][0]) for value in cv2.meanStdDev(image))
+
+        if contrast > self.low_contrast_threshold:
+            return image
+
+        alpha = 1.5
+        return cv2.convertScaleAbs(image, dst=image if image.flags.writeable else spare, alpha=alpha, beta=-mean_intensity * alpha)
+
+    def _adaptive_threshold(self, image: np.ndarray, spare: np.ndarray, metadata: dict) -> np.ndarray:
+        settings = self.adaptive_threshold
+
+        background_color = int(np.bincount(image.ravel(), minlength=256).argmax())
+        contrast = float(cv2.meanStdDev(image)[1][0][0])
+        c = settings.c_low_contrast if contrast <= settings.contrast_threshold else settings.c_high_contrast
+
+        if background_color < settings.bg_threshold:
+            output = cv2.adaptiveThreshold(image, 255, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY_INV, settings.block_size, -c, dst=spare)
+        else:
+            output = cv2.adaptiveThreshold(image, 255, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY, settings.block_size, c, dst=spare)
+
+        metadata.update({"C": c, "background_color": background_color, "contrast": contrast})
+        return output
+
+    def _otsu_threshold(self, image: np.ndarray, spare: Optional[np.ndarray], metadata: dict) -> np.ndarray:
+        _, output = cv2.threshold(image, 0, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU, dst=image if image.flags.writeable else spare)
+        return output
+
+    def _rescale(self, image: np.ndarray, spare: Optional[np.ndarray], metadata: dict) -> np.ndarray:
+        settings = self.image_rescaling
+
+        scale_factor = 1
+        if image.size < settings.small_size:
+            scale_factor = settings.factor
+        elif image.size > settings.large_size:
+            scale_factor = 1 / settings.factor
+
+        metadata["scale_factor"] = scale_factor
+
+        if scale_factor == 1:
+            return image
+
+        return cv2.resize(image, (int(image.shape[1] * scale_factor), int(image.shape[0] * scale_factor)), interpolation=settings.interpolation)
+
+    def _record_stage_seconds(self, stage_seconds: Dict[str, float]) -> None:
+        with self._timing_lock:
+            for stage, seconds in stage_seconds.items():
+                stage_timing = self._stage_timings.setdefault(stage, [0, 0.0])
+                stage_timing[0] += 1
+                stage_timing[1] += seconds
+
+    def get_stage_timings(self) -> Dict[str, Dict[str, float]]:
+        """Return the number of images and total seconds spent in each stage in this process."""
+        with self._timing_lock:
+            return {stage: {"images": images, "seconds": seconds} for stage, (images, seconds) in self._stage_timings.items()}
+
+    def get_stage_timing_report(self) -> str:
+        stage_timings = self.get_stage_timings()
+        if not stage_timings:
+            return ""
+
+        total_seconds = sum(stage_timing["seconds"] for stage_timing in stage_timings.values()) or 1.0
+        stage_reports = [f"{stage} {stage_timing['seconds']:.2f}s ({stage_timing['seconds'] / total_seconds:.0%})" for stage, stage_timing in stage_timings.items()]
+
+        return f"Image preprocessing time by stage over {max(stage_timing['images'] for stage_timing in stage_timings.values())} images: " + ", ".join(stage_reports)
+
+def get_image_preprocessor(image_preprocessor_name: str = IMAGE_PREPROCESSOR) -> ImagePreprocessor:
+    '''
+    Create the image preprocessor chosen in config: 'pipeline' for NumpyPreprocessingPipeline, or 'contrast_segmented' for ContrastSegmentedImageEnhancer.
+    '''
+    if image_preprocessor_name == "contrast_segmented":
+        return ContrastSegmentedImageEnhancer()
+
+    return NumpyPreprocessingPipeline()
+
 def bounding_boxes_overlap(box1:List, box2:List):
     """Check if two bounding boxes overlap."""
     return (box1[0] < box2[2] and box2[0] < box1[2] and
@@ -520,6 +706,100 @@ def do_aws_comprehend_call(current_batch:str, current_batch_mapping:List[Tuple],
                 raise
             time.sleep(retry_delay)
 
+def get_page_text_and_mapping(line_level_text_results_list: List[OCRResult], line_characters: List = None) -> Tuple[str, List[Tuple]]:
+    '''
+    Join the text of the lines on a page with spaces, in the form analysed by run_page_text_redaction. Returns the page text, and for each line its start position in the page text, index, line result and characters.
+    '''
+    page_text = ""
+    page_text_mapping = []
+
+    for i, text_line in enumerate(line_level_text_results_list):
+        if page_text:
+            page_text += " "
+
+        start_pos = len(page_text)
+        page_text += text_line.text
+        page_text_mapping.append((start_pos, i, text_line, line_characters[i] if line_characters is not None else None))
+
+    return page_text, page_text_mapping
+
+def analyse_page_text(nlp_analyser: Union[AnalyzerEngine, PooledAnalyzer], line_level_text_results_list: List[OCRResult], page_text: str, **analyze_kwargs) -> List[RecognizerResult]:
+    '''
+    Analyse the text of a page locally. If the analysis cache is used and every line of the page was analysed before with the same settings, the results come from the cache. Otherwise the whole page is analysed.
+    '''
+    analysis_cache = get_analysis_cache()
+
+    if not analysis_cache or not page_text:
+        return nlp_analyser.analyze(text=page_text, **analyze_kwargs)
+
+    analysis_settings = get_analysis_settings("Local", analyze_kwargs.get("language"), analyze_kwargs.get("entities"), analyze_kwargs.get("allow_list"), analyze_kwargs.get("score_threshold"), nlp_analyser)
+
+    return analyse_pages_with_cache(analysis_cache,
+                                    [[line.text for line in line_level_text_results_list]],
+                                    analysis_settings,
+                                    lambda texts: [nlp_analyser.analyze(text=text, **analyze_kwargs) for text in texts])[0]
+
+def get_cached_comprehend_line_results(line_level_text_results_list: List[OCRResult], language: str, allow_list: List[str], chosen_redact_comprehend_entities: List[str]) -> Tuple[dict, Dict[int, List[RecognizerResult]]]:
+    '''
+    Get the AWS Comprehend settings for cache keys, and the cached results of lines on a page that do not need to be sent to AWS Comprehend again.
+    '''
+    comprehend_settings = get_analysis_settings("AWS Comprehend", language, chosen_redact_comprehend_entities, allow_list)
+    return comprehend_settings, get_cached_line_results(get_analysis_cache(), [line.text for line in line_level_text_results_list], comprehend_settings)
+
+def store_comprehend_line_results(line_level_text_results_list: List[OCRResult], comprehend_settings: dict, cached_line_results: Dict[int, List[RecognizerResult]], comprehend_line_results: List[Tuple], all_text_line_results: List[Tuple]) -> List[Tuple]:
+    '''
+    Add the AWS Comprehend results of lines that were sent to AWS Comprehend to the analysis cache, and merge them and the cached line results into the results of each line.
+    '''
+    line_texts = [line.text for line in line_level_text_results_list]
+    store_line_results(get_analysis_cache(), line_texts, comprehend_settings, comprehend_line_results, [i for i in range(len(line_texts)) if i not in cached_line_results])
+
+    return merge_line_results(all_text_line_results, comprehend_line_results + list(cached_line_results.items()))
+
+def analyse_page_texts_in_batches(
+    page_texts: List[str],
+    nlp_analyser: Union[AnalyzerEngine, PooledAnalyzer],
+    language: str,
+    chosen_redact_entities: List[str],
+    score_threshold: float = 0.0,
+    allow_list: List[str] = None,
+    batch_size: int = int(TEXT_ANALYSIS_BATCH_SIZE),
+    page_line_texts: List[List[str]] = None
+) -> List[List[RecognizerResult]]:
+    '''
+    Analyse the texts of many pages together, running them through spaCy with nlp.pipe in batches of batch_size pages rather than one analyse call each. Returns the analyser results for each page, as run_page_text_redaction would get them from analysing each page on its own. With the analysis worker pool, chunks of pages are analysed by the workers at the same time.
+
+    If the line texts of each page are given and the analysis cache is used, pages whose lines were all analysed before come from the cache, and only the other pages are analysed.
+    '''
+    analysis_cache = get_analysis_cache()
+
+    if analysis_cache and page_line_texts is not None:
+        analysis_settings = get_analysis_settings("Local", language, chosen_redact_entities, allow_list, score_threshold, nlp_analyser)
+        return analyse_pages_with_cache(analysis_cache,
+                                        page_line_texts,
+                                        analysis_settings,
+                                        lambda texts: analyse_page_texts_in_batches(texts, nlp_analyser, language, chosen_redact_entities, score_threshold, allow_list, batch_size))
+
+    if isinstance(nlp_analyser, PooledAnalyzer):
+        return nlp_analyser.analyze_batch(page_texts,
+                                          language,
+                                          batch_size=batch_size,
+                                          entities=chosen_redact_entities,
+                                          score_threshold=score_threshold,
+                                          return_decision_process=True,
+                                          allow_list=allow_list)
+
+    batch_analyser = BatchAnalyzerEngine(analyzer_engine=nlp_analyser)
+
+    return analyze_iterator_custom(batch_analyser,
+                                   texts=page_texts,
+                                   language=language,
+                                   list_length=len(page_texts),
+                                   batch_size=batch_size,
+                                   entities=chosen_redact_entities,
+                                   score_threshold=score_threshold,
+                                   return_decision_process=True,
+                                   allow_list=allow_list)
+
 def run_page_text_redaction(
     language: str,
     chosen_redact_entities: List[str],
@@ -534,9 +814,13 @@ def run_page_text_redaction(
     nlp_analyser = None,
     score_threshold: float = 0.0,
     custom_entities: List[str] = None,
-    comprehend_query_number:int = 0#,
+    comprehend_query_number:int = 0,
+    page_analyser_result: List[RecognizerResult] = None
     #merge_text_bounding_boxes_fn = merge_text_bounding_boxes
 ):
+    '''
+    Analyse the text lines of a page and return the bounding boxes of the entities found. For local analysis, page_analyser_result can be given if the page text (from get_page_text_and_mapping) has already been analysed, e.g. in a batch with other pages by analyse_page_texts_in_batches.
+    '''
     #if not merge_text_bounding_boxes_fn:
     #    raise ValueError("merge_text_bounding_boxes_fn is required")
     
@@ -546,16 +830,8 @@ def run_page_text_redaction(
     comprehend_query_number = 0
 
     # Collect all text from the page
-    for i, text_line in enumerate(line_level_text_results_list):
-        #print("line_level_text_results_list:", line_level_text_results_list)
-        if chosen_redact_entities:
-            if page_text:
-                #page_text += " | "
-                page_text += " "
-            
-            start_pos = len(page_text)
-            page_text += text_line.text
-            page_text_mapping.append((start_pos, i, text_line, line_characters[i]))
+    if chosen_redact_entities:
+        page_text, page_text_mapping = get_page_text_and_mapping(line_level_text_results_list, line_characters)
 
     # Process based on identification method
     if pii_identification_method == "Local":
@@ -564,14 +840,17 @@ def run_page_text_redaction(
         
         #print("page text:", page_text)
 
-        page_analyser_result = nlp_analyser.analyze(
-            text=page_text,
-            language=language,
-            entities=chosen_redact_entities,
-            score_threshold=score_threshold,
-            return_decision_process=True,
-            allow_list=allow_list
-        )
+        if page_analyser_result is None:
+            page_analyser_result = analyse_page_text(
+                nlp_analyser,
+                line_level_text_results_list,
+                page_text,
+                language=language,
+                entities=chosen_redact_entities,
+                score_threshold=score_threshold,
+                return_decision_process=True,
+                allow_list=allow_list
+            )
 
         
         all_text_line_results = map_back_entity_results(
@@ -590,8 +869,10 @@ def run_page_text_redaction(
                 if entity in custom_entities
             ]
             if custom_redact_entities:
-                page_analyser_result = nlp_analyser.analyze(
-                    text=page_text,
+                page_analyser_result = analyse_page_text(
+                    nlp_analyser,
+                    line_level_text_results_list,
+                    page_text,
                     language=language,
                     entities=custom_redact_entities,
                     score_threshold=score_threshold,
@@ -605,12 +886,18 @@ def run_page_text_redaction(
                     all_text_line_results
                 )
 
+        # Lines found in the analysis cache are not sent to AWS Comprehend
+        comprehend_settings, cached_line_results = get_cached_comprehend_line_results(line_level_text_results_list, language, allow_list, chosen_redact_comprehend_entities)
+        comprehend_line_results = []
+
         current_batch = ""
         current_batch_mapping = []
         batch_char_count = 0
         batch_word_count = 0
 
         for i, text_line in enumerate(line_level_text_results_list):
+            if i in cached_line_results: continue
+
             words = text_line.text.split()
             word_start_positions = []
             
@@ -625,14 +912,14 @@ def run_page_text_redaction(
                 
                 if batch_word_count >= 50 or new_batch_char_count >= 200:
                     # Process current batch
-                    all_text_line_results = do_aws_comprehend_call(
+                    comprehend_line_results = do_aws_comprehend_call(
                         current_batch,
                         current_batch_mapping,
                         comprehend_client,
                         language,
                         allow_list,
                         chosen_redact_comprehend_entities,
-                        all_text_line_results
+                        comprehend_line_results
                     )
                     comprehend_query_number += 1
                     
@@ -660,17 +947,19 @@ def run_page_text_redaction(
 
         # Process final batch
         if current_batch:
-            all_text_line_results = do_aws_comprehend_call(
+            comprehend_line_results = do_aws_comprehend_call(
                 current_batch,
                 current_batch_mapping,
                 comprehend_client,
                 language,
                 allow_list,
                 chosen_redact_comprehend_entities,
-                all_text_line_results
+                comprehend_line_results
             )
             comprehend_query_number += 1
 
+        all_text_line_results = store_comprehend_line_results(line_level_text_results_list, comprehend_settings, cached_line_results, comprehend_line_results, all_text_line_results)
+
     # Process results for each line
     for i, text_line in enumerate(line_level_text_results_list):
         line_results = next((results for idx, results in all_text_line_results if idx == i), [])
@@ -859,54 +1148,108 @@ def combine_ocr_results(ocr_results:dict, x_threshold:float=50.0, y_threshold:fl
 
     return combined_results, new_format_results
 
+# Fields stored for each cached Tesseract word. Part of the cache key, so that entries written without confidence values are not used.
+cached_ocr_word_fields = "text,left,top,width,height,conf"
+
 class CustomImageAnalyzerEngine:
     def __init__(
         self,
         analyzer_engine: Optional[AnalyzerEngine] = None,
         tesseract_config: Optional[str] = None,
-        image_preprocessor: Optional[ImagePreprocessor] = None
+        image_preprocessor: Optional[ImagePreprocessor] = None,
+        ocr_cache: Optional[OCRResultCache] = None,
+        ocr_backend: str = TESSERACT_OCR_BACKEND,
+        ocr_region_mode: str = TESSERACT_OCR_REGION_MODE,
+        use_two_pass_ocr: bool = USE_TWO_PASS_OCR == "True",
+        low_confidence_threshold: float = float(OCR_LOW_CONFIDENCE_THRESHOLD),
+        page_segmentation: str = TESSERACT_PAGE_SEGMENTATION
     ):
         if not analyzer_engine:
             analyzer_engine = AnalyzerEngine()
         self.analyzer_engine = analyzer_engine
-        self.tesseract_config = tesseract_config or '--oem 3 --psm 11'
+        self.tesseract_config = tesseract_config or default_tesseract_config
 
         if not image_preprocessor:
-            image_preprocessor = ContrastSegmentedImageEnhancer()
+            image_preprocessor = get_image_preprocessor()
             #print(image_preprocessor)
         self.image_preprocessor = image_preprocessor
+        self.ocr_cache = ocr_cache
+        self.ocr_backend = ocr_backend
+        self.ocr_region_mode = ocr_region_mode
 
-    def perform_ocr(self, image: Union[str, Image.Image, np.ndarray]) -> List[OCRResult]:
-        # Ensure image is a PIL Image
+        # With two-pass OCR, the first pass only uses the lighter OCR_FIRST_PASS_STAGES, and words below low_confidence_threshold are OCRed again with image_preprocessor
+        self.first_pass_preprocessor = NumpyPreprocessingPipeline(stages=OCR_FIRST_PASS_STAGES) if use_two_pass_ocr else None
+        self.low_confidence_threshold = low_confidence_threshold
+
+        # 'fixed' always uses the page segmentation mode in tesseract_config, 'adaptive' chooses it for each page from the page layout
+        self.page_segmentation = page_segmentation
+        self.layout_decisions = []
+
+    def perform_ocr(self, image: Union[str, Image.Image, np.ndarray], page_no: Optional[int] = None) -> List[OCRResult]:
+        # Ensure image is a PIL Image so that it is only loaded once for hashing, layout analysis and OCR
         if isinstance(image, str):
-            image = Image.open(image)
+            image = open_page_image(image)
         elif isinstance(image, np.ndarray):
             image = Image.fromarray(image)
 
-        image_processed, preprocessing_metadata = self.image_preprocessor.preprocess_image(image)
-
-        ocr_data = pytesseract.image_to_data(image_processed, output_type=pytesseract.Output.DICT, config=self.tesseract_config)
-
-        if preprocessing_metadata and ("scale_factor" in preprocessing_metadata):
-            ocr_result = self._scale_bbox_results(
-                ocr_data, preprocessing_metadata["scale_factor"]
-            )
-
-        ocr_result = self.remove_space_boxes(ocr_result)
-        
-        # Filter out empty strings and low confidence results
-        valid_indices = [i for i, text in enumerate(ocr_result['text']) if text.strip() and int(ocr_result['conf'][i]) > 0]
-        
-        return [
-            OCRResult(
-                text=clean_unicode_text(ocr_result['text'][i]),
-                left=ocr_result['left'][i],
-                top=ocr_result['top'][i],
-                width=ocr_result['width'][i],
-                height=ocr_result['height'][i]
-            )
-            for i in valid_indices
-        ]
+        cache_key = None
+        if self.ocr_cache:
+            cache_key, cached_ocr_results = self.get_cached_ocr_results(image, page_no)
+            if cached_ocr_results is not None:
+                return cached_ocr_results
+
+        tesseract_config = self.tesseract_config
+        layout_decision = None
+        if self.page_segmentation == "adaptive":
+            tesseract_config, layout_decision = choose_tesseract_config_for_page(image, self.tesseract_config)
+            self.record_layout_decision(page_no, layout_decision)
+
+        ocr_results = perform_tesseract_ocr(image, tesseract_config, self.image_preprocessor, self.ocr_backend, self.ocr_region_mode, first_pass_preprocessor=self.first_pass_preprocessor, low_confidence_threshold=self.low_confidence_threshold)
+
+        if cache_key:
+            self.store_cached_ocr_results(cache_key, ocr_results, layout_decision)
+
+        return ocr_results
+
+    def record_layout_decision(self, page_no: Optional[int], layout_decision: dict):
+        '''
+        Keep the page layout and Tesseract page segmentation mode chosen for a page (page_no is zero-indexed), so that the decisions can be logged.
+        '''
+        self.layout_decisions.append({"page": page_no + 1 if page_no is not None else None, **layout_decision})
+        print(f"Page {page_no + 1 if page_no is not None else ''} layout: {layout_decision['layout']} ({layout_decision['reason']}), Tesseract page segmentation mode {layout_decision['psm']}")
+
+    def get_ocr_cache_key(self, image: Image.Image) -> str:
+        '''
+        Cache key for Tesseract results on an image, based on the image pixels, the Tesseract config and backend, and the image preprocessing settings.
+        '''
+        ocr_settings = {"cached_word_fields": cached_ocr_word_fields, "tesseract_config": self.tesseract_config, "ocr_backend": self.ocr_backend, "ocr_region_mode": self.ocr_region_mode, "page_segmentation": self.page_segmentation, "image_preprocessor": describe_ocr_settings(self.image_preprocessor)}
+        if self.first_pass_preprocessor:
+            ocr_settings.update({"first_pass_preprocessor": describe_ocr_settings(self.first_pass_preprocessor), "low_confidence_threshold": self.low_confidence_threshold})
+        return self.ocr_cache.make_key(hash_image(image), "tesseract", ocr_settings)
+
+    def get_cached_ocr_results(self, image: Image.Image, page_no: Optional[int] = None) -> Tuple[str, Optional[List[OCRResult]]]:
+        '''
+        Look up word-level Tesseract results for an image in the OCR cache. Returns the cache key, and the results or None if there are none cached. On a cache hit with adaptive page segmentation, the layout decision for the page (zero-indexed page_no) is recorded as if the page had been OCRed.
+        '''
+        cache_key = self.get_ocr_cache_key(image)
+        cached_value = self.ocr_cache.get(cache_key)
+
+        if cached_value is None:
+            return cache_key, None
+
+        if self.page_segmentation == "adaptive":
+            layout_decision = cached_value.get("layout_decision")
+            # Entries written before layout decisions were cached get the decision from the page image
+            if not layout_decision: _, layout_decision = choose_tesseract_config_for_page(image, self.tesseract_config)
+            self.record_layout_decision(page_no, layout_decision)
+
+        return cache_key, [OCRResult(*word) for word in cached_value["words"]]
+
+    def store_cached_ocr_results(self, cache_key: str, ocr_results: List[OCRResult], layout_decision: Optional[dict] = None):
+        words = [[result.text, int(result.left), int(result.top), int(result.width), int(result.height), result.conf] for result in ocr_results]
+        cached_value = {"words": words}
+        if layout_decision: cached_value["layout_decision"] = layout_decision
+        self.ocr_cache.put(cache_key, cached_value)
 
     def analyze_text(
         self, 
@@ -935,8 +1278,10 @@ class CustomImageAnalyzerEngine:
 
         # Process using either Local or AWS Comprehend
         if pii_identification_method == "Local":
-            analyzer_result = self.analyzer_engine.analyze(
-                text=page_text,
+            analyzer_result = analyse_page_text(
+                self.analyzer_engine,
+                line_level_ocr_results,
+                page_text,
                 **text_analyzer_kwargs
             )
             all_text_line_results = map_back_entity_results(
@@ -954,8 +1299,10 @@ class CustomImageAnalyzerEngine:
                 ]
                 if custom_redact_entities:
                     text_analyzer_kwargs["entities"] = custom_redact_entities
-                    page_analyser_result = self.analyzer_engine.analyze(
-                        text=page_text,
+                    page_analyser_result = analyse_page_text(
+                        self.analyzer_engine,
+                        line_level_ocr_results,
+                        page_text,
                         **text_analyzer_kwargs
                     )
                     all_text_line_results = map_back_entity_results(
@@ -964,6 +1311,10 @@ class CustomImageAnalyzerEngine:
                         all_text_line_results
                     )
 
+            # Lines found in the analysis cache are not sent to AWS Comprehend
+            comprehend_settings, cached_line_results = get_cached_comprehend_line_results(line_level_ocr_results, text_analyzer_kwargs["language"], text_analyzer_kwargs.get('allow_list', []), chosen_redact_comprehend_entities)
+            comprehend_line_results = []
+
             # Process text in batches for AWS Comprehend
             current_batch = ""
             current_batch_mapping = []
@@ -971,6 +1322,8 @@ class CustomImageAnalyzerEngine:
             batch_word_count = 0
 
             for i, text_line in enumerate(line_level_ocr_results):
+                if i in cached_line_results: continue
+
                 words = text_line.text.split()
                 word_start_positions = []
                 current_pos = 0
@@ -984,14 +1337,14 @@ class CustomImageAnalyzerEngine:
                     
                     if batch_word_count >= 50 or new_batch_char_count >= 200:
                         # Process current batch
-                        all_text_line_results = do_aws_comprehend_call(
+                        comprehend_line_results = do_aws_comprehend_call(
                             current_batch,
                             current_batch_mapping,
                             comprehend_client,
                             text_analyzer_kwargs["language"],
                             text_analyzer_kwargs.get('allow_list', []),
                             chosen_redact_comprehend_entities,
-                            all_text_line_results
+                            comprehend_line_results
                         )
                         comprehend_query_number += 1
                         
@@ -1019,17 +1372,19 @@ class CustomImageAnalyzerEngine:
 
             # Process final batch if any
             if current_batch:
-                all_text_line_results = do_aws_comprehend_call(
+                comprehend_line_results = do_aws_comprehend_call(
                     current_batch,
                     current_batch_mapping,
                     comprehend_client,
                     text_analyzer_kwargs["language"],
                     text_analyzer_kwargs.get('allow_list', []),
                     chosen_redact_comprehend_entities,
-                    all_text_line_results
+                    comprehend_line_results
                 )
                 comprehend_query_number += 1
 
+            all_text_line_results = store_comprehend_line_results(line_level_ocr_results, comprehend_settings, cached_line_results, comprehend_line_results, all_text_line_results)
+
         
 
         # Process results and create bounding boxes
@@ -1233,3 +1588,202 @@ class CustomImageAnalyzerEngine:
         estimated_width = int(proportion * ocr_result.width)
         
         return estimated_width
+
+
+def tesseract_image_to_data(image: Image.Image, tesseract_config:str, ocr_backend:str=TESSERACT_OCR_BACKEND) -> Dict[str, list]:
+    '''
+    Run Tesseract on an image that has already been preprocessed, returning the output in pytesseract's image_to_data dictionary format.
+
+    With the 'tesserocr' backend the image is passed in memory to a Tesseract engine that stays loaded in the current process. Otherwise pytesseract starts a new tesseract process for the image.
+    '''
+    if ocr_backend == tesserocr_ocr_backend:
+        return tesserocr_image_to_data(image, tesseract_config)
+
+    return pytesseract.image_to_data(image, output_type=pytesseract.Output.DICT, config=tesseract_config)
+
+def get_ocr_parts_for_page(image: Image.Image, ocr_region_mode:str, tile_size:int=int(OCR_TILE_SIZE), tile_overlap:int=int(OCR_TILE_OVERLAP), max_region_coverage:float=float(OCR_REGION_MAX_COVERAGE), tile_min_page_pixels:int=int(OCR_TILE_MIN_PAGE_PIXELS)) -> List[Tuple[int, int, int, int]]:
+    '''
+    Choose the rectangles of a preprocessed page image to OCR separately. Text regions are found with OpenCV in 'regions' and 'auto' modes, and any part larger than a tile is split into overlapping tiles.
+    '''
+    width, height = image.size
+    whole_page = (0, 0, width, height)
+    page_parts = [whole_page]
+
+    if ocr_region_mode in (regions_ocr_region_mode, auto_ocr_region_mode):
+        text_regions = find_text_regions(np.asarray(image.convert("L")))
+
+        # If no marks are found, OCR the whole page rather than risk missing text
+        if text_regions:
+            if ocr_region_mode == regions_ocr_region_mode or get_region_coverage(text_regions, width, height) <= max_region_coverage:
+                page_parts = text_regions
+
+    if ocr_region_mode == auto_ocr_region_mode and page_parts == [whole_page] and width * height <= tile_min_page_pixels:
+        return page_parts
+
+    ocr_parts = []
+    for part in page_parts:
+        if part[2] - part[0] > tile_size or part[3] - part[1] > tile_size:
+            ocr_parts.extend(split_region_into_tiles(part, tile_size, tile_overlap))
+        else:
+            ocr_parts.append(part)
+
+    return ocr_parts
+
+def tesseract_image_to_data_by_region(image: Image.Image, tesseract_config:str, ocr_backend:str=TESSERACT_OCR_BACKEND, ocr_region_mode:str=TESSERACT_OCR_REGION_MODE, max_workers:int=int(OCR_REGION_MAX_WORKERS)) -> Dict[str, list]:
+    '''
+    Run Tesseract separately on text regions or tiles of a preprocessed page image, in parallel threads, and combine the word boxes in page coordinates. Words found twice where tiles overlap are only kept once. Returns the output in pytesseract's image_to_data dictionary format.
+    '''
+    ocr_parts = get_ocr_parts_for_page(image, ocr_region_mode)
+
+    if ocr_parts == [(0, 0, image.size[0], image.size[1])]:
+        return tesseract_image_to_data(image, tesseract_config, ocr_backend)
+
+    if max_workers > 1 and len(ocr_parts) > 1:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            part_ocr_data = list(executor.map(lambda part: tesseract_image_to_data(image.crop(part), tesseract_config, ocr_backend), ocr_parts))
+    else:
+        part_ocr_data = [tesseract_image_to_data(image.crop(part), tesseract_config, ocr_backend) for part in ocr_parts]
+
+    return merge_ocr_data_from_parts(list(zip(ocr_parts, part_ocr_data)), image.size[0], image.size[1])
+
+def get_tesseract_ocr_data(image: Image.Image, tesseract_config:str, image_preprocessor:ImagePreprocessor, ocr_backend:str=TESSERACT_OCR_BACKEND, ocr_region_mode:str=TESSERACT_OCR_REGION_MODE, region_max_workers:int=int(OCR_REGION_MAX_WORKERS)) -> Dict[str, list]:
+    '''
+    Preprocess a PIL image and run Tesseract on it. Returns the words found in pytesseract's image_to_data dictionary format, with boxes in the coordinates of the image passed in.
+
+    The whole page is preprocessed once. Unless ocr_region_mode is 'page', Tesseract is then run on regions or tiles of the preprocessed page rather than the whole of it.
+    '''
+    image_processed, preprocessing_metadata = image_preprocessor.preprocess_image(image)
+
+    if ocr_region_mode == page_ocr_region_mode:
+        ocr_data = tesseract_image_to_data(image_processed, tesseract_config, ocr_backend)
+    else:
+        ocr_data = tesseract_image_to_data_by_region(image_processed, tesseract_config, ocr_backend, ocr_region_mode, region_max_workers)
+
+    ocr_result = ocr_data
+
+    if preprocessing_metadata and ("scale_factor" in preprocessing_metadata):
+        ocr_result = CustomImageAnalyzerEngine._scale_bbox_results(
+            ocr_data, preprocessing_metadata["scale_factor"]
+        )
+
+    return CustomImageAnalyzerEngine.remove_space_boxes(ocr_result)
+
+def get_two_pass_tesseract_ocr_data(image: Image.Image, tesseract_config:str, image_preprocessor:ImagePreprocessor, first_pass_preprocessor:ImagePreprocessor, ocr_backend:str=TESSERACT_OCR_BACKEND, ocr_region_mode:str=TESSERACT_OCR_REGION_MODE, region_max_workers:int=int(OCR_REGION_MAX_WORKERS), low_confidence_threshold:float=float(OCR_LOW_CONFIDENCE_THRESHOLD), region_padding:int=int(OCR_TWO_PASS_REGION_PADDING), max_low_confidence_share:float=float(OCR_TWO_PASS_MAX_LOW_CONFIDENCE_SHARE)) -> Dict[str, list]:
+    '''
+    OCR an image with a fast first pass on a lightly processed copy, then run Tesseract again, with the full image preprocessor, only on the parts of the page around words with confidence below low_confidence_threshold.
+
+    For each re-OCRed part, the second pass replaces the first pass words in it if its mean word confidence is higher. If the first pass finds no words, or more than max_low_confidence_share of its words are low confidence, the whole page is OCRed again with the full preprocessor instead.
+    '''
+    first_pass_data = get_tesseract_ocr_data(image, tesseract_config, first_pass_preprocessor, ocr_backend, ocr_region_mode, region_max_workers)
+
+    word_count = len(first_pass_data["text"])
+    low_confidence_indices = [i for i, conf in enumerate(first_pass_data["conf"]) if float(conf) < low_confidence_threshold]
+
+    if not word_count or len(low_confidence_indices) / word_count > max_low_confidence_share:
+        return get_tesseract_ocr_data(image, tesseract_config, image_preprocessor, ocr_backend, ocr_region_mode, region_max_workers)
+
+    if not low_confidence_indices:
+        return first_pass_data
+
+    width, height = image.size
+    columns = list(first_pass_data.keys())
+    first_pass_rows = [{column: first_pass_data[column][i] for column in columns} for i in range(word_count)]
+
+    def get_word_box(row:dict) -> Tuple[int, int, int, int]:
+        return (int(row["left"]), int(row["top"]), int(row["left"]) + int(row["width"]), int(row["top"]) + int(row["height"]))
+
+    def is_centre_in_region(row:dict, region:Tuple[int, int, int, int]) -> bool:
+        centre_x = int(row["left"]) + int(row["width"]) / 2
+        centre_y = int(row["top"]) + int(row["height"]) / 2
+        return region[0] <= centre_x < region[2] and region[1] <= centre_y < region[3]
+
+    def get_mean_confidence(rows:List[dict]) -> float:
+        return sum(float(row["conf"]) for row in rows) / len(rows) if rows else -1.0
+
+    low_confidence_regions = merge_overlapping_regions([(max(0, word_box[0] - region_padding), max(0, word_box[1] - region_padding), min(width, word_box[2] + region_padding), min(height, word_box[3] + region_padding))
+                                                        for word_box in (get_word_box(first_pass_rows[i]) for i in low_confidence_indices)])
+
+    # Crops are preprocessed separately, so the full preprocessor rescales each one by its own size
+    def ocr_region(region:Tuple[int, int, int, int]) -> List[dict]:
+        region_data = get_tesseract_ocr_data(image.crop(region), tesseract_config, image_preprocessor, ocr_backend, page_ocr_region_mode)
+        region_rows = [{column: region_data[column][i] for column in region_data} for i in range(len(region_data["text"]))]
+        for row in region_rows:
+            row["left"] = int(row["left"]) + region[0]
+            row["top"] = int(row["top"]) + region[1]
+        return region_rows
+
+    if region_max_workers > 1 and len(low_confidence_regions) > 1:
+        with ThreadPoolExecutor(max_workers=region_max_workers) as executor:
+            second_pass_rows_by_region = list(executor.map(ocr_region, low_confidence_regions))
+    else:
+        second_pass_rows_by_region = [ocr_region(region) for region in low_confidence_regions]
+
+    kept_rows = first_pass_rows
+
+    for region, second_pass_rows in zip(low_confidence_regions, second_pass_rows_by_region):
+        first_pass_region_rows = [row for row in kept_rows if is_centre_in_region(row, region)]
+
+        if get_mean_confidence(second_pass_rows) <= get_mean_confidence(first_pass_region_rows):
+            continue
+
+        kept_rows = [row for row in kept_rows if not is_centre_in_region(row, region)]
+
+        # Words cut by the edge of the crop are already kept from outside the region
+        edge_boxes = [get_word_box(row) for row in kept_rows if regions_overlap(get_word_box(row), region)]
+        kept_rows.extend([row for row in second_pass_rows if not any(get_overlap_share(get_word_box(row), edge_box) >= 0.5 for edge_box in edge_boxes)])
+
+    kept_rows.sort(key=lambda row: (int(row["top"]), int(row["left"])))
+
+    return {column: [row.get(column) for row in kept_rows] for column in columns}
+
+def ocr_data_to_ocr_results(ocr_result: Dict[str, list]) -> List[OCRResult]:
+    '''
+    Convert Tesseract output in dictionary form to word-level OCRResult objects, leaving out empty words and words with no confidence.
+    '''
+    valid_indices = [i for i, text in enumerate(ocr_result['text']) if text.strip() and float(ocr_result['conf'][i]) > 0]
+    
+    return [
+        OCRResult(
+            text=clean_unicode_text(ocr_result['text'][i]),
+            left=ocr_result['left'][i],
+            top=ocr_result['top'][i],
+            width=ocr_result['width'][i],
+            height=ocr_result['height'][i],
+            conf=float(ocr_result['conf'][i])
+        )
+        for i in valid_indices
+    ]
+
+def perform_tesseract_ocr(image: Union[str, Image.Image, np.ndarray], tesseract_config:str, image_preprocessor:ImagePreprocessor, ocr_backend:str=TESSERACT_OCR_BACKEND, ocr_region_mode:str=TESSERACT_OCR_REGION_MODE, region_max_workers:int=int(OCR_REGION_MAX_WORKERS), first_pass_preprocessor:Optional[ImagePreprocessor]=None, low_confidence_threshold:float=float(OCR_LOW_CONFIDENCE_THRESHOLD)) -> List[OCRResult]:
+    '''
+    Preprocess an image and run Tesseract OCR on it, returning word-level OCRResult objects. Kept outside of CustomImageAnalyzerEngine so that it can be run in worker processes without the analyser engine.
+
+    If a first_pass_preprocessor is given, the page is OCRed in two passes: a fast pass on the image prepared by first_pass_preprocessor, then a pass with image_preprocessor only on the parts of the page with low confidence words.
+    '''
+    # Ensure image is a PIL Image
+    if isinstance(image, str):
+        image = open_page_image(image)
+    elif isinstance(image, np.ndarray):
+        image = Image.fromarray(image)
+
+    if first_pass_preprocessor:
+        ocr_result = get_two_pass_tesseract_ocr_data(image, tesseract_config, image_preprocessor, first_pass_preprocessor, ocr_backend, ocr_region_mode, region_max_workers, low_confidence_threshold)
+    else:
+        ocr_result = get_tesseract_ocr_data(image, tesseract_config, image_preprocessor, ocr_backend, ocr_region_mode, region_max_workers)
+
+    return ocr_data_to_ocr_results(ocr_result)
+
+def perform_tesseract_ocr_on_page(page_no:int, image_path:str, tesseract_config:str, image_preprocessor:ImagePreprocessor, ocr_backend:str=TESSERACT_OCR_BACKEND, ocr_region_mode:str=TESSERACT_OCR_REGION_MODE, region_max_workers:int=1, first_pass_preprocessor:Optional[ImagePreprocessor]=None, low_confidence_threshold:float=float(OCR_LOW_CONFIDENCE_THRESHOLD), page_segmentation:str=TESSERACT_PAGE_SEGMENTATION) -> Tuple[int, List[OCRResult], List[OCRResult], Dict[str, Dict], Optional[dict]]:
+    '''
+    OCR a single page image with Tesseract and combine the words into lines. Returns the page number alongside the word and line-level results so that results from a process pool can be put back in page order, and the layout decision for the page if the page segmentation mode is chosen by layout. Regions of the page are OCRed one at a time by default, as pages are already OCRed in parallel.
+    '''
+    image = open_page_image(image_path)
+
+    layout_decision = None
+    if page_segmentation == "adaptive":
+        tesseract_config, layout_decision = choose_tesseract_config_for_page(image, tesseract_config)
+
+    page_word_level_ocr_results = perform_tesseract_ocr(image, tesseract_config, image_preprocessor, ocr_backend, ocr_region_mode, region_max_workers, first_pass_preprocessor, low_confidence_threshold)
+    page_line_level_ocr_results, page_line_level_ocr_results_with_children = combine_ocr_results(page_word_level_ocr_results)
+
+    return page_no, page_word_level_ocr_results, page_line_level_ocr_results, page_line_level_ocr_results_with_children, layout_decision
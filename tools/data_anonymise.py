@@ -9,15 +9,18 @@ import pandas as pd
 from faker import Faker
 from gradio import Progress
 from typing import List, Dict, Any
+from functools import partial
 
 from presidio_analyzer import AnalyzerEngine, BatchAnalyzerEngine, DictAnalyzerResult, RecognizerResult
 from presidio_anonymizer import AnonymizerEngine, BatchAnonymizerEngine
 from presidio_anonymizer.entities import OperatorConfig, ConflictResolutionStrategy
 
-from tools.config import RUN_AWS_FUNCTIONS, AWS_ACCESS_KEY, AWS_SECRET_KEY, OUTPUT_FOLDER
+from tools.config import RUN_AWS_FUNCTIONS, AWS_ACCESS_KEY, AWS_SECRET_KEY, OUTPUT_FOLDER, ANALYSIS_PROFILE, SPACY_MODEL_TIER
 from tools.helper_functions import get_file_name_without_type, read_file, detect_file_type
 from tools.load_spacy_model_custom_recognisers import nlp_analyser, score_threshold, custom_word_list_recogniser, CustomWordFuzzyRecognizer, custom_entities
+from tools.analysis_worker_pool import get_job_analyser, PooledAnalyzer
 from tools.custom_image_analyser_engine import do_aws_comprehend_call
+from tools.analysis_cache import get_analysis_cache, get_analysis_settings, analyse_dict_with_cache
 # Use custom version of analyze_dict to be able to track progress
 from tools.presidio_analyzer_custom import analyze_dict
 
@@ -536,7 +539,7 @@ def anon_wrapper_func(
 
     return out_file_paths, out_message, key_string, log_files_output_paths
        
-def anonymise_script(df:pd.DataFrame, anon_strat:str, language:str, chosen_redact_entities:List[str], in_allow_list:List[str]=[], in_deny_list:List[str]=[], max_fuzzy_spelling_mistakes_num:int=0, pii_identification_method:str="Local", chosen_redact_comprehend_entities:List[str]=[], comprehend_query_number:int=0, comprehend_client:botocore.client.BaseClient="", custom_entities=custom_entities, progress=Progress(track_tqdm=False)):
+def anonymise_script(df:pd.DataFrame, anon_strat:str, language:str, chosen_redact_entities:List[str], in_allow_list:List[str]=[], in_deny_list:List[str]=[], max_fuzzy_spelling_mistakes_num:int=0, pii_identification_method:str="Local", chosen_redact_comprehend_entities:List[str]=[], comprehend_query_number:int=0, comprehend_client:botocore.client.BaseClient="", custom_entities=custom_entities, analysis_profile:str=ANALYSIS_PROFILE, spacy_model_tier:str=SPACY_MODEL_TIER, progress=Progress(track_tqdm=False)):
     '''
     Conduct anonymisation of a dataframe using Presidio and/or AWS Comprehend if chosen.
     '''
@@ -575,8 +578,19 @@ def anonymise_script(df:pd.DataFrame, anon_strat:str, language:str, chosen_redac
         new_custom_fuzzy_recogniser = CustomWordFuzzyRecognizer(supported_entities=["CUSTOM_FUZZY"], custom_list=in_deny_list, spelling_mistakes_max=in_deny_list, search_whole_phrase=max_fuzzy_spelling_mistakes_num)
         nlp_analyser.registry.add_recognizer(new_custom_fuzzy_recogniser)
 
-    #analyzer = nlp_analyser #AnalyzerEngine()
-    batch_analyzer = BatchAnalyzerEngine(analyzer_engine=nlp_analyser)
+    # Local analysis only runs the spaCy components needed for the chosen entities (only custom entities are found locally with AWS Comprehend)
+    profile_analyser = get_job_analyser(analysis_profile, chosen_redact_entities if pii_identification_method == "Local" else custom_entities, spacy_model_tier)
+
+    # With the analysis worker pool, columns are analysed in the worker processes
+    if isinstance(profile_analyser, PooledAnalyzer):
+        analyse_dict = profile_analyser.analyze_dict
+    else:
+        analyse_dict = partial(analyze_dict, BatchAnalyzerEngine(analyzer_engine=profile_analyser))
+
+    # Cells analysed before in a column with the same name and settings take their results from the analysis cache
+    analysis_cache = get_analysis_cache()
+    if analysis_cache:
+        analyse_dict = partial(analyse_dict_with_cache, analysis_cache, analyse_dict, profile_analyser)
 
     anonymizer = AnonymizerEngine()#conflict_resolution=ConflictResolutionStrategy.MERGE_SIMILAR_OR_CONTAINED)
 
@@ -587,7 +601,7 @@ def anonymise_script(df:pd.DataFrame, anon_strat:str, language:str, chosen_redac
     if pii_identification_method == "Local":
 
         # Use custom analyzer to be able to track progress with Gradio
-        custom_results = analyze_dict(batch_analyzer,
+        custom_results = analyse_dict(
                                         df_dict,
                                         language=language, 
                                         entities=chosen_redact_entities,
@@ -613,7 +627,7 @@ def anonymise_script(df:pd.DataFrame, anon_strat:str, language:str, chosen_redac
             ]
             if custom_redact_entities:
                 # Get results from analyze_dict
-                custom_results = analyze_dict(batch_analyzer,
+                custom_results = analyse_dict(
                                     df_dict,
                                     language=language, 
                                     entities=custom_redact_entities,
@@ -628,6 +642,8 @@ def anonymise_script(df:pd.DataFrame, anon_strat:str, language:str, chosen_redac
         max_retries = 3
         retry_delay = 3
 
+        comprehend_settings = get_analysis_settings("AWS Comprehend", language, chosen_redact_comprehend_entities)
+
         # Process each text column in the dictionary
         for column_name, texts in progress.tqdm(df_dict.items(), desc="Querying AWS Comprehend service.", unit = "Columns"):
             # Get or create DictAnalyzerResult for this column
@@ -643,6 +659,12 @@ def anonymise_script(df:pd.DataFrame, anon_strat:str, language:str, chosen_redac
             # Process each text in the column
             for text_idx, text in progress.tqdm(enumerate(texts), desc="Querying AWS Comprehend service.", unit = "Row"):
 
+                # Cells seen before are not sent to AWS Comprehend again
+                cached_results = analysis_cache.get_line_results(str(text), comprehend_settings) if analysis_cache and str(text).strip() else None
+                if cached_results is not None:
+                    column_results.recognizer_results[text_idx].extend(cached_results)
+                    continue
+
                 for attempt in range(max_retries):
                     try:
                         response = comprehend_client.detect_pii_entities(
@@ -652,6 +674,8 @@ def anonymise_script(df:pd.DataFrame, anon_strat:str, language:str, chosen_redac
 
                         comprehend_query_number += 1
 
+                        text_results = []
+
                         # Add all entities from this text to the column's recognizer_results
                         for entity in response["Entities"]:
                             if entity.get("Type") not in chosen_redact_comprehend_entities:
@@ -663,7 +687,10 @@ def anonymise_script(df:pd.DataFrame, anon_strat:str, language:str, chosen_redac
                                 end=entity["EndOffset"],
                                 score=entity["Score"]
                             )
-                            column_results.recognizer_results[text_idx].append(recognizer_result)
+                            text_results.append(recognizer_result)
+
+                        column_results.recognizer_results[text_idx].extend(text_results)
+                        if analysis_cache and str(text).strip(): analysis_cache.put_line_results(str(text), comprehend_settings, text_results)
                         
                         break  # Success, exit retry loop
                         
@@ -692,6 +719,8 @@ def anonymise_script(df:pd.DataFrame, anon_strat:str, language:str, chosen_redac
     analyse_time_out = f"Analysing the text took {analyse_toc - analyse_tic:0.1f} seconds."
     print(analyse_time_out)
 
+    if analysis_cache: print(analysis_cache.get_stats_message())
+
     # Create faker function (note that it has to receive a value)
     #fake = Faker("en_UK")
 
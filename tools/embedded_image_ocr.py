@@ -0,0 +1,180 @@
+import threading
+import pymupdf
+from PIL import Image
+from pymupdf import Page, Rect
+from pdfminer.layout import LTChar, LTAnno, LTComponent
+from typing import Dict, List, Tuple
+
+from tools.config import TESSERACT_OCR_BACKEND, EMBEDDED_IMAGE_MIN_SIZE, EMBEDDED_IMAGE_OCR_DPI, EMBEDDED_IMAGE_MAX_TEXT_LAYER_WORDS
+from tools.custom_image_analyser_engine import OCRResult, ImagePreprocessor, combine_ocr_results, perform_tesseract_ocr, get_image_preprocessor
+
+# Upscaling of small embedded images before OCR is limited to this factor
+max_upscale_factor = 4.0
+
+class OCRChar(LTChar):
+    '''
+    A character of text found by OCR in an embedded image, with the pdfminer LTChar attributes used to map analyser results back to boxes on the page.
+    '''
+    def __init__(self, text:str, bbox:Tuple[float, float, float, float]):
+        LTComponent.__init__(self, bbox)
+        self._text = text
+
+    def get_text(self) -> str:
+        return self._text
+
+class EmbeddedImageOCR:
+    '''
+    OCR of the images embedded in otherwise digital PDF pages, such as signatures, stamped addresses and scanned attachments, so that their text can be analysed along with the text layer without OCRing the whole document.
+
+    Image placements are found with PyMuPDF. Images that are too small, or that already have text layer words over them (e.g. a scan with an OCR layer), are skipped. Each image is OCRed once per document, keyed on the digest of its pixels, so an image repeated on every page (e.g. a logo) is only OCRed the first time. Words are kept relative to the image, and mapped to each placement of it.
+    '''
+    def __init__(self,
+                 tesseract_config:str="--oem 3 --psm 11",
+                 image_preprocessor:ImagePreprocessor=None,
+                 ocr_backend:str=TESSERACT_OCR_BACKEND,
+                 min_image_size:float=float(EMBEDDED_IMAGE_MIN_SIZE),
+                 ocr_dpi:float=float(EMBEDDED_IMAGE_OCR_DPI),
+                 max_text_layer_words:int=int(EMBEDDED_IMAGE_MAX_TEXT_LAYER_WORDS)):
+        self.tesseract_config = tesseract_config
+        self.image_preprocessor = image_preprocessor or get_image_preprocessor()
+        self.ocr_backend = ocr_backend
+        self.min_image_size = min_image_size
+        self.ocr_dpi = ocr_dpi
+        self.max_text_layer_words = max_text_layer_words
+
+        # Image digest -> lines of words, each word as (text, (x0, y0, x1, y1)) relative to the image
+        self.image_lines:Dict[str, List[List[Tuple[str, Tuple[float, float, float, float]]]]] = {}
+        self.lock = threading.Lock()
+        self.stats = {"images_found": 0, "images_skipped": 0, "images_ocred": 0, "cache_hits": 0, "lines_found": 0}
+
+    def get_page_image_placements(self, page:Page) -> List[dict]:
+        '''
+        Find the images placed on a page that should be OCRed. Returns dicts with the image xref (0 for inline images), pixel digest, transform and bounding box in PyMuPDF page coordinates.
+        '''
+        placements = []
+
+        for image_info in page.get_image_info(hashes=True, xrefs=True):
+            bbox = Rect(image_info["bbox"]) & page.rect
+            if bbox.is_empty: continue
+
+            self.stats["images_found"] += 1
+
+            if bbox.width < self.min_image_size or bbox.height < self.min_image_size or \
+                len(page.get_text("words", clip=bbox)) > self.max_text_layer_words:
+                self.stats["images_skipped"] += 1
+                continue
+
+            placements.append({"xref": image_info.get("xref", 0),
+                               "digest": image_info["digest"].hex(),
+                               "transform": image_info["transform"],
+                               "bbox": bbox})
+
+        return placements
+
+    def get_placement_image(self, page:Page, placement:dict) -> Image.Image:
+        '''
+        Get a greyscale image of an image placement for OCR. Upright images are read from the PDF at their own resolution, and upscaled if they are placed at less than ocr_dpi. Other images (inline, rotated or flipped, including all images on rotated pages) are rendered from the page area they cover, as they appear on the page.
+        '''
+        a, b, c, d, _, _ = placement["transform"]
+        bbox = placement["bbox"]
+
+        if placement["xref"] and abs(b) < 1e-3 and abs(c) < 1e-3 and a > 0 and d > 0:
+            try:
+                pixmap = pymupdf.Pixmap(page.parent, placement["xref"])
+                if pixmap.alpha: pixmap = pymupdf.Pixmap(pixmap, 0)
+                if pixmap.n != 1: pixmap = pymupdf.Pixmap(pymupdf.csGRAY, pixmap)
+
+                image = Image.frombytes("L", (pixmap.width, pixmap.height), pixmap.samples)
+
+                placement_dpi = image.width / (bbox.width / 72)
+                if placement_dpi < self.ocr_dpi:
+                    scale = min(max_upscale_factor, self.ocr_dpi / placement_dpi)
+                    image = image.resize((int(image.width * scale), int(image.height * scale)), Image.Resampling.LANCZOS)
+
+                return image
+            except Exception as e:
+                print("Could not read embedded image", placement["xref"], "so rendering it from the page instead:", e)
+
+        pixmap = page.get_pixmap(clip=bbox, dpi=int(self.ocr_dpi), colorspace=pymupdf.csGRAY, alpha=False)
+        return Image.frombytes("L", (pixmap.width, pixmap.height), pixmap.samples)
+
+    def ocr_placement(self, page:Page, placement:dict) -> List[List[Tuple[str, Tuple[float, float, float, float]]]]:
+        '''
+        OCR an image placement, or get the results for the same image from earlier in the document. Returns lines of words with boxes relative to the image.
+        '''
+        # Rendered placements include the placement transform, so they are only shared by identical placements
+        image_key = placement["digest"]
+        if not placement["xref"] or placement["transform"][1] or placement["transform"][2]:
+            image_key += "_" + "_".join(str(round(value, 1)) for value in placement["transform"][:4])
+
+        with self.lock:
+            if image_key in self.image_lines:
+                self.stats["cache_hits"] += 1
+                return self.image_lines[image_key]
+
+        image = self.get_placement_image(page, placement)
+        word_results = perform_tesseract_ocr(image, self.tesseract_config, self.image_preprocessor, self.ocr_backend)
+
+        # Word heights scale the line grouping distance, as images can be of any resolution
+        y_threshold = max(12.0, 0.5 * sum(word.height for word in word_results) / len(word_results)) if word_results else 12.0
+        _, line_results = combine_ocr_results(word_results, y_threshold=y_threshold)
+
+        image_lines = []
+        for line in line_results.values():
+            words = [(word["text"], (word["bounding_box"][0] / image.width, word["bounding_box"][1] / image.height,
+                                     word["bounding_box"][2] / image.width, word["bounding_box"][3] / image.height))
+                     for word in line["words"] if word["text"].strip()]
+            if words: image_lines.append(words)
+
+        with self.lock:
+            self.image_lines[image_key] = image_lines
+            self.stats["images_ocred"] += 1
+
+        return image_lines
+
+    def get_page_lines(self, page:Page) -> Tuple[List[OCRResult], List[list]]:
+        '''
+        OCR the embedded images on a page (with its cropbox set to its mediabox, as in redact_text_pdf). Returns line-level OCRResults and a list of characters for each line in pdfminer page coordinates (origin at the bottom left), in the same form as create_text_bounding_boxes_from_characters, so that the lines can be analysed with the text layer lines of the page.
+        '''
+        line_results = []
+        line_characters = []
+        page_height = page.mediabox.height
+
+        for placement in self.get_page_image_placements(page):
+            image_lines = self.ocr_placement(page, placement)
+
+            bbox = placement["bbox"]
+
+            for words in image_lines:
+                characters = []
+                line_text = ""
+                line_bbox = [float("inf"), float("inf"), float("-inf"), float("-inf")]
+
+                for word_no, (word_text, (x0, y0, x1, y1)) in enumerate(words):
+                    if word_no > 0:
+                        characters.append(LTAnno(" "))
+                        line_text += " "
+
+                    # Word boxes are mapped onto the placement as it appears on the page, then onto the unrotated page. PyMuPDF y coordinates run down the page, pdfminer y coordinates run up from the bottom of the mediabox.
+                    word_rect = Rect(bbox.x0 + x0 * bbox.width, bbox.y0 + y0 * bbox.height, bbox.x0 + x1 * bbox.width, bbox.y0 + y1 * bbox.height) * page.derotation_matrix
+                    word_left, word_right = word_rect.x0, word_rect.x1
+                    word_bottom, word_top = page_height - word_rect.y1, page_height - word_rect.y0
+
+                    # Characters are spread evenly across the word, as Tesseract only gives word boxes here
+                    char_width = (word_right - word_left) / len(word_text)
+                    for char_no, character in enumerate(word_text):
+                        characters.append(OCRChar(character, (word_left + char_no * char_width, word_bottom, word_left + (char_no + 1) * char_width, word_top)))
+
+                    line_text += word_text
+                    line_bbox = [min(line_bbox[0], word_left), min(line_bbox[1], word_bottom), max(line_bbox[2], word_right), max(line_bbox[3], word_top)]
+
+                line_results.append(OCRResult(line_text, round(line_bbox[0], 2), round(line_bbox[1], 2), round(line_bbox[2] - line_bbox[0], 2), round(line_bbox[3] - line_bbox[1], 2)))
+                line_characters.append(characters)
+
+        self.stats["lines_found"] += len(line_results)
+
+        return line_results, line_characters
+
+    def get_report_message(self) -> str:
+        return (f"Embedded image OCR: {self.stats['images_found']} images found on text pages, {self.stats['images_skipped']} skipped (too small or already covered by the text layer), "
+                f"{self.stats['images_ocred']} OCRed, {self.stats['cache_hits']} repeated images reused, {self.stats['lines_found']} lines of text found.")
@@ -1,6 +1,7 @@
 from pdf2image import convert_from_path, pdfinfo_from_path
 
 from PIL import Image, ImageFile
+import io
 import os
 import re
 import time
@@ -11,11 +12,14 @@ from pymupdf import Document, Page, Rect
 import pandas as pd
 import shutil
 import zipfile
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
+from contextlib import contextmanager
 from tqdm import tqdm
 from gradio import Progress
 from typing import List, Optional, Dict, Any
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import threading
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
 from pdf2image import convert_from_path
 from PIL import Image
 from scipy.spatial import cKDTree
@@ -24,7 +28,10 @@ IMAGE_NUM_REGEX = re.compile(r'_(\d+)\.png$')
 
 pd.set_option('future.no_silent_downcasting', True)
 
-from tools.config import OUTPUT_FOLDER, INPUT_FOLDER, IMAGES_DPI, LOAD_TRUNCATED_IMAGES, MAX_IMAGE_PIXELS, CUSTOM_BOX_COLOUR
+from tools.config import OUTPUT_FOLDER, INPUT_FOLDER, IMAGES_DPI, LOAD_TRUNCATED_IMAGES, MAX_IMAGE_PIXELS, CUSTOM_BOX_COLOUR, PDF_RASTERISER, USE_ADAPTIVE_DPI, TEXTRACT_MAX_IMAGE_BYTES, USE_DIRECT_IMAGE_INPUT
+from tools.adaptive_dpi import choose_page_dpi
+from tools.image_encoder import encode_image_to_byte_budget
+from tools.page_image_store import get_page_image_store, store_page_image, open_page_image, reset_page_image_stores
 from tools.helper_functions import get_file_name_without_type, tesseract_ocr_option, text_ocr_option, textract_option, read_file
 # from tools.aws_textract import load_and_convert_textract_json
 
@@ -65,14 +72,14 @@ def is_pdf(filename):
 
 def check_image_size_and_reduce(out_path:str, image:Image):
     '''
-    Check if a given image size is above around 4.5mb, and reduce size if necessary. 5mb is the maximum possible to submit to AWS Textract.
+    Check if a given image size is above around 4.5mb, and reduce size if necessary. 5mb is the maximum possible to submit to AWS Textract. Only the resolution is reduced, keeping the colour mode of the stored page image, with the scale predicted in memory (see tools/image_encoder.py) so that the file is written once. Reducing the bit depth is left to the bytes sent to Textract. The new width and height are returned, so that boxes map back to the reduced image.
     '''
 
     all_img_details = []
     page_num = 0
 
     # Check file size and resize if necessary
-    max_size = 4.5 * 1024 * 1024  # 5 MB in bytes # 5
+    max_size = int(TEXTRACT_MAX_IMAGE_BYTES)
     file_size = os.path.getsize(out_path)        
 
     width = image.width
@@ -80,22 +87,17 @@ def check_image_size_and_reduce(out_path:str, image:Image):
 
     # Resize images if they are too big
     if file_size > max_size:
-        # Start with the original image size          
-
         print(f"Image size before {width}x{height}, original file_size: {file_size}")
 
-        while file_size > max_size:
-            # Reduce the size by a factor (e.g., 50% of the current size)
-            new_width = int(width * 0.5)
-            new_height = int(height * 0.5)
-            image = image.resize((new_width, new_height), Image.Resampling.LANCZOS)
-            
-            # Save the resized image
-            image.save(out_path, format="PNG", optimize=True)
-            
-            # Update the file size
-            file_size = os.path.getsize(out_path)
-            print(f"Resized to {new_width}x{new_height}, new file_size: {file_size}")
+        image_bytes, encoding_metadata = encode_image_to_byte_budget(image, max_size, encodings=["original"])
+
+        with open(out_path, "wb") as image_file:
+            image_file.write(image_bytes)
+
+        image = Image.open(io.BytesIO(image_bytes))
+        new_width, new_height = image.size
+
+        print(f"Resized to {new_width}x{new_height} (scale factor {encoding_metadata['scale_factor']}), new file_size: {encoding_metadata['bytes']}")
     else:
         new_width = width
         new_height = height
@@ -105,7 +107,99 @@ def check_image_size_and_reduce(out_path:str, image:Image):
 
     return image, new_width, new_height, all_img_details, out_path
 
-def process_single_page_for_image_conversion(pdf_path:str, page_num:int, image_dpi:float=image_dpi, create_images:bool = True, input_folder: str = INPUT_FOLDER) -> tuple[int, str, float, float]:
+# PDF documents opened by the PyMuPDF rasteriser in this process, so that each document is only opened and parsed once per worker. Each document has its own lock, so that different documents are rendered at the same time.
+_pymupdf_rasteriser_docs = OrderedDict()
+_pymupdf_rasteriser_docs_lock = threading.Lock()
+max_pymupdf_rasteriser_docs = 4
+
+def get_file_version(file_path:str) -> tuple:
+    '''
+    Identify a version of a file by its path, modification time and size, so that a new file uploaded to a path that was used before is not mistaken for the old one.
+    '''
+    file_stat = os.stat(file_path)
+    return os.path.abspath(file_path), file_stat.st_mtime_ns, file_stat.st_size
+
+def close_pymupdf_rasteriser_doc(doc_key:tuple):
+    pdf_doc, doc_lock = _pymupdf_rasteriser_docs.pop(doc_key)
+    with doc_lock:
+        pdf_doc.close()
+
+def get_pymupdf_rasteriser_doc(pdf_path:str) -> tuple[Document, threading.Lock]:
+    '''
+    Return the PyMuPDF document kept open by this process for rendering a PDF, and the lock to hold while using it. The document is opened again if the file at pdf_path has changed since it was opened.
+    '''
+    doc_key = get_file_version(pdf_path)
+
+    with _pymupdf_rasteriser_docs_lock:
+        if doc_key not in _pymupdf_rasteriser_docs:
+            # Close documents opened from an earlier version of the file, and the least recently used documents if too many are open
+            for open_doc_key in [open_doc_key for open_doc_key in _pymupdf_rasteriser_docs if open_doc_key[0] == doc_key[0]]:
+                close_pymupdf_rasteriser_doc(open_doc_key)
+            while len(_pymupdf_rasteriser_docs) >= max_pymupdf_rasteriser_docs:
+                close_pymupdf_rasteriser_doc(next(iter(_pymupdf_rasteriser_docs)))
+
+            _pymupdf_rasteriser_docs[doc_key] = (pymupdf.open(pdf_path), threading.Lock())
+
+        _pymupdf_rasteriser_docs.move_to_end(doc_key)
+        return _pymupdf_rasteriser_docs[doc_key]
+
+def init_rasteriser_worker():
+    '''
+    Initialiser for PyMuPDF rasteriser worker processes. Workers are forked from a server thread, so they start with copies of the app process's open rasteriser documents and page image stores, and of their locks, which other threads may have held at the time. The copies are dropped (without closing the app process's documents) so that each worker opens its own.
+    '''
+    global _pymupdf_rasteriser_docs, _pymupdf_rasteriser_docs_lock
+    _pymupdf_rasteriser_docs = OrderedDict()
+    _pymupdf_rasteriser_docs_lock = threading.Lock()
+    reset_page_image_stores()
+
+def create_rasteriser_process_pool(max_workers:int) -> ProcessPoolExecutor:
+    '''
+    Create a pool of worker processes for rendering pages with PyMuPDF. Workers are forked rather than spawned, as spawned workers import the app's main module again, and are cleaned up by init_rasteriser_worker.
+    '''
+    process_context = multiprocessing.get_context("fork") if "fork" in multiprocessing.get_all_start_methods() else None
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=process_context, initializer=init_rasteriser_worker)
+
+@contextmanager
+def open_pymupdf_rasteriser_doc(pdf_path:str):
+    '''
+    Hold the lock of the rasteriser document for a PDF while using it. If the document was closed by another thread before its lock was acquired, it is opened again.
+    '''
+    while True:
+        pdf_doc, doc_lock = get_pymupdf_rasteriser_doc(pdf_path)
+        with doc_lock:
+            if not pdf_doc.is_closed:
+                yield pdf_doc
+                return
+
+def get_adaptive_page_dpi(pdf_path:str, page_num:int, unknown_text_dpi:float=image_dpi) -> float:
+    '''
+    Choose the DPI to render a PDF page at from the size of its smaller text (see tools/adaptive_dpi.py). Pages where no text is found are rendered at unknown_text_dpi.
+    '''
+    with open_pymupdf_rasteriser_doc(pdf_path) as pdf_doc:
+        page = pdf_doc.load_page(page_num)
+        return choose_page_dpi(page, unknown_text_dpi)
+
+def render_pdf_page_with_pymupdf(pdf_path:str, page_num:int, image_dpi:float=image_dpi) -> Image.Image:
+    '''
+    Render a PDF page straight to an in-memory greyscale PIL image with PyMuPDF. As with the pdf2image route, the whole media box is rendered rather than the crop box.
+    '''
+    with open_pymupdf_rasteriser_doc(pdf_path) as pdf_doc:
+        page = pdf_doc.load_page(page_num)
+
+        # This document is only used for rendering and is never saved, so the crop box can be changed safely
+        if page.cropbox != page.mediabox:
+            page.set_cropbox(page.mediabox)
+
+        pixmap = page.get_pixmap(dpi=int(image_dpi), colorspace=pymupdf.csGRAY, alpha=False)
+
+        return Image.frombytes("L", (pixmap.width, pixmap.height), pixmap.samples)
+
+def process_single_page_for_image_conversion(pdf_path:str, page_num:int, image_dpi:float=image_dpi, create_images:bool = True, input_folder: str = INPUT_FOLDER, rasteriser:str = PDF_RASTERISER, use_adaptive_dpi:bool = USE_ADAPTIVE_DPI == "True") -> tuple[int, str, float, float]:
+    '''
+    Create a greyscale png image for a page of a PDF (or copy an image file), and return the page number, image path, and image width and height. PDF pages are rendered with pdf2image (poppler) by default, or with PyMuPDF if rasteriser is 'pymupdf'.
+
+    With use_adaptive_dpi, image_dpi is replaced by a DPI chosen for each page from the size of its text. Redaction and review coordinates stay consistent, as they are converted using the width and height of each page image rather than the DPI.
+    '''
 
     out_path_placeholder = "placeholder_image_" + str(page_num) + ".png"
 
@@ -116,9 +210,19 @@ def process_single_page_for_image_conversion(pdf_path:str, page_num:int, image_d
             out_path = os.path.join(image_output_dir, f"{os.path.basename(pdf_path)}_{page_num}.png")
             os.makedirs(os.path.dirname(out_path), exist_ok=True)
 
-            if os.path.exists(out_path):
+            if pdf_path.lower().endswith(".pdf") and use_adaptive_dpi and not os.path.exists(out_path):
+                image_dpi = get_adaptive_page_dpi(pdf_path, page_num, image_dpi)
+
+            image_created = not os.path.exists(out_path)
+
+            if not image_created:
                 # Load existing image
-                image = Image.open(out_path)
+                image = open_page_image(out_path)
+            elif pdf_path.lower().endswith(".pdf") and rasteriser == "pymupdf":
+                # Render PDF page in memory with the document kept open by this process
+                image = render_pdf_page_with_pymupdf(pdf_path, page_num, image_dpi)
+
+                image.save(out_path, format="PNG")
             elif pdf_path.lower().endswith(".pdf"):
                 # Convert PDF page to image
                 image_l = convert_from_path(pdf_path, first_page=page_num+1, last_page=page_num+1, 
@@ -137,6 +241,9 @@ def process_single_page_for_image_conversion(pdf_path:str, page_num:int, image_d
             #print("Checking size of image and reducing if necessary.")
             image, width, height, all_img_details, img_path = check_image_size_and_reduce(out_path, image)                
 
+            # Keep the decoded pixels of new page images, so that later steps do not decode the PNG again
+            if image_created: store_page_image(out_path, image)
+
             return page_num, out_path, width, height
 
         except Exception as e:
@@ -146,7 +253,50 @@ def process_single_page_for_image_conversion(pdf_path:str, page_num:int, image_d
         # print("Not creating image for page", page_num)
         return page_num,  out_path_placeholder, pd.NA, pd.NA
 
-def convert_pdf_to_images(pdf_path: str, prepare_for_review:bool=False, page_min: int = 0, page_max:int = 0, create_images:bool=True, image_dpi: float = image_dpi, num_threads: int = 8, input_folder: str = INPUT_FOLDER):
+# Page images already created in this process, keyed by document, page number and DPI. The least recently used entries are dropped, with their page locks, past max_page_image_memo_entries.
+_page_image_memo = OrderedDict()
+_page_image_locks = {}
+_page_image_memo_lock = threading.Lock()
+max_page_image_memo_entries = 2000
+
+def get_page_image(pdf_path:str, page_num:int, image_dpi:float=image_dpi, input_folder:str=INPUT_FOLDER, rasteriser:str=PDF_RASTERISER) -> tuple[int, str, float, float]:
+    '''
+    Return the page number, image path, width and height for a page image, creating the image only if it is needed and has not been created before. Results are memoised, and a lock per page means that a page requested by several stages at once (e.g. OCR and the review annotator) is only rendered once.
+    '''
+    memo_key = (os.path.abspath(pdf_path), page_num, float(image_dpi), input_folder)
+
+    with _page_image_memo_lock:
+        page_lock = _page_image_locks.setdefault(memo_key, threading.Lock())
+
+    with page_lock:
+        with _page_image_memo_lock:
+            memoised_page_image = _page_image_memo.get(memo_key)
+            if memoised_page_image: _page_image_memo.move_to_end(memo_key)
+
+        if memoised_page_image and os.path.exists(memoised_page_image[1]):
+            return memoised_page_image
+
+        page_image = process_single_page_for_image_conversion(pdf_path, page_num, image_dpi, create_images=True, input_folder=input_folder, rasteriser=rasteriser)
+
+        with _page_image_memo_lock:
+            # Only remember pages that were created successfully, so that failed pages can be tried again
+            if os.path.exists(page_image[1]):
+                _page_image_memo[memo_key] = page_image
+                _page_image_memo.move_to_end(memo_key)
+
+                while len(_page_image_memo) > max_page_image_memo_entries:
+                    evicted_memo_key, _ = _page_image_memo.popitem(last=False)
+                    _page_image_locks.pop(evicted_memo_key, None)
+            else:
+                _page_image_locks.pop(memo_key, None)
+
+        if os.path.exists(page_image[1]):
+            page_image_store, _ = get_page_image_store(page_image[1])
+            if page_image_store: page_image_store.update_index([page_image])
+
+        return page_image
+
+def convert_pdf_to_images(pdf_path: str, prepare_for_review:bool=False, page_min: int = 0, page_max:int = 0, create_images:bool=True, image_dpi: float = image_dpi, num_threads: int = 8, input_folder: str = INPUT_FOLDER, rasteriser: str = PDF_RASTERISER):
 
     # If preparing for review, just load the first page (not currently used)
     if prepare_for_review == True:
@@ -162,10 +312,17 @@ def convert_pdf_to_images(pdf_path: str, prepare_for_review:bool=False, page_min
     if page_max == 0: page_max = page_count
 
     results = []
-    with ThreadPoolExecutor(max_workers=num_threads) as executor:
+
+    # PyMuPDF holds the GIL while rendering, so its pages are split across processes rather than threads. Each worker process opens the PDF once and renders all of its pages from that copy.
+    if rasteriser == "pymupdf" and create_images == True:
+        pool_executor = create_rasteriser_process_pool(min(num_threads, os.cpu_count() or 1))
+    else:
+        pool_executor = ThreadPoolExecutor(max_workers=num_threads)
+
+    with pool_executor as executor:
         futures = []
         for page_num in range(page_min, page_max):
-            futures.append(executor.submit(process_single_page_for_image_conversion, pdf_path, page_num, image_dpi, create_images=create_images, input_folder=input_folder))
+            futures.append(executor.submit(process_single_page_for_image_conversion, pdf_path, page_num, image_dpi, create_images=create_images, input_folder=input_folder, rasteriser=rasteriser))
         
         for future in tqdm(as_completed(futures), total=len(futures), unit="pages", desc="Converting pages to image"):
             page_num, img_path, width, height = future.result()
@@ -177,6 +334,11 @@ def convert_pdf_to_images(pdf_path: str, prepare_for_review:bool=False, page_min
     
     # Sort results by page number
     results.sort(key=lambda x: x[0])
+
+    if create_images and results:
+        page_image_store, _ = get_page_image_store(results[0][1])
+        if page_image_store: page_image_store.update_index([result for result in results if not pd.isna(result[2])])
+
     images = [result[1] for result in results]
     widths = [result[2] for result in results]
     heights = [result[3] for result in results]
@@ -185,12 +347,50 @@ def convert_pdf_to_images(pdf_path: str, prepare_for_review:bool=False, page_min
     return images, widths, heights, results
 
 # Function to take in a file path, decide if it is an image or pdf, then process appropriately.
-def process_file_for_image_creation(file_path:str, prepare_for_review:bool=False, input_folder:str=INPUT_FOLDER, create_images:bool=True):
+def create_image_input_doc(image_path:str) -> Document:
+    '''
+    Create an in-memory PyMuPDF document with one blank page the size of an image, for image uploads redacted directly as images. The page gives the page count and page sizes used elsewhere, without embedding or saving the image.
+    '''
+    with Image.open(image_path) as image:
+        width, height = image.size
+
+    pymupdf_doc = pymupdf.open()
+    pymupdf_doc.new_page(width=width, height=height)
+
+    return pymupdf_doc
+
+def save_image_as_pdf(image_path:str, pdf_path:str) -> str:
+    '''
+    Save an image as a one page PDF the size of the image.
+    '''
+    with Image.open(image_path) as image:
+        width, height = image.size
+
+    with pymupdf.open() as pdf_doc:
+        pdf_page = pdf_doc.new_page(width=width, height=height)
+        pdf_page.insert_image(pymupdf.Rect(0, 0, width, height), filename=image_path)
+        pdf_doc.save(pdf_path, garbage=4, deflate=True)
+
+    return pdf_path
+
+def process_file_for_image_creation(file_path:str, prepare_for_review:bool=False, input_folder:str=INPUT_FOLDER, create_images:bool=True, use_direct_image_input:bool=USE_DIRECT_IMAGE_INPUT == "True"):
     # Get the file extension
     file_extension = os.path.splitext(file_path)[1].lower()
  
+    # Images redacted directly are used as they are. Only the image header is read here, for the image size.
+    if file_extension in ['.jpg', '.jpeg', '.png'] and use_direct_image_input:
+        print(f"{file_path} is an image file.")
+
+        with Image.open(file_path) as image:
+            width, height = image.size
+
+        img_path = [file_path]
+        image_sizes_width = [width]
+        image_sizes_height = [height]
+        all_img_details = [[(0, file_path, width, height)]]
+
     # Check if the file is an image type
-    if file_extension in ['.jpg', '.jpeg', '.png']:
+    elif file_extension in ['.jpg', '.jpeg', '.png']:
         print(f"{file_path} is an image file.")
         # Perform image processing here
         img_object = [file_path] #[Image.open(file_path)]
@@ -579,16 +779,20 @@ def prepare_image_or_pdf(
             if file_extension in ['.jpg', '.jpeg', '.png'] and in_redact_method == text_ocr_option:
                 in_redact_method = tesseract_ocr_option
 
-            # Convert image to a pymupdf document
-            pymupdf_doc = pymupdf.open()  # Create a new empty document
+            file_path_str = str(file_path)
 
-            img = Image.open(file_path)  # Open the image file
-            rect = pymupdf.Rect(0, 0, img.width, img.height)  # Create a rectangle for the image
-            pymupdf_page = pymupdf_doc.new_page(width=img.width, height=img.height)  # Add a new page
-            pymupdf_page.insert_image(rect, filename=file_path)  # Insert the image into the page
-            pymupdf_page = pymupdf_doc.load_page(0)
+            # Redact the image as it is, with a blank in-memory page giving the page size
+            if USE_DIRECT_IMAGE_INPUT == "True":
+                pymupdf_doc = create_image_input_doc(file_path_str)
+            else:
+                # Convert image to a pymupdf document
+                pymupdf_doc = pymupdf.open()  # Create a new empty document
 
-            file_path_str = str(file_path)
+                img = Image.open(file_path)  # Open the image file
+                rect = pymupdf.Rect(0, 0, img.width, img.height)  # Create a rectangle for the image
+                pymupdf_page = pymupdf_doc.new_page(width=img.width, height=img.height)  # Add a new page
+                pymupdf_page.insert_image(rect, filename=file_path)  # Insert the image into the page
+                pymupdf_page = pymupdf_doc.load_page(0)
 
             image_file_paths, image_sizes_width, image_sizes_height, all_img_details = process_file_for_image_creation(file_path_str, prepare_for_review, input_folder, create_images=True)
 
@@ -596,9 +800,12 @@ def prepare_image_or_pdf(
             # Create a page_sizes_object
             page_sizes, original_cropboxes = create_page_size_objects(pymupdf_doc, image_sizes_width, image_sizes_height, image_file_paths)
 
-            converted_file_path = output_folder + file_name_with_ext
+            if USE_DIRECT_IMAGE_INPUT == "True":
+                converted_file_path = file_path_str
+            else:
+                converted_file_path = output_folder + file_name_with_ext
 
-            pymupdf_doc.save(converted_file_path, garbage=4, deflate=True, clean=True)
+                pymupdf_doc.save(converted_file_path, garbage=4, deflate=True, clean=True)
 
         elif file_extension in ['.csv']:
             if '_review_file' in file_path_without_ext:
@@ -851,7 +1058,8 @@ def divide_coordinates_by_page_sizes(review_file_df:pd.DataFrame, page_sizes_df:
             review_file_df_div = review_file_df_div.merge(page_sizes_df[["page", "image_width", "image_height", "mediabox_width", "mediabox_height"]], on="page", how="left")
 
         if "image_width" in review_file_df_div.columns:
-            if review_file_df_div["image_width"].isna().all():  # Check if all are NaN values. If so, assume we only have mediabox coordinates available
+            # Pages without an image size (e.g. lazily created page images that have not been rendered yet) only have mediabox coordinates available
+            if "mediabox_width" in review_file_df_div.columns:
                 review_file_df_div["image_width"] = review_file_df_div["image_width"].fillna(review_file_df_div["mediabox_width"]).infer_objects()
                 review_file_df_div["image_height"] = review_file_df_div["image_height"].fillna(review_file_df_div["mediabox_height"]).infer_objects()
 
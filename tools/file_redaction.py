@@ -1,7 +1,5 @@
 import time
 import re
-import json
-import io
 import os
 import boto3
 import copy
@@ -12,19 +10,35 @@ from typing import List, Dict, Tuple
 import pandas as pd
 
 from pdfminer.high_level import extract_pages
-from pdfminer.layout import LTTextContainer, LTChar, LTTextLine, LTTextLineHorizontal, LTAnno
+from pdfminer.layout import LTTextContainer, LTChar, LTTextLine, LTTextLineHorizontal, LTAnno, LTPage
 from pikepdf import Pdf, Dictionary, Name
-from pymupdf import Rect, Page, Document
+from pymupdf import Rect, Page, Document, PDF_REDACT_IMAGE_NONE, PDF_REDACT_IMAGE_PIXELS
+from presidio_analyzer import AnalyzerEngine
 import gradio as gr
 from gradio import Progress
 from collections import defaultdict  # For efficient grouping
 
-from tools.config import OUTPUT_FOLDER, IMAGES_DPI, MAX_IMAGE_PIXELS, RUN_AWS_FUNCTIONS, AWS_ACCESS_KEY, AWS_SECRET_KEY, AWS_REGION, PAGE_BREAK_VALUE, MAX_TIME_VALUE, LOAD_TRUNCATED_IMAGES, INPUT_FOLDER
-from tools.custom_image_analyser_engine import CustomImageAnalyzerEngine, OCRResult, combine_ocr_results, CustomImageRecognizerResult, run_page_text_redaction, merge_text_bounding_boxes
-from tools.file_conversion import convert_annotation_json_to_review_df, redact_whole_pymupdf_page, redact_single_box, convert_pymupdf_to_image_coords, is_pdf, is_pdf_or_image, prepare_image_or_pdf, divide_coordinates_by_page_sizes, multiply_coordinates_by_page_sizes, convert_annotation_data_to_dataframe, divide_coordinates_by_page_sizes, create_annotation_dicts_from_annotation_df, remove_duplicate_images_with_blank_boxes
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+
+from tools.config import OUTPUT_FOLDER, IMAGES_DPI, MAX_IMAGE_PIXELS, RUN_AWS_FUNCTIONS, AWS_ACCESS_KEY, AWS_SECRET_KEY, AWS_REGION, PAGE_BREAK_VALUE, MAX_TIME_VALUE, LOAD_TRUNCATED_IMAGES, INPUT_FOLDER, TESSERACT_MAX_WORKERS, RUN_PAGE_PIPELINE, PAGE_PIPELINE_QUEUE_SIZE, LAZY_PAGE_IMAGES, TEXTRACT_MAX_IN_FLIGHT, AWS_TEXTRACT_ENDPOINT_URL, MIXED_DOCUMENT_OCR_METHOD, USE_BLANK_PAGE_DETECTION, IMAGE_INPUT_OUTPUT_PDF, USE_EMBEDDED_IMAGE_OCR, TEXT_ANALYSIS_MODE, TEXT_ANALYSIS_PAGE_WINDOW, TEXT_ANALYSIS_BATCH_SIZE, ANALYSIS_PROFILE, SPACY_MODEL_TIER
+from tools.custom_image_analyser_engine import CustomImageAnalyzerEngine, OCRResult, combine_ocr_results, CustomImageRecognizerResult, run_page_text_redaction, merge_text_bounding_boxes, perform_tesseract_ocr_on_page, NumpyPreprocessingPipeline, get_page_text_and_mapping, analyse_page_texts_in_batches
+from tools.file_conversion import convert_annotation_json_to_review_df, redact_whole_pymupdf_page, redact_single_box, convert_pymupdf_to_image_coords, is_pdf, is_pdf_or_image, prepare_image_or_pdf, divide_coordinates_by_page_sizes, multiply_coordinates_by_page_sizes, convert_annotation_data_to_dataframe, divide_coordinates_by_page_sizes, create_annotation_dicts_from_annotation_df, remove_duplicate_images_with_blank_boxes, get_page_image, save_image_as_pdf, get_file_version
 from tools.load_spacy_model_custom_recognisers import nlp_analyser, score_threshold, custom_entities, custom_recogniser, custom_word_list_recogniser, CustomWordFuzzyRecognizer
-from tools.helper_functions import get_file_name_without_type, clean_unicode_text, tesseract_ocr_option, text_ocr_option, textract_option, local_pii_detector, aws_pii_detector, no_redaction_option
-from tools.aws_textract import analyse_page_with_textract, json_to_ocrresult, load_and_convert_textract_json
+from tools.analysis_worker_pool import get_job_analyser
+from tools.helper_functions import get_file_name_without_type, clean_unicode_text, tesseract_ocr_option, text_ocr_option, textract_option, mixed_page_option, local_pii_detector, aws_pii_detector, no_redaction_option
+from tools.image_encoder import encode_image_to_byte_budget, load_image_bytes_for_byte_budget
+from tools.aws_textract import analyse_page_with_textract, json_to_ocrresult, TextractPageSubmitter, get_textract_client, get_textract_rate_limiter, textract_client_config
+from tools.textract_page_store import TextractPageStore
+from tools.page_router import route_pdf_pages, get_page_route_runs, text_layer_route, ocr_route
+from tools.blank_page_detector import BlankPageDetector
+from tools.embedded_image_ocr import EmbeddedImageOCR
+from tools.page_pipeline import PagePipeline
+from tools.ocr_cache import get_ocr_cache
+from tools.analysis_cache import get_analysis_cache
+from tools.tesseract_engine_pool import get_tesseract_engine_pool, discard_tesseract_engine_pool
+from tools.page_image_store import open_page_image
 
 ImageFile.LOAD_TRUNCATED_IMAGES = LOAD_TRUNCATED_IMAGES.lower() == "true"
 if not MAX_IMAGE_PIXELS: Image.MAX_IMAGE_PIXELS = None
@@ -164,6 +178,9 @@ def choose_and_run_redactor(file_paths:List[str],
     all_textract_request_metadata = all_request_metadata_str.split('\n') if all_request_metadata_str else []
     review_out_file_paths = [prepared_pdf_file_paths[0]]  
 
+    # With the automatic option, pages without a usable text layer are sent to this OCR method
+    mixed_page_ocr_method = textract_option if MIXED_DOCUMENT_OCR_METHOD == "textract" else tesseract_ocr_option
+
     # Ensure all_pages_decision_process_table is in correct format for downstream processes
     if isinstance(all_pages_decision_process_table,list):
         if not all_pages_decision_process_table: all_pages_decision_process_table = pd.DataFrame(columns=["image_path", "page", "label", "xmin", "xmax", "ymin", "ymax", "boundingBox", "text", "start","end","score"])
@@ -243,6 +260,18 @@ def choose_and_run_redactor(file_paths:List[str],
         print("Running text extraction analysis, not preparing images.")
         prepare_images_flag = False
 
+    elif text_extraction_method == mixed_page_option:
+        print("Page images will only be created for pages that need OCR, not preparing images up front.")
+        prepare_images_flag = False
+
+    elif RUN_PAGE_PIPELINE == "True" and not pdf_image_file_paths and (text_extraction_method == tesseract_ocr_option or text_extraction_method == textract_option):
+        print("Page images will be created as part of the redaction pipeline, not preparing images up front.")
+        prepare_images_flag = False
+
+    elif LAZY_PAGE_IMAGES == "True" and not pdf_image_file_paths and (text_extraction_method == tesseract_ocr_option or text_extraction_method == textract_option):
+        print("Page images will be created when each page is redacted, not preparing images up front.")
+        prepare_images_flag = False
+
     elif prepare_images and not pdf_image_file_paths:
         print("Prepared PDF images not found, loading from file")
         prepare_images_flag = True
@@ -352,20 +381,19 @@ def choose_and_run_redactor(file_paths:List[str],
     else: comprehend_client = ""
         
     # Try to connect to AWS Textract Client if using that text extraction method
-    if text_extraction_method == textract_option:   
+    if text_extraction_method == textract_option or (text_extraction_method == mixed_page_option and mixed_page_ocr_method == textract_option):   
         if aws_access_key_textbox and aws_secret_key_textbox:
             print("Connecting to Textract using AWS access key and secret keys from textboxes.")
+            textract_client_kwargs = {"endpoint_url": AWS_TEXTRACT_ENDPOINT_URL} if AWS_TEXTRACT_ENDPOINT_URL else {}
             textract_client = boto3.client('textract', 
                 aws_access_key_id=aws_access_key_textbox, 
-                aws_secret_access_key=aws_secret_key_textbox, region_name=AWS_REGION)
+                aws_secret_access_key=aws_secret_key_textbox, region_name=AWS_REGION, config=textract_client_config, **textract_client_kwargs)
         elif RUN_AWS_FUNCTIONS == "1":
             print("Connecting to Textract via existing SSO connection")
-            textract_client = boto3.client('textract', region_name=AWS_REGION)
+            textract_client = get_textract_client()
         elif AWS_ACCESS_KEY and AWS_SECRET_KEY:
             print("Getting Textract credentials from environment variables.")
-            textract_client = boto3.client('textract', 
-                aws_access_key_id=AWS_ACCESS_KEY, 
-                aws_secret_access_key=AWS_SECRET_KEY, region_name=AWS_REGION)        
+            textract_client = get_textract_client()
         else:
             textract_client = ""
             out_message_warning = "Cannot connect to AWS Textract service."
@@ -397,6 +425,8 @@ def choose_and_run_redactor(file_paths:List[str],
                 # If user has not submitted a pdf, assume it's an image
                 print("File is not a pdf, assuming that image analysis needs to be used.")
                 text_extraction_method = tesseract_ocr_option
+            elif is_a_pdf == False and text_extraction_method == mixed_page_option:
+                text_extraction_method = mixed_page_ocr_method
         else:
             out_message = "No file selected"
             print(out_message)
@@ -406,6 +436,10 @@ def choose_and_run_redactor(file_paths:List[str],
         orig_pdf_file_path = output_folder + pdf_file_name_with_ext
         review_file_path = orig_pdf_file_path + '_review_file.csv'
 
+        # Note any redacted image left in the output folder by an earlier run, so that it is not mistaken for one written by this run
+        redacted_image_file_path = output_folder + pdf_file_name_without_ext + "_redacted.png"
+        earlier_redacted_image_version = get_file_version(redacted_image_file_path) if not is_a_pdf and os.path.exists(redacted_image_file_path) else None
+
         # Remove any existing review_file paths from the review file outputs
         if text_extraction_method == tesseract_ocr_option or text_extraction_method == textract_option:
 
@@ -444,7 +478,8 @@ def choose_and_run_redactor(file_paths:List[str],
              page_sizes_df,
              text_extraction_only,             
              log_files_output_paths=log_files_output_paths,
-             output_folder=output_folder)
+             output_folder=output_folder,
+             input_folder=input_folder)
                         
             # Save Textract request metadata (if exists)
             if new_request_metadata: all_textract_request_metadata.append(new_request_metadata)              
@@ -482,6 +517,121 @@ def choose_and_run_redactor(file_paths:List[str],
             page_sizes_df,
             document_cropboxes,
             text_extraction_only)
+
+        elif text_extraction_method == mixed_page_option:
+
+            if is_pdf(file_path) == False:
+                out_message = "Please upload a PDF file for automatic text extraction."
+                raise Exception(out_message)
+
+            # Send pages with a usable text layer (including scanned pages with an existing OCR layer) to text extraction, and the rest to OCR. Routes are decided when the document is started, and read back from the page routes file when redaction continues after a page break.
+            page_routes_file_path = output_folder + pdf_file_name_without_ext + "_page_routes.csv"
+            if current_loop_page > 0 and os.path.exists(page_routes_file_path):
+                page_routes_df = pd.read_csv(page_routes_file_path)
+            else:
+                page_routes_df = route_pdf_pages(pymupdf_doc, page_min, page_max)
+                page_routes_df.to_csv(page_routes_file_path, index=None)
+            if page_routes_file_path not in log_files_output_paths: log_files_output_paths.append(page_routes_file_path)
+
+            print('Redacting file with', (page_routes_df["route"] == text_layer_route).sum(), 'pages from the text layer and', (page_routes_df["route"] == ocr_route).sum(), 'pages with OCR')
+
+            # Runs of consecutive pages on the same route are redacted in page order, so that page breaks and the time limit apply to both routes and redaction continues from current_loop_page in the next call
+            mixed_tic = time.perf_counter()
+            max_time = int(MAX_TIME_VALUE)
+            page_break_return = False
+
+            for route, run_page_numbers in get_page_route_runs(page_routes_df, current_loop_page):
+                run_max_time = max_time - (time.perf_counter() - mixed_tic)
+
+                # Each run starts with empty results tables, so that its coordinates can be converted without converting the results of earlier runs again
+                run_decision_process_table = all_pages_decision_process_table.iloc[0:0]
+                run_line_level_ocr_results_df = all_line_level_ocr_results_df.iloc[0:0]
+
+                if route == text_layer_route:
+                    pymupdf_doc, run_decision_process_table, run_line_level_ocr_results_df, annotations_all_pages, run_loop_page, page_break_return, comprehend_query_number = redact_text_pdf(
+                    file_path,
+                    language,
+                    chosen_redact_entities,
+                    chosen_redact_comprehend_entities,
+                    in_allow_list_flat,
+                    page_min,
+                    page_max,
+                    run_page_numbers[0],
+                    False,
+                    annotations_all_pages,
+                    run_line_level_ocr_results_df,
+                    run_decision_process_table,
+                    pymupdf_doc,
+                    pii_identification_method,
+                    comprehend_query_number,
+                    comprehend_client,
+                    custom_recogniser_word_list_flat,
+                    redact_whole_page_list_flat,
+                    max_fuzzy_spelling_mistakes_num,
+                    match_fuzzy_whole_phrase_bool,
+                    page_sizes_df,
+                    document_cropboxes,
+                    text_extraction_only,
+                    max_time=run_max_time,
+                    page_numbers_to_process=run_page_numbers)
+                else:
+                    pymupdf_doc, run_decision_process_table, out_file_paths, new_request_metadata, annotations_all_pages, run_loop_page, page_break_return, run_line_level_ocr_results_df, comprehend_query_number = redact_image_pdf(file_path,
+                     pdf_image_file_paths,
+                     language,
+                     chosen_redact_entities,
+                     chosen_redact_comprehend_entities,
+                     in_allow_list_flat,
+                     page_min,
+                     page_max,
+                     mixed_page_ocr_method,
+                     handwrite_signature_checkbox,
+                     request_metadata,
+                     run_page_numbers[0],
+                     False,
+                     annotations_all_pages,
+                     run_line_level_ocr_results_df,
+                     run_decision_process_table,
+                     pymupdf_doc,
+                     pii_identification_method,
+                     comprehend_query_number,
+                     comprehend_client,
+                     textract_client,
+                     custom_recogniser_word_list_flat,
+                     redact_whole_page_list_flat,
+                     max_fuzzy_spelling_mistakes_num,
+                     match_fuzzy_whole_phrase_bool,
+                     page_sizes_df,
+                     text_extraction_only,
+                     max_time=run_max_time,
+                     log_files_output_paths=log_files_output_paths,
+                     output_folder=output_folder,
+                     input_folder=input_folder,
+                     page_numbers_to_process=run_page_numbers)
+
+                    # Save Textract request metadata (if exists)
+                    if new_request_metadata: all_textract_request_metadata.append(new_request_metadata)
+
+                # A run that stopped at a page break or the time limit returns its results in absolute coordinates, which are otherwise converted when the run reaches the end of the document
+                if page_break_return:
+                    run_decision_process_table, run_line_level_ocr_results_df = convert_redaction_results_to_relative_coordinates(run_decision_process_table, run_line_level_ocr_results_df, page_sizes_df, from_text_layer=route == text_layer_route)
+
+                all_pages_decision_process_table = pd.concat([all_pages_decision_process_table, run_decision_process_table])
+                all_line_level_ocr_results_df = pd.concat([all_line_level_ocr_results_df, run_line_level_ocr_results_df])
+
+                if page_break_return:
+                    current_loop_page = run_loop_page
+                    break
+
+                current_loop_page = run_page_numbers[-1] + 1
+
+                if time.perf_counter() - mixed_tic > max_time:
+                    print("Processing for", max_time, "seconds, breaking.")
+                    page_break_return = True
+                    break
+
+            if not page_break_return:
+                current_loop_page = number_of_pages
+
         else:
             out_message = "No redaction method selected"
             print(out_message)
@@ -500,11 +650,15 @@ def choose_and_run_redactor(file_paths:List[str],
             # Save redacted file
             if pii_identification_method != no_redaction_option:
                 if is_pdf(file_path) == False:
-                    out_redacted_pdf_file_path = output_folder + pdf_file_name_without_ext + "_redacted.png"
-                    # pymupdf_doc is an image list in this case
-                    img = Image.open(pymupdf_doc[-1])
-                    img.save(out_redacted_pdf_file_path, "PNG" ,resolution=image_dpi)
-                    #            
+                    out_redacted_pdf_file_path = redacted_image_file_path
+                    # The redacted image is saved by redact_image_pdf. If this run did not write it, pymupdf_doc is an image list in this case
+                    if not os.path.exists(out_redacted_pdf_file_path) or get_file_version(out_redacted_pdf_file_path) == earlier_redacted_image_version:
+                        img = Image.open(pymupdf_doc[-1])
+                        img.save(out_redacted_pdf_file_path, "PNG" ,resolution=image_dpi)
+
+                    # A PDF is only built from the redacted image if asked for
+                    if IMAGE_INPUT_OUTPUT_PDF == "True":
+                        out_file_paths.append(save_image_as_pdf(out_redacted_pdf_file_path, output_folder + pdf_file_name_without_ext + "_redacted.pdf"))
                 else:
                     out_redacted_pdf_file_path = output_folder + pdf_file_name_without_ext + "_redacted.pdf"
                     print("saving redacted pdf file:", out_redacted_pdf_file_path)
@@ -671,7 +825,7 @@ def convert_pikepdf_to_image_coords(pymupdf_page, annot, image:Image, type="pike
 def convert_pikepdf_decision_output_to_image_coords(pymupdf_page:Document, pikepdf_decision_ouput_data:List[dict], image:Image):
     if isinstance(image, str):
         image_path = image
-        image = Image.open(image_path)
+        image = open_page_image(image_path)
 
     # Loop through each item in the data
     for item in pikepdf_decision_ouput_data:
@@ -856,8 +1010,10 @@ def convert_pikepdf_annotations_to_result_annotation_box(page:Page, annot:dict,
     
     return img_annotation_box, rect
 
-def redact_page_with_pymupdf(page:Page, page_annotations:dict, image:Image=None, custom_colours:bool=False, redact_whole_page:bool=False, convert_pikepdf_to_pymupdf_coords:bool=True, original_cropbox:List[Rect]=[], page_sizes_df:pd.DataFrame=pd.DataFrame()):
-
+def redact_page_with_pymupdf(page:Page, page_annotations:dict, image:Image=None, custom_colours:bool=False, redact_whole_page:bool=False, convert_pikepdf_to_pymupdf_coords:bool=True, original_cropbox:List[Rect]=[], page_sizes_df:pd.DataFrame=pd.DataFrame(), redact_image_pixels:bool=False):
+    '''
+    Apply redaction boxes to a PyMuPDF page. If redact_image_pixels is True, image pixels under the boxes are also blanked, e.g. where the redacted text was found by OCR of an embedded image. Otherwise images are left as they are.
+    '''
     rect_height = page.rect.height
     rect_width = page.rect.width
 
@@ -891,7 +1047,7 @@ def redact_page_with_pymupdf(page:Page, page_annotations:dict, image:Image=None,
     elif isinstance(image, str):
         if os.path.exists(image):
             image_path = image
-            image = Image.open(image_path)
+            image = open_page_image(image_path)
         elif 'image_path' in page_sizes_df.columns:
             try:
                 image_path = page_sizes_df.loc[page_sizes_df["page"]==(page_no+1), "image_path"].iloc[0]
@@ -980,7 +1136,7 @@ def redact_page_with_pymupdf(page:Page, page_annotations:dict, image:Image=None,
         "boxes": all_image_annotation_boxes
     }
 
-    page.apply_redactions(images=0, graphics=0)
+    page.apply_redactions(images=PDF_REDACT_IMAGE_PIXELS if redact_image_pixels else PDF_REDACT_IMAGE_NONE, graphics=0)
     page.set_cropbox(original_cropbox)  # Set CropBox to original size
     page.clean_contents()
 
@@ -1097,6 +1253,198 @@ def merge_img_bboxes(bboxes, combined_results: Dict, page_signature_recogniser_r
     unique_bboxes = list({(bbox.left, bbox.top, bbox.width, bbox.height): bbox for bbox in all_bboxes}.values())
     return unique_bboxes
 
+def get_page_image_path(page_no:int, page_sizes_df:pd.DataFrame, pdf_image_file_paths:List[str]) -> str:
+    '''
+    Find the image path for a page (zero-indexed) from the page sizes dataframe, falling back to the list of page image paths.
+    '''
+    try:
+        image_path = page_sizes_df.loc[page_sizes_df["page"] == (page_no + 1), "image_path"].iloc[0]
+    except Exception:
+        image_path = pdf_image_file_paths[page_no] if page_no < len(pdf_image_file_paths) else ""
+
+    return image_path
+
+def rasterise_page_for_pipeline(page:dict, file_path:str, input_folder:str=INPUT_FOLDER) -> dict:
+    '''
+    Page pipeline stage: create the image for a PDF page if it does not already exist on disk.
+    '''
+    image_path = page["image_path"]
+
+    if page["in_range"] and is_pdf(file_path) and not (isinstance(image_path, str) and os.path.exists(image_path)):
+        _, image_path, image_width, image_height = get_page_image(file_path, page["page_no"], input_folder=input_folder)
+
+        page["image_path"] = image_path
+        page["image_width"] = image_width
+        page["image_height"] = image_height
+        page["rasterised"] = True
+
+    return page
+
+def update_page_image_details(page_no:int, image_path:str, image_width:float, image_height:float, page_sizes_df:pd.DataFrame, pdf_image_file_paths:List[str]):
+    '''
+    Record the location and size of a page image that has been created after the document was prepared.
+    '''
+    page_sizes_df.loc[page_sizes_df["page"] == (page_no + 1), ["image_path", "image_width", "image_height"]] = [image_path, image_width, image_height]
+    if page_no < len(pdf_image_file_paths): pdf_image_file_paths[page_no] = image_path
+
+def materialise_page_images(file_path:str, page_numbers:List[int], page_sizes_df:pd.DataFrame, pdf_image_file_paths:List[str], input_folder:str=INPUT_FOLDER, max_workers:int=8):
+    '''
+    Create images for the given PDF pages if they do not already exist on disk, and record their locations and sizes. Used when page images were not created up front, so that only pages that are actually needed are rendered.
+    '''
+    if not is_pdf(file_path): return
+
+    missing_page_numbers = [page_no for page_no in page_numbers if not os.path.exists(str(get_page_image_path(page_no, page_sizes_df, pdf_image_file_paths)))]
+
+    if not missing_page_numbers: return
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(get_page_image, file_path, page_no, input_folder=input_folder) for page_no in missing_page_numbers]
+
+        for future in tqdm(as_completed(futures), total=len(futures), unit="pages", desc="Converting pages to image"):
+            page_no, image_path, image_width, image_height = future.result()
+            update_page_image_details(page_no, image_path, image_width, image_height, page_sizes_df, pdf_image_file_paths)
+
+def load_page_bytes_for_textract(page_no:int, file_path:str, page_image_paths:Dict[int, str], input_folder:str=INPUT_FOLDER, blank_page_detector:BlankPageDetector=None) -> bytes:
+    '''
+    Load a page image as PNG bytes to send to AWS Textract. Uses the existing page image if there is one, otherwise creates it. page_image_paths is taken up front by the caller, so that this can run in worker threads without reading the page sizes dataframe while it is being updated. Returns None for blank pages if a blank page detector is given.
+    '''
+    image_path = page_image_paths.get(page_no, "")
+
+    if not (isinstance(image_path, str) and os.path.exists(image_path)) and is_pdf(file_path):
+        _, image_path, _, _ = get_page_image(file_path, page_no, input_folder=input_folder)
+
+    if blank_page_detector and blank_page_detector.is_blank_page(image_path, page_no): return None
+
+    # Textract returns boxes relative to the page size, so a scaled down copy maps back to the page image without adjustment
+    page_bytes, encoding_metadata = load_image_bytes_for_byte_budget(image_path)
+    if encoding_metadata["encodes"]: print(f"Page {page_no + 1} encoded for Textract as {encoding_metadata['encoding']} at scale factor {encoding_metadata['scale_factor']}, {encoding_metadata['bytes']} bytes")
+
+    return page_bytes
+
+def close_textract_submitter(textract_submitter:TextractPageSubmitter, textract_store:TextractPageStore, request_metadata:str) -> str:
+    '''
+    Stop sending pages to Textract, and save the results of requests that completed but were not used yet to the page store, so that they are not requested again when redaction continues.
+    '''
+    if not textract_submitter: return request_metadata
+
+    for wrapped_response, new_request_metadata in textract_submitter.close():
+        if not wrapped_response: continue
+        textract_store.add_page(wrapped_response)
+        request_metadata = request_metadata + "\n" + new_request_metadata
+
+    return request_metadata
+
+def convert_redaction_results_to_relative_coordinates(decision_process_table:pd.DataFrame, line_level_ocr_results_df:pd.DataFrame, page_sizes_df:pd.DataFrame, from_text_layer:bool=False) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    '''
+    Convert the decision process table and line-level OCR results of redacted pages from absolute to relative page coordinates, as redact_image_pdf and redact_text_pdf do when they reach the end of a document. Text layer coordinates are measured from the bottom of the page, so they are also flipped to be measured from the top, as for page images.
+    '''
+    decision_process_table = divide_coordinates_by_page_sizes(decision_process_table, page_sizes_df, xmin="xmin", xmax="xmax", ymin="ymin", ymax="ymax")
+    line_level_ocr_results_df = divide_coordinates_by_page_sizes(line_level_ocr_results_df, page_sizes_df, xmin="left", xmax="width", ymin="top", ymax="height")
+
+    if from_text_layer:
+        # Coordinates need to be reversed for ymin and ymax to match with image annotator objects downstream
+        if "ymin" in decision_process_table.columns:
+            decision_process_table['ymin'] = 1 - decision_process_table['ymin']
+            decision_process_table['ymax'] = 1 - decision_process_table['ymax']
+
+        if "top" in line_level_ocr_results_df.columns:
+            line_level_ocr_results_df['top'] = 1 - line_level_ocr_results_df['top'].astype(float)
+
+    return decision_process_table, line_level_ocr_results_df
+
+def save_page_layout_decisions(image_analyser:CustomImageAnalyzerEngine, page_layouts_file_path:str, append:bool, log_files_output_paths:List[str]):
+    '''
+    Log the page layout and Tesseract page segmentation mode chosen for each OCRed page to a csv file. Redaction stops at each page break and continues in a new call, so with append set the decisions already saved by earlier calls for the document are kept, and replaced for pages that were OCRed again.
+    '''
+    if not image_analyser.layout_decisions: return
+
+    page_layouts_df = pd.DataFrame(image_analyser.layout_decisions)
+
+    if append and os.path.exists(page_layouts_file_path):
+        page_layouts_df = pd.concat([pd.read_csv(page_layouts_file_path), page_layouts_df]).drop_duplicates(subset="page", keep="last")
+
+    page_layouts_df.sort_values("page").to_csv(page_layouts_file_path, index=None)
+    if page_layouts_file_path not in log_files_output_paths: log_files_output_paths.append(page_layouts_file_path)
+
+def ocr_page_for_pipeline(page:dict, image_analyser:CustomImageAnalyzerEngine, blank_page_detector:BlankPageDetector=None) -> dict:
+    '''
+    Page pipeline stage: run local Tesseract OCR on the page image and combine words into lines. Blank pages are not OCRed if a blank page detector is given.
+    '''
+    image_path = page["image_path"]
+
+    if page["in_range"] and isinstance(image_path, str) and os.path.exists(image_path):
+        if blank_page_detector and blank_page_detector.is_blank_page(image_path, page["page_no"]): return page
+
+        page_word_level_ocr_results = image_analyser.perform_ocr(image_path, page["page_no"])
+        page["ocr_results"] = combine_ocr_results(page_word_level_ocr_results)
+
+    return page
+
+def run_tesseract_ocr_on_pages_in_parallel(page_numbers:List[int], page_sizes_df:pd.DataFrame, pdf_image_file_paths:List[str], image_analyser:CustomImageAnalyzerEngine) -> Dict[int, Tuple[List[OCRResult], Dict[str, Dict]]]:
+    '''
+    Run local Tesseract OCR for a set of pages across the shared Tesseract worker pool. Returns a dictionary of line-level OCR results keyed by page number, so that the main redaction loop can pick them up in page order. Pages without an image on disk, or that fail in a worker, are left out so that the main loop OCRs them as normal, as are all pages if the pool was not started when the app started. If the image analyser has an OCR cache, cached pages are not sent to the workers, and new results are added to the cache.
+    '''
+    tesseract_engine_pool = get_tesseract_engine_pool()
+    if not tesseract_engine_pool: return {}
+
+    page_image_paths = {}
+    page_cache_keys = {}
+    ocr_results_by_page = {}
+
+    for page_no in page_numbers:
+        image_path = get_page_image_path(page_no, page_sizes_df, pdf_image_file_paths)
+
+        if not (isinstance(image_path, str) and os.path.exists(image_path)): continue
+
+        if image_analyser.ocr_cache:
+            cache_key, cached_ocr_results = image_analyser.get_cached_ocr_results(open_page_image(image_path), page_no)
+            if cached_ocr_results is not None:
+                ocr_results_by_page[page_no] = combine_ocr_results(cached_ocr_results)
+                continue
+            page_cache_keys[page_no] = cache_key
+
+        page_image_paths[page_no] = image_path
+
+    if not page_image_paths: return ocr_results_by_page
+
+    print("Running Tesseract OCR on", len(page_image_paths), "pages with", tesseract_engine_pool.max_workers, "worker processes")
+
+    futures = []
+    try:
+        for page_no, image_path in page_image_paths.items():
+            futures.append(tesseract_engine_pool.submit(perform_tesseract_ocr_on_page, page_no, image_path, image_analyser.tesseract_config, image_analyser.image_preprocessor, image_analyser.ocr_backend, image_analyser.ocr_region_mode, 1, image_analyser.first_pass_preprocessor, image_analyser.low_confidence_threshold, image_analyser.page_segmentation))
+    except BrokenProcessPool as e:
+        discard_tesseract_engine_pool(tesseract_engine_pool, e)
+
+    for future in tqdm(as_completed(futures), total=len(futures), unit="pages", desc="Performing OCR on pages"):
+        try:
+            page_no, page_word_level_ocr_results, page_line_level_ocr_results, page_line_level_ocr_results_with_children, layout_decision = future.result()
+            ocr_results_by_page[page_no] = (page_line_level_ocr_results, page_line_level_ocr_results_with_children)
+
+            if layout_decision: image_analyser.record_layout_decision(page_no, layout_decision)
+
+            if page_no in page_cache_keys:
+                image_analyser.store_cached_ocr_results(page_cache_keys[page_no], page_word_level_ocr_results, layout_decision)
+        except BrokenProcessPool as e:
+            discard_tesseract_engine_pool(tesseract_engine_pool, e)
+        except Exception as e:
+            print("OCR in worker process failed, page will be processed in the main process. Error:", e)
+
+    return ocr_results_by_page
+
+def run_tesseract_ocr_on_next_pages_in_parallel(page_no:int, pending_page_numbers:List[int], file_path:str, page_sizes_df:pd.DataFrame, pdf_image_file_paths:List[str], image_analyser:CustomImageAnalyzerEngine, blank_page_detector:BlankPageDetector=None, input_folder:str=INPUT_FOLDER, max_workers:int=int(TESSERACT_MAX_WORKERS)) -> Dict[int, Tuple[List[OCRResult], Dict[str, Dict]]]:
+    '''
+    OCR the next chunk of pending pages from page_no onwards across the process pool, removing them from pending_page_numbers. Pages are OCRed a chunk at a time as the redaction loop reaches them, so that few results are thrown away if the loop returns early because it ran past max_time.
+    '''
+    chunk_page_numbers = [pending_page_no for pending_page_no in pending_page_numbers if pending_page_no >= page_no][:max_workers * 2]
+    for chunk_page_no in chunk_page_numbers: pending_page_numbers.remove(chunk_page_no)
+
+    materialise_page_images(file_path, chunk_page_numbers, page_sizes_df, pdf_image_file_paths, input_folder=input_folder)
+    if blank_page_detector:
+        chunk_page_numbers = [chunk_page_no for chunk_page_no in chunk_page_numbers if not blank_page_detector.is_blank_page(get_page_image_path(chunk_page_no, page_sizes_df, pdf_image_file_paths), chunk_page_no)]
+
+    return run_tesseract_ocr_on_pages_in_parallel(chunk_page_numbers, page_sizes_df, pdf_image_file_paths, image_analyser)
+
 def redact_image_pdf(file_path:str,
                      pdf_image_file_paths:List[str],
                      language:str,
@@ -1128,6 +1476,14 @@ def redact_image_pdf(file_path:str,
                      log_files_output_paths:List=[],
                      max_time:int=int(MAX_TIME_VALUE),
                      output_folder:str=OUTPUT_FOLDER,
+                     ocr_max_workers:int=int(TESSERACT_MAX_WORKERS),
+                     run_page_pipeline:bool=RUN_PAGE_PIPELINE == "True",
+                     page_pipeline_queue_size:int=int(PAGE_PIPELINE_QUEUE_SIZE),
+                     input_folder:str=INPUT_FOLDER,
+                     page_numbers_to_process:List[int]=None,
+                     use_blank_page_detection:bool=USE_BLANK_PAGE_DETECTION == "True",
+                     analysis_profile:str=ANALYSIS_PROFILE,
+                     spacy_model_tier:str=SPACY_MODEL_TIER,
                      progress=Progress(track_tqdm=True)):
 
     '''
@@ -1163,6 +1519,14 @@ def redact_image_pdf(file_path:str,
     - log_files_output_paths (List, optional): List of file paths used for saving redaction process logging results.
     - max_time (int, optional): The maximum amount of time (s) that the function should be running before it breaks. To avoid timeout errors with some APIs.
     - output_folder (str, optional): The folder for file outputs.
+    - ocr_max_workers (int, optional): The number of worker processes used for local Tesseract OCR. If 1, or if the Tesseract worker pool was not started when the app started, pages are OCRed one at a time in the main process.
+    - run_page_pipeline (bool, optional): If True, page images are created and OCRed in background pipeline stages while earlier pages are analysed and redacted.
+    - page_pipeline_queue_size (int, optional): The maximum number of pages waiting between two pipeline stages.
+    - input_folder (str, optional): The folder where page images are saved.
+    - page_numbers_to_process (List[int], optional): If given, only these (zero-indexed) pages are analysed and redacted, and other pages are left as they are. Used when pages are routed between text extraction and OCR.
+    - use_blank_page_detection (bool, optional): If True, page images are checked for blank pages before OCR. Blank pages skip OCR and text analysis, but are otherwise redacted and recorded as other pages are.
+    - analysis_profile (str, optional): The analysis profile used for local text analysis, see tools/analysis_profiles.py.
+    - spacy_model_tier (str, optional): The spaCy model tier used for local text analysis, see tools/model_tiers.py.
     - progress (Progress, optional): A progress tracker for the redaction process. Defaults to a Progress object with track_tqdm set to True.
 
     The function returns a redacted PDF document along with processing output objects.
@@ -1184,7 +1548,13 @@ def redact_image_pdf(file_path:str,
         new_custom_fuzzy_recogniser = CustomWordFuzzyRecognizer(supported_entities=["CUSTOM_FUZZY"], custom_list=custom_recogniser_word_list, spelling_mistakes_max=max_fuzzy_spelling_mistakes_num, search_whole_phrase=match_fuzzy_whole_phrase_bool)
         nlp_analyser.registry.add_recognizer(new_custom_fuzzy_recogniser)
 
-    image_analyser = CustomImageAnalyzerEngine(nlp_analyser)    
+    # OCR cache is None unless USE_OCR_CACHE is True
+    ocr_cache = get_ocr_cache()
+
+    # Local analysis only runs the spaCy components needed for the chosen entities (only custom entities are found locally with AWS Comprehend)
+    profile_analyser = get_job_analyser(analysis_profile, chosen_redact_entities if pii_identification_method == "Local" else custom_entities, spacy_model_tier)
+
+    image_analyser = CustomImageAnalyzerEngine(profile_analyser, ocr_cache=ocr_cache)    
 
     if pii_identification_method == "AWS Comprehend" and comprehend_client == "":
         out_message = "Connection to AWS Comprehend service unsuccessful."
@@ -1211,348 +1581,421 @@ def redact_image_pdf(file_path:str,
     # If running Textract, check if file already exists. If it does, load in existing data
     if text_extraction_method == textract_option:                
         textract_json_file_path = output_folder + file_name + "_textract.json"
-        textract_data, is_missing, log_files_output_paths = load_and_convert_textract_json(textract_json_file_path, log_files_output_paths)
-        original_textract_data = textract_data.copy()
+        textract_store = TextractPageStore(output_folder + file_name + "_textract.jsonl.gz", textract_json_file_path)
+        log_files_output_paths = textract_store.load(log_files_output_paths)
 
     ###
     if current_loop_page == 0: page_loop_start = 0
     else: page_loop_start = current_loop_page
 
+    if page_numbers_to_process is not None: page_numbers_to_process = set(page_numbers_to_process)
+    pages_to_process = [page_no for page_no in range(page_loop_start, number_of_pages) if page_numbers_to_process is None or page_no in page_numbers_to_process]
+
+    blank_page_detector = BlankPageDetector() if use_blank_page_detection else None
+
+    # If running the page pipeline, page images are created (and OCRed with Tesseract) in background stages while the loop below analyses and redacts earlier pages
+    page_pipeline = None
+    if run_page_pipeline and (text_extraction_method == tesseract_ocr_option or text_extraction_method == textract_option):
+        pipeline_stages = [("rasterise", partial(rasterise_page_for_pipeline, file_path=file_path, input_folder=input_folder))]
+        if text_extraction_method == tesseract_ocr_option:
+            pipeline_stages.append(("ocr", partial(ocr_page_for_pipeline, image_analyser=image_analyser, blank_page_detector=blank_page_detector)))
+
+        pipeline_page_inputs = [{"page_no": page_no,
+                                 "image_path": get_page_image_path(page_no, page_sizes_df, pdf_image_file_paths),
+                                 "in_range": page_min <= page_no < page_max} for page_no in pages_to_process]
+
+        page_pipeline = PagePipeline(pipeline_stages, consumer_name="analyse_and_redact", max_queue_size=page_pipeline_queue_size)
+        pipeline_pages = page_pipeline.run(pipeline_page_inputs)
+        pipeline_report_file_path = output_folder + file_name + "_pipeline_stage_report.csv"
+
+    # If using Tesseract with more than one worker, OCR pages ahead of the loop below across a process pool, a chunk at a time. Only pages that this call reaches before its next page break return are OCRed. Results are used in page order in the loop below
+    parallel_ocr_results = {}
+    parallel_ocr_pending_pages = []
+    if text_extraction_method == tesseract_ocr_option and ocr_max_workers > 1 and not page_pipeline and get_tesseract_engine_pool():
+        page_break_limit = (page_loop_start // page_break_val + 1) * page_break_val
+        parallel_ocr_pending_pages = [page_no for page_no in pages_to_process if page_min <= page_no < min(page_max, page_break_limit)]
+        if len(parallel_ocr_pending_pages) < 2: parallel_ocr_pending_pages = []
+
+    # If using Textract, send several pages that do not have results yet at once, limited by the shared rate limiter. Results are collected in page order in the loop below
+    textract_submitter = None
+    if text_extraction_method == textract_option and textract_client != "" and int(TEXTRACT_MAX_IN_FLIGHT) > 1:
+        textract_page_numbers = [page_no for page_no in pages_to_process if page_min <= page_no < page_max and not textract_store.has_page(str(page_no + 1))]
+        if len(textract_page_numbers) > 1:
+            try:
+                page_image_paths = {page_no: get_page_image_path(page_no, page_sizes_df, pdf_image_file_paths) for page_no in textract_page_numbers}
+                textract_submitter = TextractPageSubmitter(textract_page_numbers,
+                                                           partial(load_page_bytes_for_textract, file_path=file_path, page_image_paths=page_image_paths, input_folder=input_folder, blank_page_detector=blank_page_detector),
+                                                           textract_client, handwrite_signature_checkbox, ocr_cache=ocr_cache)
+            except Exception as e:
+                print("Could not start sending Textract pages in parallel, pages will be sent one at a time. Error:", e)
+                textract_submitter = None
+
     progress_bar = tqdm(range(page_loop_start, number_of_pages), unit="pages remaining", desc="Redacting pages")    
 
     all_pages_decision_process_table_list = [all_pages_decision_process_table]
     all_line_level_ocr_results_df_list = [all_line_level_ocr_results_df]
 
-    # Go through each page
-    for page_no in progress_bar:
+    try:
+        # Go through each page
+        for page_no in progress_bar:
 
-        handwriting_or_signature_boxes = []
-        page_signature_recogniser_results = []
-        page_handwriting_recogniser_results = []
-        page_break_return = False
-        reported_page_number = str(page_no + 1)
+            # Pages routed to text extraction are left to redact_text_pdf
+            if page_numbers_to_process is not None and page_no not in page_numbers_to_process:
+                current_loop_page += 1
+                continue
 
-        #print("page_sizes_df for row:", page_sizes_df.loc[page_sizes_df["page"] == (page_no + 1)])
-        
-        # Try to find image location
-        try:
-            image_path = page_sizes_df.loc[page_sizes_df["page"] == (page_no + 1), "image_path"].iloc[0]
-        except Exception as e:
-            print("Could not find image_path in page_sizes_df due to:", e)
-            image_path = pdf_image_file_paths[page_no]
+            handwriting_or_signature_boxes = []
+            page_signature_recogniser_results = []
+            page_handwriting_recogniser_results = []
+            page_break_return = False
+            reported_page_number = str(page_no + 1)
 
-        page_image_annotations = {"image": image_path, "boxes": []}        
-        pymupdf_page = pymupdf_doc.load_page(page_no)
+            #print("page_sizes_df for row:", page_sizes_df.loc[page_sizes_df["page"] == (page_no + 1)])
+        
+            # Try to find image location
+            try:
+                image_path = page_sizes_df.loc[page_sizes_df["page"] == (page_no + 1), "image_path"].iloc[0]
+            except Exception as e:
+                print("Could not find image_path in page_sizes_df due to:", e)
+                image_path = pdf_image_file_paths[page_no]
+
+            # If the page image was created by the pipeline, record its location and size
+            if page_pipeline:
+                pipeline_page = next(pipeline_pages)
+                if pipeline_page.get("rasterised"):
+                    image_path = pipeline_page["image_path"]
+                    update_page_image_details(page_no, image_path, pipeline_page["image_width"], pipeline_page["image_height"], page_sizes_df, pdf_image_file_paths)
+
+            # If page images were not created up front, create the image for this page now. Not needed for pages that already have Textract results.
+            elif page_no >= page_min and page_no < page_max and is_pdf(file_path) and not (isinstance(image_path, str) and os.path.exists(image_path)) and \
+                (text_extraction_method == tesseract_ocr_option or not textract_store.has_page(reported_page_number)):
+                _, image_path, image_width, image_height = get_page_image(file_path, page_no, input_folder=input_folder)
+                update_page_image_details(page_no, image_path, image_width, image_height, page_sizes_df, pdf_image_file_paths)
+
+            page_image_annotations = {"image": image_path, "boxes": []}        
+            pymupdf_page = pymupdf_doc.load_page(page_no)
  
-        if page_no >= page_min and page_no < page_max:    
-            # Need image size to convert OCR outputs to the correct sizes        
-            if isinstance(image_path, str):
-                if os.path.exists(image_path):
-                    image = Image.open(image_path)
-                    page_width, page_height = image.size
-                else:
-                    #print("Image path does not exist, using mediabox coordinates as page sizes")
+            if page_no >= page_min and page_no < page_max:    
+                # Need image size to convert OCR outputs to the correct sizes        
+                if isinstance(image_path, str):
+                    if os.path.exists(image_path):
+                        image = open_page_image(image_path)
+                        page_width, page_height = image.size
+                    else:
+                        #print("Image path does not exist, using mediabox coordinates as page sizes")
+                        image = None
+                        page_width = pymupdf_page.mediabox.width
+                        page_height = pymupdf_page.mediabox.height
+                elif not isinstance(image_path, Image.Image):
+                    print(f"Unexpected image_path type: {type(image_path)}, using page mediabox coordinates as page sizes")  # Ensure image_path is valid
                     image = None
                     page_width = pymupdf_page.mediabox.width
                     page_height = pymupdf_page.mediabox.height
-            elif not isinstance(image_path, Image.Image):
-                print(f"Unexpected image_path type: {type(image_path)}, using page mediabox coordinates as page sizes")  # Ensure image_path is valid
-                image = None
-                page_width = pymupdf_page.mediabox.width
-                page_height = pymupdf_page.mediabox.height
             
-            try:
-                if not page_sizes_df.empty:
-                    original_cropbox = page_sizes_df.loc[page_sizes_df["page"]==(page_no+1), "original_cropbox"].iloc[0]
-            except IndexError:
-                print("Can't find original cropbox details for page, using current PyMuPDF page cropbox")
-                original_cropbox =  pymupdf_page.cropbox.irect
-
-            # Possibility to use different languages
-            if language == 'en': ocr_lang = 'eng'
-            else: ocr_lang = language
-
-            # Step 1: Perform OCR. Either with Tesseract, or with AWS Textract
-
-            # If using Tesseract, need to check if we have page as image_path
-            if text_extraction_method == tesseract_ocr_option:
-                #print("image_path:", image_path)
-                #print("print(type(image_path)):", print(type(image_path)))
-                #if not isinstance(image_path, image_path.image_path) or not isinstance(image_path, str): raise Exception("image_path object for page", reported_page_number, "not found, cannot perform local OCR analysis.")
-
-                page_word_level_ocr_results = image_analyser.perform_ocr(image_path)
-                page_line_level_ocr_results, page_line_level_ocr_results_with_children = combine_ocr_results(page_word_level_ocr_results)
+                try:
+                    if not page_sizes_df.empty:
+                        original_cropbox = page_sizes_df.loc[page_sizes_df["page"]==(page_no+1), "original_cropbox"].iloc[0]
+                except IndexError:
+                    print("Can't find original cropbox details for page, using current PyMuPDF page cropbox")
+                    original_cropbox =  pymupdf_page.cropbox.irect
+
+                # Possibility to use different languages
+                if language == 'en': ocr_lang = 'eng'
+                else: ocr_lang = language
+
+                # Blank pages skip OCR and text analysis, but are still redacted (e.g. if in the whole page redaction list) and recorded as other pages are
+                is_blank_page = False
+                if blank_page_detector and (isinstance(image_path, Image.Image) or (isinstance(image_path, str) and os.path.exists(image_path))):
+                    is_blank_page = blank_page_detector.is_blank_page(image_path, page_no)
+
+                if is_blank_page:
+                    page_line_level_ocr_results, page_line_level_ocr_results_with_children = [], {}
+                    parallel_ocr_results.pop(page_no, None)
+                    if textract_submitter: textract_submitter.discard_page(page_no)
+
+                # Step 1: Perform OCR. Either with Tesseract, or with AWS Textract
+
+                # If using Tesseract, need to check if we have page as image_path
+                if text_extraction_method == tesseract_ocr_option and not is_blank_page:
+                    #print("image_path:", image_path)
+                    #print("print(type(image_path)):", print(type(image_path)))
+                    #if not isinstance(image_path, image_path.image_path) or not isinstance(image_path, str): raise Exception("image_path object for page", reported_page_number, "not found, cannot perform local OCR analysis.")
+
+                    if page_no in parallel_ocr_pending_pages:
+                        parallel_ocr_results.update(run_tesseract_ocr_on_next_pages_in_parallel(page_no, parallel_ocr_pending_pages, file_path, page_sizes_df, pdf_image_file_paths, image_analyser, blank_page_detector, input_folder=input_folder, max_workers=ocr_max_workers))
+
+                    if page_no in parallel_ocr_results:
+                        page_line_level_ocr_results, page_line_level_ocr_results_with_children = parallel_ocr_results.pop(page_no)
+                    elif page_pipeline and "ocr_results" in pipeline_page:
+                        page_line_level_ocr_results, page_line_level_ocr_results_with_children = pipeline_page["ocr_results"]
+                    else:
+                        page_word_level_ocr_results = image_analyser.perform_ocr(image_path, page_no)
+                        page_line_level_ocr_results, page_line_level_ocr_results_with_children = combine_ocr_results(page_word_level_ocr_results)
     
-            # Check if page exists in existing textract data. If not, send to service to analyse
-            if text_extraction_method == textract_option:
-                if not textract_data:
-                    try:
-                        # Convert the image_path to bytes using an in-memory buffer
-                        image_buffer = io.BytesIO()
-                        image.save(image_buffer, format='PNG')  # Save as PNG, or adjust format if needed
-                        pdf_page_as_bytes = image_buffer.getvalue()
-
-                        text_blocks, new_request_metadata = analyse_page_with_textract(pdf_page_as_bytes, reported_page_number, textract_client, handwrite_signature_checkbox)  # Analyse page with Textract
-                        
-                        if textract_json_file_path not in log_files_output_paths:
-                            log_files_output_paths.append(textract_json_file_path)
-
-                        textract_data = {"pages":[text_blocks]}
-                    except Exception as e:
-                        print("Textract extraction for page", reported_page_number, "failed due to:", e)
-                        textract_data = {"pages":[]}
-                        new_request_metadata = "Failed Textract API call"
-                    
-                    request_metadata = request_metadata + "\n" + new_request_metadata
+                # Check if page exists in existing textract data. If not, send to service to analyse
+                if text_extraction_method == textract_option and not is_blank_page:
+                    text_blocks = textract_store.get_page(reported_page_number)
 
-                else:                    
-                    # Check if the current reported_page_number exists in the loaded JSON
-                    page_exists = any(page['page_no'] == reported_page_number for page in textract_data.get("pages", []))
-
-                    if not page_exists:  # If the page does not exist, analyze again
-                        print(f"Page number {reported_page_number} not found in existing Textract data. Analysing.")
+                    if text_blocks is None:  # If the page does not exist, analyse it
+                        if textract_store.pages: print(f"Page number {reported_page_number} not found in existing Textract data. Analysing.")
 
                         try:
-                            # Convert the image_path to bytes using an in-memory buffer
-                            image_buffer = io.BytesIO()
-                            image.save(image_buffer, format='PNG')  # Save as PNG, or adjust format if needed
-                            pdf_page_as_bytes = image_buffer.getvalue()
-
-                            text_blocks, new_request_metadata = analyse_page_with_textract(pdf_page_as_bytes, reported_page_number, textract_client, handwrite_signature_checkbox)  # Analyse page with Textract
+                            if textract_submitter:
+                                text_blocks, new_request_metadata = textract_submitter.get_page_result(page_no)
+                            else:
+                                # Convert the page image to bytes within the Textract size limit, sending the image file as it is where possible
+                                if isinstance(image_path, str) and os.path.exists(image_path):
+                                    pdf_page_as_bytes, _ = load_image_bytes_for_byte_budget(image_path)
+                                else:
+                                    pdf_page_as_bytes, _ = encode_image_to_byte_budget(image)
 
-                            # Check if "pages" key exists, if not, initialise it as an empty list
-                            if "pages" not in textract_data: textract_data["pages"] = []
+                                text_blocks, new_request_metadata = analyse_page_with_textract(pdf_page_as_bytes, reported_page_number, textract_client, handwrite_signature_checkbox, ocr_cache=ocr_cache, rate_limiter=get_textract_rate_limiter())  # Analyse page with Textract
 
-                            # Append the new page data
-                            textract_data["pages"].append(text_blocks)
+                            # Append the new page to the store file straight away
+                            textract_store.add_page(text_blocks)
 
                         except Exception as e:
                             print("Textract extraction for page", reported_page_number, "failed due to:", e)
-                            text_blocks = []
+                            text_blocks = {"Blocks": []}
                             new_request_metadata = "Failed Textract API call"
-
-                            # Check if "pages" key exists, if not, initialise it as an empty list
-                            if "pages" not in textract_data: textract_data["pages"] = []                        
                         
                         request_metadata = request_metadata + "\n" + new_request_metadata
-                        
-                    else:
-                        # If the page exists, retrieve the data
-                        text_blocks = next(page['data'] for page in textract_data["pages"] if page['page_no'] == reported_page_number)
-                
                 
-                page_line_level_ocr_results, handwriting_or_signature_boxes, page_signature_recogniser_results, page_handwriting_recogniser_results, page_line_level_ocr_results_with_children = json_to_ocrresult(text_blocks, page_width, page_height, reported_page_number)
+                    page_line_level_ocr_results, handwriting_or_signature_boxes, page_signature_recogniser_results, page_handwriting_recogniser_results, page_line_level_ocr_results_with_children = json_to_ocrresult(text_blocks, page_width, page_height, reported_page_number)
 
-            if pii_identification_method != no_redaction_option:
-                # Step 2: Analyse text and identify PII
-                if chosen_redact_entities or chosen_redact_comprehend_entities:
-
-                    page_redaction_bounding_boxes, comprehend_query_number_new = image_analyser.analyze_text(
-                        page_line_level_ocr_results,
-                        page_line_level_ocr_results_with_children,
-                        chosen_redact_comprehend_entities = chosen_redact_comprehend_entities,
-                        pii_identification_method = pii_identification_method,
-                        comprehend_client=comprehend_client,                 
-                        language=language,
-                        entities=chosen_redact_entities,
-                        allow_list=allow_list,
-                        score_threshold=score_threshold
-                    )                
-
-                    comprehend_query_number = comprehend_query_number + comprehend_query_number_new
+                if pii_identification_method != no_redaction_option:
+                    # Step 2: Analyse text and identify PII
+                    if (chosen_redact_entities or chosen_redact_comprehend_entities) and not is_blank_page:
+
+                        page_redaction_bounding_boxes, comprehend_query_number_new = image_analyser.analyze_text(
+                            page_line_level_ocr_results,
+                            page_line_level_ocr_results_with_children,
+                            chosen_redact_comprehend_entities = chosen_redact_comprehend_entities,
+                            pii_identification_method = pii_identification_method,
+                            comprehend_client=comprehend_client,                 
+                            language=language,
+                            entities=chosen_redact_entities,
+                            allow_list=allow_list,
+                            score_threshold=score_threshold
+                        )                
+
+                        comprehend_query_number = comprehend_query_number + comprehend_query_number_new
                     
-                else: page_redaction_bounding_boxes = []
+                    else: page_redaction_bounding_boxes = []
 
-                # Merge redaction bounding boxes that are close together
-                page_merged_redaction_bboxes = merge_img_bboxes(page_redaction_bounding_boxes, page_line_level_ocr_results_with_children, page_signature_recogniser_results, page_handwriting_recogniser_results, handwrite_signature_checkbox)
+                    # Merge redaction bounding boxes that are close together
+                    page_merged_redaction_bboxes = merge_img_bboxes(page_redaction_bounding_boxes, page_line_level_ocr_results_with_children, page_signature_recogniser_results, page_handwriting_recogniser_results, handwrite_signature_checkbox)
 
-            else: page_merged_redaction_bboxes = []           
+                else: page_merged_redaction_bboxes = []           
             
-            # 3. Draw the merged boxes
-            ## Apply annotations to pdf with pymupdf            
-            if is_pdf(file_path) == True:
-                if redact_whole_page_list:
-                    int_reported_page_number = int(reported_page_number) 
-                    if int_reported_page_number in redact_whole_page_list: redact_whole_page = True
+                # 3. Draw the merged boxes
+                ## Apply annotations to pdf with pymupdf            
+                if is_pdf(file_path) == True:
+                    if redact_whole_page_list:
+                        int_reported_page_number = int(reported_page_number) 
+                        if int_reported_page_number in redact_whole_page_list: redact_whole_page = True
+                        else: redact_whole_page = False
                     else: redact_whole_page = False
-                else: redact_whole_page = False
 
-                pymupdf_page, page_image_annotations = redact_page_with_pymupdf(pymupdf_page, page_merged_redaction_bboxes, image_path, redact_whole_page=redact_whole_page, original_cropbox=original_cropbox, page_sizes_df=page_sizes_df)
+                    pymupdf_page, page_image_annotations = redact_page_with_pymupdf(pymupdf_page, page_merged_redaction_bboxes, image_path, redact_whole_page=redact_whole_page, original_cropbox=original_cropbox, page_sizes_df=page_sizes_df)
 
-            # If an image_path file, draw onto the image_path
-            elif is_pdf(file_path) == False:
-                if isinstance(image_path, str):
-                    if os.path.exists(image_path):
-                        image = Image.open(image_path)
-                elif isinstance(image_path, Image.Image):                        
-                    image = image_path
-                else:
-                    # Assume image_path is an image
-                    image = image_path
-
-                print("image:", image)
-
-                fill = (0, 0, 0)   # Fill colour for redactions
-                draw = ImageDraw.Draw(image)
-
-                all_image_annotations_boxes = []
-
-                for box in page_merged_redaction_bboxes:
-                    try:
-                        x0 = box.left
-                        y0 = box.top
-                        x1 = x0 + box.width
-                        y1 = y0 + box.height
-
-                        label = box.entity_type  # Attempt to get the label
-                    except AttributeError as e:
-                        print(f"Error accessing box attributes: {e}")
-                        label = "Redaction"  # Default label if there's an error
-
-                    # Check if coordinates are valid numbers
-                    if any(v is None for v in [x0, y0, x1, y1]):
-                        print(f"Invalid coordinates for box: {box}")
-                        continue  # Skip this box if coordinates are invalid
-
-                    # Directly append the dictionary with the required keys
-                    all_image_annotations_boxes.append({
-                        "xmin": x0,
-                        "ymin": y0,
-                        "xmax": x1,
-                        "ymax": y1,
-                        "label": label,
-                        "color": (0, 0, 0)
-                    })
-
-                    # Draw the rectangle
-                    try:
-                        draw.rectangle([x0, y0, x1, y1], fill=fill)
-                    except Exception as e:
-                        print(f"Error drawing rectangle: {e}")
-
-                page_image_annotations = {"image": file_path, "boxes": all_image_annotations_boxes}           
-
-            # Convert decision process to table
-            decision_process_table = pd.DataFrame([{
-                'text': result.text,
-                'xmin': result.left,
-                'ymin': result.top,
-                'xmax': result.left + result.width,
-                'ymax': result.top + result.height, 
-                'label': result.entity_type,
-                'start': result.start,
-                'end': result.end,
-                'score': result.score,
-                'page': reported_page_number                
-            } for result in page_merged_redaction_bboxes])
-
-            all_pages_decision_process_table_list.append(decision_process_table)
-
-            # Convert to DataFrame and add to ongoing logging table
-            line_level_ocr_results_df = pd.DataFrame([{
-                'page': reported_page_number,
-                'text': result.text,
-                'left': result.left,
-                'top': result.top,
-                'width': result.width,
-                'height': result.height
-            } for result in page_line_level_ocr_results])
-
-            all_line_level_ocr_results_df_list.append(line_level_ocr_results_df)
+                # If an image_path file, draw onto the image_path
+                elif is_pdf(file_path) == False:
+                    if isinstance(image_path, str):
+                        if os.path.exists(image_path):
+                            image = open_page_image(image_path)
+                    elif isinstance(image_path, Image.Image):                        
+                        image = image_path
+                    else:
+                        # Assume image_path is an image
+                        image = image_path
 
-            toc = time.perf_counter()
+                    fill = (0, 0, 0)   # Fill colour for redactions
+                    if image.mode not in ("RGB", "RGBA"): image = image.convert("RGB")
+                    draw = ImageDraw.Draw(image)
 
-            time_taken = toc - tic
+                    all_image_annotations_boxes = []
 
-            # Break if time taken is greater than max_time seconds
-            if time_taken > max_time:
-                print("Processing for", max_time, "seconds, breaking loop.")
-                page_break_return = True
-                progress.close(_tqdm=progress_bar)
-                tqdm._instances.clear()
+                    for box in page_merged_redaction_bboxes:
+                        try:
+                            x0 = box.left
+                            y0 = box.top
+                            x1 = x0 + box.width
+                            y1 = y0 + box.height
+
+                            label = box.entity_type  # Attempt to get the label
+                        except AttributeError as e:
+                            print(f"Error accessing box attributes: {e}")
+                            label = "Redaction"  # Default label if there's an error
+
+                        # Check if coordinates are valid numbers
+                        if any(v is None for v in [x0, y0, x1, y1]):
+                            print(f"Invalid coordinates for box: {box}")
+                            continue  # Skip this box if coordinates are invalid
+
+                        # Directly append the dictionary with the required keys
+                        all_image_annotations_boxes.append({
+                            "xmin": x0,
+                            "ymin": y0,
+                            "xmax": x1,
+                            "ymax": y1,
+                            "label": label,
+                            "color": (0, 0, 0)
+                        })
+
+                        # Draw the rectangle
+                        try:
+                            draw.rectangle([x0, y0, x1, y1], fill=fill)
+                        except Exception as e:
+                            print(f"Error drawing rectangle: {e}")
+
+                    page_image_annotations = {"image": file_path, "boxes": all_image_annotations_boxes}
+
+                    # Save the redacted image now, rather than opening the input image again when the file is finished
+                    if not text_extraction_only:
+                        image.save(output_folder + get_file_name_without_type(file_path) + "_redacted.png", "PNG")
+
+                # Convert decision process to table
+                decision_process_table = pd.DataFrame([{
+                    'text': result.text,
+                    'xmin': result.left,
+                    'ymin': result.top,
+                    'xmax': result.left + result.width,
+                    'ymax': result.top + result.height, 
+                    'label': result.entity_type,
+                    'start': result.start,
+                    'end': result.end,
+                    'score': result.score,
+                    'page': reported_page_number                
+                } for result in page_merged_redaction_bboxes])
+
+                all_pages_decision_process_table_list.append(decision_process_table)
+
+                # Convert to DataFrame and add to ongoing logging table
+                line_level_ocr_results_df = pd.DataFrame([{
+                    'page': reported_page_number,
+                    'text': result.text,
+                    'left': result.left,
+                    'top': result.top,
+                    'width': result.width,
+                    'height': result.height
+                } for result in page_line_level_ocr_results])
+
+                all_line_level_ocr_results_df_list.append(line_level_ocr_results_df)
 
-                if is_pdf(file_path) == False:
-                    pdf_image_file_paths.append(image_path)
-                    pymupdf_doc = pdf_image_file_paths
-
-                # Check if the image_path already exists in annotations_all_pages
-                existing_index = next((index for index, ann in enumerate(annotations_all_pages) if ann["image"] == page_image_annotations["image"]), None)
-                if existing_index is not None:
-                    # Replace the existing annotation
-                    annotations_all_pages[existing_index] = page_image_annotations
-                else:
-                    # Append new annotation if it doesn't exist
-                    annotations_all_pages.append(page_image_annotations)
+                toc = time.perf_counter()
 
-                if text_extraction_method == textract_option:
-                    if original_textract_data != textract_data:
-                        # Write the updated existing textract data back to the JSON file
-                        with open(textract_json_file_path, 'w') as json_file:
-                            json.dump(textract_data, json_file, separators=(",", ":"))  # indent=4 makes the JSON file pretty-printed
+                time_taken = toc - tic
 
-                    if textract_json_file_path not in log_files_output_paths:
-                        log_files_output_paths.append(textract_json_file_path)
+                # Break if time taken is greater than max_time seconds
+                if time_taken > max_time:
+                    print("Processing for", max_time, "seconds, breaking loop.")
+                    page_break_return = True
+                    progress.close(_tqdm=progress_bar)
+                    tqdm._instances.clear()
 
-                all_pages_decision_process_table = pd.concat(all_pages_decision_process_table_list)
-                all_line_level_ocr_results_df = pd.concat(all_line_level_ocr_results_df_list)
+                    if is_pdf(file_path) == False:
+                        pdf_image_file_paths.append(image_path)
+                        pymupdf_doc = pdf_image_file_paths
 
-                current_loop_page += 1
+                    # Check if the image_path already exists in annotations_all_pages
+                    existing_index = next((index for index, ann in enumerate(annotations_all_pages) if ann["image"] == page_image_annotations["image"]), None)
+                    if existing_index is not None:
+                        # Replace the existing annotation
+                        annotations_all_pages[existing_index] = page_image_annotations
+                    else:
+                        # Append new annotation if it doesn't exist
+                        annotations_all_pages.append(page_image_annotations)
 
-                return pymupdf_doc, all_pages_decision_process_table, log_files_output_paths, request_metadata, annotations_all_pages, current_loop_page, page_break_return, all_line_level_ocr_results_df, comprehend_query_number
+                    # Textract pages have already been appended to the store as they were analysed. The json export is written when the document is finished.
+                    request_metadata = close_textract_submitter(textract_submitter, textract_store, request_metadata)
+                    if text_extraction_method == textract_option and textract_store.pages:
+                        if textract_store.store_file_path not in log_files_output_paths:
+                            log_files_output_paths.append(textract_store.store_file_path)
 
-        # If it's an image file
-        if is_pdf(file_path) == False:
-            pdf_image_file_paths.append(image_path)
-            pymupdf_doc = pdf_image_file_paths
+                    if page_pipeline:
+                        page_pipeline.close_and_write_report(pipeline_report_file_path)
+                        if pipeline_report_file_path not in log_files_output_paths: log_files_output_paths.append(pipeline_report_file_path)
 
-        # Check if the image_path already exists in annotations_all_pages
-        existing_index = next((index for index, ann in enumerate(annotations_all_pages) if ann["image"] == page_image_annotations["image"]), None)
-        if existing_index is not None:
-            # Replace the existing annotation
-            annotations_all_pages[existing_index] = page_image_annotations
-        else:
-            # Append new annotation if it doesn't exist
-            annotations_all_pages.append(page_image_annotations)
+                    if blank_page_detector: print(blank_page_detector.get_report_message())
+                    save_page_layout_decisions(image_analyser, output_folder + file_name + "_page_layouts.csv", page_loop_start > 0, log_files_output_paths)
 
-        current_loop_page += 1
+                    all_pages_decision_process_table = pd.concat(all_pages_decision_process_table_list)
+                    all_line_level_ocr_results_df = pd.concat(all_line_level_ocr_results_df_list)
 
-        # Break if new page is a multiple of chosen page_break_val
-        if current_loop_page % page_break_val == 0:
-            page_break_return = True
-            progress.close(_tqdm=progress_bar)
-            tqdm._instances.clear()
+                    current_loop_page += 1
 
-            if text_extraction_method == textract_option:
-                # Write the updated existing textract data back to the JSON file
-                if original_textract_data != textract_data:
-                    with open(textract_json_file_path, 'w') as json_file:
-                        json.dump(textract_data, json_file, separators=(",", ":"))  # indent=4 makes the JSON file pretty-printed
+                    return pymupdf_doc, all_pages_decision_process_table, log_files_output_paths, request_metadata, annotations_all_pages, current_loop_page, page_break_return, all_line_level_ocr_results_df, comprehend_query_number
 
-                if textract_json_file_path not in log_files_output_paths:
-                    log_files_output_paths.append(textract_json_file_path)
+            # If it's an image file
+            if is_pdf(file_path) == False:
+                pdf_image_file_paths.append(image_path)
+                pymupdf_doc = pdf_image_file_paths
+
+            # Check if the image_path already exists in annotations_all_pages
+            existing_index = next((index for index, ann in enumerate(annotations_all_pages) if ann["image"] == page_image_annotations["image"]), None)
+            if existing_index is not None:
+                # Replace the existing annotation
+                annotations_all_pages[existing_index] = page_image_annotations
+            else:
+                # Append new annotation if it doesn't exist
+                annotations_all_pages.append(page_image_annotations)
 
-            all_pages_decision_process_table = pd.concat(all_pages_decision_process_table_list)
-            all_line_level_ocr_results_df = pd.concat(all_line_level_ocr_results_df_list)
+            current_loop_page += 1
 
-            return pymupdf_doc, all_pages_decision_process_table, log_files_output_paths, request_metadata, annotations_all_pages, current_loop_page, page_break_return, all_line_level_ocr_results_df, comprehend_query_number
-               
-    if text_extraction_method == textract_option:
-        # Write the updated existing textract data back to the JSON file
-        
-        if original_textract_data != textract_data:
-            with open(textract_json_file_path, 'w') as json_file:
-                json.dump(textract_data, json_file, separators=(",", ":"))  # indent=4 makes the JSON file pretty-printed
+            # Break if new page is a multiple of chosen page_break_val
+            if current_loop_page % page_break_val == 0:
+                page_break_return = True
+                progress.close(_tqdm=progress_bar)
+                tqdm._instances.clear()
+
+                # Textract pages have already been appended to the store as they were analysed. The json export is written when the document is finished.
+                request_metadata = close_textract_submitter(textract_submitter, textract_store, request_metadata)
+                if text_extraction_method == textract_option and textract_store.pages:
+                    if textract_store.store_file_path not in log_files_output_paths:
+                        log_files_output_paths.append(textract_store.store_file_path)
+
+                if page_pipeline:
+                    page_pipeline.close_and_write_report(pipeline_report_file_path)
+                    if pipeline_report_file_path not in log_files_output_paths: log_files_output_paths.append(pipeline_report_file_path)
+
+                if ocr_cache: print(ocr_cache.get_stats_message())
+                if get_analysis_cache(): print(get_analysis_cache().get_stats_message())
+                if blank_page_detector: print(blank_page_detector.get_report_message())
+                save_page_layout_decisions(image_analyser, output_folder + file_name + "_page_layouts.csv", page_loop_start > 0, log_files_output_paths)
+
+                all_pages_decision_process_table = pd.concat(all_pages_decision_process_table_list)
+                all_line_level_ocr_results_df = pd.concat(all_line_level_ocr_results_df_list)
+
+                return pymupdf_doc, all_pages_decision_process_table, log_files_output_paths, request_metadata, annotations_all_pages, current_loop_page, page_break_return, all_line_level_ocr_results_df, comprehend_query_number
+    finally:
+        # Save results of Textract requests that completed but were not used, and stop the Textract threads, also when redaction stops early due to an error
+        request_metadata = close_textract_submitter(textract_submitter, textract_store, request_metadata)
+
+    if text_extraction_method == textract_option and textract_store.pages:
+        # Export the store to the _textract.json format if new pages were analysed, so that the results can be downloaded and uploaded again later
+        if textract_store.new_pages_added or not os.path.exists(textract_json_file_path):
+            textract_store.export_json(textract_json_file_path)
 
         if textract_json_file_path not in log_files_output_paths:
             log_files_output_paths.append(textract_json_file_path)
 
+    if page_pipeline:
+        page_pipeline.close_and_write_report(pipeline_report_file_path)
+        if pipeline_report_file_path not in log_files_output_paths: log_files_output_paths.append(pipeline_report_file_path)
+
+    if ocr_cache: print(ocr_cache.get_stats_message())
+    if get_analysis_cache(): print(get_analysis_cache().get_stats_message())
+    if blank_page_detector: print(blank_page_detector.get_report_message())
+    if isinstance(image_analyser.image_preprocessor, NumpyPreprocessingPipeline) and image_analyser.image_preprocessor.get_stage_timings(): print(image_analyser.image_preprocessor.get_stage_timing_report())
+
+    save_page_layout_decisions(image_analyser, output_folder + file_name + "_page_layouts.csv", page_loop_start > 0, log_files_output_paths)
+
     all_pages_decision_process_table = pd.concat(all_pages_decision_process_table_list)
     all_line_level_ocr_results_df = pd.concat(all_line_level_ocr_results_df_list)
 
-    # Convert decision table to relative coordinates
-    all_pages_decision_process_table = divide_coordinates_by_page_sizes(all_pages_decision_process_table, page_sizes_df, xmin="xmin", xmax="xmax", ymin="ymin", ymax="ymax")
-
-    all_line_level_ocr_results_df = divide_coordinates_by_page_sizes(all_line_level_ocr_results_df, page_sizes_df, xmin="left", xmax="width", ymin="top", ymax="height")
+    # Convert decision table and OCR results to relative coordinates
+    all_pages_decision_process_table, all_line_level_ocr_results_df = convert_redaction_results_to_relative_coordinates(all_pages_decision_process_table, all_line_level_ocr_results_df, page_sizes_df)
 
     return pymupdf_doc, all_pages_decision_process_table, log_files_output_paths, request_metadata, annotations_all_pages, current_loop_page, page_break_return, all_line_level_ocr_results_df, comprehend_query_number
 
@@ -1680,6 +2123,78 @@ def create_text_bounding_boxes_from_characters(char_objects:List[LTChar]) -> Tup
 
     return line_level_results_out, line_level_characters_out  # Return both results and character objects
 
+def get_page_text_lines(page_layout:LTPage, page_no:int, pymupdf_page:Page=None, embedded_image_ocr:EmbeddedImageOCR=None) -> Tuple[List[OCRResult], List[list], pd.DataFrame, bool]:
+    '''
+    Get the text lines of a pdfminer page layout and the characters of each line, and the lines in OCR output format for the logs. If embedded_image_ocr is given, lines of text found by OCR in the images embedded in the page are added after the text layer lines. Also returns whether any image lines were added.
+    '''
+    all_page_line_level_text_extraction_results_list = []
+    all_page_line_text_extraction_characters = []
+    page_text_ocr_outputs = pd.DataFrame()
+
+    for n, text_container in enumerate(page_layout):
+        characters = []
+
+        if isinstance(text_container, LTTextContainer) or isinstance(text_container, LTAnno):
+            characters = get_text_container_characters(text_container)
+
+        # Create dataframe for all the text on the page
+        line_level_text_results_list, line_characters = create_text_bounding_boxes_from_characters(characters)
+
+        all_page_line_level_text_extraction_results_list.extend(line_level_text_results_list)
+        all_page_line_text_extraction_characters.extend(line_characters)
+
+    # Add the text of images embedded in the page, found by OCR, to the text layer lines
+    image_line_level_results_list = []
+    if embedded_image_ocr and pymupdf_page is not None:
+        image_line_level_results_list, image_line_characters = embedded_image_ocr.get_page_lines(pymupdf_page)
+
+        all_page_line_level_text_extraction_results_list.extend(image_line_level_results_list)
+        all_page_line_text_extraction_characters.extend(image_line_characters)
+
+    ### Create page_text_ocr_outputs (OCR format outputs)
+    if all_page_line_level_text_extraction_results_list:
+        page_text_ocr_outputs = pd.DataFrame([{
+            'page': page_no + 1,
+            'text': (result.text).strip(),
+            'left': result.left,
+            'top': result.top,
+            'width': result.width,
+            'height': result.height
+        } for result in all_page_line_level_text_extraction_results_list])
+
+    return all_page_line_level_text_extraction_results_list, all_page_line_text_extraction_characters, page_text_ocr_outputs, bool(image_line_level_results_list)
+
+def prepare_text_page_window(filename:str, page_numbers:List[int], pymupdf_doc:Document, language:str, chosen_redact_entities:List[str], allow_list:List[str]=None, embedded_image_ocr:EmbeddedImageOCR=None, batch_size:int=int(TEXT_ANALYSIS_BATCH_SIZE), analyser:AnalyzerEngine=nlp_analyser) -> Dict[int, tuple]:
+    '''
+    Extract the text lines of a window of pages in one pdfminer pass, then analyse the text of all of the pages together with the local model, in batches through spaCy rather than one analyser call per page. Pages are analysed only if there are chosen_redact_entities.
+
+    Returns, for each page number, the outputs of get_page_text_lines followed by the analyser results for the page (or None if not analysed).
+    '''
+    tic = time.perf_counter()
+    page_numbers = sorted(page_numbers)
+    extracted_pages = []
+
+    for page_no, page_layout in zip(page_numbers, extract_pages(filename, page_numbers=page_numbers)):
+        pymupdf_page = None
+        if embedded_image_ocr:
+            pymupdf_page = pymupdf_doc.load_page(page_no)
+            pymupdf_page.set_cropbox(pymupdf_page.mediabox)
+
+        extracted_pages.append((page_no, get_page_text_lines(page_layout, page_no, pymupdf_page, embedded_image_ocr)))
+
+    toc = time.perf_counter()
+
+    if chosen_redact_entities:
+        page_texts = [get_page_text_and_mapping(page_text_lines[0])[0] for _, page_text_lines in extracted_pages]
+        page_line_texts = [[line.text for line in page_text_lines[0]] for _, page_text_lines in extracted_pages]
+        page_analyser_results = analyse_page_texts_in_batches(page_texts, analyser, language, chosen_redact_entities, score_threshold, allow_list, batch_size, page_line_texts)
+
+        print(f"Extracted text of {len(extracted_pages)} pages in {toc - tic:0.1f} seconds and analysed it in {time.perf_counter() - toc:0.1f} seconds.")
+    else:
+        page_analyser_results = [None] * len(extracted_pages)
+
+    return {page_no: page_text_lines + (page_analyser_result,) for (page_no, page_text_lines), page_analyser_result in zip(extracted_pages, page_analyser_results)}
+
 def create_text_redaction_process_results(analyser_results, analysed_bounding_boxes, page_num):
     decision_process_table = pd.DataFrame()
 
@@ -1753,6 +2268,12 @@ def redact_text_pdf(
     text_extraction_only:bool=False,
     page_break_val: int = int(PAGE_BREAK_VALUE),  # Value for page break
     max_time: int = int(MAX_TIME_VALUE),    
+    page_numbers_to_process: List[int] = None,  # Optional list of zero-indexed pages to redact, other pages are left as they are
+    use_embedded_image_ocr: bool = USE_EMBEDDED_IMAGE_OCR == "True",  # Also OCR the images embedded in each page
+    text_analysis_mode: str = TEXT_ANALYSIS_MODE,  # 'page' or 'document'
+    text_analysis_page_window: int = int(TEXT_ANALYSIS_PAGE_WINDOW),
+    analysis_profile: str = ANALYSIS_PROFILE,  # Analysis profile used for local text analysis
+    spacy_model_tier: str = SPACY_MODEL_TIER,  # spaCy model tier used for local text analysis
     progress: Progress = Progress(track_tqdm=True)  # Progress tracking object
 ):
     
@@ -1786,6 +2307,12 @@ def redact_text_pdf(
     - text_extraction_only (bool, optional): Should the function only extract text, or also do redaction.
     - page_break_val: Value for page break
     - max_time (int, optional): The maximum amount of time (s) that the function should be running before it breaks. To avoid timeout errors with some APIs.    
+    - page_numbers_to_process (List[int], optional): If given, only these (zero-indexed) pages are redacted, and other pages are left as they are. Used when pages are routed between text extraction and OCR.
+    - use_embedded_image_ocr (bool, optional): Also OCR the images embedded in each page (e.g. signatures and stamps), and analyse their text with the text layer of the page.
+    - text_analysis_mode (str, optional): 'page' analyses each page as it is redacted. 'document' extracts text_analysis_page_window pages at a time and analyses them together in batches with the local model.
+    - text_analysis_page_window (int, optional): Number of pages extracted and analysed together in 'document' mode.
+    - analysis_profile (str, optional): The analysis profile used for local text analysis, see tools/analysis_profiles.py.
+    - spacy_model_tier (str, optional): The spaCy model tier used for local text analysis, see tools/model_tiers.py.
     - progress: Progress tracking object
     '''
 
@@ -1812,6 +2339,9 @@ def redact_text_pdf(
         new_custom_fuzzy_recogniser = CustomWordFuzzyRecognizer(supported_entities=["CUSTOM_FUZZY"], custom_list=custom_recogniser_word_list, spelling_mistakes_max=max_fuzzy_spelling_mistakes_num, search_whole_phrase=match_fuzzy_whole_phrase_bool)
         nlp_analyser.registry.add_recognizer(new_custom_fuzzy_recogniser)
 
+    # Local analysis only runs the spaCy components needed for the chosen entities (only custom entities are found locally with AWS Comprehend)
+    profile_analyser = get_job_analyser(analysis_profile, chosen_redact_entities if pii_identification_method == "Local" else custom_entities, spacy_model_tier)
+
     # Open with Pikepdf to get text lines
     pikepdf_pdf = Pdf.open(filename)
     number_of_pages = len(pikepdf_pdf.pages)    
@@ -1825,10 +2355,20 @@ def redact_text_pdf(
 
     print("Page range is",str(page_min + 1), "to", str(page_max))
 
+    if page_numbers_to_process is not None: page_numbers_to_process = set(page_numbers_to_process)
+
+    embedded_image_ocr = EmbeddedImageOCR() if use_embedded_image_ocr else None
+    prepared_text_pages = {}
+
     # Run through each page in document to 1. Extract text and then 2. Create redaction boxes
     progress_bar = tqdm(range(current_loop_page, number_of_pages), unit="pages remaining", desc="Redacting pages")
     
     for page_no in progress_bar:
+        # Pages routed to OCR are left to redact_image_pdf
+        if page_numbers_to_process is not None and page_no not in page_numbers_to_process:
+            current_loop_page += 1
+            continue
+
         reported_page_number = str(page_no + 1)
         # Create annotations for every page, even if blank.
 
@@ -1845,44 +2385,25 @@ def redact_text_pdf(
         pymupdf_page.set_cropbox(pymupdf_page.mediabox)  # Set CropBox to MediaBox
 
         if page_min <= page_no < page_max:
-            # Go page by page
-            for page_layout in extract_pages(filename, page_numbers = [page_no], maxpages=1):
+            # In document mode, the text of the next window of pages is extracted and analysed together when the first of them is reached
+            if text_analysis_mode == "document" and page_no not in prepared_text_pages:
+                window_page_numbers = [page for page in range(page_no, page_max) if page_numbers_to_process is None or page in page_numbers_to_process][:text_analysis_page_window]
+                analysis_entities = chosen_redact_entities if pii_identification_method == "Local" else []
+                prepared_text_pages = prepare_text_page_window(filename, window_page_numbers, pymupdf_doc, language, analysis_entities, allow_list, embedded_image_ocr, analyser=profile_analyser)
+
+            if page_no in prepared_text_pages:
+                page_text_lines = [prepared_text_pages.pop(page_no)]
+            else:
+                # Go page by page
+                page_text_lines = [get_page_text_lines(page_layout, page_no, pymupdf_page, embedded_image_ocr) + (None,) for page_layout in extract_pages(filename, page_numbers = [page_no], maxpages=1)]
+
+            for all_page_line_level_text_extraction_results_list, all_page_line_text_extraction_characters, page_text_ocr_outputs, has_image_lines, page_analyser_result in page_text_lines:
                 
-                all_page_line_text_extraction_characters = []
-                all_page_line_level_text_extraction_results_list = []
                 page_analyser_results = []
                 page_redaction_bounding_boxes = []            
                 
-                characters = []
                 pikepdf_redaction_annotations_on_page = []
                 page_decision_process_table = pd.DataFrame()    
-                page_text_ocr_outputs = pd.DataFrame()  
-
-                for n, text_container in enumerate(page_layout):                    
-                    characters = []
-
-                    if isinstance(text_container, LTTextContainer) or isinstance(text_container, LTAnno):
-                        characters = get_text_container_characters(text_container)
-
-                    # Create dataframe for all the text on the page
-                    line_level_text_results_list, line_characters = create_text_bounding_boxes_from_characters(characters)
-
-                    ### Create page_text_ocr_outputs (OCR format outputs)
-                    if line_level_text_results_list:
-                        # Convert to DataFrame and add to ongoing logging table
-                        line_level_text_results_df = pd.DataFrame([{
-                            'page': page_no + 1,
-                            'text': (result.text).strip(),
-                            'left': result.left,
-                            'top': result.top,
-                            'width': result.width,
-                            'height': result.height
-                        } for result in line_level_text_results_list])
-
-                        page_text_ocr_outputs = pd.concat([page_text_ocr_outputs, line_level_text_results_df])
-
-                    all_page_line_level_text_extraction_results_list.extend(line_level_text_results_list)
-                    all_page_line_text_extraction_characters.extend(line_characters)
 
                 ### REDACTION
                 if pii_identification_method != no_redaction_option:
@@ -1899,10 +2420,11 @@ def redact_text_pdf(
                             comprehend_client, 
                             allow_list,
                             pii_identification_method,
-                            nlp_analyser,
+                            profile_analyser,
                             score_threshold,
                             custom_entities,
-                            comprehend_query_number
+                            comprehend_query_number,
+                            page_analyser_result=page_analyser_result
                             )
                         
                         # Annotate redactions on page
@@ -1917,7 +2439,7 @@ def redact_text_pdf(
                         else: redact_whole_page = False
                     else: redact_whole_page = False
 
-                    pymupdf_page, page_image_annotations = redact_page_with_pymupdf(pymupdf_page, pikepdf_redaction_annotations_on_page, image_path, redact_whole_page=redact_whole_page, convert_pikepdf_to_pymupdf_coords=True, original_cropbox=original_cropboxes[page_no], page_sizes_df=page_sizes_df)
+                    pymupdf_page, page_image_annotations = redact_page_with_pymupdf(pymupdf_page, pikepdf_redaction_annotations_on_page, image_path, redact_whole_page=redact_whole_page, convert_pikepdf_to_pymupdf_coords=True, original_cropbox=original_cropboxes[page_no], page_sizes_df=page_sizes_df, redact_image_pixels=has_image_lines)
 
                     # Create decision process table
                     page_decision_process_table = create_text_redaction_process_results(page_analyser_results, page_redaction_bounding_boxes, current_loop_page)     
@@ -1985,25 +2507,18 @@ def redact_text_pdf(
 
             # Write logs
             all_pages_decision_process_table = pd.concat(all_pages_decision_process_table_list) 
+            all_line_level_ocr_results_df = pd.concat(all_line_level_ocr_results_df_list)
 
             return pymupdf_doc, all_pages_decision_process_table, all_line_level_ocr_results_df, annotations_all_pages, current_loop_page, page_break_return, comprehend_query_number
         
+    if embedded_image_ocr: print(embedded_image_ocr.get_report_message())
+    if get_analysis_cache(): print(get_analysis_cache().get_stats_message())
+
     # Write decision logs
     all_pages_decision_process_table = pd.concat(all_pages_decision_process_table_list)
     all_line_level_ocr_results_df = pd.concat(all_line_level_ocr_results_df_list)
     
-    # Convert decision table to relative coordinates
-    all_pages_decision_process_table = divide_coordinates_by_page_sizes(all_pages_decision_process_table, page_sizes_df, xmin="xmin", xmax="xmax", ymin="ymin", ymax="ymax")
-
-    # Coordinates need to be reversed for ymin and ymax to match with image annotator objects downstream
-    all_pages_decision_process_table['ymin'] = 1 - all_pages_decision_process_table['ymin']
-    all_pages_decision_process_table['ymax'] = 1 - all_pages_decision_process_table['ymax']
-
-    # Convert decision table to relative coordinates
-    all_line_level_ocr_results_df = divide_coordinates_by_page_sizes(all_line_level_ocr_results_df, page_sizes_df, xmin="left", xmax="width", ymin="top", ymax="height")
-
-    # Coordinates need to be reversed for ymin and ymax to match with image annotator objects downstream
-    all_line_level_ocr_results_df['top'] = all_line_level_ocr_results_df['top'].astype(float)
-    all_line_level_ocr_results_df['top'] = 1 - all_line_level_ocr_results_df['top']
+    # Convert decision table and text lines to relative coordinates measured from the top of the page
+    all_pages_decision_process_table, all_line_level_ocr_results_df = convert_redaction_results_to_relative_coordinates(all_pages_decision_process_table, all_line_level_ocr_results_df, page_sizes_df, from_text_layer=True)
                     
     return pymupdf_doc, all_pages_decision_process_table, all_line_level_ocr_results_df, annotations_all_pages, current_loop_page, page_break_return, comprehend_query_number
\ No newline at end of file
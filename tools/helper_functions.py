@@ -15,6 +15,7 @@ from tools.config import CUSTOM_HEADER_VALUE, CUSTOM_HEADER, OUTPUT_FOLDER, INPU
 text_ocr_option = "Local model - selectable text"
 tesseract_ocr_option = "Local OCR model - PDFs without selectable text"
 textract_option = "AWS Textract service - all PDF types"
+mixed_page_option = "Automatic - selectable text where found, OCR for other pages"
 
 no_redaction_option = "Only extract text (no redaction)"
 local_pii_detector = "Local"
@@ -193,8 +194,9 @@ def put_columns_in_df(in_file:List[str]):
 
 def check_for_existing_textract_file(doc_file_name_no_extension_textbox:str, output_folder:str=OUTPUT_FOLDER):
     textract_output_path = os.path.join(output_folder, doc_file_name_no_extension_textbox + "_textract.json")
+    textract_store_path = os.path.join(output_folder, doc_file_name_no_extension_textbox + "_textract.jsonl.gz")
 
-    if os.path.exists(textract_output_path):
+    if os.path.exists(textract_output_path) or os.path.exists(textract_store_path):
         print("Existing Textract file found.")    
         return True
     
@@ -0,0 +1,141 @@
+import io
+import os
+from PIL import Image
+from typing import List, Tuple
+
+from tools.config import TEXTRACT_MAX_IMAGE_BYTES, TEXTRACT_IMAGE_ENCODINGS
+
+# Encodings in order of how much of the image they keep. 'original' keeps colour, 'grey8' is 8-bit greyscale, 'grey4' is 16 grey levels, and 'bilevel' is black and white.
+image_encodings = ("original", "grey8", "grey4", "bilevel")
+
+# PNG compression levels tried for each encoding, fastest first
+png_compress_levels = (1, 6, 9)
+
+grey4_palette = [channel for level in range(16) for channel in (level * 17,) * 3]
+
+def convert_image_for_encoding(image:Image.Image, encoding:str) -> Image.Image:
+    '''
+    Convert an image to the mode used by an encoding.
+    '''
+    if encoding == "original":
+        return image if image.mode in ("L", "RGB", "1") else image.convert("RGB")
+
+    grey_image = image if image.mode == "L" else image.convert("L")
+
+    if encoding == "grey4":
+        # An L image with a palette attached becomes a P image, which is saved as a 4-bit PNG
+        quantised_image = grey_image.point(lambda value: value // 17)
+        quantised_image.putpalette(grey4_palette)
+        return quantised_image
+
+    if encoding == "bilevel":
+        return grey_image.convert("1", dither=Image.Dither.NONE)
+
+    return grey_image
+
+def encode_png(image:Image.Image, compress_level:int) -> bytes:
+    image_buffer = io.BytesIO()
+    if image.mode == "P":
+        image.save(image_buffer, format="PNG", compress_level=compress_level, bits=4)
+    else:
+        image.save(image_buffer, format="PNG", compress_level=compress_level)
+    return image_buffer.getvalue()
+
+def get_sample_strips(image:Image.Image, strip_count:int=8, strip_height:int=32) -> Image.Image:
+    '''
+    Stack strips of rows taken evenly down the image into one small image. PNG compresses row by row, so the bytes per pixel of the strips are close to those of the whole image.
+    '''
+    width, height = image.size
+    if height <= strip_count * strip_height: return image
+
+    sample_image = Image.new(image.mode, (width, strip_count * strip_height))
+    if image.mode == "P": sample_image.putpalette(image.getpalette())
+
+    for strip_no in range(strip_count):
+        top = int((strip_no + 0.5) * height / strip_count) - strip_height // 2
+        sample_image.paste(image.crop((0, top, width, top + strip_height)), (0, strip_no * strip_height))
+
+    return sample_image
+
+def estimate_png_bytes(image:Image.Image, encoding:str, compress_level:int, scale_factor:float=1.0) -> float:
+    '''
+    Estimate the PNG size of the whole image in an encoding, compression level and scale, from the bytes per pixel of sample strips.
+    '''
+    sample_image = get_sample_strips(image)
+    if scale_factor != 1.0:
+        sample_image = sample_image.resize((max(1, int(sample_image.width * scale_factor)), max(1, int(sample_image.height * scale_factor))), Image.Resampling.LANCZOS)
+
+    sample_bytes = len(encode_png(convert_image_for_encoding(sample_image, encoding), compress_level))
+    bytes_per_pixel = sample_bytes / (sample_image.width * sample_image.height)
+
+    return bytes_per_pixel * image.width * image.height * scale_factor * scale_factor
+
+def encode_image_to_byte_budget(image:Image.Image, max_bytes:int=int(TEXTRACT_MAX_IMAGE_BYTES), encodings:List[str]=None, safety_margin:float=0.95) -> Tuple[bytes, dict]:
+    '''
+    Encode an image as a PNG of at most max_bytes, keeping as much resolution as possible, with normally a single full-size encode.
+
+    Sizes are predicted from sample strips of the image. The first of the encodings (see image_encodings) and PNG compression levels, fastest first, that is predicted to fit at full resolution is used. If none fit, the last encoding is used at the highest compression and the image is scaled down once, by a factor predicted from the samples. If the result is still over budget, the scale is corrected and the image encoded again.
+
+    Returns the PNG bytes and metadata: the scale factor applied to the image (for mapping boxes back to the original image), encoding, compression level, width, height, bytes and number of full-size encodes.
+    '''
+    if encodings is None:
+        encodings = [encoding.strip() for encoding in TEXTRACT_IMAGE_ENCODINGS.split(",") if encoding.strip() in image_encodings] or ["grey8"]
+
+    target_bytes = max_bytes * safety_margin
+    chosen_encoding, chosen_compress_level, estimated_bytes = None, None, None
+
+    for encoding in encodings:
+        for compress_level in png_compress_levels:
+            estimated_bytes = estimate_png_bytes(image, encoding, compress_level)
+            if estimated_bytes <= target_bytes:
+                chosen_encoding, chosen_compress_level = encoding, compress_level
+                break
+        if chosen_encoding: break
+
+    scale_factor = 1.0
+
+    if not chosen_encoding:
+        chosen_encoding, chosen_compress_level = encodings[-1], png_compress_levels[-1]
+
+        # Bytes per pixel rise as an image is scaled down, so the scale predicted from pixel counts is checked on the samples and refined
+        for _ in range(3):
+            scale_factor = min(1.0, scale_factor * (target_bytes / estimated_bytes) ** 0.5)
+            estimated_bytes = estimate_png_bytes(image, chosen_encoding, chosen_compress_level, scale_factor)
+            if estimated_bytes <= target_bytes: break
+
+    encodes = 0
+    while True:
+        if scale_factor < 1.0:
+            encoded_image = image.resize((max(1, int(image.width * scale_factor)), max(1, int(image.height * scale_factor))), Image.Resampling.LANCZOS)
+        else:
+            encoded_image = image
+
+        image_bytes = encode_png(convert_image_for_encoding(encoded_image, chosen_encoding), chosen_compress_level)
+        encodes += 1
+
+        if len(image_bytes) <= max_bytes or encodes >= 4: break
+
+        if chosen_compress_level != png_compress_levels[-1]:
+            chosen_compress_level = png_compress_levels[-1]
+        else:
+            scale_factor = scale_factor * (target_bytes / len(image_bytes)) ** 0.5
+
+    return image_bytes, {"scale_factor": round(encoded_image.width / image.width, 4),
+                         "encoding": chosen_encoding,
+                         "compress_level": chosen_compress_level,
+                         "width": encoded_image.width,
+                         "height": encoded_image.height,
+                         "bytes": len(image_bytes),
+                         "encodes": encodes}
+
+def load_image_bytes_for_byte_budget(image_path:str, max_bytes:int=int(TEXTRACT_MAX_IMAGE_BYTES)) -> Tuple[bytes, dict]:
+    '''
+    Load an image file as bytes of at most max_bytes. PNG and JPEG files already within the budget are sent as they are, without decoding or encoding them. Other files are encoded with encode_image_to_byte_budget.
+    '''
+    with Image.open(image_path) as image:
+        if image.format in ("PNG", "JPEG") and os.path.getsize(image_path) <= max_bytes:
+            with open(image_path, "rb") as image_file:
+                return image_file.read(), {"scale_factor": 1.0, "encoding": "file", "width": image.width, "height": image.height, "bytes": os.path.getsize(image_path), "encodes": 0}
+
+        image.load()
+        return encode_image_to_byte_budget(image, max_bytes)
@@ -0,0 +1,65 @@
+import time
+import threading
+import spacy
+from spacy.cli.download import download
+from spacy.language import Language
+from typing import Dict
+
+from tools.config import SPACY_MODEL_TIERS, SPACY_MODEL_TIER
+from tools.load_spacy_model_custom_recognisers import nlp, model_name as startup_model_name
+
+def parse_model_tiers(model_tiers:str=SPACY_MODEL_TIERS) -> Dict[str, str]:
+    '''
+    Read a mapping of model tiers to spaCy model names from a string such as 'small:en_core_web_sm,large:en_core_web_lg'.
+    '''
+    tier_models = {}
+    for tier_model in model_tiers.split(","):
+        if ":" not in tier_model: continue
+        tier, tier_model_name = tier_model.split(":", 1)
+        tier_models[tier.strip()] = tier_model_name.strip()
+    return tier_models
+
+model_tiers = parse_model_tiers()
+
+# Model name -> loaded spaCy model. The model loaded at start-up is shared with any tier that names it.
+_loaded_models: Dict[str, Language] = {startup_model_name: nlp}
+_loaded_models_lock = threading.Lock()
+
+def load_spacy_model(model_name:str) -> Language:
+    try:
+        return spacy.load(model_name)
+    except OSError:
+        download(model_name)
+        return spacy.load(model_name)
+
+def get_model_tier(tier:str) -> str:
+    if tier in model_tiers: return tier
+
+    print("spaCy model tier", tier, "not found, so using the", SPACY_MODEL_TIER, "tier.")
+    return SPACY_MODEL_TIER if SPACY_MODEL_TIER in model_tiers else ""
+
+def get_tier_model_name(tier:str=SPACY_MODEL_TIER) -> str:
+    return model_tiers.get(get_model_tier(tier), startup_model_name)
+
+def get_tier_spacy_model(tier:str=SPACY_MODEL_TIER) -> Language:
+    '''
+    Get the spaCy model for a tier, loading it (and downloading it if needed) the first time any job uses it. If the model cannot be loaded, the model loaded at start-up is used for the tier instead.
+    '''
+    tier_model_name = get_tier_model_name(tier)
+
+    with _loaded_models_lock:
+        if tier_model_name not in _loaded_models:
+            print("Loading spaCy model", tier_model_name, "for model tier", tier)
+            tic = time.perf_counter()
+            try:
+                _loaded_models[tier_model_name] = load_spacy_model(tier_model_name)
+                print(f"Loaded spaCy model {tier_model_name} in {time.perf_counter() - tic:0.1f} seconds.")
+            except Exception as e:
+                print("Could not load spaCy model", tier_model_name, "so using", startup_model_name, "instead:", e)
+                _loaded_models[tier_model_name] = nlp
+
+        return _loaded_models[tier_model_name]
+
+def get_loaded_model_names() -> list:
+    with _loaded_models_lock:
+        return list(_loaded_models.keys())
@@ -0,0 +1,188 @@
+import os
+import gzip
+import json
+import hashlib
+import threading
+from typing import Optional, Dict, Any
+
+from tools.config import USE_OCR_CACHE, OCR_CACHE_FOLDER, OCR_CACHE_MAX_SIZE_MB
+
+class OCRResultCache:
+    '''
+    Persistent on-disk cache of OCR results, keyed on the content of the page image and the settings used to OCR it. Because the key is based on image content rather than file names, identical pages in differently named documents share cache entries.
+
+    Each entry is a gzipped json file. When the cache folder grows past max_size_mb, the least recently used entries are removed.
+    '''
+    def __init__(self, cache_folder:str=OCR_CACHE_FOLDER, max_size_mb:float=float(OCR_CACHE_MAX_SIZE_MB)):
+        self.cache_folder = cache_folder
+        self.max_size_bytes = int(max_size_mb * 1024 * 1024)
+        self.lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+
+        os.makedirs(self.cache_folder, exist_ok=True)
+        self.current_size_bytes = self._get_folder_size()
+
+    @staticmethod
+    def make_key(content_hash:str, ocr_engine:str, settings:Dict[str, Any]={}) -> str:
+        '''
+        Create a cache key from a hash of the page content, the OCR engine name, and a dictionary of the settings that affect OCR output.
+        '''
+        key_source = json.dumps({"content_hash": content_hash, "ocr_engine": ocr_engine, "settings": settings}, sort_keys=True, default=str)
+        return hashlib.sha256(key_source.encode("utf-8")).hexdigest()
+
+    def _get_entry_path(self, key:str) -> str:
+        return os.path.join(self.cache_folder, key[:2], key + ".json.gz")
+
+    def _get_folder_size(self) -> int:
+        total_size = 0
+        for root, _, files in os.walk(self.cache_folder):
+            for file_name in files:
+                try:
+                    total_size += os.path.getsize(os.path.join(root, file_name))
+                except OSError:
+                    pass
+        return total_size
+
+    def get(self, key:str) -> Optional[Dict[str, Any]]:
+        '''
+        Return the cached value for a key, or None if it is not in the cache.
+        '''
+        entry_path = self._get_entry_path(key)
+
+        try:
+            with gzip.open(entry_path, "rt", encoding="utf-8") as entry_file:
+                value = json.load(entry_file)
+            # Update the modified time so that recently used entries are kept when the cache is trimmed
+            os.utime(entry_path)
+        except (OSError, ValueError):
+            with self.lock: self.misses += 1
+            return None
+
+        with self.lock: self.hits += 1
+        return value
+
+    def put(self, key:str, value:Dict[str, Any]):
+        '''
+        Add a value to the cache, removing old entries if the cache is over its size limit.
+        '''
+        entry_path = self._get_entry_path(key)
+        os.makedirs(os.path.dirname(entry_path), exist_ok=True)
+
+        # Write to a temporary file first so that other processes never read a partly written entry
+        temp_entry_path = entry_path + "." + str(os.getpid()) + "." + str(threading.get_ident()) + ".tmp"
+
+        try:
+            with gzip.open(temp_entry_path, "wt", encoding="utf-8") as entry_file:
+                json.dump(value, entry_file, separators=(",", ":"))
+            os.replace(temp_entry_path, entry_path)
+            entry_size = os.path.getsize(entry_path)
+        except (OSError, TypeError, ValueError) as e:
+            print("Could not write OCR result to cache due to:", e)
+            if os.path.exists(temp_entry_path): os.remove(temp_entry_path)
+            return
+
+        with self.lock:
+            self.writes += 1
+            self.current_size_bytes += entry_size
+            over_size_limit = self.current_size_bytes > self.max_size_bytes
+
+        if over_size_limit: self.trim()
+
+    def trim(self):
+        '''
+        Remove the least recently used entries until the cache is below 90% of its size limit.
+        '''
+        with self.lock:
+            entries = []
+            for root, _, files in os.walk(self.cache_folder):
+                for file_name in files:
+                    if not file_name.endswith(".json.gz"): continue
+                    entry_path = os.path.join(root, file_name)
+                    try:
+                        entry_stat = os.stat(entry_path)
+                        entries.append((entry_stat.st_mtime, entry_stat.st_size, entry_path))
+                    except OSError:
+                        pass
+
+            total_size = sum(entry[1] for entry in entries)
+            target_size = int(self.max_size_bytes * 0.9)
+
+            for _, entry_size, entry_path in sorted(entries):
+                if total_size <= target_size: break
+                try:
+                    os.remove(entry_path)
+                    total_size -= entry_size
+                    self.evictions += 1
+                except OSError:
+                    pass
+
+            self.current_size_bytes = total_size
+
+    def get_stats(self) -> Dict[str, Any]:
+        '''
+        Return hit, miss, write and eviction counts, and the current size of the cache.
+        '''
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "writes": self.writes,
+                "evictions": self.evictions,
+                "size_mb": round(self.current_size_bytes / (1024 * 1024), 2),
+                "max_size_mb": round(self.max_size_bytes / (1024 * 1024), 2)
+            }
+
+    def get_stats_message(self) -> str:
+        stats = self.get_stats()
+        return f"OCR cache: {stats['hits']} hits, {stats['misses']} misses (hit rate {stats['hit_rate']:.1%}), {stats['writes']} writes, {stats['evictions']} evictions, {stats['size_mb']} of {stats['max_size_mb']} MB used."
+
+def hash_image(image) -> str:
+    '''
+    Hash the decoded pixels of a PIL image, so that the same page gets the same hash regardless of file name or how it was encoded on disk.
+    '''
+    image_hash = hashlib.sha256()
+    image_hash.update(f"{image.mode}|{image.size[0]}x{image.size[1]}|".encode("utf-8"))
+    image_hash.update(image.tobytes())
+    return image_hash.hexdigest()
+
+def hash_bytes(content:bytes) -> str:
+    return hashlib.sha256(content).hexdigest()
+
+def describe_ocr_settings(settings_object) -> Any:
+    '''
+    Convert an object holding OCR settings (e.g. an image preprocessor) into a json-friendly description of its class and attributes, for use in cache keys. Attributes starting with an underscore hold run-time state rather than settings, and are left out.
+    '''
+    if isinstance(settings_object, (str, int, float, bool)) or settings_object is None:
+        return settings_object
+    if isinstance(settings_object, (list, tuple)):
+        return [describe_ocr_settings(item) for item in settings_object]
+    if isinstance(settings_object, dict):
+        return {str(key): describe_ocr_settings(value) for key, value in settings_object.items()}
+    if hasattr(settings_object, "__dict__"):
+        description = {"class": type(settings_object).__name__}
+        for attribute_name, attribute_value in vars(settings_object).items():
+            if attribute_name.startswith("_"): continue
+            description[attribute_name] = describe_ocr_settings(attribute_value)
+        return description
+    return repr(settings_object)
+
+_ocr_cache = None
+
+def get_ocr_cache() -> Optional[OCRResultCache]:
+    '''
+    Return the shared OCR result cache if USE_OCR_CACHE is set to True, otherwise None.
+    '''
+    global _ocr_cache
+
+    if USE_OCR_CACHE != "True": return None
+
+    if _ocr_cache is None:
+        _ocr_cache = OCRResultCache(OCR_CACHE_FOLDER, float(OCR_CACHE_MAX_SIZE_MB))
+
+    return _ocr_cache
@@ -0,0 +1,171 @@
+import cv2
+import numpy as np
+from typing import Dict, List, Tuple
+
+# A rectangle on a page image as (left, top, right, bottom) in pixels
+Region = Tuple[int, int, int, int]
+
+page_ocr_region_mode = "page"
+regions_ocr_region_mode = "regions"
+tiles_ocr_region_mode = "tiles"
+auto_ocr_region_mode = "auto"
+
+def find_text_regions(image:np.ndarray, working_size:int=1600, padding:int=10, min_region_area:int=64) -> List[Region]:
+    '''
+    Find the parts of a greyscale page image that contain text or other marks. Dark marks are found with Otsu thresholding on a reduced copy of the page, then joined into words, lines and blocks by dilating with a wide, short kernel. Returns padded block rectangles in the coordinates of the original image, with overlapping blocks merged.
+    '''
+    height, width = image.shape[:2]
+    if height == 0 or width == 0: return []
+
+    scale = min(1.0, working_size / max(height, width))
+    if scale < 1.0:
+        working_image = cv2.resize(image, (max(1, int(width * scale)), max(1, int(height * scale))), interpolation=cv2.INTER_AREA)
+    else:
+        working_image = image
+
+    _, ink_mask = cv2.threshold(working_image, 0, 255, cv2.THRESH_BINARY_INV | cv2.THRESH_OTSU)
+
+    # Gaps between letters and words are closed horizontally, and between lines of a paragraph vertically
+    kernel_width = max(3, int(working_image.shape[1] * 0.015))
+    kernel_height = max(3, int(working_image.shape[0] * 0.005))
+    block_mask = cv2.dilate(ink_mask, cv2.getStructuringElement(cv2.MORPH_RECT, (kernel_width, kernel_height)))
+
+    contours, _ = cv2.findContours(block_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+    regions = []
+    for contour in contours:
+        x, y, w, h = cv2.boundingRect(contour)
+        if w * h < min_region_area: continue
+
+        regions.append((max(0, int(x / scale) - padding),
+                        max(0, int(y / scale) - padding),
+                        min(width, int(np.ceil((x + w) / scale)) + padding),
+                        min(height, int(np.ceil((y + h) / scale)) + padding)))
+
+    return merge_overlapping_regions(regions)
+
+def regions_overlap(region_a:Region, region_b:Region) -> bool:
+    return region_a[0] < region_b[2] and region_b[0] < region_a[2] and region_a[1] < region_b[3] and region_b[1] < region_a[3]
+
+def get_overlap_share(region_a:Region, region_b:Region) -> float:
+    '''
+    Area where two rectangles overlap, as a share of the area of the smaller one.
+    '''
+    if not regions_overlap(region_a, region_b): return 0.0
+
+    intersection = (min(region_a[2], region_b[2]) - max(region_a[0], region_b[0])) * (min(region_a[3], region_b[3]) - max(region_a[1], region_b[1]))
+    smaller_area = max(1, min((region_a[2] - region_a[0]) * (region_a[3] - region_a[1]), (region_b[2] - region_b[0]) * (region_b[3] - region_b[1])))
+
+    return intersection / smaller_area
+
+def merge_overlapping_regions(regions:List[Region]) -> List[Region]:
+    '''
+    Merge overlapping rectangles until none overlap, so that no part of the page is OCRed twice.
+    '''
+    merged_regions = list(regions)
+
+    merged = True
+    while merged:
+        merged = False
+        remaining_regions = []
+
+        for region in merged_regions:
+            for i, remaining_region in enumerate(remaining_regions):
+                if regions_overlap(region, remaining_region):
+                    remaining_regions[i] = (min(region[0], remaining_region[0]), min(region[1], remaining_region[1]),
+                                            max(region[2], remaining_region[2]), max(region[3], remaining_region[3]))
+                    merged = True
+                    break
+            else:
+                remaining_regions.append(region)
+
+        merged_regions = remaining_regions
+
+    return sorted(merged_regions, key=lambda region: (region[1], region[0]))
+
+def get_region_coverage(regions:List[Region], width:int, height:int) -> float:
+    '''
+    Share of the page area covered by the regions, which do not overlap after merging.
+    '''
+    if width <= 0 or height <= 0: return 0.0
+    return sum((right - left) * (bottom - top) for left, top, right, bottom in regions) / (width * height)
+
+def split_region_into_tiles(region:Region, tile_size:int, overlap:int) -> List[Region]:
+    '''
+    Split a rectangle into tiles of at most tile_size pixels a side, with neighbouring tiles overlapping by overlap pixels so that a word cut by one tile edge is whole in the next tile.
+    '''
+    left, top, right, bottom = region
+    step = max(1, tile_size - overlap)
+
+    tiles = []
+    for tile_top in range(top, max(top + 1, bottom - overlap), step):
+        for tile_left in range(left, max(left + 1, right - overlap), step):
+            tiles.append((tile_left, tile_top, min(tile_left + tile_size, right), min(tile_top + tile_size, bottom)))
+
+    return tiles
+
+def get_seam_distance(word_box:Region, part:Region, width:int, height:int) -> float:
+    '''
+    Distance from a word to the nearest edge of the part of the page it was OCRed in, counting only edges inside the page (seams). Words close to a seam are more likely to have been cut off.
+    '''
+    word_left, word_top, word_right, word_bottom = word_box
+    part_left, part_top, part_right, part_bottom = part
+
+    seam_distances = []
+    if part_left > 0: seam_distances.append(word_left - part_left)
+    if part_top > 0: seam_distances.append(word_top - part_top)
+    if part_right < width: seam_distances.append(part_right - word_right)
+    if part_bottom < height: seam_distances.append(part_bottom - word_bottom)
+
+    return min(seam_distances) if seam_distances else float("inf")
+
+def merge_ocr_data_from_parts(part_ocr_data:List[Tuple[Region, Dict[str, list]]], width:int, height:int, min_overlap:float=0.5, grid_size:int=256) -> Dict[str, list]:
+    '''
+    Combine Tesseract image_to_data outputs (in dictionary form) for parts of a page into one output in page coordinates.
+
+    Where tiles overlap, the same word can be found in two parts, sometimes cut short in one of them. Words from different parts whose boxes overlap by at least min_overlap of the smaller box are treated as the same word, and the copy furthest from a seam is kept. Candidate pairs are found with a grid over the page rather than by comparing every pair of words.
+    '''
+    words = []
+    for part_index, (part, ocr_data) in enumerate(part_ocr_data):
+        for i, text in enumerate(ocr_data.get("text", [])):
+            if not str(text).strip(): continue
+
+            row = {column: values[i] for column, values in ocr_data.items()}
+            row["left"] = int(row["left"]) + part[0]
+            row["top"] = int(row["top"]) + part[1]
+
+            word_box = (row["left"], row["top"], row["left"] + int(row["width"]), row["top"] + int(row["height"]))
+            words.append((get_seam_distance(word_box, part, width, height), part_index, word_box, row))
+
+    words.sort(key=lambda word: -word[0])
+
+    kept_rows = []
+    grid: Dict[Tuple[int, int], List[Tuple[int, Region]]] = {}
+
+    for _, part_index, word_box, row in words:
+        grid_cells = [(cell_x, cell_y)
+                      for cell_x in range(word_box[0] // grid_size, word_box[2] // grid_size + 1)
+                      for cell_y in range(word_box[1] // grid_size, word_box[3] // grid_size + 1)]
+
+        is_duplicate = False
+
+        for cell in grid_cells:
+            for kept_part_index, kept_box in grid.get(cell, []):
+                if kept_part_index == part_index: continue
+
+                if get_overlap_share(word_box, kept_box) >= min_overlap:
+                    is_duplicate = True
+                    break
+            if is_duplicate: break
+
+        if is_duplicate: continue
+
+        kept_rows.append(row)
+        for cell in grid_cells:
+            grid.setdefault(cell, []).append((part_index, word_box))
+
+    # Return in reading order, in the same format as a single image_to_data call
+    kept_rows.sort(key=lambda row: (row["top"], row["left"]))
+    columns = list(part_ocr_data[0][1].keys()) if part_ocr_data else ["left", "top", "width", "height", "conf", "text"]
+
+    return {column: [row.get(column) for row in kept_rows] for column in columns}
@@ -0,0 +1,166 @@
+import os
+import re
+import json
+import threading
+import numpy as np
+from PIL import Image
+from typing import Dict, List, Optional, Tuple
+
+from tools.config import USE_PAGE_IMAGE_STORE
+
+# Page images are saved as <document file name>_<zero-indexed page number>.png
+page_image_name_pattern = re.compile(r"^(?P<document_name>.+)_(?P<page_no>\d+)\.png$")
+
+class PageImageStore:
+    '''
+    Per-document store of decoded greyscale page images, so that each page PNG is decoded once rather than by every step that reads it. Each page is kept as a .npy file next to the page PNGs and opened as a read-only memory-mapped array, which PIL images are then created on top of without copying. A small json index records the width, height and PNG path of each stored page.
+
+    Page files are written to a temporary file and renamed into place, so they can be written from worker processes. The index is only updated from the main process. A page is only used if its file is at least as new as its PNG, so that a PNG that has been changed since (e.g. reduced in size) is read again.
+
+    The PNGs are still written as before, for the review annotator and output files, and a PNG can be recreated from the store with export_png.
+    '''
+    def __init__(self, store_folder:str):
+        self.store_folder = store_folder
+        self.index_file_path = os.path.join(store_folder, "index.json")
+        self.lock = threading.Lock()
+        self.index = self._read_index()
+
+    def _read_index(self) -> Dict[str, dict]:
+        if not os.path.exists(self.index_file_path): return {}
+        try:
+            with open(self.index_file_path, "r", encoding="utf-8") as index_file:
+                return json.load(index_file).get("pages", {})
+        except (OSError, ValueError) as e:
+            print("Could not read page image store index, it will be rebuilt:", e)
+            return {}
+
+    def get_page_file_path(self, page_no:int) -> str:
+        return os.path.join(self.store_folder, f"page_{page_no}.npy")
+
+    def has_page(self, page_no:int, image_path:str="") -> bool:
+        page_file_path = self.get_page_file_path(page_no)
+        if not os.path.exists(page_file_path): return False
+        if image_path and os.path.exists(image_path) and os.path.getmtime(image_path) > os.path.getmtime(page_file_path): return False
+        return True
+
+    def get_page_pixels(self, page_no:int, image_path:str="") -> Optional[np.ndarray]:
+        '''
+        Return a read-only memory-mapped array of the greyscale pixels of a page, or None if the page is not stored or is older than its PNG.
+        '''
+        if not self.has_page(page_no, image_path): return None
+        try:
+            return np.load(self.get_page_file_path(page_no), mmap_mode="r")
+        except (OSError, ValueError) as e:
+            print("Could not read page", page_no + 1, "from page image store:", e)
+            return None
+
+    def get_page_image(self, page_no:int, image_path:str="") -> Optional[Image.Image]:
+        '''
+        Return a greyscale PIL image that shares memory with the stored page pixels, or None if the page is not stored. The image is read only, so PIL copies it before drawing on it.
+        '''
+        pixels = self.get_page_pixels(page_no, image_path)
+        if pixels is None: return None
+        return Image.frombuffer("L", (pixels.shape[1], pixels.shape[0]), pixels, "raw", "L", 0, 1)
+
+    def put_page(self, page_no:int, image:Image.Image) -> bool:
+        '''
+        Store the pixels of a decoded page image. Only greyscale images are stored. Returns True if the page was stored.
+        '''
+        if image.mode != "L": return False
+
+        os.makedirs(self.store_folder, exist_ok=True)
+        page_file_path = self.get_page_file_path(page_no)
+        temp_file_path = f"{page_file_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+        with open(temp_file_path, "wb") as page_file:
+            np.save(page_file, np.asarray(image))
+        os.replace(temp_file_path, page_file_path)
+
+        return True
+
+    def update_index(self, pages:List[Tuple[int, str, int, int]]):
+        '''
+        Record the PNG path, width and height of stored pages, given as (page_no, image_path, width, height). Only called from the main process.
+        '''
+        with self.lock:
+            for page_no, image_path, width, height in pages:
+                if not os.path.exists(self.get_page_file_path(page_no)): continue
+                self.index[str(page_no)] = {"image_path": image_path, "width": int(width), "height": int(height)}
+
+            os.makedirs(self.store_folder, exist_ok=True)
+            temp_file_path = self.index_file_path + ".tmp"
+            with open(temp_file_path, "w", encoding="utf-8") as index_file:
+                json.dump({"pages": self.index}, index_file)
+            os.replace(temp_file_path, self.index_file_path)
+
+    def export_png(self, page_no:int, out_path:str) -> Optional[str]:
+        '''
+        Save a stored page as a PNG, e.g. for the review annotator if the page PNG has been removed. Returns the path, or None if the page is not stored.
+        '''
+        image = self.get_page_image(page_no)
+        if image is None: return None
+        image.save(out_path, format="PNG")
+        return out_path
+
+# Stores opened in this process, keyed by store folder
+_page_image_stores: Dict[str, PageImageStore] = {}
+_page_image_stores_lock = threading.Lock()
+
+def get_page_image_store(image_path:str, use_page_image_store:bool=USE_PAGE_IMAGE_STORE == "True") -> Tuple[Optional[PageImageStore], Optional[int]]:
+    '''
+    Return the page image store and zero-indexed page number for a page image path, or (None, None) if the store is not used or the path is not a page image.
+    '''
+    if not use_page_image_store or not isinstance(image_path, str): return None, None
+
+    name_match = page_image_name_pattern.match(os.path.basename(image_path))
+    if not name_match: return None, None
+
+    store_folder = os.path.join(os.path.dirname(image_path), name_match.group("document_name") + "_page_store")
+
+    with _page_image_stores_lock:
+        if store_folder not in _page_image_stores:
+            _page_image_stores[store_folder] = PageImageStore(store_folder)
+        return _page_image_stores[store_folder], int(name_match.group("page_no"))
+
+def reset_page_image_stores():
+    '''
+    Forget the stores opened in this process, for a worker process that was forked while another thread may have been using them.
+    '''
+    global _page_image_stores, _page_image_stores_lock
+    _page_image_stores = {}
+    _page_image_stores_lock = threading.Lock()
+
+def store_page_image(image_path:str, image:Image.Image) -> bool:
+    '''
+    Add a page image that has just been created (and so is already decoded) to the page image store for its document.
+    '''
+    page_image_store, page_no = get_page_image_store(image_path)
+    if not page_image_store: return False
+    return page_image_store.put_page(page_no, image)
+
+def open_page_image(image_path:str) -> Image.Image:
+    '''
+    Open a page image, from the page image store without decoding the PNG if the page is stored, otherwise from the file as Image.open does.
+    '''
+    page_image_store, page_no = get_page_image_store(image_path)
+
+    if page_image_store:
+        image = page_image_store.get_page_image(page_no, image_path)
+        if image is not None: return image
+
+    return Image.open(image_path)
+
+def restore_page_image(image_path:str) -> Optional[Tuple[str, int, int]]:
+    '''
+    Recreate a page PNG that has been removed from the page image store, e.g. for the review annotator. Returns (image_path, width, height), with the page size from the store index, or None if the PNG exists or the page is not stored.
+    '''
+    page_image_store, page_no = get_page_image_store(image_path)
+    if not page_image_store or os.path.exists(image_path): return None
+
+    if not page_image_store.export_png(page_no, image_path): return None
+
+    page_info = page_image_store.index.get(str(page_no))
+    if page_info: return image_path, page_info["width"], page_info["height"]
+
+    with Image.open(image_path) as image:
+        return image_path, image.width, image.height
@@ -0,0 +1,135 @@
+import re
+import cv2
+import numpy as np
+from PIL import Image
+from typing import Dict, Tuple, Union
+
+from tools.config import TESSERACT_PSM_BY_LAYOUT
+
+dense_single_column_layout = "dense_single_column"
+multi_column_layout = "multi_column"
+sparse_form_layout = "sparse_form"
+table_like_layout = "table_like"
+
+def parse_psm_by_layout(psm_by_layout:str=TESSERACT_PSM_BY_LAYOUT) -> Dict[str, int]:
+    '''
+    Read a mapping of page layouts to Tesseract page segmentation modes from a string such as 'dense_single_column:6,multi_column:3'.
+    '''
+    layout_psms = {}
+    for layout_psm in psm_by_layout.split(","):
+        if ":" not in layout_psm: continue
+        layout, psm = layout_psm.split(":", 1)
+        layout_psms[layout.strip()] = int(psm)
+    return layout_psms
+
+def get_page_layout_features(image:Union[Image.Image, np.ndarray], working_size:int=1000) -> dict:
+    '''
+    Measure cheap layout features of a page image on a reduced greyscale copy: the number of text lines, the share of the page they cover, how much of the text block width a typical line fills, the number of text columns, and the number of long horizontal and vertical ruling lines.
+    '''
+    if isinstance(image, Image.Image):
+        image = np.asarray(image.convert("L"))
+    elif image.ndim == 3:
+        image = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+
+    height, width = image.shape[:2]
+    scale = min(1.0, working_size / max(height, width, 1))
+    if scale < 1.0:
+        image = cv2.resize(image, (max(1, int(width * scale)), max(1, int(height * scale))), interpolation=cv2.INTER_AREA)
+        height, width = image.shape[:2]
+
+    _, ink_mask = cv2.threshold(image, 0, 255, cv2.THRESH_BINARY_INV | cv2.THRESH_OTSU)
+
+    # Ruling lines are runs of ink at least an eighth of the page long
+    horizontal_rules = cv2.morphologyEx(ink_mask, cv2.MORPH_OPEN, cv2.getStructuringElement(cv2.MORPH_RECT, (max(3, width // 8), 1)))
+    vertical_rules = cv2.morphologyEx(ink_mask, cv2.MORPH_OPEN, cv2.getStructuringElement(cv2.MORPH_RECT, (1, max(3, height // 8))))
+    horizontal_rule_count = cv2.connectedComponents(horizontal_rules)[0] - 1
+    vertical_rule_count = cv2.connectedComponents(vertical_rules)[0] - 1
+
+    # Join letters into words and words into lines, without bridging the gutter between columns
+    text_mask = cv2.subtract(ink_mask, cv2.bitwise_or(horizontal_rules, vertical_rules))
+    line_mask = cv2.dilate(text_mask, cv2.getStructuringElement(cv2.MORPH_RECT, (max(3, width // 100), 1)))
+
+    number_of_labels, _, component_stats, _ = cv2.connectedComponentsWithStats(line_mask, connectivity=8)
+
+    line_boxes = []
+    for label in range(1, number_of_labels):
+        x, y, w, h = component_stats[label, :4]
+        if h >= 3 and w >= 2 * h and h <= height // 10:
+            line_boxes.append((x, y, x + w, y + h))
+
+    if not line_boxes:
+        return {"text_lines": 0, "text_coverage": 0.0, "line_fill": 0.0, "columns": 0,
+                "horizontal_rules": horizontal_rule_count, "vertical_rules": vertical_rule_count}
+
+    line_boxes = np.asarray(line_boxes)
+    text_left, text_right = int(line_boxes[:, 0].min()), int(line_boxes[:, 2].max())
+    text_block_width = max(1, text_right - text_left)
+
+    # Gutters are vertical gaps in the text at least 2% of the page wide, that at least three text lines lie either side of
+    column_profile = np.zeros(width, dtype=np.int32)
+    for left, _, right, _ in line_boxes:
+        column_profile[left:right] += 1
+
+    min_gutter_width = max(2, width // 50)
+    gutters = 0
+    gap_start = None
+    for x in range(text_left, text_right):
+        if column_profile[x] == 0:
+            if gap_start is None: gap_start = x
+        else:
+            if gap_start is not None and x - gap_start >= min_gutter_width:
+                lines_left = int((line_boxes[:, 2] <= gap_start).sum())
+                lines_right = int((line_boxes[:, 0] >= x).sum())
+                if lines_left >= 3 and lines_right >= 3: gutters += 1
+            gap_start = None
+
+    line_widths = line_boxes[:, 2] - line_boxes[:, 0]
+    line_areas = line_widths * (line_boxes[:, 3] - line_boxes[:, 1])
+
+    return {"text_lines": len(line_boxes),
+            "text_coverage": round(float(line_areas.sum()) / (width * height), 3),
+            "line_fill": round(float(np.median(line_widths)) / text_block_width, 3),
+            "columns": gutters + 1,
+            "horizontal_rules": horizontal_rule_count,
+            "vertical_rules": vertical_rule_count}
+
+def classify_page_layout(layout_features:dict, min_dense_lines:int=15, min_dense_coverage:float=0.1, min_dense_line_fill:float=0.6) -> Tuple[str, str]:
+    '''
+    Classify a page as a dense single column, multi-column, sparse form or table-like page from its layout features. Returns the layout and the reason for it.
+    '''
+    if layout_features["horizontal_rules"] >= 3 and layout_features["vertical_rules"] >= 2:
+        return table_like_layout, "ruled grid"
+
+    if layout_features["text_lines"] < min_dense_lines or layout_features["text_coverage"] < min_dense_coverage:
+        return sparse_form_layout, "few text lines"
+
+    if layout_features["columns"] >= 2:
+        return multi_column_layout, f"{layout_features['columns']} text columns"
+
+    if layout_features["line_fill"] < min_dense_line_fill:
+        return sparse_form_layout, "short lines"
+
+    return dense_single_column_layout, "full width lines"
+
+def set_tesseract_config_psm(tesseract_config:str, psm:int) -> str:
+    '''
+    Replace the page segmentation mode in a Tesseract config string, or add one if there is none.
+    '''
+    if re.search(r"--psm\s+\d+", tesseract_config or ""):
+        return re.sub(r"--psm\s+\d+", f"--psm {psm}", tesseract_config)
+    return f"{tesseract_config or ''} --psm {psm}".strip()
+
+def choose_tesseract_config_for_page(image:Union[Image.Image, np.ndarray], tesseract_config:str, psm_by_layout:Dict[str, int]=None) -> Tuple[str, dict]:
+    '''
+    Choose the Tesseract page segmentation mode for a page image from its layout. Returns the Tesseract config to use and a record of the decision (layout, reason, page segmentation mode and layout features).
+    '''
+    if psm_by_layout is None: psm_by_layout = parse_psm_by_layout()
+
+    layout_features = get_page_layout_features(image)
+    layout, reason = classify_page_layout(layout_features)
+
+    if layout not in psm_by_layout:
+        return tesseract_config, {"layout": layout, "reason": reason, "psm": None, **layout_features}
+
+    psm = psm_by_layout[layout]
+    return set_tesseract_config_psm(tesseract_config, psm), {"layout": layout, "reason": reason, "psm": psm, **layout_features}
@@ -0,0 +1,185 @@
+import time
+import queue
+import threading
+import pandas as pd
+from typing import List, Tuple, Callable, Iterable, Iterator, Any
+
+# Placed on a queue to tell the next stage that there are no more items
+_END_OF_STREAM = object()
+
+class PipelineStageError:
+    '''
+    Wraps an exception raised inside a pipeline stage so that it can be passed downstream and raised again in the consumer thread.
+    '''
+    def __init__(self, stage_name:str, error:Exception):
+        self.stage_name = stage_name
+        self.error = error
+
+class PipelineStage:
+    '''
+    A single stage of a PagePipeline. Runs a function on each item from its input queue in a worker thread and passes the result to its output queue, recording how long it spent working, waiting for input, and blocked on a full output queue.
+    '''
+    def __init__(self, name:str, function:Callable[[Any], Any]):
+        self.name = name
+        self.function = function
+        self.items_processed = 0
+        self.busy_time = 0.0
+        self.input_wait_time = 0.0
+        self.output_blocked_time = 0.0
+
+class PagePipeline:
+    '''
+    Streams items (usually pages) through a sequence of stages connected by bounded queues, so that each stage can work on a different page at the same time. Items are returned to the consumer in the order they went in.
+
+    The final step of the pipeline is whatever the consumer does with each item as it is yielded by run(). The time the consumer spends between items and waiting for the next one is recorded as its own stage, so that the stage report covers the whole process.
+
+    Stage statistics are used to see where the bottleneck is:
+    - busy_time: time spent running the stage function.
+    - input_wait_time: time spent waiting for the previous stage (the stage is starved).
+    - output_blocked_time: time spent waiting for space on the next queue (backpressure from downstream).
+    '''
+    def __init__(self, stages:List[Tuple[str, Callable[[Any], Any]]], consumer_name:str="consumer", max_queue_size:int=4):
+        self.stages = [PipelineStage(name, function) for name, function in stages]
+        self.consumer = PipelineStage(consumer_name, None)
+        self.max_queue_size = max(1, int(max_queue_size))
+        self.queues = []
+        self.threads = []
+        self.stop_event = threading.Event()
+        self.start_time = None
+        self.end_time = None
+
+    def _put(self, out_queue:queue.Queue, item:Any, stage:PipelineStage=None) -> bool:
+        '''
+        Put an item on a queue, checking regularly whether the pipeline has been closed. Returns False if the pipeline was closed before the item could be added.
+        '''
+        put_tic = time.perf_counter()
+        while not self.stop_event.is_set():
+            try:
+                out_queue.put(item, timeout=0.1)
+                if stage: stage.output_blocked_time += time.perf_counter() - put_tic
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, in_queue:queue.Queue, stage:PipelineStage) -> Any:
+        '''
+        Get an item from a queue, checking regularly whether the pipeline has been closed.
+        '''
+        get_tic = time.perf_counter()
+        while not self.stop_event.is_set():
+            try:
+                item = in_queue.get(timeout=0.1)
+                stage.input_wait_time += time.perf_counter() - get_tic
+                return item
+            except queue.Empty:
+                continue
+        return _END_OF_STREAM
+
+    def _feed(self, items:Iterable[Any], out_queue:queue.Queue):
+        for item in items:
+            if not self._put(out_queue, item): return
+        self._put(out_queue, _END_OF_STREAM)
+
+    def _run_stage(self, stage:PipelineStage, in_queue:queue.Queue, out_queue:queue.Queue):
+        while True:
+            item = self._get(in_queue, stage)
+
+            # Pass on the end of stream marker and errors from earlier stages without processing them
+            if item is _END_OF_STREAM or isinstance(item, PipelineStageError):
+                self._put(out_queue, item)
+                return
+
+            stage_tic = time.perf_counter()
+            try:
+                result = stage.function(item)
+            except Exception as e:
+                print("Pipeline stage", stage.name, "failed due to:", e)
+                self._put(out_queue, PipelineStageError(stage.name, e))
+                return
+            stage.busy_time += time.perf_counter() - stage_tic
+            stage.items_processed += 1
+
+            if not self._put(out_queue, result, stage): return
+
+    def run(self, items:Iterable[Any]) -> Iterator[Any]:
+        '''
+        Start the stage threads and yield the output of the final stage for each item, in the original item order.
+        '''
+        self.start_time = time.perf_counter()
+        self.queues = [queue.Queue(maxsize=self.max_queue_size) for _ in range(len(self.stages) + 1)]
+
+        feeder = threading.Thread(target=self._feed, args=(items, self.queues[0]), daemon=True)
+        self.threads = [feeder]
+
+        for stage_no, stage in enumerate(self.stages):
+            stage_thread = threading.Thread(target=self._run_stage, args=(stage, self.queues[stage_no], self.queues[stage_no + 1]), name="pipeline_" + stage.name, daemon=True)
+            self.threads.append(stage_thread)
+
+        for thread in self.threads: thread.start()
+
+        final_queue = self.queues[-1]
+
+        while True:
+            item = self._get(final_queue, self.consumer)
+
+            if item is _END_OF_STREAM: break
+
+            # Stop the other stages, which may be blocked on full queues, before raising the error in the consumer
+            if isinstance(item, PipelineStageError):
+                self.close()
+                raise item.error
+
+            consumer_tic = time.perf_counter()
+            yield item
+            self.consumer.busy_time += time.perf_counter() - consumer_tic
+            self.consumer.items_processed += 1
+
+        self.end_time = time.perf_counter()
+
+    def close(self):
+        '''
+        Stop all stage threads, e.g. if the consumer has stopped reading from the pipeline early.
+        '''
+        self.stop_event.set()
+        for thread in self.threads:
+            thread.join(timeout=5)
+        if self.end_time is None: self.end_time = time.perf_counter()
+
+    def get_stage_report(self) -> pd.DataFrame:
+        '''
+        Return a dataframe of timings for each stage, including the consumer. The stage with the largest busy time is marked as the bottleneck.
+        '''
+        all_stages = self.stages + [self.consumer]
+
+        stage_report = pd.DataFrame([{
+            "stage": stage.name,
+            "items_processed": stage.items_processed,
+            "busy_seconds": round(stage.busy_time, 3),
+            "waiting_for_input_seconds": round(stage.input_wait_time, 3),
+            "blocked_by_downstream_seconds": round(stage.output_blocked_time, 3),
+            "seconds_per_item": round(stage.busy_time / stage.items_processed, 3) if stage.items_processed else 0.0
+        } for stage in all_stages])
+
+        stage_report["is_bottleneck"] = stage_report["busy_seconds"] == stage_report["busy_seconds"].max()
+
+        if self.start_time is not None:
+            end_time = self.end_time if self.end_time is not None else time.perf_counter()
+            stage_report["pipeline_wall_seconds"] = round(end_time - self.start_time, 3)
+
+        return stage_report
+
+    def close_and_write_report(self, report_file_path:str) -> str:
+        '''
+        Close the pipeline, print the stage report and write it to a csv file. Returns the report file path.
+        '''
+        self.close()
+
+        stage_report = self.get_stage_report()
+
+        print("Page pipeline stage report:")
+        print(stage_report.to_string(index=False))
+
+        stage_report.to_csv(report_file_path, index=None)
+
+        return report_file_path
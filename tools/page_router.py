@@ -0,0 +1,112 @@
+import unicodedata
+import pandas as pd
+from typing import List, Tuple
+from pymupdf import Document, Page, Rect
+
+from tools.config import PAGE_ROUTER_MIN_CHARS, PAGE_ROUTER_MIN_READABLE_SHARE, PAGE_ROUTER_LARGE_IMAGE_COVERAGE, PAGE_ROUTER_MIN_CHARS_WITH_LARGE_IMAGE
+
+text_layer_route = "text"
+ocr_route = "ocr"
+
+# Text render mode used for text that is not drawn, e.g. the OCR layer that scanners add on top of a page image
+invisible_text_render_mode = 3
+
+def is_readable_character(character:str) -> bool:
+    '''
+    Characters that come from a working text layer. Fonts without a usable unicode mapping give replacement, private use or control characters instead.
+    '''
+    if character == "\ufffd": return False
+    return unicodedata.category(character) not in ("Co", "Cn", "Cc", "Cs")
+
+def get_page_text_layer_stats(page:Page) -> dict:
+    '''
+    Measure the text layer and image coverage of a PyMuPDF page: the number of non-space characters, the share that are readable, the share that are invisible (as in an OCR layer), and the share of the page area covered by images.
+    '''
+    page_rect = page.rect
+    page_area = abs(page_rect) or 1.0
+
+    characters = [character for character in page.get_text("text") if not character.isspace()]
+    char_count = len(characters)
+    readable_share = sum(is_readable_character(character) for character in characters) / char_count if char_count else 0.0
+
+    invisible_char_count = 0
+    try:
+        for span in page.get_texttrace():
+            if span.get("type") == invisible_text_render_mode or span.get("opacity", 1) == 0:
+                invisible_char_count += len(span.get("chars", []))
+    except Exception as e:
+        print("Could not read text render modes for page", page.number + 1, "due to:", e)
+
+    # Overlapping images are counted once each, so coverage is capped at the full page
+    image_area = 0.0
+    for image_info in page.get_image_info():
+        image_rect = Rect(image_info["bbox"]) & page_rect
+        if not image_rect.is_empty: image_area += abs(image_rect)
+
+    return {"chars": char_count,
+            "readable_share": round(readable_share, 3),
+            "invisible_text_share": round(min(1.0, invisible_char_count / char_count), 3) if char_count else 0.0,
+            "image_coverage": round(min(1.0, image_area / page_area), 3)}
+
+def choose_page_route(page_stats:dict,
+                      min_chars:int=int(PAGE_ROUTER_MIN_CHARS),
+                      min_readable_share:float=float(PAGE_ROUTER_MIN_READABLE_SHARE),
+                      large_image_coverage:float=float(PAGE_ROUTER_LARGE_IMAGE_COVERAGE),
+                      min_chars_with_large_image:int=int(PAGE_ROUTER_MIN_CHARS_WITH_LARGE_IMAGE)) -> tuple[str, str]:
+    '''
+    Decide whether a page can be redacted from its text layer, or needs OCR. Returns the route and the reason for it.
+    '''
+    if page_stats["chars"] < min_chars:
+        return ocr_route, "little or no text layer"
+
+    if page_stats["readable_share"] < min_readable_share:
+        return ocr_route, "text layer not readable"
+
+    # A scanned page with an OCR layer is covered by an image, but its text is invisible and spread over the page. A large image with a little visible text (e.g. a typed header on a scan) still needs OCR.
+    if page_stats["image_coverage"] >= large_image_coverage and page_stats["invisible_text_share"] < 0.5 and page_stats["chars"] < min_chars_with_large_image:
+        return ocr_route, "large image with little text"
+
+    if page_stats["invisible_text_share"] >= 0.5:
+        return text_layer_route, "existing OCR text layer"
+
+    return text_layer_route, "text layer"
+
+def route_pdf_pages(pymupdf_doc:Document, page_min:int=0, page_max:int=0) -> pd.DataFrame:
+    '''
+    Route each page in the page range (page_min is one-indexed as for redact_image_pdf, 0 or less means the first page, and 0 for page_max means the last page) to text layer extraction or OCR. Returns a dataframe with the one-indexed page number, route, reason and page measurements.
+    '''
+    number_of_pages = pymupdf_doc.page_count
+
+    if page_max > number_of_pages or page_max == 0: page_max = number_of_pages
+    if page_min <= 0: page_min = 0
+    else: page_min = page_min - 1
+
+    page_routes = []
+
+    for page_no in range(page_min, page_max):
+        page_stats = get_page_text_layer_stats(pymupdf_doc.load_page(page_no))
+        route, reason = choose_page_route(page_stats)
+        page_routes.append({"page": page_no + 1, "route": route, "reason": reason, **page_stats})
+
+    page_routes_df = pd.DataFrame(page_routes, columns=["page", "route", "reason", "chars", "readable_share", "invisible_text_share", "image_coverage"])
+
+    print("Pages routed to text layer extraction:", (page_routes_df["route"] == text_layer_route).sum(), "Pages routed to OCR:", (page_routes_df["route"] == ocr_route).sum())
+
+    return page_routes_df
+
+def get_page_route_runs(page_routes_df:pd.DataFrame, start_page:int=0) -> List[Tuple[str, List[int]]]:
+    '''
+    Split the routed pages from start_page (zero-indexed) onwards into runs of consecutive pages on the same route, in page order. Returns the route and the zero-indexed page numbers of each run.
+    '''
+    page_route_runs = []
+
+    for page, route in sorted(zip(page_routes_df["page"], page_routes_df["route"])):
+        page_no = int(page) - 1
+        if page_no < start_page: continue
+
+        if page_route_runs and page_route_runs[-1][0] == route:
+            page_route_runs[-1][1].append(page_no)
+        else:
+            page_route_runs.append((route, [page_no]))
+
+    return page_route_runs
@@ -34,6 +34,7 @@ def analyze_iterator_custom(
         language: str,
         list_length:int,
         progress=gr.Progress(),
+        batch_size:int=1,
         **kwargs,
     ) -> List[List[RecognizerResult]]:
         """
@@ -42,6 +43,7 @@ def analyze_iterator_custom(
         :param texts: An list containing strings to be analyzed.
         :param language: Input language
         :param list_length: Length of the input list.
+        :param batch_size: Number of texts passed through the spaCy pipeline at a time (nlp.pipe batch size).
         :param kwargs: Additional parameters for the `AnalyzerEngine.analyze` method.
         """
 
@@ -52,7 +54,7 @@ def analyze_iterator_custom(
         nlp_artifacts_batch: Iterator[
             Tuple[str, NlpArtifacts]
         ] = self.analyzer_engine.nlp_engine.process_batch(
-            texts=texts, language=language
+            texts=texts, language=language, batch_size=batch_size
         )
 
         
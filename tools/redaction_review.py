@@ -15,9 +15,10 @@ import pymupdf
 from PIL import ImageDraw, Image
 
 from tools.config import OUTPUT_FOLDER, CUSTOM_BOX_COLOUR, MAX_IMAGE_PIXELS, INPUT_FOLDER
-from tools.file_conversion import is_pdf, convert_annotation_json_to_review_df, convert_review_df_to_annotation_json, process_single_page_for_image_conversion, multiply_coordinates_by_page_sizes, convert_annotation_data_to_dataframe, create_annotation_dicts_from_annotation_df, remove_duplicate_images_with_blank_boxes
+from tools.file_conversion import is_pdf, convert_annotation_json_to_review_df, convert_review_df_to_annotation_json, multiply_coordinates_by_page_sizes, convert_annotation_data_to_dataframe, create_annotation_dicts_from_annotation_df, remove_duplicate_images_with_blank_boxes, get_page_image
 from tools.helper_functions import get_file_name_without_type,  detect_file_type
 from tools.file_redaction import redact_page_with_pymupdf
+from tools.page_image_store import open_page_image, restore_page_image
 
 if not MAX_IMAGE_PIXELS: Image.MAX_IMAGE_PIXELS = None
 
@@ -272,7 +273,13 @@ def update_annotator_object_and_filter_df(
 
     if not os.path.exists(current_image_path):        
 
-        page_num, replaced_image_path, width, height = process_single_page_for_image_conversion(doc_full_file_name_textbox, page_num_reported_zero_indexed, input_folder=input_folder)
+        # Recreate the page PNG from the page image store if it is there, rather than rendering the page again
+        restored_page_image = restore_page_image(current_image_path)
+
+        if restored_page_image:
+            replaced_image_path, width, height = restored_page_image
+        else:
+            page_num, replaced_image_path, width, height = get_page_image(doc_full_file_name_textbox, page_num_reported_zero_indexed, input_folder=input_folder)
 
         # Overwrite page_sizes values 
         page_sizes_df.loc[page_sizes_df['page']==page_num_reported, "image_width"] = width
@@ -284,7 +291,7 @@ def update_annotator_object_and_filter_df(
             width = page_sizes_df.loc[page_sizes_df['page']==page_num_reported, "image_width"].max()
             height = page_sizes_df.loc[page_sizes_df['page']==page_num_reported, "image_height"].max()      
         else:
-            image = Image.open(current_image_path)
+            image = open_page_image(current_image_path)
             width = image.width
             height = image.height
 
@@ -549,7 +556,7 @@ def apply_redactions_to_review_df_and_files(page_image_annotator_object:Annotate
                         if not os.path.exists(image_loc):
                             image=page_sizes_df.loc[page_sizes_df['page']==i, "image_path"]
                         try:
-                            image = Image.open(image_loc)
+                            image = open_page_image(image_loc)
                         except Exception as e:
                             image = None
 
@@ -1242,7 +1249,7 @@ def convert_xfdf_to_dataframe(file_paths_list:List[str], pymupdf_doc, image_path
                 image_path = image_paths[page_python_format]
 
                 if isinstance(image_path, str):
-                    image = Image.open(image_path)
+                    image = open_page_image(image_path)
 
                 image_page_width, image_page_height = image.size
 
@@ -0,0 +1,195 @@
+import os
+import shlex
+import atexit
+import threading
+import multiprocessing
+import numpy as np
+from PIL import Image
+from typing import Dict, List, Optional, Tuple, Union
+from concurrent.futures import ProcessPoolExecutor, wait
+
+from tools.config import TESSERACT_OCR_BACKEND, TESSERACT_MAX_WORKERS
+
+# tesserocr is an optional dependency, only needed for the 'tesserocr' OCR backend
+try:
+    from tesserocr import PyTessBaseAPI, PSM, OEM
+except ImportError:
+    PyTessBaseAPI = None
+
+pytesseract_ocr_backend = "pytesseract"
+tesserocr_ocr_backend = "tesserocr"
+
+# Tesseract config used by CustomImageAnalyzerEngine when none is given
+default_tesseract_config = "--oem 3 --psm 11"
+
+# Column names of Tesseract tsv output, as returned by pytesseract.image_to_data
+tesseract_tsv_columns = ["level", "page_num", "block_num", "par_num", "line_num", "word_num", "left", "top", "width", "height", "conf", "text"]
+
+# Tesseract engines loaded in this process, keyed by language and config
+_tesseract_apis = {}
+_tesseract_apis_lock = threading.Lock()
+
+def parse_tesseract_config(tesseract_config:str) -> Tuple[str, int, int, Dict[str, str]]:
+    '''
+    Split a Tesseract command line config string (e.g. '--oem 3 --psm 11 -c preserve_interword_spaces=1') into language, page segmentation mode, OCR engine mode and config variables.
+    '''
+    language = "eng"
+    psm = 3
+    oem = 3
+    variables = {}
+
+    config_parts = shlex.split(tesseract_config or "")
+    i = 0
+    while i < len(config_parts):
+        part = config_parts[i]
+        value = config_parts[i + 1] if i + 1 < len(config_parts) else ""
+
+        if part == "--psm":
+            psm = int(value)
+            i += 2
+        elif part == "--oem":
+            oem = int(value)
+            i += 2
+        elif part == "-l":
+            language = value
+            i += 2
+        elif part == "-c" and "=" in value:
+            variable_name, variable_value = value.split("=", 1)
+            variables[variable_name] = variable_value
+            i += 2
+        else:
+            print("Tesseract config option", part, "is not supported by the tesserocr backend and will be ignored.")
+            i += 1
+
+    return language, psm, oem, variables
+
+def get_tesseract_api(tesseract_config:str) -> Tuple["PyTessBaseAPI", threading.Lock]:
+    '''
+    Return a Tesseract engine for this process and config, loading it the first time it is needed. The engine stays loaded so that later pages do not pay the start-up cost again. A lock is returned alongside the engine, as a single engine cannot be used by two threads at once.
+    '''
+    if PyTessBaseAPI is None:
+        raise ImportError("The tesserocr package is required for the tesserocr OCR backend. Install it, or set TESSERACT_OCR_BACKEND to pytesseract.")
+
+    with _tesseract_apis_lock:
+        if tesseract_config not in _tesseract_apis:
+            language, psm, oem, variables = parse_tesseract_config(tesseract_config)
+
+            tessdata_path = os.environ.get("TESSDATA_PREFIX")
+            if tessdata_path:
+                api = PyTessBaseAPI(path=tessdata_path, lang=language, psm=PSM(psm), oem=OEM(oem))
+            else:
+                api = PyTessBaseAPI(lang=language, psm=PSM(psm), oem=OEM(oem))
+
+            for variable_name, variable_value in variables.items():
+                api.SetVariable(variable_name, variable_value)
+
+            _tesseract_apis[tesseract_config] = (api, threading.Lock())
+
+        return _tesseract_apis[tesseract_config]
+
+def _end_tesseract_apis():
+    for api, _ in _tesseract_apis.values():
+        api.End()
+    _tesseract_apis.clear()
+
+atexit.register(_end_tesseract_apis)
+
+def tesserocr_image_to_data(image:Union[Image.Image, np.ndarray], tesseract_config:str) -> Dict[str, List[Union[int, float, str]]]:
+    '''
+    Run OCR on an in-memory image with a persistent Tesseract engine. Returns a dictionary in the same format as pytesseract.image_to_data with output_type=pytesseract.Output.DICT, so that the results can be processed in the same way.
+    '''
+    if isinstance(image, np.ndarray):
+        image = Image.fromarray(image)
+
+    api, api_lock = get_tesseract_api(tesseract_config)
+
+    with api_lock:
+        api.SetImage(image)
+        tsv_text = api.GetTSVText(0)
+        api.Clear()
+
+    ocr_data = {column: [] for column in tesseract_tsv_columns}
+
+    for row in tsv_text.splitlines():
+        row_values = row.split("\t")
+        if len(row_values) < len(tesseract_tsv_columns): continue
+
+        for column, value in zip(tesseract_tsv_columns, row_values):
+            if column == "text": ocr_data[column].append(value)
+            elif column == "conf": ocr_data[column].append(float(value))
+            else: ocr_data[column].append(int(value))
+
+    return ocr_data
+
+def init_tesseract_worker(tesseract_config:str, ocr_backend:str):
+    '''
+    Initialiser for worker processes in a TesseractEnginePool. With the tesserocr backend, loads the Tesseract engine when the worker starts rather than on its first page.
+    '''
+    if ocr_backend == tesserocr_ocr_backend: get_tesseract_api(tesseract_config)
+
+class TesseractEnginePool:
+    '''
+    A pool of worker processes for local Tesseract OCR that is kept for as long as the app is running, so that the workers (and with the tesserocr backend, their loaded Tesseract engines) are reused across pages and documents. Engines for other Tesseract configs are loaded in the workers the first time they are used.
+
+    The workers are forked from the app process, so the pool should be started before the app starts its server threads, as forking a process with other threads running can leave locks held in the workers.
+    '''
+    def __init__(self, tesseract_config:str=default_tesseract_config, max_workers:int=int(TESSERACT_MAX_WORKERS), ocr_backend:str=TESSERACT_OCR_BACKEND):
+        self.tesseract_config = tesseract_config
+        self.max_workers = max(1, int(max_workers))
+        self.executor = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=multiprocessing.get_context("fork"), initializer=init_tesseract_worker, initargs=(tesseract_config, ocr_backend))
+
+        # All workers are forked now rather than when the first pages arrive
+        wait([self.executor.submit(os.getpid) for _ in range(self.max_workers)])
+
+        print("Started", self.max_workers, "Tesseract OCR worker processes.")
+
+    def submit(self, function, *args, **kwargs):
+        return self.executor.submit(function, *args, **kwargs)
+
+    def close(self, wait:bool=True):
+        self.executor.shutdown(wait=wait)
+
+_tesseract_engine_pool: Optional[TesseractEnginePool] = None
+_tesseract_engine_pool_lock = threading.Lock()
+
+def start_tesseract_engine_pool(tesseract_config:str=default_tesseract_config, max_workers:int=int(TESSERACT_MAX_WORKERS)) -> Optional[TesseractEnginePool]:
+    '''
+    Start the shared Tesseract OCR worker pool if more than one worker is set and it is not already running. Only called when the app starts, before the server starts its threads.
+    '''
+    global _tesseract_engine_pool
+
+    if int(max_workers) <= 1: return None
+
+    with _tesseract_engine_pool_lock:
+        if _tesseract_engine_pool is None:
+            if "fork" not in multiprocessing.get_all_start_methods():
+                print("Tesseract OCR worker processes need an OS that can fork processes, so pages will be OCRed in the app process.")
+                return None
+            _tesseract_engine_pool = TesseractEnginePool(tesseract_config, max_workers)
+
+        return _tesseract_engine_pool
+
+def get_tesseract_engine_pool() -> Optional[TesseractEnginePool]:
+    '''
+    Get the shared Tesseract OCR worker pool if it was started when the app started. The pool is never started here, as jobs run in server threads.
+    '''
+    with _tesseract_engine_pool_lock:
+        return _tesseract_engine_pool
+
+def discard_tesseract_engine_pool(pool:TesseractEnginePool, error:Exception):
+    '''
+    Stop using a pool whose worker processes have died. It is not restarted, as forking a new pool from a server thread can leave locks held in the workers, so later pages are OCRed in the app process.
+    '''
+    global _tesseract_engine_pool
+
+    with _tesseract_engine_pool_lock:
+        if _tesseract_engine_pool is not pool: return
+        _tesseract_engine_pool = None
+
+    print("Tesseract OCR worker processes stopped unexpectedly, so pages will be OCRed in the app process. Error:", error)
+    pool.close(wait=False)
+
+def _close_tesseract_engine_pool():
+    if _tesseract_engine_pool: _tesseract_engine_pool.close()
+
+atexit.register(_close_tesseract_engine_pool)
@@ -0,0 +1,119 @@
+import os
+import gzip
+import json
+import zipfile
+from typing import Dict, List, Optional
+
+from tools.aws_textract import load_and_convert_textract_json
+
+class TextractPageStore:
+    '''
+    Page-keyed store of AWS Textract responses for a document, saved as an append-only gzipped json lines file. Each line holds one page in the same {"page_no": ..., "data": {...}} format used in the app's _textract.json files.
+
+    New pages are appended to the file as soon as they are analysed, so a resumed or repeated run never needs to rewrite existing results. Pages are looked up through an in-memory index keyed by page number. If a page appears more than once in the file, the latest entry is used.
+
+    Existing _textract.json files (either the app's {"pages": [...]} format or a raw Textract response with "Blocks") are imported when they are newer than the store, and the store can be exported back to these formats.
+    '''
+    def __init__(self, store_file_path:str, textract_json_file_path:str=""):
+        self.store_file_path = store_file_path
+        self.textract_json_file_path = textract_json_file_path
+        self.pages: Dict[str, dict] = {}
+        self.new_pages_added = False
+
+    @staticmethod
+    def _page_key(page_no) -> str:
+        return str(page_no).strip()
+
+    def load(self, log_files_output_paths:List[str]=[]) -> List[str]:
+        '''
+        Load the page index from the store file, importing from the _textract.json file first if it is newer than the store (e.g. if it has just been uploaded).
+        '''
+        self.pages = {}
+
+        store_exists = os.path.exists(self.store_file_path)
+        json_exists = bool(self.textract_json_file_path) and os.path.exists(self.textract_json_file_path)
+
+        if store_exists:
+            self._read_store_file()
+
+        if json_exists and (not store_exists or os.path.getmtime(self.textract_json_file_path) > os.path.getmtime(self.store_file_path)):
+            print("Importing Textract results from", os.path.basename(self.textract_json_file_path))
+            textract_data, is_missing, log_files_output_paths = load_and_convert_textract_json(self.textract_json_file_path, log_files_output_paths)
+
+            imported_pages = [page for page in textract_data.get("pages", []) if page.get("page_no") is not None]
+            if imported_pages:
+                self._append_to_store_file(imported_pages)
+                for page in imported_pages:
+                    self.pages[self._page_key(page["page_no"])] = page["data"]
+
+        if self.pages: print("Found existing Textract results for", len(self.pages), "pages.")
+
+        return log_files_output_paths
+
+    def _read_store_file(self):
+        try:
+            with gzip.open(self.store_file_path, "rt", encoding="utf-8") as store_file:
+                for line in store_file:
+                    if not line.strip(): continue
+                    page = json.loads(line)
+                    self.pages[self._page_key(page["page_no"])] = page["data"]
+        except (EOFError, OSError, ValueError) as e:
+            # A run that was stopped part way through can leave an incomplete final line. Pages read before it are kept.
+            print("Textract results store could not be fully read, using the", len(self.pages), "pages read before the error:", e)
+
+    def _append_to_store_file(self, pages:List[dict]):
+        store_folder = os.path.dirname(self.store_file_path)
+        if store_folder: os.makedirs(store_folder, exist_ok=True)
+
+        # Each append adds a new gzip member to the end of the file, which gzip reads back as one stream
+        with gzip.open(self.store_file_path, "at", encoding="utf-8") as store_file:
+            for page in pages:
+                store_file.write(json.dumps({"page_no": self._page_key(page["page_no"]), "data": page["data"]}, separators=(",", ":")) + "\n")
+
+    def has_page(self, page_no) -> bool:
+        return self._page_key(page_no) in self.pages
+
+    def get_page(self, page_no) -> Optional[dict]:
+        '''
+        Return the Textract response for a page, or None if the page has not been analysed.
+        '''
+        return self.pages.get(self._page_key(page_no))
+
+    def add_page(self, wrapped_response:dict):
+        '''
+        Add a page in the {"page_no": ..., "data": {...}} format returned by analyse_page_with_textract, and append it to the store file straight away.
+        '''
+        self._append_to_store_file([wrapped_response])
+        self.pages[self._page_key(wrapped_response["page_no"])] = wrapped_response["data"]
+        self.new_pages_added = True
+
+    def get_page_numbers(self) -> List[str]:
+        return sorted(self.pages.keys(), key=lambda page_no: int(page_no) if page_no.isdigit() else float("inf"))
+
+    def to_textract_json_data(self) -> dict:
+        return {"pages": [{"page_no": page_no, "data": self.pages[page_no]} for page_no in self.get_page_numbers()]}
+
+    def export_json(self, textract_json_file_path:str="") -> str:
+        '''
+        Write all pages to a _textract.json file in the format read by prepare_image_or_pdf. Returns the file path.
+        '''
+        textract_json_file_path = textract_json_file_path or self.textract_json_file_path
+
+        with open(textract_json_file_path, 'w') as json_file:
+            json.dump(self.to_textract_json_data(), json_file, separators=(",", ":"))
+
+        # Touch the store so that the export is not mistaken for a newer file to import next time
+        if os.path.exists(self.store_file_path): os.utime(self.store_file_path)
+
+        return textract_json_file_path
+
+    def export_zip(self, zip_file_path:str) -> str:
+        '''
+        Write all pages to a zip file containing a single json file, as accepted by prepare_image_or_pdf for Textract outputs. Returns the file path.
+        '''
+        json_file_name = os.path.basename(self.textract_json_file_path) if self.textract_json_file_path else "textract.json"
+
+        with zipfile.ZipFile(zip_file_path, "w", compression=zipfile.ZIP_DEFLATED) as zip_file:
+            zip_file.writestr(json_file_name, json.dumps(self.to_textract_json_data(), separators=(",", ":")))
+
+        return zip_file_path